@@ -0,0 +1,91 @@
+"""
+客户端传输方式的对比基准：在本地模拟服务上分别用 openai SDK 和直接解析 SSE 的轻量传输（见 sse_transport.py）
+跑同一组并发数，统计压测进程的 CPU 耗时，换算出单核能维持的最大流数。
+
+模拟服务在独立子进程中运行，其 CPU 不计入压测进程。单核可维持的流数 = 每 CPU 秒处理的块数 / 单个流每秒的块数，
+单个流每秒的块数由模拟服务的 Token 间隔决定（每块 1 个 token）。同时报告 ITL P99，压测端 CPU 饱和时 ITL 会被拉长。
+
+用法: python bench_transport.py --concurrency 16,64,256 --itl 0.01
+"""
+import argparse
+import asyncio
+import logging
+import socket
+import subprocess
+import sys
+import time
+
+from llm_benchmark import TRANSPORTS, BenchmarkObserver, run_benchmark
+
+
+class _ChunkCounter(BenchmarkObserver):
+    def __init__(self):
+        self.chunks = 0
+
+    def on_record(self, record):
+        self.chunks += record.get("output_chunks") or 0
+
+
+def _wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"mock server did not start on port {port}")
+
+
+def _measure(transport, concurrency, args):
+    """返回 (墙钟秒数, CPU 秒数, 收到的块数, ITL P99)。"""
+    counter = _ChunkCounter()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    results = asyncio.run(run_benchmark(
+        concurrency * args.requests_per_stream, concurrency, 120, args.output_tokens,
+        f"http://127.0.0.1:{args.port}", "default", "mock-model", False,
+        observers=[counter], transport=transport,
+    ))
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    return wall, cpu, counter.chunks, results.get("inter_token_latency", {}).get("p99")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare client CPU cost of the openai SDK and the raw SSE transport")
+    parser.add_argument("--concurrency", type=str, default="16,64,256", help="Comma separated concurrency levels (default: 16,64,256)")
+    parser.add_argument("--requests_per_stream", type=int, default=3, help="Requests per concurrent stream (default: 3)")
+    parser.add_argument("--output_tokens", type=int, default=200, help="Tokens per response, one SSE chunk each (default: 200)")
+    parser.add_argument("--ttft", type=str, default="0.05", help="Mock server time to first token (default: 0.05)")
+    parser.add_argument("--itl", type=float, default=0.01, help="Mock server inter-token delay in seconds (default: 0.01)")
+    parser.add_argument("--port", type=int, default=18180, help="Port for the mock server (default: 18180)")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    server = subprocess.Popen([sys.executable, "mock_server.py", "--port", str(args.port), "--ttft", args.ttft,
+                               "--itl", str(args.itl)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_for_port(args.port)
+        stream_rate = 1 / args.itl
+        print(f"模拟服务: TTFT {args.ttft} 秒, Token 间隔 {args.itl:g} 秒 (单流 {stream_rate:.0f} 块/秒), "
+              f"每个响应 {args.output_tokens} 块")
+        print(f"{'传输方式':<10}{'并发数':>8}{'墙钟(秒)':>10}{'CPU(秒)':>10}{'CPU占用':>9}{'CPU/块(微秒)':>14}"
+              f"{'ITL P99(秒)':>13}{'单核可维持流数':>16}")
+        per_core = {}
+        for concurrency in [int(value) for value in args.concurrency.split(",")]:
+            for transport in TRANSPORTS:
+                wall, cpu, chunks, itl_p99 = _measure(transport, concurrency, args)
+                streams_per_core = chunks / cpu / stream_rate if cpu > 0 else float("inf")
+                per_core.setdefault(transport, []).append(streams_per_core)
+                itl_text = f"{itl_p99:.4f}" if itl_p99 is not None else "N/A"
+                print(f"{transport:<10}{concurrency:>8}{wall:>10.2f}{cpu:>10.2f}{cpu / wall:>9.0%}"
+                      f"{cpu / max(chunks, 1) * 1e6:>14.1f}{itl_text:>13}{streams_per_core:>16.0f}")
+        best = {transport: max(values) for transport, values in per_core.items()}
+        print(f"单核可维持的最大流数: " + ", ".join(f"{transport} {value:.0f}" for transport, value in best.items())
+              + f"  (raw / openai = {best['raw'] / best['openai']:.1f}x)")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
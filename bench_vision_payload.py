@@ -0,0 +1,92 @@
+"""
+视觉请求体构造的微基准：对比逐请求深拷贝模板、共享图片内容、预序列化请求体三种方式
+每个请求的 CPU 耗时和峰值内存分配。
+
+三种方式都计入把请求体序列化为 HTTP 内容的开销（前两种由 SDK 在发送时执行 json.dumps，这里直接模拟）。
+
+用法: python bench_vision_payload.py --iterations 500
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from llm_benchmark import _load_vision_messages_template
+from vision_payload import VisionPayloadBuilder
+
+
+def _legacy_body(base_messages, timestamp_label, model, max_tokens):
+    """原实现：通过 JSON 往返深拷贝整个模板后追加时间戳。"""
+    messages = json.loads(json.dumps(base_messages))
+    for message in messages:
+        role = message.get("role")
+        if role == "system" and isinstance(message.get("content"), str):
+            message["content"] = f"{message['content']}\n\n[timestamp:{timestamp_label}]"
+        elif role == "user":
+            content = message.get("content")
+            if isinstance(content, list):
+                content.append({"type": "text", "text": f"timestamp:{timestamp_label}"})
+            elif isinstance(content, str):
+                message["content"] = f"{content}\n\n[timestamp:{timestamp_label}]"
+    body = {"model": model, "messages": messages, "max_tokens": max_tokens, "stream": True,
+            "stream_options": {"include_usage": True}}
+    return json.dumps(body).encode("utf-8")
+
+
+def _shared_body(builder, timestamp_label, model, max_tokens):
+    body = {"model": model, "messages": builder.messages(timestamp_label), "max_tokens": max_tokens, "stream": True,
+            "stream_options": {"include_usage": True}}
+    return json.dumps(body).encode("utf-8")
+
+
+def _prebuilt_body(builder, timestamp_label, model, max_tokens):
+    return builder.body_bytes(timestamp_label, model, max_tokens)
+
+
+def _measure(build, iterations):
+    """返回 (每次构造的 CPU 微秒数, 单次构造的峰值分配字节数)。"""
+    labels = [f"2025-01-01 00:00:{i % 60:02d}" for i in range(iterations)]
+    build(labels[0])  # 预热缓存
+    cpu_start = time.process_time()
+    for label in labels:
+        build(label)
+    cpu_per_call = (time.process_time() - cpu_start) / iterations * 1e6
+
+    tracemalloc.start()
+    peaks = []
+    for label in labels[:min(iterations, 50)]:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        build(label)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    return cpu_per_call, max(peaks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vision request body construction")
+    parser.add_argument("--iterations", type=int, default=500, help="Requests to build per strategy (default: 500)")
+    parser.add_argument("--model", type=str, default="vision-model", help="Model name written into the body")
+    parser.add_argument("--output_tokens", type=int, default=50, help="max_tokens written into the body")
+    args = parser.parse_args()
+
+    base_messages = _load_vision_messages_template()
+    builder = VisionPayloadBuilder(base_messages)
+    strategies = [
+        ("深拷贝模板 (原实现)", lambda label: _legacy_body(base_messages, label, args.model, args.output_tokens)),
+        ("共享图片内容", lambda label: _shared_body(builder, label, args.model, args.output_tokens)),
+        ("预序列化请求体", lambda label: _prebuilt_body(builder, label, args.model, args.output_tokens)),
+    ]
+
+    body_size = len(_prebuilt_body(builder, "2025-01-01 00:00:00", args.model, args.output_tokens))
+    print(f"请求体大小: {body_size / 1024:.1f} KB, 每种方式构造 {args.iterations} 次")
+    print(f"{'方式':<16}{'CPU/请求(微秒)':>16}{'峰值分配/请求(KB)':>20}")
+    baseline_cpu = None
+    for name, build in strategies:
+        cpu_per_call, peak_bytes = _measure(build, args.iterations)
+        baseline_cpu = baseline_cpu or cpu_per_call
+        print(f"{name:<16}{cpu_per_call:>16.1f}{peak_bytes / 1024:>20.1f}   ({baseline_cpu / cpu_per_call:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,565 @@
+"""
+多机分布式压测：agent 在各压测机上常驻，按协调端的指令执行 run_benchmark 阶段；
+协调端下发配置和统一开始时间，通过 TCP 收集各 agent 的原始请求记录并合并出一份报告。
+
+通信协议为按行分隔的 JSON 消息：
+    协调端 -> agent: {"type": "ping"} / {"type": "run", "phase": {...}, "start_at": ...}
+    agent -> 协调端: {"type": "pong", "time": ...} / {"type": "started", "count": ...} / {"type": "records", "records": [...]} /
+                     {"type": "heartbeat"} / {"type": "done"} / {"type": "error", "error": "..."}
+执行阶段期间 agent 每隔 _HEARTBEAT_INTERVAL 秒发送一次心跳，协调端据此判断 agent 是否失联。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+import numpy as np
+from openai import DEFAULT_MAX_RETRIES
+
+from llm_benchmark import (
+    ARRIVAL_DISTRIBUTIONS,
+    TRANSPORTS,
+    BenchmarkObserver,
+    assemble_results,
+    build_request_kwargs,
+    count_issued_requests,
+    create_llm_client,
+    load_config,
+    load_shard,
+    notify_start,
+    open_measurement_window,
+    open_metrics_observer,
+    open_replay_drift,
+    open_sample_writer,
+    open_timeseries_writer,
+    output_config,
+    print_results,
+    run_benchmark_multiprocess,
+    split_evenly,
+    trace_shard,
+    without_fixed_concurrency,
+    workload_config,
+)
+from http_client import DEFAULT_KEEPALIVE_EXPIRY, connection_pool_config
+from sessions import THINK_DISTRIBUTIONS, session_config
+from trace_replay import PROMPT_SOURCES, trace_config
+from vision_workload import vision_workload_config
+
+DEFAULT_AGENT_PORT = 9100
+# 记录中需要在 agent 时钟和协调端时钟之间换算的字段
+_RECORD_TIME_FIELDS = ("start_time", "send_time", "first_token_time", "end_time")
+# 单条消息上限，避免一批记录过大时触发 StreamReader 的默认 64KB 限制
+_STREAM_LIMIT = 64 * 1024 * 1024
+# 执行阶段期间 agent 发送心跳的间隔（秒）
+_HEARTBEAT_INTERVAL = 2.0
+# 按时长运行时，截止时间在时长和单个请求最长耗时之外再留的余量（秒），覆盖记录回传的攒批间隔和网络延迟
+_FINISH_MARGIN = 2.0
+
+
+def _json_default(value):
+    # 记录中的 ITL 等字段为 numpy 数组/标量
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _encode_message(message):
+    return (json.dumps(message, ensure_ascii=False, default=_json_default) + "\n").encode("utf-8")
+
+
+async def _read_message(reader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("对端已关闭连接")
+    return json.loads(line)
+
+
+class _ConnectionStreamer(BenchmarkObserver):
+    """agent 端观察者：把请求记录和已发出的请求数分批写回协调端连接（攒满一批或超过 flush_interval 秒时发送）。"""
+
+    def __init__(self, writer, batch_size=64, flush_interval=0.5):
+        self.writer = writer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.started = 0
+        self.last_flush = time.monotonic()
+
+    def on_request_start(self):
+        self.started += 1
+        self._maybe_flush()
+
+    def on_record(self, record):
+        self.buffer.append(record)
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if len(self.buffer) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if self.started:
+            self.writer.write(_encode_message({"type": "started", "count": self.started}))
+            self.started = 0
+        if self.buffer:
+            self.writer.write(_encode_message({"type": "records", "records": self.buffer}))
+            self.buffer = []
+
+
+async def _send_heartbeats(writer):
+    while True:
+        await asyncio.sleep(_HEARTBEAT_INTERVAL)
+        writer.write(_encode_message({"type": "heartbeat"}))
+
+
+def _client_key(phase):
+    return json.dumps([phase.get("llm_url"), phase.get("api_key"), phase.get("auth_config"), phase.get("pool_config"),
+                       phase.get("transport")],
+                      sort_keys=True)
+
+
+async def _handle_agent_connection(reader, writer, token):
+    peer = writer.get_extra_info("peername")
+    logging.info(f"协调端已连接: {peer}")
+    # 单进程执行时各阶段复用同一客户端（按端点、认证和连接池配置区分），连接在阶段之间保持
+    clients = {}
+    try:
+        while True:
+            try:
+                message = await _read_message(reader)
+            except ConnectionError:
+                break
+
+            if token and message.get("token") != token:
+                writer.write(_encode_message({"type": "error", "error": "invalid token"}))
+                await writer.drain()
+                break
+
+            if message["type"] == "ping":
+                writer.write(_encode_message({"type": "pong", "time": time.time()}))
+            elif message["type"] == "run":
+                phase = message["phase"]
+                if phase.get("trace"):
+                    scope = f"回放 {phase['trace']['path']} (分片 {phase['trace']['shard_index']}/{phase['trace']['shard_count']})"
+                elif phase["load"]["duration"]:
+                    scope = f"时长 {phase['load']['duration']:g} 秒"
+                else:
+                    scope = f"请求数 {phase['num_requests']}"
+                logging.info(f"开始执行阶段: {scope}, 并发数 {phase['concurrency']}")
+                streamer = _ConnectionStreamer(writer)
+                processes = phase.pop("processes", 1)
+                heartbeat = asyncio.create_task(_send_heartbeats(writer))
+                try:
+                    client = None
+                    if processes == 1:
+                        key = _client_key(phase)
+                        if key not in clients:
+                            clients[key] = create_llm_client(phase["llm_url"], phase["api_key"], phase["auth_config"],
+                                                             phase.get("pool_config"), phase.get("transport", "openai"))
+                        client = clients[key]
+                    result = await run_benchmark_multiprocess(
+                        processes,
+                        observers=[streamer],
+                        start_at=message["start_at"],
+                        client=client,
+                        **phase
+                    )
+                    streamer.flush()
+                    # 分到的并发数或请求数少于进程数时实际使用的进程更少，单进程执行的结果中没有该字段
+                    writer.write(_encode_message({"type": "done", "processes": result.get("processes", 1)}))
+                except Exception as exc:
+                    streamer.flush()
+                    logging.error(f"阶段执行失败: {exc}")
+                    writer.write(_encode_message({"type": "error", "error": f"{type(exc).__name__}: {exc}"}))
+                finally:
+                    heartbeat.cancel()
+            else:
+                writer.write(_encode_message({"type": "error", "error": f"unknown message type {message['type']}"}))
+            await writer.drain()
+    finally:
+        for client in clients.values():
+            await client.close()
+        writer.close()
+        logging.info(f"协调端已断开: {peer}")
+
+
+async def run_agent(host="127.0.0.1", port=DEFAULT_AGENT_PORT, token=None):
+    """启动 agent 并一直运行，等待协调端下发测试阶段。"""
+    server = await asyncio.start_server(
+        lambda reader, writer: _handle_agent_connection(reader, writer, token),
+        host, port, limit=_STREAM_LIMIT
+    )
+    logging.info(f"压测 agent 已启动: {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+class _AgentConnection:
+    def __init__(self, address, reader, writer):
+        self.address = address
+        self.reader = reader
+        self.writer = writer
+        # agent 时钟 - 协调端时钟
+        self.clock_offset = 0.0
+
+
+class DistributedCoordinator:
+    """
+    连接一组 agent，测量各自的时钟偏差，把一轮测试按 agent 拆分后同步开始，
+    并在协调端时钟下合并所有原始记录计算全局指标。
+    """
+
+    def __init__(self, agents, token=None, start_delay=5.0, agent_timeout=30.0):
+        """
+        :param agents: agent 地址列表，形如 ["10.0.0.2:9100", "10.0.0.3:9100"]
+        :param start_delay: 下发配置到统一开始时间之间的余量（秒），需覆盖 agent 启动子进程的耗时
+        :param agent_timeout: 阶段开始后 agent 连续多久（秒）没有任何消息（含心跳）视为失联
+        """
+        self.agent_addresses = list(agents)
+        self.token = token
+        self.start_delay = start_delay
+        self.agent_timeout = agent_timeout
+        self.connections = []
+
+    async def connect(self):
+        for address in self.agent_addresses:
+            host, _, port = address.rpartition(":")
+            reader, writer = await asyncio.open_connection(host or "127.0.0.1", int(port), limit=_STREAM_LIMIT)
+            connection = _AgentConnection(address, reader, writer)
+            await self._sync_clock(connection)
+            self.connections.append(connection)
+            logging.info(f"已连接 agent {address}, 时钟偏差 {connection.clock_offset * 1000:.1f} 毫秒")
+
+    async def close(self):
+        for connection in self.connections:
+            connection.writer.close()
+        self.connections = []
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _send(self, connection, message):
+        if self.token:
+            message = dict(message, token=self.token)
+        connection.writer.write(_encode_message(message))
+        await connection.writer.drain()
+
+    async def _sync_clock(self, connection, samples=5):
+        """类 NTP 测量：取往返时间最短的一次样本估算时钟偏差。"""
+        best_rtt = None
+        for _ in range(samples):
+            sent = time.time()
+            await self._send(connection, {"type": "ping"})
+            reply = await _read_message(connection.reader)
+            received = time.time()
+            if reply.get("type") != "pong":
+                raise RuntimeError(f"agent {connection.address} 握手失败: {reply.get('error', reply)}")
+            rtt = received - sent
+            if best_rtt is None or rtt < best_rtt:
+                best_rtt = rtt
+                connection.clock_offset = reply["time"] - (sent + received) / 2
+
+    def _drop(self, connection):
+        """未完成阶段的连接上可能还有迟到的记录，关闭后不再用于后续阶段。"""
+        connection.writer.close()
+        if connection in self.connections:
+            self.connections.remove(connection)
+
+    async def _collect(self, connection, observers, start_at, deadline=None):
+        """
+        接收单个 agent 的记录直到完成，返回 (错误信息, 实际使用的进程数)，成功时错误信息为 None。
+        超过 deadline 仍未完成、超过 agent_timeout 没有消息或连接断开时视为未完成，断开该 agent。
+        """
+        while True:
+            # 开始之前 agent 在启动子进程和准备语料，空闲超时从开始时间起算
+            timeout = max(start_at - time.time(), 0.0) + self.agent_timeout
+            if deadline is not None:
+                timeout = min(timeout, max(deadline - time.time(), 0.0))
+            try:
+                message = await asyncio.wait_for(_read_message(connection.reader), timeout)
+            except asyncio.TimeoutError:
+                self._drop(connection)
+                if deadline is not None and time.time() >= deadline:
+                    return "超过阶段截止时间仍未完成", 0
+                return f"超过 {self.agent_timeout:g} 秒没有回传任何消息", 0
+            except ConnectionError as exc:
+                self._drop(connection)
+                return f"连接断开: {exc}", 0
+            if message["type"] == "started":
+                for _ in range(message["count"]):
+                    for observer in observers:
+                        observer.on_request_start()
+            elif message["type"] == "records":
+                for record in message["records"]:
+                    for field in _RECORD_TIME_FIELDS:
+                        if record.get(field) is not None:
+                            record[field] -= connection.clock_offset
+                    for observer in observers:
+                        observer.on_record(record)
+            elif message["type"] == "done":
+                return None, message.get("processes", 1)
+            elif message["type"] == "error":
+                return message["error"], 0
+
+    async def run_phase(self, num_requests, concurrency, request_timeout, output_tokens, llm_url, api_key, model, use_long_context, long_context_length=20000, auth_config=None, vision_model=False,
+                        load=None, workload=None, output=None, processes_per_agent=1, observers=None, pool_config=None,
+                        transport="openai", request_mix=None, trace=None, session=None):
+        """
+        与 run_benchmark 参数一致，请求数、并发数和到达速率均匀拆分给各 agent。
+        workload 中的 prompt_file 和图片目录为各 agent 本机上的路径。
+        :param load: 按时长运行时各 agent 运行相同的时长；预热和收尾排除在协调端按合并后的记录计算
+        :param output: 样本文件、时间序列和 Prometheus 指标均在协调端输出，汇总所有 agent 的请求事件
+        :param observers: 额外的观察者，接收各 agent 回传的请求开始事件和记录（如实时面板）
+        :param pool_config: 各 agent 压测进程的连接池配置；agent 单进程执行时客户端在阶段之间复用
+        :param transport: 各 agent 客户端的传输方式（"openai" 或 "raw"）
+        :param request_mix: 场景文件中的加权请求类别，其中的 prompt_file / image_dir 同样为 agent 本机路径
+        :param trace: trace 回放配置，trace 文件为 agent 本机路径；各 agent 按行号交错回放，调度偏差在协调端汇总
+        :param session: 多轮会话配置，虚拟用户数（并发数）和总轮次数拆分给各 agent
+        """
+        load = load or load_config()
+        workload = workload or workload_config()
+        output = output or output_config()
+        duration = load["duration"]
+        if not self.connections:
+            await self.connect()
+        num_agents = max(1, min(len(self.connections), concurrency if duration or trace else min(concurrency, num_requests)))
+        connections = self.connections[:num_agents]
+        request_shards = split_evenly(num_requests, num_agents) if not duration and not trace else [None] * num_agents
+        concurrency_shards = split_evenly(concurrency, num_agents)
+
+        start_at = time.time() + self.start_delay
+        # 按时长运行时 agent 最晚在时长结束后再等最后一批请求超时；openai SDK 超时后还会重试
+        request_budget = request_timeout * (1 if transport == "raw" else DEFAULT_MAX_RETRIES + 1)
+        deadline = start_at + duration + request_budget + _FINISH_MARGIN if duration else None
+        for index, connection in enumerate(connections):
+            phase = {
+                "num_requests": request_shards[index],
+                "concurrency": concurrency_shards[index],
+                "request_timeout": request_timeout,
+                "output_tokens": output_tokens,
+                "llm_url": llm_url,
+                "api_key": api_key,
+                "model": model,
+                "use_long_context": use_long_context,
+                "long_context_length": long_context_length,
+                "auth_config": auth_config,
+                "vision_model": vision_model,
+                "load": load_shard(load, index, num_agents),
+                "workload": workload,
+                "processes": processes_per_agent,
+                "pool_config": pool_config,
+                "transport": transport,
+                "request_mix": request_mix,
+                "trace": trace_shard(trace, index, num_agents) if trace else None,
+                "session": session,
+            }
+            # 开始时间换算到各 agent 自己的时钟
+            await self._send(connection, {"type": "run", "phase": phase, "start_at": start_at + connection.clock_offset})
+
+        aggregator = open_measurement_window(concurrency, without_fixed_concurrency(load["arrival_rate"], trace, session),
+                                             load, output["exact_percentiles"])
+        observers = [aggregator] + list(observers or [])
+        drift = open_replay_drift(trace)
+        if drift:
+            observers.append(drift)
+        metrics_observer = await open_metrics_observer(output, concurrency)
+        if metrics_observer:
+            observers.append(metrics_observer)
+        sample_writer = open_sample_writer(output["samples_file"])
+        if sample_writer:
+            observers.append(sample_writer)
+        timeseries_writer = open_timeseries_writer(output["timeseries_file"], output["timeseries_interval"])
+        if timeseries_writer:
+            observers.append(timeseries_writer)
+        notify_start(observers, start_at)
+        try:
+            outcomes = await asyncio.gather(*(self._collect(connection, observers, start_at, deadline)
+                                              for connection in connections))
+        finally:
+            if sample_writer:
+                sample_writer.close()
+            if timeseries_writer:
+                timeseries_writer.close()
+        errors = [error for error, _ in outcomes]
+        failed_agents = [{"agent": connection.address, "error": error}
+                         for connection, error in zip(connections, errors) if error]
+        for failed in failed_agents:
+            logging.error(f"agent {failed['agent']} 执行失败: {failed['error']}")
+        if all(errors) and not aggregator.requests:
+            raise RuntimeError(f"所有 agent 均执行失败: {errors[0]}")
+
+        aggregator.finish()
+        end_time = aggregator.last_end_time or time.time()
+        issued_requests, _ = count_issued_requests(None if trace or duration else num_requests, aggregator, observers)
+        summary = aggregator.summary(issued_requests, end_time - start_at)
+        request_kwargs = build_request_kwargs(model, output_tokens, request_timeout, use_long_context, long_context_length,
+                                              vision_model, workload, request_mix)
+        return assemble_results(summary, aggregator.reported_requests(issued_requests), concurrency, request_kwargs,
+                                load["arrival_rate"], load["arrival_distribution"],
+                                agents=num_agents, processes=sum(processes for _, processes in outcomes),
+                                failed_agents=failed_agents or None,
+                                samples_file=output["samples_file"],
+                                duration=duration, timeseries=timeseries_writer.summary() if timeseries_writer else None,
+                                trace_replay=drift.summary() if drift else None, session=session, transport=transport)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed LLM benchmark agent/coordinator")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    agent_parser = subparsers.add_parser("agent", help="Run a load-generator agent that waits for phases")
+    agent_parser.add_argument("--host", type=str, default="127.0.0.1",
+                              help="Address to listen on; use 0.0.0.0 to accept remote coordinators (default: 127.0.0.1)")
+    agent_parser.add_argument("--port", type=int, default=DEFAULT_AGENT_PORT, help=f"Port to listen on (default: {DEFAULT_AGENT_PORT})")
+    agent_parser.add_argument("--token", type=str, help="Shared secret the coordinator must present")
+
+    coordinator_parser = subparsers.add_parser("coordinator", help="Run one phase across a set of agents")
+    coordinator_parser.add_argument("--agents", type=str, required=True, help="Comma separated agent addresses, e.g. host1:9100,host2:9100")
+    coordinator_parser.add_argument("--token", type=str, help="Shared secret presented to the agents")
+    coordinator_parser.add_argument("--num_requests", type=int, help="Number of requests to make (required unless --duration is set)")
+    coordinator_parser.add_argument("--concurrency", type=int, required=True, help="Number of concurrent requests")
+    coordinator_parser.add_argument("--request_timeout", type=int, default=60, help="Timeout for each request in seconds (default: 60)")
+    coordinator_parser.add_argument("--output_tokens", type=int, default=50, help="Number of output tokens (default: 50)")
+    coordinator_parser.add_argument("--llm_url", type=str, required=True, help="URL of the LLM server")
+    coordinator_parser.add_argument("--api_key", type=str, required=False, default="default", help="API key for LLM server")
+    coordinator_parser.add_argument("--model", type=str, default="deepseek-r1", help="Model name to use for inference (default: deepseek-r1)")
+    coordinator_parser.add_argument("--use_long_context", action="store_true", help="Use long context prompt pairs instead of short prompts")
+    coordinator_parser.add_argument("--long_context_length", type=int, default=20000,
+                                    help="Target length for long context prompts in characters (default: 20000)")
+    coordinator_parser.add_argument("--auth_type", type=str, choices=['auto', 'bearer', 'basic', 'none'], default='auto',
+                                    help="Authentication strategy. auto=detect based on provided credentials.")
+    coordinator_parser.add_argument("--basic_auth_user", type=str, help="Username for HTTP Basic auth")
+    coordinator_parser.add_argument("--basic_auth_password", type=str, help="Password for HTTP Basic auth")
+    coordinator_parser.add_argument("--auth_header", type=str, help="Override Authorization header (e.g. 'Basic xxxx')")
+    coordinator_parser.add_argument("--vision_model", action="store_true", help="Flag to indicate the target model expects vision inputs")
+    coordinator_parser.add_argument("--arrival_rate", type=float, default=None, help="Total target requests/second across all agents")
+    coordinator_parser.add_argument("--arrival_distribution", type=str, choices=list(ARRIVAL_DISTRIBUTIONS), default="poisson",
+                                    help="Inter-arrival distribution for open-loop mode (default: poisson)")
+    coordinator_parser.add_argument("--gamma_shape", type=float, default=0.5,
+                                    help="Shape of gamma inter-arrivals; <1 is burstier than Poisson (default: 0.5)")
+    coordinator_parser.add_argument("--arrival_seed", type=int, default=None,
+                                    help="Random seed for the arrival schedule; agent i uses seed + i")
+    coordinator_parser.add_argument("--processes_per_agent", type=int, default=1, help="Load-generator processes on each agent (default: 1)")
+    coordinator_parser.add_argument("--tokenizer", type=str,
+                                    help="Local tokenizer used when the server returns no usage: tiktoken:<encoding> or a tokenizer.json path")
+    coordinator_parser.add_argument("--no_stream_usage", action="store_true",
+                                    help="Do not send stream_options.include_usage (for servers that reject it)")
+    coordinator_parser.add_argument("--prompt_file", type=str,
+                                    help="JSONL prompt corpus used instead of the built-in prompts; must exist at this path on every agent")
+    coordinator_parser.add_argument("--prebuilt_body", action="store_true",
+                                    help="In vision mode, send a pre-serialized request body instead of letting the SDK serialize it per request")
+    coordinator_parser.add_argument("--image_dir", type=str,
+                                    help="Directory of images to send instead of the vision template; must exist on every agent")
+    coordinator_parser.add_argument("--images_per_request", type=int, default=1, help="Images attached to each request (default: 1)")
+    coordinator_parser.add_argument("--image_resolutions", type=str,
+                                    help="Comma separated max image sides to sweep, 0 keeps the original size, e.g. 512,1024,0")
+    coordinator_parser.add_argument("--jpeg_qualities", type=str,
+                                    help="Comma separated JPEG qualities to sweep, 0 keeps the original encoding, e.g. 50,85")
+    coordinator_parser.add_argument("--image_cache_mb", type=float, default=256, help="Memory budget for encoded images in MB (default: 256)")
+    coordinator_parser.add_argument("--exact_percentiles", action="store_true",
+                                    help="Keep every sample for exact percentiles instead of constant-memory DDSketch")
+    coordinator_parser.add_argument("--metrics_port", type=int,
+                                    help="Serve Prometheus metrics aggregated over all agents on this port at /metrics")
+    coordinator_parser.add_argument("--metrics_phase", type=str, default="run",
+                                    help="Value of the phase label on exported metrics (default: run)")
+    coordinator_parser.add_argument("--metrics_host", type=str, default="127.0.0.1",
+                                    help="Address the metrics server listens on; use 0.0.0.0 to allow remote scrapes (default: 127.0.0.1)")
+    coordinator_parser.add_argument("--warmup_requests", type=int, default=0,
+                                    help="Exclude the first N requests (by start time) from the reported metrics")
+    coordinator_parser.add_argument("--warmup_seconds", type=float, default=0.0,
+                                    help="Exclude requests sent during the first S seconds from the reported metrics")
+    coordinator_parser.add_argument("--cooldown_seconds", type=float, default=0.0,
+                                    help="Exclude requests finishing during the last S seconds from the reported metrics")
+    coordinator_parser.add_argument("--duration", type=float,
+                                    help="Run for this many seconds on every agent instead of a fixed number of requests")
+    coordinator_parser.add_argument("--timeseries_file", type=str, help="Write per-interval aggregates to this .csv or .jsonl file")
+    coordinator_parser.add_argument("--timeseries_interval", type=float, default=10.0,
+                                    help="Length of each time-series interval in seconds (default: 10)")
+    coordinator_parser.add_argument("--max_connections", type=int,
+                                    help="Connection pool limit per load-generator process (default: unlimited)")
+    coordinator_parser.add_argument("--max_keepalive_connections", type=int,
+                                    help="Idle keep-alive connections kept in the pool (default: unlimited)")
+    coordinator_parser.add_argument("--keepalive_expiry", type=float, default=DEFAULT_KEEPALIVE_EXPIRY,
+                                    help=f"Seconds an idle connection is kept alive (default: {DEFAULT_KEEPALIVE_EXPIRY:g})")
+    coordinator_parser.add_argument("--http2", action="store_true", help="Use HTTP/2 (h2 must be installed on every agent)")
+    coordinator_parser.add_argument("--transport", type=str, choices=list(TRANSPORTS), default="openai",
+                                    help="openai=official SDK; raw=lean httpx client parsing SSE directly (default: openai)")
+    coordinator_parser.add_argument("--trace", type=str,
+                                    help="Replay a request log (.jsonl/.csv, optionally .gz) that exists at this path on every agent; "
+                                         "--num_requests then limits the number of trace rows")
+    coordinator_parser.add_argument("--trace_time_scale", type=float, default=1.0,
+                                    help="Multiply trace inter-arrival times by this factor (default: 1)")
+    coordinator_parser.add_argument("--trace_prompt", type=str, choices=list(PROMPT_SOURCES), default="synthetic",
+                                    help="How to rebuild trace prompts: synthetic text or long-context corpus slices (default: synthetic)")
+    coordinator_parser.add_argument("--session_turns", type=str,
+                                    help="Run multi-turn conversations: turns per session, fixed (5) or a range (3-8); "
+                                         "--concurrency becomes the number of virtual users")
+    coordinator_parser.add_argument("--think_time", type=float, default=0.0,
+                                    help="Mean think time in seconds between turns of a session (default: 0)")
+    coordinator_parser.add_argument("--think_distribution", type=str, choices=list(THINK_DISTRIBUTIONS), default="exponential",
+                                    help="Think time distribution (default: exponential)")
+    coordinator_parser.add_argument("--session_turn_tokens", type=int, default=32,
+                                    help="Tokens in each follow-up user message of a session (default: 32)")
+    coordinator_parser.add_argument("--samples_file", type=str, help="Write raw per-request samples to this .npy/.parquet file")
+    coordinator_parser.add_argument("--start_delay", type=float, default=5.0,
+                                    help="Seconds between dispatching a phase and its synchronized start (default: 5)")
+    coordinator_parser.add_argument("--agent_timeout", type=float, default=30.0,
+                                    help="Give up on an agent that sends nothing, not even a heartbeat, for this many seconds (default: 30)")
+    coordinator_parser.add_argument("--output_format", type=str, choices=['json', 'line', 'both'], default='line',
+                                    help="Output format (json/line/both)")
+    args = parser.parse_args()
+
+    if args.command == "agent":
+        asyncio.run(run_agent(args.host, args.port, args.token))
+        return
+    if args.trace and (args.arrival_rate or args.duration):
+        coordinator_parser.error("--trace replays the trace's own arrival times; drop --arrival_rate / --duration")
+    if args.session_turns and (args.arrival_rate or args.trace or args.vision_model or args.image_dir):
+        coordinator_parser.error("--session_turns runs closed-loop text conversations; drop --arrival_rate / --trace / vision options")
+    if args.num_requests is None and not args.duration and not args.trace:
+        coordinator_parser.error("one of --num_requests, --duration or --trace is required")
+
+    auth_config = {
+        "auth_type": args.auth_type,
+        "basic_auth_user": args.basic_auth_user,
+        "basic_auth_password": args.basic_auth_password,
+        "auth_header": args.auth_header,
+    }
+
+    async def run_coordinator():
+        async with DistributedCoordinator(args.agents.split(","), token=args.token, start_delay=args.start_delay,
+                                          agent_timeout=args.agent_timeout) as coordinator:
+            return await coordinator.run_phase(
+                args.num_requests, args.concurrency, args.request_timeout, args.output_tokens,
+                args.llm_url, args.api_key, args.model, args.use_long_context, args.long_context_length,
+                auth_config, args.vision_model,
+                load=load_config(args.arrival_rate, args.arrival_distribution, args.gamma_shape, args.arrival_seed, args.duration,
+                                 warmup_requests=args.warmup_requests, warmup_seconds=args.warmup_seconds,
+                                 cooldown_seconds=args.cooldown_seconds),
+                workload=workload_config(args.tokenizer, not args.no_stream_usage, args.prompt_file, args.prebuilt_body,
+                                         vision_workload_config(args.image_dir, args.images_per_request,
+                                                                args.image_resolutions, args.jpeg_qualities,
+                                                                args.image_cache_mb)),
+                output=output_config(args.samples_file, args.timeseries_file, args.timeseries_interval,
+                                     args.exact_percentiles, args.metrics_port, args.metrics_host, args.metrics_phase),
+                processes_per_agent=args.processes_per_agent,
+                pool_config=connection_pool_config(args.max_connections, args.max_keepalive_connections,
+                                                   args.keepalive_expiry, args.http2),
+                transport=args.transport,
+                trace=trace_config(args.trace, args.trace_time_scale, args.trace_prompt, args.num_requests),
+                session=session_config(args.session_turns, args.think_time, args.think_distribution, args.session_turn_tokens)
+            )
+
+    print_results(asyncio.run(run_coordinator()), args.output_format)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+延迟、长度等参数的分布描述解析，模拟服务（mock_server.py）和场景文件（scenario.py）共用。
+"""
+import math
+import random
+
+
+def parse_distribution(spec, rng=None):
+    """
+    把分布描述解析为采样函数，单位为秒（或个数）。rng 为采样使用的 random.Random 实例，未指定时使用全局 random。支持:
+        "0.2" / "const:0.2"        固定值
+        "uniform:0.1,0.3"          均匀分布
+        "exp:0.2"                  均值为 0.2 的指数分布
+        "normal:0.2,0.05"          正态分布（截断到 >= 0）
+        "lognormal:0.2,0.5"        中位数 0.2、sigma 0.5 的对数正态分布
+    """
+    if isinstance(spec, (int, float)):
+        value = float(spec)
+        return lambda: value
+    kind, _, params = str(spec).partition(":")
+    if not params:
+        value = float(kind)
+        return lambda: value
+    values = [float(v) for v in params.split(",")]
+    # random 模块的函数与 random.Random 实例的方法同名，未指定 rng 时直接使用全局状态
+    rng = rng or random
+    if kind == "const":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == "exp":
+        return lambda: rng.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0
+    if kind == "normal":
+        return lambda: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        mu = math.log(values[0])
+        return lambda: rng.lognormvariate(mu, values[1])
+    raise ValueError(f"Unsupported distribution '{spec}'")
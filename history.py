@@ -0,0 +1,418 @@
+"""
+基准测试运行历史与回归对比。
+
+每次运行都会覆盖 benchmark_results.json / .png，无法回头比较。HistoryStore 把每次运行追加到本地 SQLite 数据库，
+只插入不修改：
+    - runs 表：时间、模型、端点、运行配置（JSON，不含密钥）及其哈希、模式、标签，按 (model, endpoint, config_hash, created_at) 建索引；
+    - phases 表：每轮测试的结果字典（JSON）；
+    - samples 表：每轮成功请求的 TTFT、端到端延迟和单请求 ITL 中位数，超过 max_samples 时为均匀水库抽样，
+      以 numpy 定长数组的字节存储；
+    - baselines 表：命名基线，同名的最新一条生效。
+
+compare 命令按轮次（并发数，以及场景阶段、到达速率、前缀缓存参数、扫描格点等）对齐两次运行，报告 RPS、TTFT P50、
+ITL P50 和 P99 延迟的变化和显著性：
+    - 延迟类指标用存储的样本做 bootstrap，得到差值的 95% 置信区间和双侧 p 值；ITL 以请求为单位（单请求 ITL 中位数），
+      避免同一请求内 token 间隔相关导致过于乐观；
+    - RPS 把成功请求数视为泊松计数，用两样本速率的 z 检验；
+    - 变差超过阈值（百分比）且显著（p < alpha，无样本时只看阈值）记为回归，存在回归时以退出码 1 退出，可用于发布门禁。
+
+用法：
+    python history.py list [--model M]
+    python history.py baseline <run>               # 设为基线（--name 默认 default）
+    python history.py compare <candidate> [<baseline>] [--threshold 5] [--alpha 0.05]
+run 可以是运行 id、latest 或基线名；compare 不指定基线时依次使用名为 default 的基线、
+同一模型 / 端点 / 配置的上一次运行。
+"""
+import argparse
+import datetime
+import json
+import math
+import random
+import sqlite3
+import sys
+
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+from llm_benchmark import BenchmarkObserver
+
+DEFAULT_HISTORY_DB = "benchmark_history.db"
+DEFAULT_MAX_SAMPLES = 5000
+HISTORY_SAMPLE_DTYPE = np.dtype([("ttft", "f4"), ("latency", "f4"), ("itl", "f4")])
+
+# 对比的指标：(名称, 结果中的路径, 样本字段, 样本统计的分位数, 越大越好)
+COMPARE_METRICS = (
+    ("RPS", ("requests_per_second",), None, None, True),
+    ("TTFT P50", ("time_to_first_token", "p50"), "ttft", 50, False),
+    ("ITL P50", ("inter_token_latency", "p50"), "itl", 50, False),
+    ("延迟 P99", ("latency", "p99"), "latency", 99, False),
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    model TEXT,
+    endpoint TEXT,
+    config_hash TEXT,
+    config TEXT,
+    mode TEXT,
+    label TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_lookup ON runs (model, endpoint, config_hash, created_at);
+CREATE TABLE IF NOT EXISTS phases (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    phase_index INTEGER NOT NULL,
+    concurrency INTEGER,
+    result TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_phases_run ON phases (run_id, phase_index);
+CREATE TABLE IF NOT EXISTS samples (
+    phase_id INTEGER PRIMARY KEY REFERENCES phases (id),
+    count INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS baselines (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_baselines_name ON baselines (name, id);
+"""
+
+
+def _now():
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+class SampleReservoir(BenchmarkObserver):
+    """
+    本轮成功请求的 TTFT、延迟和单请求 ITL 中位数，最多保留 capacity 个（水库抽样），用于对比时的显著性检验。
+    """
+
+    def __init__(self, capacity=DEFAULT_MAX_SAMPLES, seed=0):
+        self.capacity = capacity
+        self.rows = []
+        self.seen = 0
+        self.rng = random.Random(seed)
+
+    def on_record(self, record):
+        if record["status"] != "success" or record.get("latency") is None:
+            return
+        itl = record.get("itl")
+        row = (record.get("ttft") if record.get("ttft") is not None else math.nan, record["latency"],
+               float(np.median(itl)) if itl is not None and len(itl) else math.nan)
+        self.seen += 1
+        if len(self.rows) < self.capacity:
+            self.rows.append(row)
+            return
+        index = self.rng.randrange(self.seen)
+        if index < self.capacity:
+            self.rows[index] = row
+
+    def to_array(self):
+        return np.array(self.rows, dtype=HISTORY_SAMPLE_DTYPE)
+
+
+class HistoryRecorder:
+    """在各轮测试中收集样本，运行结束后与结果一起写入 HistoryStore。续跑时来自检查点的轮次没有样本。"""
+
+    def __init__(self, max_samples=DEFAULT_MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.phases = []
+
+    def sample_observer(self):
+        return SampleReservoir(self.max_samples, seed=len(self.phases))
+
+    def add(self, result, reservoir):
+        self.phases.append((result, reservoir))
+
+    def samples_for(self, result):
+        """按对象身份查找某轮结果的样本。"""
+        for recorded, reservoir in self.phases:
+            if recorded is result:
+                return reservoir.to_array()
+        return None
+
+
+class HistoryStore:
+    """运行历史的 SQLite 存储，见模块说明。"""
+
+    def __init__(self, path=DEFAULT_HISTORY_DB):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def save_run(self, results, model, endpoint, config, config_hash, mode, label=None, samples_for=None):
+        """
+        在一个事务内追加一次运行及其各轮结果和样本，返回运行 id。
+        :param samples_for: result -> 样本数组或 None
+        """
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT INTO runs (created_at, model, endpoint, config_hash, config, mode, label) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (_now(), model, endpoint, config_hash, json.dumps(config, ensure_ascii=False, default=str), mode, label))
+            run_id = cursor.lastrowid
+            for index, result in enumerate(results):
+                cursor = self.db.execute(
+                    "INSERT INTO phases (run_id, phase_index, concurrency, result) VALUES (?, ?, ?, ?)",
+                    (run_id, index, result.get("concurrency"), json.dumps(result, ensure_ascii=False)))
+                samples = samples_for(result) if samples_for else None
+                if samples is not None and len(samples):
+                    self.db.execute("INSERT INTO samples (phase_id, count, data) VALUES (?, ?, ?)",
+                                    (cursor.lastrowid, len(samples), samples.tobytes()))
+        return run_id
+
+    def set_baseline(self, name, run_id):
+        self.run(run_id)
+        with self.db:
+            self.db.execute("INSERT INTO baselines (name, run_id, created_at) VALUES (?, ?, ?)", (name, run_id, _now()))
+
+    def baseline(self, name):
+        row = self.db.execute("SELECT run_id FROM baselines WHERE name = ? ORDER BY id DESC LIMIT 1", (name,)).fetchone()
+        return row["run_id"] if row else None
+
+    def run(self, run_id):
+        row = self.db.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"run {run_id} not found in {self.path}")
+        return dict(row)
+
+    def resolve(self, ref):
+        """把运行 id、latest 或基线名解析为运行 id。"""
+        if str(ref).isdigit():
+            return self.run(int(ref))["id"]
+        if ref == "latest":
+            row = self.db.execute("SELECT id FROM runs ORDER BY id DESC LIMIT 1").fetchone()
+            if row is None:
+                raise ValueError(f"no runs in {self.path}")
+            return row["id"]
+        run_id = self.baseline(ref)
+        if run_id is None:
+            raise ValueError(f"'{ref}' is neither a run id, 'latest' nor a baseline name")
+        return run_id
+
+    def previous_run(self, run_id):
+        """同一模型、端点和配置哈希的上一次运行，没有时返回 None。"""
+        run = self.run(run_id)
+        row = self.db.execute(
+            "SELECT id FROM runs WHERE model IS ? AND endpoint IS ? AND config_hash IS ? AND id < ? "
+            "ORDER BY created_at DESC, id DESC LIMIT 1",
+            (run["model"], run["endpoint"], run["config_hash"], run_id)).fetchone()
+        return row["id"] if row else None
+
+    def list_runs(self, model=None, endpoint=None, limit=20):
+        query = ("SELECT runs.*, COUNT(phases.id) AS phases FROM runs LEFT JOIN phases ON phases.run_id = runs.id "
+                 "WHERE (? IS NULL OR model = ?) AND (? IS NULL OR endpoint = ?) GROUP BY runs.id ORDER BY runs.id DESC LIMIT ?")
+        return [dict(row) for row in self.db.execute(query, (model, model, endpoint, endpoint, limit))]
+
+    def phases(self, run_id):
+        """返回 [(结果字典, 样本数组或 None)]，按轮次顺序。"""
+        rows = self.db.execute(
+            "SELECT phases.result, samples.data FROM phases LEFT JOIN samples ON samples.phase_id = phases.id "
+            "WHERE phases.run_id = ? ORDER BY phases.phase_index", (run_id,))
+        return [(json.loads(row["result"]), np.frombuffer(row["data"], dtype=HISTORY_SAMPLE_DTYPE) if row["data"] else None)
+                for row in rows]
+
+
+def phase_label(result):
+    """用于对齐两次运行的轮次标识：并发数和区分同一并发数下不同轮次的参数。"""
+    parts = [f"并发 {result.get('concurrency')}"]
+    if result.get("phase"):
+        parts.insert(0, str(result["phase"]))
+    if result.get("arrival_rate"):
+        parts.append(f"{result['arrival_rate']:g} req/s")
+    if result.get("prefix_cache"):
+        parts.append(f"前缀 {result['prefix_cache']['prefix_tokens']} 命中率 {result['prefix_cache']['hit_rate']:g}")
+    if result.get("sweep_cell"):
+        cell = result["sweep_cell"]
+        parts.append(f"输入 {cell['input_tokens']} 输出 {cell['max_tokens']}")
+    return ", ".join(parts)
+
+
+def _align(baseline_phases, candidate_phases):
+    """按轮次标识配对，同一标识出现多次时按出现顺序配对。"""
+    remaining = {}
+    for phase in baseline_phases:
+        remaining.setdefault(phase_label(phase[0]), []).append(phase)
+    pairs = []
+    for phase in candidate_phases:
+        matches = remaining.get(phase_label(phase[0]))
+        if matches:
+            pairs.append((phase_label(phase[0]), matches.pop(0), phase))
+    return pairs
+
+
+def _metric(result, path):
+    value = result
+    for key in path:
+        value = (value or {}).get(key)
+    return value
+
+
+def _bootstrap(baseline, candidate, percentile, iterations, rng, chunk=100):
+    """分位数差值（候选 - 基线）的 bootstrap 分布，返回 (95% 置信区间, 双侧 p 值)。"""
+    diffs = []
+    for start in range(0, iterations, chunk):
+        size = min(chunk, iterations - start)
+        base = np.percentile(rng.choice(baseline, (size, len(baseline))), percentile, axis=1)
+        cand = np.percentile(rng.choice(candidate, (size, len(candidate))), percentile, axis=1)
+        diffs.append(cand - base)
+    diffs = np.concatenate(diffs)
+    p_value = min(1.0, 2 * min(np.mean(diffs <= 0), np.mean(diffs >= 0)))
+    return (float(np.percentile(diffs, 2.5)), float(np.percentile(diffs, 97.5))), float(p_value)
+
+
+def _rate_test(baseline, candidate):
+    """两个泊松速率之差的 z 检验（双侧 p 值）：成功请求数 / 计时窗口。"""
+    n1, t1 = baseline["successful_requests"], baseline.get("total_time") or 0
+    n2, t2 = candidate["successful_requests"], candidate.get("total_time") or 0
+    if t1 <= 0 or t2 <= 0 or n1 + n2 == 0:
+        return None
+    stderr = math.sqrt(n1 / t1 ** 2 + n2 / t2 ** 2)
+    z = (n2 / t2 - n1 / t1) / stderr
+    return math.erfc(abs(z) / math.sqrt(2))
+
+
+def compare_runs(baseline_phases, candidate_phases, threshold=5.0, alpha=0.05, iterations=1000, seed=0):
+    """
+    对齐两次运行的各轮并计算各指标的变化。
+    :param threshold: 判定回归的变差百分比
+    :return: 每个 (轮次, 指标) 一行的列表，regression 为 True 表示超过阈值且显著
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for label, (base, base_samples), (cand, cand_samples) in _align(baseline_phases, candidate_phases):
+        for name, path, field, percentile, higher_is_better in COMPARE_METRICS:
+            before, after = _metric(base, path), _metric(cand, path)
+            row = {"phase": label, "metric": name, "baseline": before, "candidate": after, "delta_pct": None,
+                   "ci": None, "p_value": None, "regression": False}
+            if before is None or after is None:
+                rows.append(row)
+                continue
+            row["delta_pct"] = (after - before) / before * 100 if before else None
+            if field is None:
+                row["p_value"] = _rate_test(base, cand)
+            elif base_samples is not None and cand_samples is not None:
+                base_values = base_samples[field][~np.isnan(base_samples[field])]
+                cand_values = cand_samples[field][~np.isnan(cand_samples[field])]
+                if len(base_values) >= 2 and len(cand_values) >= 2:
+                    row["ci"], row["p_value"] = _bootstrap(base_values, cand_values, percentile, iterations, rng)
+            worse = row["delta_pct"] is not None and (-row["delta_pct"] if higher_is_better else row["delta_pct"]) > threshold
+            row["regression"] = worse and (row["p_value"] is None or row["p_value"] < alpha)
+            rows.append(row)
+    return rows
+
+
+def _format_value(value):
+    if value is None:
+        return "N/A"
+    return f"{value:.2f}" if abs(value) >= 10 else f"{value:.4f}"
+
+
+def print_comparison(rows, baseline_run, candidate_run, threshold, alpha, console=None):
+    console = console or Console()
+    table = Table(title=f"运行 #{candidate_run['id']} 对比基线 #{baseline_run['id']} (阈值 {threshold:g}%, alpha {alpha:g})",
+                  header_style="bold cyan", border_style="blue")
+    for column in ("轮次", "指标", "基线", "候选", "变化", "差值 95% CI", "p 值", "判定"):
+        table.add_column(column, justify="left" if column in ("轮次", "指标") else "right")
+    for row in rows:
+        delta = f"{row['delta_pct']:+.1f}%" if row["delta_pct"] is not None else "N/A"
+        ci = f"[{row['ci'][0]:+.4f}, {row['ci'][1]:+.4f}]" if row["ci"] else "-"
+        p_value = f"{row['p_value']:.3f}" if row["p_value"] is not None else "-"
+        verdict = "[bold red]回归[/bold red]" if row["regression"] else "[green]通过[/green]"
+        table.add_row(row["phase"], row["metric"], _format_value(row["baseline"]), _format_value(row["candidate"]),
+                      delta, ci, p_value, verdict)
+    Console(width=160).print(table)
+    console.print("RPS 的 p 值来自泊松速率 z 检验，延迟类指标来自存储样本的 bootstrap；无样本时只按阈值判定")
+
+
+def _print_runs(runs, console):
+    table = Table(title="运行历史", header_style="bold cyan", border_style="blue")
+    for column in ("id", "时间", "模型", "端点", "模式", "轮次", "配置哈希", "标签"):
+        table.add_column(column)
+    for run in runs:
+        table.add_row(str(run["id"]), run["created_at"], run["model"] or "", run["endpoint"] or "", run["mode"] or "",
+                      str(run["phases"]), (run["config_hash"] or "")[:12], run["label"] or "")
+    Console(width=160).print(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark run history and regression comparison")
+    parser.add_argument("--db", type=str, default=DEFAULT_HISTORY_DB, help=f"历史数据库路径 (默认: {DEFAULT_HISTORY_DB})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = subparsers.add_parser("list", help="列出最近的运行")
+    list_parser.add_argument("--model", type=str, help="只列出该模型的运行")
+    list_parser.add_argument("--endpoint", type=str, help="只列出该端点的运行")
+    list_parser.add_argument("--limit", type=int, default=20, help="最多列出的运行数 (默认: 20)")
+
+    baseline_parser = subparsers.add_parser("baseline", help="把某次运行设为命名基线")
+    baseline_parser.add_argument("run", type=str, help="运行 id 或 latest")
+    baseline_parser.add_argument("--name", type=str, default="default", help="基线名 (默认: default)")
+
+    compare_parser = subparsers.add_parser("compare", help="对比两次运行，存在回归时退出码为 1")
+    compare_parser.add_argument("candidate", type=str, help="候选运行：id、latest 或基线名")
+    compare_parser.add_argument("baseline", type=str, nargs="?",
+                                help="基线运行：id、latest 或基线名 (默认: 基线 default，否则同配置的上一次运行)")
+    compare_parser.add_argument("--threshold", type=float, default=5.0, help="判定回归的变差百分比 (默认: 5)")
+    compare_parser.add_argument("--alpha", type=float, default=0.05, help="显著性水平 (默认: 0.05)")
+    compare_parser.add_argument("--bootstrap", type=int, default=1000, help="bootstrap 重抽样次数 (默认: 1000)")
+    compare_parser.add_argument("--json", type=str, help="同时把对比结果写入该 JSON 文件")
+    args = parser.parse_args()
+
+    console = Console()
+    store = HistoryStore(args.db)
+    try:
+        if args.command == "list":
+            _print_runs(store.list_runs(args.model, args.endpoint, args.limit), console)
+            return 0
+        if args.command == "baseline":
+            run_id = store.resolve(args.run)
+            store.set_baseline(args.name, run_id)
+            console.print(f"基线 {args.name} -> 运行 #{run_id}")
+            return 0
+
+        candidate_id = store.resolve(args.candidate)
+        if args.baseline:
+            baseline_id = store.resolve(args.baseline)
+        else:
+            baseline_id = store.baseline("default")
+            if baseline_id is None or baseline_id == candidate_id:
+                baseline_id = store.previous_run(candidate_id)
+        if baseline_id is None:
+            parser.error("no baseline: pass one explicitly or set one with 'history.py baseline <run>'")
+        baseline_run, candidate_run = store.run(baseline_id), store.run(candidate_id)
+        if baseline_run["config_hash"] != candidate_run["config_hash"]:
+            console.print("[yellow]两次运行的配置不同，只对比参数相同的轮次[/yellow]")
+        rows = compare_runs(store.phases(baseline_id), store.phases(candidate_id), args.threshold, args.alpha,
+                            args.bootstrap)
+        if not rows:
+            console.print("[bold red]两次运行没有可对齐的轮次[/bold red]")
+            return 2
+        print_comparison(rows, baseline_run, candidate_run, args.threshold, args.alpha, console)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump({"baseline": baseline_id, "candidate": candidate_id, "threshold": args.threshold,
+                           "alpha": args.alpha, "rows": rows}, f, indent=2, ensure_ascii=False)
+        regressions = sum(row["regression"] for row in rows)
+        if regressions:
+            console.print(f"[bold red]发现 {regressions} 项回归[/bold red]")
+            return 1
+        console.print("[bold green]未发现回归[/bold green]")
+        return 0
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
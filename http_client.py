@@ -0,0 +1,104 @@
+"""
+HTTP 连接池配置与连接获取耗时统计。
+
+AsyncOpenAI 默认的 httpx 连接池最多保持 100 个空闲长连接、空闲 5 秒即关闭：
+并发数超过 100 时连接反复新建，两轮测试之间的冷却时间也足以让所有连接过期，每轮都重新握手。
+这里按配置创建底层的 httpx 客户端：
+    - max_connections / max_keepalive_connections：连接数上限，默认不限制（在途请求数已由并发数控制，
+      再加一层连接池上限只会让请求在客户端内部排队）；
+    - keepalive_expiry：空闲连接保持时间，默认 30 秒，覆盖多轮测试之间的冷却时间；
+    - http2：启用 HTTP/2（需要 h2，`pip install 'httpx[http2]'`），多个请求复用同一连接。
+客户端通过请求钩子为每个请求挂上 httpcore 的 trace 回调，把请求进入连接池到开始发送请求头之间的时间
+拆成新建连接耗时（TCP + TLS，复用连接时为空）和等待可用连接的耗时，与服务端延迟分开报告。
+"""
+import contextvars
+import time
+
+import httpx
+from openai import DefaultAsyncHttpxClient
+
+# 当前请求的连接耗时记录，由 make_request 在发送前设置，请求钩子在同一任务内读取
+_CONNECTION_TIMING = contextvars.ContextVar("connection_timing", default=None)
+
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+# 计入新建连接耗时的 httpcore trace 阶段
+_CONNECT_PHASES = ("connection.connect_tcp", "connection.start_tls", "http2.send_connection_init")
+
+
+def connection_pool_config(max_connections=None, max_keepalive_connections=None,
+                           keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY, http2=False):
+    """由命令行参数构造连接池配置，作为 pool_config 传给 run_benchmark 等入口。"""
+    return {
+        "max_connections": max_connections,
+        "max_keepalive_connections": max_keepalive_connections,
+        "keepalive_expiry": keepalive_expiry,
+        "http2": http2,
+    }
+
+
+class ConnectionTiming:
+    """单个请求的连接获取耗时，时间均为 time.perf_counter()。"""
+
+    __slots__ = ("request_time", "headers_time", "connect_time", "_phase_start")
+
+    def __init__(self):
+        self.request_time = None
+        self.headers_time = None
+        self.connect_time = None
+        self._phase_start = None
+
+    def begin(self):
+        # SDK 重试时重新计时，只保留最后一次尝试
+        self.request_time = time.perf_counter()
+        self.headers_time = None
+        self.connect_time = None
+
+    async def trace(self, event, info):
+        now = time.perf_counter()
+        phase, _, stage = event.rpartition(".")
+        if phase in _CONNECT_PHASES:
+            if stage == "started":
+                self._phase_start = now
+            elif stage == "complete" and self._phase_start is not None:
+                self.connect_time = (self.connect_time or 0.0) + now - self._phase_start
+        elif stage == "started" and phase.endswith("send_request_headers") and self.headers_time is None:
+            self.headers_time = now
+
+    @property
+    def pool_wait(self):
+        """等待可用连接的秒数（不含新建连接耗时）；请求未经过 trace 时为 None。"""
+        if self.request_time is None or self.headers_time is None:
+            return None
+        return max(0.0, self.headers_time - self.request_time - (self.connect_time or 0.0))
+
+
+def track_connection():
+    """为当前任务中即将发出的请求创建连接耗时记录。"""
+    timing = ConnectionTiming()
+    _CONNECTION_TIMING.set(timing)
+    return timing
+
+
+async def _attach_trace(request):
+    timing = _CONNECTION_TIMING.get()
+    if timing is None:
+        return
+    timing.begin()
+    request.extensions["trace"] = timing.trace
+
+
+def create_http_client(pool_config=None):
+    """按连接池配置创建 httpx.AsyncClient，超时等其余设置与 openai SDK 的默认客户端一致。"""
+    pool_config = pool_config or {}
+    http2 = bool(pool_config.get("http2"))
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            raise ImportError("HTTP/2 requires the h2 package; `pip install 'httpx[http2]'` or drop --http2.")
+    limits = httpx.Limits(
+        max_connections=pool_config.get("max_connections"),
+        max_keepalive_connections=pool_config.get("max_keepalive_connections"),
+        keepalive_expiry=pool_config.get("keepalive_expiry", DEFAULT_KEEPALIVE_EXPIRY),
+    )
+    return DefaultAsyncHttpxClient(limits=limits, http2=http2, event_hooks={"request": [_attach_trace]})
@@ -0,0 +1,137 @@
+"""
+测试过程中的实时面板。
+
+按最近 window_seconds 秒内完成的请求计算滑动窗口统计：RPS、输出 token/s、TTFT 和延迟分位数、
+错误率，以及当前在途请求数。面板由 rich.live 的后台刷新线程按固定频率渲染，与请求热路径解耦：
+    - 观察者回调只把精简后的记录元组追加到 deque、更新在途计数，不做任何计算；
+    - 渲染线程每次刷新时把新记录从共享 deque 中取出（append/popleft 线程安全，无需加锁），
+      丢弃窗口外的记录后再计算分位数，渲染耗时不占用事件循环。
+"""
+import collections
+import time
+
+import numpy as np
+from rich.console import Group
+from rich.live import Live
+from rich.panel import Panel
+from rich.table import Table
+from rich.text import Text
+
+from llm_benchmark import BenchmarkObserver
+
+LIVE_PERCENTILES = (50, 90, 99)
+
+
+def _format_seconds(value):
+    return "-" if value is None else f"{value:.3f}"
+
+
+class LiveDashboard(BenchmarkObserver):
+    """滑动窗口实时面板，作为观察者接入 run_benchmark / 多进程 / 分布式测试，用 with 语句启动和停止显示。"""
+
+    def __init__(self, title="", total_requests=None, window_seconds=10.0, refresh_per_second=4, console=None):
+        self.title = title
+        self.total_requests = total_requests
+        self.window_seconds = window_seconds
+        self.refresh_per_second = refresh_per_second
+        self.console = console
+        # 热路径只写入的共享队列：(结束时间, 是否成功, 输出 token 数, TTFT, 延迟)
+        self.incoming = collections.deque()
+        # 渲染线程独占的窗口内记录
+        self.window = collections.deque()
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.first_start = None
+        self.live = None
+
+    def on_request_start(self):
+        if self.first_start is None:
+            self.first_start = time.time()
+        self.started += 1
+
+    def on_record(self, record):
+        success = record["status"] == "success"
+        self.incoming.append((
+            record.get("end_time") or time.time(),
+            success,
+            record.get("output_tokens") or 0,
+            record.get("ttft"),
+            record.get("latency"),
+        ))
+        self.completed += 1
+        if not success:
+            self.failed += 1
+
+    def snapshot(self, now=None):
+        """计算当前窗口的统计值，只在渲染线程中调用。"""
+        now = now or time.time()
+        while True:
+            try:
+                self.window.append(self.incoming.popleft())
+            except IndexError:
+                break
+        cutoff = now - self.window_seconds
+        while self.window and self.window[0][0] < cutoff:
+            self.window.popleft()
+
+        # 测试刚开始时窗口尚未填满，按实际经过的时间计算速率
+        elapsed = now - self.first_start if self.first_start else 0.0
+        span = min(self.window_seconds, elapsed) or self.window_seconds
+        records = list(self.window)
+        successes = [item for item in records if item[1]]
+        ttfts = np.array([item[3] for item in successes if item[3] is not None], dtype=np.float64)
+        latencies = np.array([item[4] for item in successes if item[4] is not None], dtype=np.float64)
+        return {
+            "elapsed": elapsed,
+            "span": span,
+            "started": self.started,
+            "completed": self.completed,
+            "failed": self.failed,
+            "in_flight": max(0, self.started - self.completed),
+            "window_requests": len(records),
+            "requests_per_second": len(records) / span,
+            "tokens_per_second": sum(item[2] for item in successes) / span,
+            "error_rate": (len(records) - len(successes)) / len(records) * 100 if records else 0.0,
+            "ttft": {p: float(np.percentile(ttfts, p)) if ttfts.size else None for p in LIVE_PERCENTILES},
+            "latency": {p: float(np.percentile(latencies, p)) if latencies.size else None for p in LIVE_PERCENTILES},
+        }
+
+    def __rich__(self):
+        stats = self.snapshot()
+        progress = f"{stats['completed']}/{self.total_requests}" if self.total_requests else str(stats["completed"])
+        header = Text.assemble(
+            ("已完成 ", "bold"), progress,
+            ("   在途 ", "bold"), str(stats["in_flight"]),
+            ("   累计失败 ", "bold"), (str(stats["failed"]), "red" if stats["failed"] else ""),
+            ("   已运行 ", "bold"), f"{stats['elapsed']:.1f}s",
+        )
+
+        rates = Table(show_header=True, header_style="bold magenta", box=None, padding=(0, 2))
+        rates.add_column("RPS", justify="right")
+        rates.add_column("输出Token/s", justify="right")
+        rates.add_column("错误率", justify="right")
+        rates.add_column("窗口请求数", justify="right")
+        error_style = "red" if stats["error_rate"] > 0 else ""
+        rates.add_row(f"{stats['requests_per_second']:.2f}", f"{stats['tokens_per_second']:.1f}",
+                      Text(f"{stats['error_rate']:.1f}%", style=error_style), str(stats["window_requests"]))
+
+        percentiles = Table(show_header=True, header_style="bold magenta", box=None, padding=(0, 2))
+        percentiles.add_column("指标(秒)")
+        for p in LIVE_PERCENTILES:
+            percentiles.add_column(f"P{p}", justify="right")
+        percentiles.add_row("TTFT", *(_format_seconds(stats["ttft"][p]) for p in LIVE_PERCENTILES))
+        percentiles.add_row("延迟", *(_format_seconds(stats["latency"][p]) for p in LIVE_PERCENTILES))
+
+        title = f"{self.title}  最近 {self.window_seconds:g} 秒" if self.title else f"最近 {self.window_seconds:g} 秒"
+        return Panel(Group(header, rates, percentiles), title=title, border_style="cyan")
+
+    def __enter__(self):
+        # auto_refresh 使用 rich 的后台线程按固定频率调用 __rich__，不在事件循环内渲染
+        self.live = Live(self, console=self.console, refresh_per_second=self.refresh_per_second, auto_refresh=True)
+        self.live.start()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.live.stop()
+        self.live = None
@@ -2,14 +2,25 @@ import asyncio
 import time
 import base64
 import numpy as np
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, AsyncStream
+from openai.types.chat import ChatCompletionChunk
 import logging
 import argparse
 import json
-import random
 import collections
+import itertools
+import multiprocessing
 import os
+import queue as queue_module
 from typing import Any, Dict, Optional
+from http_client import DEFAULT_KEEPALIVE_EXPIRY, connection_pool_config, create_http_client, track_connection
+from prompt_corpus import build_builtin_corpus, cached_prompt_bytes, load_jsonl_corpus
+from sessions import THINK_DISTRIBUTIONS, SessionWorkload, session_config
+from sketches import make_quantile_sketch
+from sse_transport import SSEChatClient, process_sse_stream, read_completion
+from token_counter import load_token_counter
+from vision_payload import VisionPayloadBuilder
+from vision_workload import get_vision_workload, vision_workload_config
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -191,6 +202,19 @@ LONG_PROMPT_PAIRS = [
 
 VISION_TEMPLATE_FILE = "vl-model-template-data.json"
 _VISION_MESSAGES_CACHE = None
+_VISION_PAYLOAD_BUILDER = None
+_REQUEST_MIXES = {}
+
+# 本地 tokenizer 统计的输入 token 数缓存，键为 (tokenizer, prompt_key)
+_PROMPT_TOKENS_CACHE = {}
+
+# make_request 返回的请求状态分类（success 之外均为错误类型）
+STATUS_CATEGORIES = ("success", "timeout", "rate_limit", "auth_error", "network_error", "not_found", "invalid_params", "api_error")
+
+# 开环模式支持的请求到达间隔分布
+ARRIVAL_DISTRIBUTIONS = ("constant", "poisson", "gamma")
+# 客户端传输方式：openai SDK，或直接解析 SSE 的轻量实现
+TRANSPORTS = ("openai", "raw")
 
 
 def _load_vision_messages_template():
@@ -217,26 +241,42 @@ def _load_vision_messages_template():
         raise
 
 
-def _build_vision_messages(timestamp_label: str):
-    """
-    基于模板构造视觉模型的消息，并为 system/user 加上时间戳，避免缓存。
-    """
-    base_messages = _load_vision_messages_template()
-    # 通过序列化实现深拷贝，避免原模板被修改
-    messages = json.loads(json.dumps(base_messages))
+def get_vision_payload_builder():
+    """返回基于视觉模板的请求构造器，模板只加载一次，图片内容在请求之间共享。"""
+    global _VISION_PAYLOAD_BUILDER
+    if _VISION_PAYLOAD_BUILDER is None:
+        _VISION_PAYLOAD_BUILDER = VisionPayloadBuilder(_load_vision_messages_template())
+    return _VISION_PAYLOAD_BUILDER
+
+
+def _prompt_tokens(prompt_key, messages, token_counter):
+    """按 prompt 缓存本地 tokenizer 的输入 token 数，同一 prompt 只编码一次；prompt_key 为 None（如多轮会话）时不缓存。"""
+    if prompt_key is None:
+        return token_counter.count_messages(messages)
+    cache_key = (token_counter.spec,) + prompt_key
+    count = _PROMPT_TOKENS_CACHE.get(cache_key)
+    if count is None:
+        count = token_counter.count_messages(messages)
+        _PROMPT_TOKENS_CACHE[cache_key] = count
+    return count
 
-    for message in messages:
-        role = message.get("role")
-        if role == "system" and isinstance(message.get("content"), str):
-            message["content"] = f"{message['content']}\n\n[timestamp:{timestamp_label}]"
-        elif role == "user":
-            content = message.get("content")
-            if isinstance(content, list):
-                content.append({"type": "text", "text": f"timestamp:{timestamp_label}"})
-            elif isinstance(content, str):
-                message["content"] = f"{content}\n\n[timestamp:{timestamp_label}]"
 
-    return messages
+def _get_request_mix(config):
+    """按场景文件中的请求类别创建（或取缓存的）混合负载，见 scenario.py。"""
+    key = json.dumps(config, sort_keys=True)
+    mix = _REQUEST_MIXES.get(key)
+    if mix is None:
+        # 延迟导入：scenario 依赖本模块
+        from scenario import RequestMix
+        mix = _REQUEST_MIXES[key] = RequestMix(config)
+    return mix
+
+
+def get_prompt_corpus(prompt_file, use_long_context, long_context_length):
+    """返回本轮使用的预构建语料：指定 prompt_file 时为外部 JSONL 语料，否则为内置短文本/长文本语料。"""
+    if prompt_file:
+        return load_jsonl_corpus(prompt_file)
+    return build_builtin_corpus(SHORT_PROMPTS, LONG_PROMPT_PAIRS, use_long_context, long_context_length)
 
 
 def _normalize_api_key(api_key: Optional[str]) -> Optional[str]:
@@ -262,13 +302,13 @@ def _build_basic_auth_header(api_key: Optional[str], auth_config: Dict[str, Any]
     return None
 
 
-def _create_llm_client(llm_url: str, api_key: Optional[str], auth_config: Optional[Dict[str, Any]]) -> AsyncOpenAI:
-    """根据认证配置创建 AsyncOpenAI 客户端，支持 Bearer、Basic 以及无认证。"""
+def _resolve_client_auth(llm_url: str, api_key: Optional[str], auth_config: Optional[Dict[str, Any]]):
+    """根据认证配置返回 (base_url, api_key, default_headers)，支持 Bearer、Basic 以及无认证。"""
     auth_config = auth_config or {}
     auth_header_override = auth_config.get("auth_header")
 
     if auth_header_override:
-        return AsyncOpenAI(base_url=llm_url, api_key="", default_headers={"Authorization": auth_header_override})
+        return llm_url, "", {"Authorization": auth_header_override}
 
     normalized_api_key = _normalize_api_key(api_key)
     requested_type = (auth_config.get("auth_type") or "auto").lower()
@@ -320,99 +360,265 @@ def _create_llm_client(llm_url: str, api_key: Optional[str], auth_config: Option
 
     logging.info(f"使用认证类型: {auth_type}")
     logging.info(f"API端点: {base_url}")
+    return base_url, client_api_key, default_headers
+
 
-    return AsyncOpenAI(base_url=base_url, api_key=client_api_key, default_headers=default_headers)
+def create_llm_client(llm_url: str, api_key: Optional[str], auth_config: Optional[Dict[str, Any]],
+                      pool_config: Optional[Dict[str, Any]] = None, transport: str = "openai"):
+    """
+    根据认证配置创建客户端，支持 Bearer、Basic 以及无认证。
+    transport 为 "openai" 时返回 AsyncOpenAI；为 "raw" 时返回绕过 SDK 的 SSEChatClient（见 sse_transport.py）。
+    底层 httpx 连接池按 pool_config 创建（见 http_client.py），用完后由创建方调用 close() 释放连接。
+    """
+    if transport not in TRANSPORTS:
+        raise ValueError(f"Unsupported transport '{transport}'. Valid options: {', '.join(TRANSPORTS)}")
+    base_url, client_api_key, default_headers = _resolve_client_auth(llm_url, api_key, auth_config)
+    if transport == "raw":
+        return SSEChatClient(base_url, client_api_key, default_headers, create_http_client(pool_config))
+    return AsyncOpenAI(base_url=base_url, api_key=client_api_key, default_headers=default_headers,
+                       http_client=create_http_client(pool_config))
 
-async def process_stream(stream):
+async def process_stream(stream, expected_chunks=0, collect_text=False):
+    """
+    消费流式响应，返回 (first_token_time, total_chunks, chunk_times, usage, text)。
+    chunk_times 为每个有内容的块的到达时间，写入按 expected_chunks 预分配的数组，避免逐块创建 Python 对象。
+    usage 为服务端在流末尾返回的用量信息（请求了 stream_options.include_usage 时），没有时为 None；
+    text 仅在 collect_text 时拼接，供本地 tokenizer 兜底计数和多轮会话追加助手回复。
+    """
     first_token_time = None
     total_tokens = 0
+    chunk_times = np.empty(max(expected_chunks, 16) + 1)
+    usage = None
+    text_parts = [] if collect_text else None
     try:
         async for chunk in stream:
+            now = time.time()
+            # include_usage 时最后一个块的 choices 为空，只携带 usage
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
             if first_token_time is None:
-                first_token_time = time.time()
+                first_token_time = now
             
             # 检查是否有内容
             content = chunk.choices[0].delta.content if hasattr(chunk.choices[0].delta, 'content') else None
             reasoning_content = getattr(chunk.choices[0].delta, "reasoning_content", None)
             
             if content or reasoning_content:
+                if total_tokens == len(chunk_times):
+                    chunk_times = np.resize(chunk_times, total_tokens * 2)
+                chunk_times[total_tokens] = now
                 total_tokens += 1
+                if text_parts is not None:
+                    text_parts.append(reasoning_content or "")
+                    text_parts.append(content or "")
             
-            # 检查是否完成
+            # 结束原因之后服务端可能还会发送 usage 块，因此不提前退出，读到流结束为止
             if chunk.choices[0].finish_reason is not None:
                 logging.debug(f"流式响应完成，原因: {chunk.choices[0].finish_reason}")
-                break
         
-        logging.debug(f"流式响应处理完毕，共收到 {total_tokens} 个token")
-        return first_token_time, total_tokens
+        logging.debug(f"流式响应处理完毕，共收到 {total_tokens} 个内容块")
+        return first_token_time, total_tokens, chunk_times[:total_tokens], usage, "".join(text_parts or ())
     except Exception as e:
         logging.error(f"处理流式响应时出错: {str(e)}")
         import traceback
         logging.error(traceback.format_exc())
         # 如果已经收到了一些token，返回已有数据；否则返回None
         if first_token_time and total_tokens > 0:
-            return first_token_time, total_tokens
+            return first_token_time, total_tokens, chunk_times[:total_tokens], usage, "".join(text_parts or ())
         else:
             raise  # 重新抛出异常，让上层函数处理
 
-async def make_request(client, model, output_tokens, request_timeout, use_long_context, long_context_length=20000, vision_model=False):
-    start_time = time.time()
-    timestamp_label = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+async def _complete_request(client, model, messages, max_tokens):
+    """发送非流式请求，返回值与 process_stream 一致：没有首 Token 时间，整个响应计为一个内容块。"""
+    if isinstance(client, SSEChatClient):
+        response = await client.send(client.encode_body(model, messages, max_tokens, stream=False))
+        usage, text = await read_completion(response)
+    else:
+        completion = await client.chat.completions.create(model=model, messages=messages, max_tokens=max_tokens)
+        usage = completion.usage
+        message = completion.choices[0].message if completion.choices else None
+        text = (getattr(message, "reasoning_content", None) or "") + (message.content or "") if message else ""
+    end_time = time.time()
+    return None, 1 if text else 0, np.array([end_time] if text else []), usage, text
+
+async def make_request(client, model, output_tokens, request_timeout, use_long_context, long_context_length=20000, vision_model=False, scheduled_time=None,
+                       tokenizer=None, stream_usage=True, prompt_file=None, prebuilt_body=False,
+                       vision_workload=None, request_mix=None, request_spec=None):
+    """
+    发送单个请求（默认流式）并返回该请求的记录字典。
+    :param scheduled_time: 开环模式下请求的计划发送时间；提供时延迟从计划时间起算，避免协同遗漏
+    :param tokenizer: 本地 tokenizer（见 token_counter.py），服务端未返回 usage 时用于统计输入/输出 token 数
+    :param stream_usage: 请求 stream_options.include_usage，优先使用服务端返回的真实 token 数
+    :param prompt_file: 外部 JSONL 语料路径（见 prompt_corpus.py），提供时替代内置 prompt
+    :param prebuilt_body: 视觉模式下发送预序列化的请求体字节，见 vision_payload.py
+    :param vision_workload: 图片目录负载配置（见 vision_workload.vision_workload_config），提供时替代视觉模板
+    :param request_mix: 场景文件中的加权请求类别（见 scenario.py），提供时按类别生成请求并打上 class 标签
+    :param request_spec: 调用方预先构造的请求规格（如 trace 回放、多轮会话），字段与 workload.next_request 的返回值一致；
+                         带 collect_reply 时成功记录中另附 reply（回复文本），由调用方取出后再交给观察者
+    """
+    labels = None
+    stream = True
+    collect_reply = False
+    spec = request_spec
+    workload = None
+    if spec is None:
+        workload = _get_request_mix(request_mix) if request_mix else get_vision_workload(vision_workload) if vision_workload else None
+    if workload is not None:
+        # 图片在线程池中编码，放在记录发送时间之前，编码耗时不计入闭环模式的请求延迟
+        spec = await workload.next_request(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()))
+    send_time = time.time()
+    start_time = scheduled_time if scheduled_time is not None else send_time
+    schedule_lag = send_time - scheduled_time if scheduled_time is not None else None
 
-    if vision_model:
+    if spec is not None:
+        messages = spec["messages"]
+        accounting_messages = spec.get("accounting_messages", messages)
+        prompt_id = spec["prompt_id"]
+        prompt_key = spec["prompt_key"]
+        prompt_bytes = spec["prompt_bytes"]
+        labels = spec["labels"]
+        max_tokens = spec.get("max_tokens") or output_tokens
+        stream = spec.get("stream", True)
+        collect_reply = spec.get("collect_reply", False)
+        body = None
+    elif vision_model:
         if use_long_context:
             logging.debug("视觉模型模式下忽略长文本参数")
-        messages = _build_vision_messages(timestamp_label)
+        timestamp_label = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        vision_builder = get_vision_payload_builder()
+        max_tokens = output_tokens
+        if prebuilt_body:
+            body = vision_builder.body_bytes(timestamp_label, model, max_tokens, stream_usage)
+            messages = None
+        else:
+            body = None
+            messages = vision_builder.messages(timestamp_label)
+        prompt_id = 0
+        prompt_key = ("vision",)
+        # 字节数和 token 数按模板统计（不含时间戳），只计算一次
+        accounting_messages = vision_builder.base_messages
+        prompt_bytes = cached_prompt_bytes(prompt_key, accounting_messages)
         logging.debug("视觉模型请求: 使用模板消息并追加时间戳避免缓存")
     else:
-        if use_long_context:
-            prompt_pair = random.choice(LONG_PROMPT_PAIRS)
-            # 根据目标长度动态计算倍数
-            context_base = prompt_pair["context_base"]
-            context_base_length = len(context_base)
-
-            # 计算需要重复的倍数，至少为1
-            multiplier = max(1, long_context_length // context_base_length)
-
-            # 构建最终的上下文内容
-            content = context_base * multiplier + "\n\n" + prompt_pair["prompt"]
-
-            # 记录实际长度信息用于调试
-            actual_context_length = len(context_base * multiplier)
-            total_content_length = len(content)
-            logging.debug(f"目标上下文长度: {long_context_length}, 基础上下文长度: {context_base_length}, "
-                         f"计算倍数: {multiplier}, 实际上下文长度: {actual_context_length}, 总内容长度: {total_content_length}")
-        else:
-            content = random.choice(SHORT_PROMPTS)
-        messages = [
-            {"role": "user", "content": content}
-        ]
+        # 请求体在本轮开始前已构建好，这里只抽取，不在热路径上拼接长文本
+        entry = get_prompt_corpus(prompt_file, use_long_context, long_context_length).draw()
+        messages = entry["messages"]
+        prompt_id = entry["prompt_id"]
+        prompt_key = entry["prompt_key"]
+        prompt_bytes = entry["prompt_bytes"]
+        max_tokens = entry["max_tokens"] or output_tokens
+        accounting_messages = messages
+        body = None
+
+    record = {
+        "status": None,
+        "error": None,
+        "start_time": start_time,
+        "send_time": send_time,
+        "first_token_time": None,
+        "end_time": None,
+        "schedule_lag": schedule_lag,
+        "prompt_id": prompt_id,
+        "prompt_bytes": prompt_bytes,
+        "output_tokens": None,
+        "output_chunks": None,
+        "prompt_tokens": None,
+        "token_source": None,
+        "latency": None,
+        "tokens_per_second": None,
+        "ttft": None,
+        "tpot": None,
+        "itl": None,
+        "itl_max": None,
+        "pool_wait": None,
+        "connect_time": None,
+        "labels": labels,
+    }
 
     # 记录请求参数 - 保留这条有用的日志，但简化内容
-    logging.debug(f"请求参数: model={model}, max_tokens={output_tokens}, use_long_context={use_long_context}, vision_model={vision_model}")
+    logging.debug(f"请求参数: model={model}, max_tokens={max_tokens}, use_long_context={use_long_context}, vision_model={vision_model}")
+    
+    token_counter = load_token_counter(tokenizer) if tokenizer else None
+    connection_timing = track_connection()
     
     try:
-        stream = await client.chat.completions.create(
-            model=model,
-            messages=messages,
-            max_tokens=output_tokens,
-            stream=True
-        )
-        
-        first_token_time, total_tokens = await asyncio.wait_for(process_stream(stream), timeout=request_timeout)
+        if not stream:
+            # 非流式请求整体计时，没有首 Token 时间和 Token 间隔
+            first_token_time, total_chunks, chunk_times, usage, output_text = await asyncio.wait_for(
+                _complete_request(client, model, messages, max_tokens), timeout=request_timeout
+            )
+        else:
+            consume_stream = process_stream
+            if isinstance(client, SSEChatClient):
+                # 轻量传输：直接发送请求体字节并按行解析 SSE，不经过 SDK
+                response = await client.send(body if body is not None else
+                                             client.encode_body(model, messages, max_tokens, stream_usage))
+                consume_stream = process_sse_stream
+            elif body is not None:
+                # 预序列化的请求体直接作为 HTTP 内容发送，跳过 SDK 的参数转换和 JSON 序列化
+                response = await client.post("/chat/completions", cast_to=ChatCompletionChunk, body=body,
+                                             stream=True, stream_cls=AsyncStream[ChatCompletionChunk])
+            else:
+                response = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    **({"stream_options": {"include_usage": True}} if stream_usage else {})
+                )
+
+            first_token_time, total_chunks, chunk_times, usage, output_text = await asyncio.wait_for(
+                consume_stream(response, expected_chunks=max_tokens, collect_text=token_counter is not None or collect_reply),
+                timeout=request_timeout
+            )
         
         end_time = time.time()
+        # token 数优先取服务端 usage，其次本地 tokenizer，最后退化为内容块数（合并多个 token 的服务端会偏低）
+        if usage is not None and usage.completion_tokens is not None:
+            total_tokens, prompt_tokens, token_source = usage.completion_tokens, usage.prompt_tokens, "usage"
+        elif token_counter is not None:
+            total_tokens = token_counter.count(output_text)
+            prompt_tokens = _prompt_tokens(prompt_key, accounting_messages, token_counter)
+            token_source = "tokenizer"
+        else:
+            total_tokens, prompt_tokens, token_source = total_chunks, None, "chunks"
         elapsed_time = end_time - start_time
         ttft = first_token_time - start_time if first_token_time else None
         tokens_per_second = total_tokens / elapsed_time if elapsed_time > 0 else 0
+        # 解码阶段指标：块间隔 (ITL) 和平均每个输出 token 的耗时 (TPOT)，不含预填充
+        itl = np.diff(chunk_times).astype(np.float32)
+        tpot = (chunk_times[-1] - chunk_times[0]) / (total_tokens - 1) if total_chunks > 1 and total_tokens > 1 else None
         
         # 使用更有意义的日志信息
-        logging.info(f"请求成功: tokens={total_tokens}, 耗时={elapsed_time:.2f}秒, TPS={tokens_per_second:.2f}, TTFT={ttft:.3f}秒")
-        return total_tokens, elapsed_time, tokens_per_second, ttft, "success", None
+        logging.info(f"请求成功: tokens={total_tokens}, 耗时={elapsed_time:.2f}秒, TPS={tokens_per_second:.2f}, TTFT={_format_optional(ttft)}秒")
+        record.update({
+            "status": "success",
+            "first_token_time": first_token_time,
+            "end_time": end_time,
+            "output_tokens": total_tokens,
+            "output_chunks": total_chunks,
+            "prompt_tokens": prompt_tokens,
+            "token_source": token_source,
+            "latency": elapsed_time,
+            "tokens_per_second": tokens_per_second,
+            "ttft": ttft,
+            "tpot": tpot,
+            "itl": itl,
+            "itl_max": float(itl.max()) if len(itl) else None,
+            # 等待可用连接和新建连接的耗时，已包含在延迟和 TTFT 中
+            "pool_wait": connection_timing.pool_wait,
+            "connect_time": connection_timing.connect_time,
+        })
+        if collect_reply:
+            record["reply"] = output_text
+        return record
 
     except asyncio.TimeoutError:
         logging.warning(f"请求超时: 超过{request_timeout}秒")
-        return None, None, None, None, "timeout", f"请求超时（{request_timeout}秒）"
+        record.update({"status": "timeout", "error": f"请求超时（{request_timeout}秒）", "end_time": time.time()})
+        return record
     except Exception as e:
         error_type = type(e).__name__
         error_msg = str(e)
@@ -434,26 +640,198 @@ async def make_request(client, model, output_tokens, request_timeout, use_long_c
         # 简化错误日志，但保留关键信息
         logging.error(f"请求失败({error_category}): {error_type}: {error_msg}")
         
-        return None, None, None, None, error_category, f"{error_type}: {error_msg}"
+        record.update({"status": error_category, "error": f"{error_type}: {error_msg}", "end_time": time.time()})
+        return record
+
+class BenchmarkObserver:
+    """
+    基准测试事件观察者基类，子类按需覆盖回调。
+    回调在事件循环内同步执行，必须足够轻量，不能阻塞请求协程。
+    观察者把 stop_requested 置为 True 后，本轮测试不再发出新请求，等在途请求完成后提前结束。
+    """
 
-async def worker(client, semaphore, queue, results, model, output_tokens, request_timeout, use_long_context, long_context_length, vision_model):
+    stop_requested = False
+
+    def on_start(self, start_time):
+        """测试统一开始时调用，start_time 为开始时间戳（time.time()）。"""
+
+    def on_request_start(self):
+        """请求即将发出时调用。"""
+
+    def on_record(self, record):
+        """请求完成（成功或失败）后调用，record 为 make_request 返回的记录字典。"""
+
+async def worker(client, semaphore, queue, request_kwargs, observers):
     while True:
         async with semaphore:
             task_id = await queue.get()
             if task_id is None:
                 queue.task_done()
                 break
+            if _stop_requested(observers):
+                # 提前结束：丢弃剩余任务，直到取到结束标记
+                queue.task_done()
+                continue
             logging.debug(f"Starting request {task_id}")
-            result = await make_request(client, model, output_tokens, request_timeout, use_long_context, long_context_length, vision_model)
-            if result:
-                results.append(result)
-                if result[4] != "success":  # 如果不是成功状态
-                    logging.warning(f"Request {task_id} failed with error type: {result[4]}, message: {result[5]}")
-            else:
-                logging.warning(f"Request {task_id} failed with unknown error")
+            _notify_request_start(observers)
+            result = await make_request(client, **request_kwargs)
+            _collect_result(task_id, result, observers)
             queue.task_done()
             logging.debug(f"Finished request {task_id}")
 
+async def _timed_worker(client, semaphore, deadline, task_ids, request_kwargs, observers):
+    """按时长运行的闭环 worker：不预先填充任务队列，到达截止时间后不再发出新请求。"""
+    while time.time() < deadline and not _stop_requested(observers):
+        async with semaphore:
+            # 等待并发名额期间可能已过截止时间或被要求停止，拿到名额后再检查一次
+            if time.time() >= deadline or _stop_requested(observers):
+                break
+            task_id = next(task_ids)
+            logging.debug(f"Starting request {task_id}")
+            _notify_request_start(observers)
+            result = await make_request(client, **request_kwargs)
+            _collect_result(task_id, result, observers)
+            logging.debug(f"Finished request {task_id}")
+
+async def _session_worker(client, semaphore, sessions, deadline, task_ids, num_requests, request_kwargs, observers):
+    """
+    多轮会话 worker：作为一个虚拟用户依次进行会话，每轮把回复追加到历史后等待思考时间再发下一轮；
+    思考时间不占用并发名额。请求失败时结束当前会话。task_ids 为各 worker 共享的计数，达到 num_requests 或截止时间后停止。
+    """
+    conversation = None
+    while not _stop_requested(observers) and (deadline is None or time.time() < deadline):
+        task_id = next(task_ids)
+        if num_requests is not None and task_id >= num_requests:
+            break
+        if conversation is None:
+            conversation = sessions.start()
+        async with semaphore:
+            logging.debug(f"Starting request {task_id} (turn {conversation.turn})")
+            _notify_request_start(observers)
+            result = await make_request(client, request_spec=conversation.next_request(), **request_kwargs)
+        # 回复文本只用于追加历史，不随记录传给观察者（多进程时避免回传）
+        reply = result.pop("reply", None)
+        _collect_result(task_id, result, observers)
+        if reply is None or not conversation.advance(reply):
+            conversation = None
+            continue
+        think_time = sessions.think_time()
+        if deadline is not None:
+            think_time = min(think_time, deadline - time.time())
+        if think_time > 0:
+            await asyncio.sleep(think_time)
+
+def notify_start(observers, start_time):
+    for observer in observers:
+        observer.on_start(start_time)
+
+def _notify_request_start(observers):
+    for observer in observers:
+        observer.on_request_start()
+
+def _stop_requested(observers):
+    return any(observer.stop_requested for observer in observers)
+
+def _collect_result(task_id, result, observers):
+    if result:
+        for observer in observers:
+            observer.on_record(result)
+        if result["status"] != "success":  # 如果不是成功状态
+            logging.warning(f"Request {task_id} failed with error type: {result['status']}, message: {result['error']}")
+    else:
+        logging.warning(f"Request {task_id} failed with unknown error")
+
+def _check_arrival(arrival_rate, distribution, gamma_shape):
+    if arrival_rate <= 0:
+        raise ValueError("arrival_rate must be positive")
+    if distribution not in ARRIVAL_DISTRIBUTIONS:
+        raise ValueError(f"Unsupported arrival distribution '{distribution}'. Valid options: {', '.join(ARRIVAL_DISTRIBUTIONS)}")
+    if distribution == "gamma" and gamma_shape <= 0:
+        raise ValueError("gamma_shape must be positive")
+
+def _arrival_intervals(rng, count, arrival_rate, distribution, gamma_shape):
+    """采样 count 个到达间隔，均值为 1/arrival_rate。"""
+    mean_interval = 1.0 / arrival_rate
+    if distribution == "constant":
+        return np.full(count, mean_interval)
+    if distribution == "poisson":
+        return rng.exponential(mean_interval, count)
+    # 保持均值为 1/rate，shape 只改变间隔的离散程度
+    return rng.gamma(gamma_shape, mean_interval / gamma_shape, count)
+
+def _arrival_offsets(num_requests, arrival_rate, distribution="poisson", gamma_shape=0.5, seed=None):
+    """
+    生成开环模式下每个请求的计划发送时间（相对于测试开始的秒数）。
+    constant 为固定间隔；poisson 为指数分布间隔；gamma 的 shape<1 时比泊松更突发，>1 时更平滑。
+    """
+    _check_arrival(arrival_rate, distribution, gamma_shape)
+    if num_requests <= 0:
+        return []
+
+    intervals = _arrival_intervals(np.random.default_rng(seed), num_requests, arrival_rate, distribution, gamma_shape)
+    # 第一个请求在起始时刻立即发出
+    offsets = np.cumsum(intervals) - intervals[0]
+    return offsets.tolist()
+
+def _arrival_offsets_until(duration, arrival_rate, distribution="poisson", gamma_shape=0.5, seed=None, batch_size=1024):
+    """
+    按时长生成开环到达时间：惰性产出 [0, duration) 内的计划发送时间，分批采样间隔，
+    内存占用与运行时长无关。
+    """
+    _check_arrival(arrival_rate, distribution, gamma_shape)
+    rng = np.random.default_rng(seed)
+    # 第一个请求在起始时刻立即发出
+    offset = 0.0
+    if duration <= 0:
+        return
+    yield offset
+    while True:
+        for interval in _arrival_intervals(rng, batch_size, arrival_rate, distribution, gamma_shape).tolist():
+            offset += interval
+            if offset >= duration:
+                return
+            yield offset
+
+async def _scheduled_request(client, semaphore, task_id, scheduled_time, request_kwargs, observers, request_spec=None):
+    # 并发上限只用于保护客户端；排队时间计入延迟，因为起点是计划时间
+    async with semaphore:
+        logging.debug(f"Starting request {task_id}")
+        _notify_request_start(observers)
+        result = await make_request(client, scheduled_time=scheduled_time, request_spec=request_spec, **request_kwargs)
+    _collect_result(task_id, result, observers)
+    logging.debug(f"Finished request {task_id}")
+
+async def _run_open_loop(client, semaphore, offsets, start_time, request_kwargs, observers, request_specs=None):
+    """
+    按照到达时间表发起请求，不等待前序请求完成。offsets 可以是惰性生成器。
+    request_specs 为与 offsets 一一对应的请求规格（trace 回放），未提供时由 make_request 按请求参数生成。
+    """
+    # 只持有未完成的任务，长时间运行时内存不随已完成的请求数增长
+    tasks = set()
+    specs = request_specs if request_specs is not None else itertools.repeat(None)
+    for task_id, (offset, spec) in enumerate(zip(offsets, specs)):
+        scheduled_time = start_time + offset
+        delay = scheduled_time - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if _stop_requested(observers):
+            break
+        task = asyncio.create_task(_scheduled_request(
+            client, semaphore, task_id, scheduled_time, request_kwargs, observers, spec
+        ))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+
+async def _wait_until(start_at):
+    """等待到指定的绝对时间戳后返回实际开始时间；未指定时立即开始。"""
+    if start_at is None:
+        return time.time()
+    delay = start_at - time.time()
+    if delay > 0:
+        await asyncio.sleep(delay)
+    return start_at
+
 def calculate_percentile(values, percentile, reverse=False):
     if not values:
         return None
@@ -461,101 +839,812 @@ def calculate_percentile(values, percentile, reverse=False):
         return np.percentile(values, 100 - percentile)
     return np.percentile(values, percentile)
 
-async def run_benchmark(num_requests, concurrency, request_timeout, output_tokens, llm_url, api_key, model, use_long_context, long_context_length=20000, auth_config=None, vision_model=False):
-    client = _create_llm_client(llm_url, api_key, auth_config)
+class MetricsAggregator(BenchmarkObserver):
+    """
+    在线汇总请求记录：计数、错误样本和各项指标的分位数草图（见 sketches.py）。
+    内存占用与请求数无关，任意时刻都可以调用 summary() 查询，也可以 merge() 其他进程或阶段的汇总。
+    :param exact: 保留全部取值计算精确分位数，适合小规模测试
+    """
+
+    # 各指标对应的记录字段
+    METRIC_FIELDS = ("latency", "tokens_per_second", "ttft", "tpot", "schedule_lag", "pool_wait", "connect_time")
+
+    def __init__(self, exact=False, relative_accuracy=0.01, with_breakdown=True):
+        self.exact = exact
+        self.relative_accuracy = relative_accuracy
+        self.with_breakdown = with_breakdown
+        self.sketches = {name: make_quantile_sketch(exact, relative_accuracy) for name in self.METRIC_FIELDS + ("itl",)}
+        self.requests = 0
+        self.successful_requests = 0
+        self.total_output_tokens = 0
+        self.total_output_chunks = 0
+        self.total_prompt_tokens = 0
+        self.prompt_token_requests = 0
+        self.total_prompt_bytes = 0
+        self.token_sources = collections.Counter()
+        self.error_counter = collections.Counter()
+        self.error_samples = {}
+        self.last_end_time = None
+        # 按请求标签分组的子汇总，键为 (标签名, 标签值)
+        self.groups = {}
+
+    def on_record(self, record):
+        self.requests += 1
+        self.total_prompt_bytes += record.get("prompt_bytes") or 0
+        if record.get("end_time") is not None:
+            self.last_end_time = max(self.last_end_time or record["end_time"], record["end_time"])
+        if record["output_tokens"] is not None:
+            self.total_output_tokens += record["output_tokens"]
+        if record.get("output_chunks") is not None:
+            self.total_output_chunks += record["output_chunks"]
+        if record.get("prompt_tokens") is not None:
+            self.total_prompt_tokens += record["prompt_tokens"]
+            self.prompt_token_requests += 1
+        if record.get("token_source"):
+            self.token_sources[record["token_source"]] += 1
+        for name in self.METRIC_FIELDS:
+            if record.get(name) is not None:
+                self.sketches[name].add(record[name])
+        if record.get("itl") is not None and len(record["itl"]):
+            self.sketches["itl"].add_many(record["itl"])
+
+        status = record["status"]
+        if status == "success":
+            self.successful_requests += 1
+        else:
+            self.error_counter[status] += 1
+            # 为每种错误类型保存最多3个样本
+            samples = self.error_samples.setdefault(status, [])
+            if len(samples) < 3 and record["error"]:
+                samples.append(record["error"])
+
+        if self.with_breakdown:
+            for label in (record.get("labels") or {}).items():
+                group = self.groups.get(label)
+                if group is None:
+                    group = self.groups[label] = MetricsAggregator(self.exact, self.relative_accuracy, with_breakdown=False)
+                group.on_record(record)
+
+    def merge(self, other):
+        """合并另一个汇总（如其他进程或其他阶段）的全部计数和草图。"""
+        self.requests += other.requests
+        self.successful_requests += other.successful_requests
+        self.total_output_tokens += other.total_output_tokens
+        self.total_output_chunks += other.total_output_chunks
+        self.total_prompt_tokens += other.total_prompt_tokens
+        self.prompt_token_requests += other.prompt_token_requests
+        self.total_prompt_bytes += other.total_prompt_bytes
+        self.token_sources.update(other.token_sources)
+        self.error_counter.update(other.error_counter)
+        for status, samples in other.error_samples.items():
+            merged = self.error_samples.setdefault(status, [])
+            merged.extend(samples[:3 - len(merged)])
+        if other.last_end_time is not None:
+            self.last_end_time = max(self.last_end_time or other.last_end_time, other.last_end_time)
+        for name, sketch in other.sketches.items():
+            self.sketches[name].merge(sketch)
+        for label, group in other.groups.items():
+            if label in self.groups:
+                self.groups[label].merge(group)
+            else:
+                self.groups[label] = group
+
+    def percentiles(self, name, percentiles, reverse=False):
+        """查询指标的若干分位数；reverse 时取 100-p 分位（用于越大越好的指标，如 TPS）。"""
+        sketch = self.sketches[name]
+        return [sketch.quantile(100 - p if reverse else p) for p in percentiles]
+
+    def _breakdown(self, total_elapsed_time):
+        """
+        按请求标签分组的统计；同一标签下的各组按平均请求体字节数从小到大排列。
+        各组的吞吐按整轮的计时窗口计算，同一标签下各组的 RPS 之和等于整体 RPS。
+        """
+        breakdown = {}
+        ordered = sorted(self.groups.items(), key=lambda item: (item[0][0], item[1].total_prompt_bytes / item[1].requests))
+        for (name, value), group in ordered:
+            entry = {
+                "requests": group.requests,
+                "successful_requests": group.successful_requests,
+                "failed_requests": group.requests - group.successful_requests,
+                "errors": dict(group.error_counter),
+                "average_prompt_bytes": group.total_prompt_bytes / group.requests,
+                "average_prompt_tokens": group.total_prompt_tokens / group.prompt_token_requests if group.prompt_token_requests else None,
+                "total_output_tokens": group.total_output_tokens,
+                "requests_per_second": group.successful_requests / total_elapsed_time if total_elapsed_time > 0 else 0,
+                "output_token_throughput": group.total_output_tokens / total_elapsed_time if total_elapsed_time > 0 else 0,
+            }
+            for key, metric in (("latency", "latency"), ("time_to_first_token", "ttft"), ("time_per_output_token", "tpot"),
+                                ("inter_token_latency", "itl")):
+                p50, p95, p99 = group.percentiles(metric, [50, 95, 99])
+                entry[key] = {"average": group.sketches[metric].mean, "p50": p50, "p95": p95, "p99": p99}
+            p50_tps, = group.percentiles("tokens_per_second", [50], reverse=True)
+            entry["tokens_per_second"] = {"average": group.sketches["tokens_per_second"].mean, "p50": p50_tps}
+            breakdown.setdefault(name, {})[str(value)] = entry
+        return breakdown
+
+    def summary(self, num_requests, total_elapsed_time):
+        """汇总成功率、吞吐、延迟分位数和错误统计，字段与 run_benchmark 的结果一致。"""
+        successful_requests = self.successful_requests
+        total_tokens = self.total_output_tokens
+        total_prompt_tokens = self.total_prompt_tokens
+        sketches = self.sketches
+
+        # Calculate percentiles
+        percentiles = [50, 95, 99]
+        latency_percentiles = self.percentiles("latency", percentiles)
+        tps_percentiles = self.percentiles("tokens_per_second", percentiles, reverse=True)
+        ttft_percentiles = self.percentiles("ttft", percentiles)
+
+        summary = {
+            "successful_requests": successful_requests,
+            "failed_requests": num_requests - successful_requests,
+            "total_time": total_elapsed_time,
+            "requests_per_second": successful_requests / total_elapsed_time if total_elapsed_time > 0 else 0,
+            "total_output_tokens": total_tokens,
+            "total_prompt_tokens": total_prompt_tokens,
+            "output_token_throughput": total_tokens / total_elapsed_time if total_elapsed_time > 0 else 0,
+            "total_token_throughput": (total_tokens + total_prompt_tokens) / total_elapsed_time if total_elapsed_time > 0 else 0,
+            "percentile_method": "exact" if self.exact else f"ddsketch({self.relative_accuracy:g})",
+            "token_accounting": {
+                # usage=服务端用量, tokenizer=本地 tokenizer 计数, chunks=按内容块计数
+                "sources": dict(self.token_sources),
+                "average_prompt_tokens": total_prompt_tokens / self.prompt_token_requests if self.prompt_token_requests else None,
+                "total_output_chunks": self.total_output_chunks,
+                "tokens_per_chunk": total_tokens / self.total_output_chunks if self.total_output_chunks else None
+            },
+            "error_statistics": {
+                "count": dict(self.error_counter),
+                "samples": self.error_samples
+            },
+            "latency": {
+                "average": sketches["latency"].mean,
+                "p50": latency_percentiles[0],
+                "p95": latency_percentiles[1],
+                "p99": latency_percentiles[2]
+            },
+            "tokens_per_second": {
+                "average": sketches["tokens_per_second"].mean,
+                "p50": tps_percentiles[0],
+                "p95": tps_percentiles[1],
+                "p99": tps_percentiles[2]
+            },
+            "time_to_first_token": {
+                "average": sketches["ttft"].mean,
+                "p50": ttft_percentiles[0],
+                "p95": ttft_percentiles[1],
+                "p99": ttft_percentiles[2]
+            }
+        }
+
+        # 解码阶段分位数使用 p50/p90/p99，和 vLLM 等推理框架的调优口径一致
+        decode_percentiles = [50, 90, 99]
+        tpot_percentiles = self.percentiles("tpot", decode_percentiles)
+        summary["time_per_output_token"] = {
+            "average": sketches["tpot"].mean,
+            "p50": tpot_percentiles[0],
+            "p90": tpot_percentiles[1],
+            "p99": tpot_percentiles[2]
+        }
+        itl_percentiles = self.percentiles("itl", decode_percentiles)
+        summary["inter_token_latency"] = {
+            "average": sketches["itl"].mean,
+            "p50": itl_percentiles[0],
+            "p90": itl_percentiles[1],
+            "p99": itl_percentiles[2],
+            "max": sketches["itl"].max if sketches["itl"].count else None
+        }
+
+        if self.groups:
+            summary["breakdown"] = self._breakdown(total_elapsed_time)
+
+        if sketches["pool_wait"].count:
+            # 只有新建连接的请求才有 connect_time，其余请求复用了连接池中的连接
+            wait_percentiles = self.percentiles("pool_wait", percentiles)
+            connect_p99, = self.percentiles("connect_time", [99])
+            summary["connection_pool"] = {
+                "pool_wait": {
+                    "average": sketches["pool_wait"].mean,
+                    "p50": wait_percentiles[0],
+                    "p95": wait_percentiles[1],
+                    "p99": wait_percentiles[2],
+                    "max": sketches["pool_wait"].max
+                },
+                "new_connections": sketches["connect_time"].count,
+                "reused_connections": sketches["pool_wait"].count - sketches["connect_time"].count,
+                "connect_time": {
+                    "average": sketches["connect_time"].mean if sketches["connect_time"].count else None,
+                    "p99": connect_p99
+                }
+            }
+
+        if sketches["schedule_lag"].count:
+            lag_percentiles = self.percentiles("schedule_lag", percentiles)
+            summary["schedule_lag"] = {
+                "average": sketches["schedule_lag"].mean,
+                "p50": lag_percentiles[0],
+                "p95": lag_percentiles[1],
+                "p99": lag_percentiles[2],
+                "max": sketches["schedule_lag"].max
+            }
+
+        return summary
+
+def load_config(arrival_rate=None, arrival_distribution="poisson", gamma_shape=0.5, arrival_seed=None, duration=None,
+                warmup_requests=0, warmup_seconds=0.0, cooldown_seconds=0.0):
+    """
+    由命令行参数构造负载配置，作为 load 传给 run_benchmark 等入口。
+    :param arrival_rate: 目标到达速率（请求/秒），指定时切换为开环模式
+    :param arrival_distribution: 开环到达间隔的分布（constant/poisson/gamma）
+    :param gamma_shape: gamma 分布的形状参数，小于 1 时比泊松到达更突发
+    :param arrival_seed: 到达时间表的随机种子
+    :param duration: 按时长运行的秒数，指定后忽略 num_requests：闭环 worker 持续发请求、开环按速率持续到达，
+                     到时不再发新请求，等在途请求完成后结束
+    :param warmup_requests: 主结果中排除最早开始的 N 个请求（预热）
+    :param warmup_seconds: 主结果中排除测试开始后 S 秒内发出的请求
+    :param cooldown_seconds: 主结果中排除最后 S 秒内结束的请求（收尾）
+    """
+    return {
+        "arrival_rate": arrival_rate,
+        "arrival_distribution": arrival_distribution,
+        "gamma_shape": gamma_shape,
+        "arrival_seed": arrival_seed,
+        # 开环时间表整体后移的秒数，多进程/多机分片时由 load_shard 设置，用于错开 constant 到达
+        "arrival_offset": 0.0,
+        "duration": duration,
+        "warmup_requests": warmup_requests,
+        "warmup_seconds": warmup_seconds,
+        "cooldown_seconds": cooldown_seconds,
+    }
+
+def load_shard(load, index, count):
+    """
+    把负载配置的到达速率拆成 count 份，返回第 index 份；可以逐级拆分（多机 × 多进程）。
+    各分片的泊松/伽马过程叠加后仍是目标速率；constant 分布按分片错开相位，合并后保持等间隔。
+    """
+    arrival_rate = load["arrival_rate"]
+    if not arrival_rate:
+        return load
+    return dict(load, arrival_rate=arrival_rate / count,
+                arrival_seed=load["arrival_seed"] + index if load["arrival_seed"] is not None else None,
+                arrival_offset=load["arrival_offset"] + (index / arrival_rate if load["arrival_distribution"] == "constant" else 0.0))
+
+def workload_config(tokenizer=None, stream_usage=True, prompt_file=None, prebuilt_body=False, vision_workload=None):
+    """
+    由命令行参数构造请求内容配置，作为 workload 传给 run_benchmark 等入口。
+    :param tokenizer: 本地 tokenizer（tiktoken:<encoding> 或 tokenizer.json 路径），服务端不返回 usage 时用于计数
+    :param stream_usage: 是否请求 stream_options.include_usage；服务端不支持该参数时设为 False
+    :param prompt_file: 外部 JSONL 语料路径，每行 {"messages": [...]} 或 {"prompt": "..."}，替代内置 prompt
+    :param prebuilt_body: 视觉模式下把请求体预先序列化为字节发送，减少每个请求的 CPU 开销
+    :param vision_workload: 图片目录负载配置（见 vision_workload.vision_workload_config），按图片数量/尺寸/质量生成视觉请求，
+                            结果按图片大小分桶统计
+    """
+    return {
+        "tokenizer": tokenizer,
+        "stream_usage": stream_usage,
+        "prompt_file": prompt_file,
+        "prebuilt_body": prebuilt_body,
+        "vision_workload": vision_workload,
+    }
+
+def output_config(samples_file=None, timeseries_file=None, timeseries_interval=10.0, exact_percentiles=False,
+                  metrics_port=None, metrics_host=None, metrics_phase=None):
+    """
+    由命令行参数构造结果输出配置，作为 output 传给 run_benchmark 等入口；多进程/多机时均在汇总记录的进程中输出。
+    :param samples_file: 逐请求原始样本的输出文件（.npy 或 .parquet），见 sample_store.py
+    :param timeseries_file: 按 timeseries_interval 秒输出分区间汇总的时间序列文件（.csv 或 .jsonl），见 timeseries.py
+    :param exact_percentiles: 保留全部取值计算精确分位数；默认使用固定内存的 DDSketch（相对误差 1%）
+    :param metrics_port: 在该端口启动 Prometheus /metrics 服务（同一进程内各轮测试共用），见 metrics_exporter.py
+    :param metrics_host: 指标服务监听的地址，默认只监听本机（127.0.0.1）
+    :param metrics_phase: 导出指标的 phase 标签，默认 "run"
+    """
+    return {
+        "samples_file": samples_file,
+        "timeseries_file": timeseries_file,
+        "timeseries_interval": timeseries_interval,
+        "exact_percentiles": exact_percentiles,
+        "metrics_port": metrics_port,
+        "metrics_host": metrics_host,
+        "metrics_phase": metrics_phase,
+    }
+
+async def run_benchmark(num_requests, concurrency, request_timeout, output_tokens, llm_url, api_key, model, use_long_context, long_context_length=20000, auth_config=None, vision_model=False,
+                        load=None, workload=None, output=None, observers=None, start_at=None, client=None,
+                        pool_config=None, transport="openai", request_mix=None, trace=None, session=None):
+    """
+    执行一轮基准测试。
+    默认是闭环模式：concurrency 个 worker 循环取任务，前一个请求完成后才发下一个。
+    负载配置中指定 arrival_rate（请求/秒）时切换为开环模式：按 constant/poisson/gamma 到达时间表发请求，
+    concurrency 仅作为在途请求上限，延迟从计划发送时间起算并额外报告调度滞后。
+    :param load: 负载配置（见 load_config）：到达速率和分布、按时长运行、预热/收尾排除；默认闭环按请求数运行
+    :param workload: 请求内容配置（见 workload_config）：本地 tokenizer、外部语料、视觉负载等
+    :param output: 结果输出配置（见 output_config）：样本文件、时间序列、精确分位数和 Prometheus 指标
+    :param observers: BenchmarkObserver 列表，在请求开始/完成时回调
+    :param start_at: 绝对开始时间戳（time.time()），多进程/多机时用于对齐统一的计时窗口
+    :param client: 复用已创建的客户端（由调用方负责关闭）；未提供时按 llm_url/api_key/auth_config/pool_config 新建，
+                   本轮结束后关闭
+    :param pool_config: 新建客户端时的连接池配置（见 http_client.connection_pool_config）
+    :param transport: 新建客户端的传输方式，"openai" 为 SDK，"raw" 为直接解析 SSE 的轻量实现（见 sse_transport.py）
+    :param request_mix: 场景文件中的加权请求类别（见 scenario.load_scenario），提供时替代 prompt 和视觉参数，
+                        结果的 breakdown.class 中按类别统计
+    :param trace: trace 回放配置（见 trace_replay.trace_config），提供时按 trace 中的到达时间和输入/输出长度开环发送请求，
+                  忽略 num_requests / arrival_rate / duration；结果中另附 trace_replay 调度偏差报告
+    :param session: 多轮会话配置（见 sessions.session_config），提供时 concurrency 个虚拟用户各自进行多轮对话，
+                    num_requests / duration 限制总轮次数 / 运行时长；不支持开环到达和 trace 回放，结果的 breakdown.turn 按轮次统计
+    闭环模式下结果中另附 steady_state：在途请求数等于并发数的稳态窗口内的统计，见 steady_state.py
+    """
+    load = load or load_config()
+    workload = workload or workload_config()
+    output = output or output_config()
+    arrival_rate, duration = load["arrival_rate"], load["duration"]
+    if session and (arrival_rate or trace):
+        raise ValueError("sessions run closed-loop virtual users; arrival_rate and trace are not supported")
+    owns_client = client is None
+    if owns_client:
+        client = create_llm_client(llm_url, api_key, auth_config, pool_config, transport)
     semaphore = asyncio.Semaphore(concurrency)
-    queue = asyncio.Queue()
-    results = []
+    # 请求记录在完成时即汇入分位数草图，不保留记录列表；trace 回放同为开环
+    aggregator = open_measurement_window(concurrency, without_fixed_concurrency(arrival_rate, trace, session), load,
+                                         output["exact_percentiles"])
+    observers = [aggregator] + list(observers or [])
+    request_kwargs = build_request_kwargs(model, output_tokens, request_timeout, use_long_context, long_context_length,
+                                          vision_model, workload, request_mix)
+    # 提前加载 tokenizer 并构建语料，避免首批请求承担初始化开销
+    load_token_counter(workload["tokenizer"])
+    if request_mix:
+        _get_request_mix(request_mix).prepare()
+    elif workload["vision_workload"]:
+        get_vision_workload(workload["vision_workload"])
+    elif vision_model:
+        get_vision_payload_builder()
+    elif not trace:
+        get_prompt_corpus(workload["prompt_file"], use_long_context, long_context_length)
+    replay = _open_trace_replay(trace, workload["tokenizer"])
+    drift = open_replay_drift(trace)
+    if drift:
+        observers.append(drift)
+    sample_writer = open_sample_writer(output["samples_file"])
+    if sample_writer:
+        observers.append(sample_writer)
+    metrics_observer = await open_metrics_observer(output, concurrency)
+    if metrics_observer:
+        observers.append(metrics_observer)
+    timeseries_writer = open_timeseries_writer(output["timeseries_file"], output["timeseries_interval"])
+    if timeseries_writer:
+        observers.append(timeseries_writer)
 
-    # Add tasks to the queue
-    for i in range(num_requests):
-        await queue.put(i)
-    
-    # Add sentinel values to stop workers
-    for _ in range(concurrency):
-        await queue.put(None)
+    try:
+        if replay:
+            start_time = await _wait_until(start_at)
+            notify_start(observers, start_time)
+            # 到达时间和请求规格来自同一次流式读取，按行同步消费
+            offsets, specs = itertools.tee(replay.schedule())
+            await _run_open_loop(client, semaphore, (offset for offset, _ in offsets), start_time, request_kwargs,
+                                 observers, request_specs=(spec for _, spec in specs))
+        elif session:
+            sessions = SessionWorkload(session, get_prompt_corpus(workload["prompt_file"], use_long_context, long_context_length))
+            start_time = await _wait_until(start_at)
+            notify_start(observers, start_time)
+            task_ids = itertools.count()
+            workers = [asyncio.create_task(_session_worker(client, semaphore, sessions,
+                                                           start_time + duration if duration else None, task_ids,
+                                                           None if duration else num_requests, request_kwargs, observers))
+                       for _ in range(concurrency)]
+            await asyncio.gather(*workers)
+        elif arrival_rate:
+            schedule = (load["arrival_distribution"], load["gamma_shape"], load["arrival_seed"])
+            if duration:
+                offsets = _arrival_offsets_until(duration, arrival_rate, *schedule)
+            else:
+                offsets = _arrival_offsets(num_requests, arrival_rate, *schedule)
+            start_time = await _wait_until(start_at)
+            notify_start(observers, start_time)
+            await _run_open_loop(client, semaphore, (offset + load["arrival_offset"] for offset in offsets),
+                                 start_time, request_kwargs, observers)
+        elif duration:
+            start_time = await _wait_until(start_at)
+            notify_start(observers, start_time)
+            task_ids = itertools.count()
+            workers = [asyncio.create_task(_timed_worker(client, semaphore, start_time + duration, task_ids,
+                                                         request_kwargs, observers)) for _ in range(concurrency)]
+            await asyncio.gather(*workers)
+        else:
+            queue = asyncio.Queue()
 
-    # Create worker tasks
-    workers = [asyncio.create_task(worker(client, semaphore, queue, results, model, output_tokens, request_timeout, use_long_context, long_context_length, vision_model)) for _ in range(concurrency)]
+            # Add tasks to the queue
+            for i in range(num_requests):
+                await queue.put(i)
+            
+            # Add sentinel values to stop workers
+            for _ in range(concurrency):
+                await queue.put(None)
 
-    start_time = time.time()
-    
-    # Wait for all tasks to complete
-    await queue.join()
-    await asyncio.gather(*workers)
+            start_time = await _wait_until(start_at)
+            notify_start(observers, start_time)
 
-    end_time = time.time()
+            # Create worker tasks
+            workers = [asyncio.create_task(worker(client, semaphore, queue, request_kwargs, observers)) for _ in range(concurrency)]
+            
+            # Wait for all tasks to complete
+            await queue.join()
+            await asyncio.gather(*workers)
+    finally:
+        # 结束时间取在关闭文件和连接之前，收尾开销不计入测试时间
+        end_time = time.time()
+        if sample_writer:
+            sample_writer.close()
+        if timeseries_writer:
+            timeseries_writer.close()
+        if owns_client:
+            await client.close()
+
+    aggregator.finish()
 
     # Calculate metrics
     total_elapsed_time = end_time - start_time
-    total_tokens = sum(tokens for tokens, _, _, _, _, _ in results if tokens is not None)
-    latencies = [elapsed_time for _, elapsed_time, _, _, _, _ in results if elapsed_time is not None]
-    tokens_per_second_list = [tps for _, _, tps, _, _, _ in results if tps is not None]
-    ttft_list = [ttft for _, _, _, ttft, _, _ in results if ttft is not None]
-
-    # 收集错误统计
-    error_counter = collections.Counter()
-    error_samples = {}
-    for _, _, _, _, status, error_msg in results:
-        if status != "success":
-            error_counter[status] += 1
-            # 为每种错误类型保存最多3个样本
-            if status not in error_samples:
-                error_samples[status] = []
-            if len(error_samples[status]) < 3 and error_msg:
-                error_samples[status].append(error_msg)
-
-    successful_requests = sum(1 for _, _, _, _, status, _ in results if status == "success")
-    failed_requests = num_requests - successful_requests
-    requests_per_second = successful_requests / total_elapsed_time if total_elapsed_time > 0 else 0
-    avg_latency = sum(latencies) / len(latencies) if latencies else 0
-    avg_tokens_per_second = sum(tokens_per_second_list) / len(tokens_per_second_list) if tokens_per_second_list else 0
-    avg_ttft = sum(ttft_list) / len(ttft_list) if ttft_list else 0
-    
-    # Calculate percentiles
-    percentiles = [50, 95, 99]
-    latency_percentiles = [calculate_percentile(latencies, p) for p in percentiles]
-    tps_percentiles = [calculate_percentile(tokens_per_second_list, p, reverse=True) for p in percentiles]
-    ttft_percentiles = [calculate_percentile(ttft_list, p) for p in percentiles]
-    
+    issued_requests, planned_requests = count_issued_requests(None if trace or duration else num_requests, aggregator, observers)
+    summary = aggregator.summary(issued_requests, total_elapsed_time)
+    return assemble_results(summary, aggregator.reported_requests(issued_requests), concurrency, request_kwargs,
+                            arrival_rate, load["arrival_distribution"],
+                            samples_file=output["samples_file"], planned_requests=planned_requests,
+                            stopped_early=True if planned_requests else None, duration=duration,
+                            timeseries=timeseries_writer.summary() if timeseries_writer else None,
+                            trace_replay=drift.summary() if drift else None, session=session,
+                            transport="raw" if isinstance(client, SSEChatClient) else "openai")
+
+def open_measurement_window(concurrency, open_loop, load, exact_percentiles=False):
+    """创建主结果的汇总，并按负载配置中的预热/收尾排除和稳态窗口分流请求记录。"""
+    # 延迟导入：steady_state 依赖本模块
+    from steady_state import MeasurementWindow
+    return MeasurementWindow(MetricsAggregator(exact=exact_percentiles), concurrency, closed_loop=not open_loop,
+                             warmup_requests=load["warmup_requests"], warmup_seconds=load["warmup_seconds"],
+                             cooldown_seconds=load["cooldown_seconds"], exact=exact_percentiles)
+
+def without_fixed_concurrency(arrival_rate, trace, session):
+    """开环到达、trace 回放和带思考时间的会话没有固定的在途请求数，不计算稳态窗口。"""
+    return bool(arrival_rate or trace or (session and session["think_time"] > 0))
+
+def count_issued_requests(num_requests, aggregator, observers):
+    """返回 (实际发出的请求数, 计划请求数)；未提前结束或按时长运行时计划请求数为 None。"""
+    if num_requests is None:
+        return aggregator.requests, None
+    if _stop_requested(observers) and aggregator.requests < num_requests:
+        return aggregator.requests, num_requests
+    return num_requests, None
+
+def build_request_kwargs(model, output_tokens, request_timeout, use_long_context, long_context_length, vision_model,
+                         workload=None, request_mix=None):
+    """make_request 的请求参数（含请求内容配置的各项，见 workload_config），同时用于在结果中记录本轮配置。"""
     return {
-        "total_requests": num_requests,
-        "successful_requests": successful_requests,
-        "failed_requests": failed_requests,
-        "concurrency": concurrency,
+        "model": model,
+        "output_tokens": output_tokens,
         "request_timeout": request_timeout,
-        "max_output_tokens": output_tokens,
         "use_long_context": use_long_context,
-        "long_context_target_length": long_context_length if use_long_context else None,
-        "model": model,
-        "total_time": total_elapsed_time,
-        "requests_per_second": requests_per_second,
-        "total_output_tokens": total_tokens,
+        "long_context_length": long_context_length,
         "vision_model": vision_model,
-        "error_statistics": {
-            "count": dict(error_counter),
-            "samples": error_samples
-        },
-        "latency": {
-            "average": avg_latency,
-            "p50": latency_percentiles[0],
-            "p95": latency_percentiles[1],
-            "p99": latency_percentiles[2]
-        },
-        "tokens_per_second": {
-            "average": avg_tokens_per_second,
-            "p50": tps_percentiles[0],
-            "p95": tps_percentiles[1],
-            "p99": tps_percentiles[2]
-        },
-        "time_to_first_token": {
-            "average": avg_ttft,
-            "p50": ttft_percentiles[0],
-            "p95": ttft_percentiles[1],
-            "p99": ttft_percentiles[2]
-        }
+        **(workload or workload_config()),
+        "request_mix": request_mix,
     }
 
+def open_sample_writer(samples_file):
+    if not samples_file:
+        return None
+    # 延迟导入：sample_store 依赖本模块
+    from sample_store import SampleWriter
+    return SampleWriter(samples_file)
+
+def open_timeseries_writer(timeseries_file, timeseries_interval):
+    if not timeseries_file:
+        return None
+    # 延迟导入：timeseries 依赖本模块
+    from timeseries import TimeSeriesWriter
+    return TimeSeriesWriter(timeseries_file, timeseries_interval)
+
+def _open_trace_replay(trace, tokenizer=None):
+    if not trace:
+        return None
+    # 延迟导入：trace_replay 依赖本模块
+    from trace_replay import TraceReplay
+    return TraceReplay(tokenizer=tokenizer, **trace)
+
+def open_replay_drift(trace):
+    if not trace:
+        return None
+    # 延迟导入：trace_replay 依赖本模块
+    from trace_replay import ReplayDrift
+    return ReplayDrift(trace)
+
+def trace_shard(trace, index, count):
+    """把 trace 回放配置再拆成 count 个按行号交错的分片，返回第 index 个；可以逐级拆分（多机 × 多进程）。"""
+    return dict(trace, shard_index=trace["shard_index"] + trace["shard_count"] * index,
+                shard_count=trace["shard_count"] * count)
+
+async def open_metrics_observer(output, concurrency):
+    """按输出配置启动（或复用）本进程的 Prometheus 导出服务，返回本轮测试标签下的观察者。"""
+    if not output["metrics_port"]:
+        return None
+    # 延迟导入：metrics_exporter 依赖本模块
+    from metrics_exporter import DEFAULT_METRICS_HOST, get_metrics_exporter
+    exporter = await get_metrics_exporter(output["metrics_port"], output["metrics_host"] or DEFAULT_METRICS_HOST)
+    return exporter.phase_observer(output["metrics_phase"] or "run", concurrency)
+
+def assemble_results(summary, num_requests, concurrency, request_kwargs, arrival_rate, arrival_distribution, **extra_fields):
+    """把本轮配置和汇总指标组装成 run_benchmark 的结果字典。"""
+    benchmark_results = {
+        "total_requests": num_requests,
+        "successful_requests": summary.pop("successful_requests"),
+        "failed_requests": summary.pop("failed_requests"),
+        "concurrency": concurrency,
+    }
+    benchmark_results.update({key: value for key, value in extra_fields.items() if value is not None})
+    benchmark_results.update({
+        "arrival_mode": "open_loop" if arrival_rate or extra_fields.get("trace_replay") else "closed_loop",
+        "arrival_rate": arrival_rate,
+        "arrival_distribution": arrival_distribution if arrival_rate else None,
+        "request_timeout": request_kwargs["request_timeout"],
+        "max_output_tokens": request_kwargs["output_tokens"],
+        "use_long_context": request_kwargs["use_long_context"],
+        "long_context_target_length": request_kwargs["long_context_length"] if request_kwargs["use_long_context"] else None,
+        "model": request_kwargs["model"],
+        "vision_model": request_kwargs["vision_model"],
+        "tokenizer": request_kwargs.get("tokenizer"),
+        "prompt_file": request_kwargs.get("prompt_file"),
+        "vision_workload": request_kwargs.get("vision_workload"),
+        "request_mix": request_kwargs.get("request_mix"),
+    })
+    benchmark_results.update(summary)
+    return benchmark_results
+
+def split_evenly(total, parts):
+    """把 total 尽量均匀地拆成 parts 份，前面的分片多分到余数。"""
+    base, remainder = divmod(total, parts)
+    return [base + (1 if i < remainder else 0) for i in range(parts)]
+
+class _QueueStreamer(BenchmarkObserver):
+    """
+    子进程内的观察者：把请求记录分批推送给协调进程，同时回传已发出的请求数，
+    供协调进程的实时面板统计在途请求。攒满 batch_size 条或距上次发送超过 flush_interval 秒时发送。
+    """
+
+    def __init__(self, sample_queue, shard_index, batch_size=64, flush_interval=0.5):
+        self.sample_queue = sample_queue
+        self.shard_index = shard_index
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.started = 0
+        self.last_flush = time.monotonic()
+
+    def on_request_start(self):
+        self.started += 1
+        self._maybe_flush()
+
+    def on_record(self, record):
+        self.buffer.append(record)
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if len(self.buffer) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if self.started:
+            self.sample_queue.put(("started", self.shard_index, self.started))
+            self.started = 0
+        if self.buffer:
+            self.sample_queue.put(("records", self.shard_index, self.buffer))
+            self.buffer = []
+
+class _EventStopper(BenchmarkObserver):
+    """子进程内的观察者：协调进程设置 stop_event 后提前结束本分片。"""
+
+    def __init__(self, stop_event):
+        self.stop_event = stop_event
+
+    @property
+    def stop_requested(self):
+        return self.stop_event.is_set()
+
+async def _run_shard(client, observers, start_at, benchmark_kwargs):
+    """在子进程的事件循环中运行本分片，结束后关闭客户端。"""
+    try:
+        return await run_benchmark(observers=observers, start_at=start_at, client=client, **benchmark_kwargs)
+    finally:
+        await client.close()
+
+def _process_worker_main(shard_index, benchmark_kwargs, sample_queue, start_event, start_value, log_level, stop_event):
+    """多进程模式下子进程的入口：等待统一开始时间，运行本分片并回传原始记录。"""
+    logging.getLogger().setLevel(log_level)
+    streamer = _QueueStreamer(sample_queue, shard_index)
+    try:
+        # 客户端初始化（加载证书等）放在就绪信号之前，避免挤占统一开始后的时间
+        client = create_llm_client(benchmark_kwargs["llm_url"], benchmark_kwargs["api_key"], benchmark_kwargs["auth_config"],
+                                   benchmark_kwargs.get("pool_config"), benchmark_kwargs.get("transport", "openai"))
+        workload = benchmark_kwargs["workload"]
+        load_token_counter(workload["tokenizer"])
+        if benchmark_kwargs.get("request_mix"):
+            _get_request_mix(benchmark_kwargs["request_mix"]).prepare()
+        elif workload["vision_workload"]:
+            get_vision_workload(workload["vision_workload"])
+        elif benchmark_kwargs["vision_model"]:
+            get_vision_payload_builder()
+        elif not benchmark_kwargs.get("trace"):
+            get_prompt_corpus(workload["prompt_file"], benchmark_kwargs["use_long_context"], benchmark_kwargs["long_context_length"])
+        sample_queue.put(("ready", shard_index, None))
+        start_event.wait()
+        asyncio.run(_run_shard(client, [streamer, _EventStopper(stop_event)], start_value.value, benchmark_kwargs))
+        streamer.flush()
+        sample_queue.put(("done", shard_index, None))
+    except Exception as exc:
+        streamer.flush()
+        sample_queue.put(("error", shard_index, f"{type(exc).__name__}: {exc}"))
+
+async def run_benchmark_multiprocess(num_processes, num_requests, concurrency, request_timeout, output_tokens, llm_url, api_key, model, use_long_context, long_context_length=20000, auth_config=None, vision_model=False,
+                                     load=None, workload=None, output=None, observers=None, start_at=None,
+                                     log_level=logging.WARNING, pool_config=None, client=None, transport="openai",
+                                     request_mix=None, trace=None, session=None):
+    """
+    把一轮测试的请求数和并发数拆分到多个子进程执行，每个子进程使用独立的事件循环和 AsyncOpenAI 客户端。
+    子进程把原始请求记录流式回传，由本进程在统一的计时窗口上计算全局分位数和 RPS。
+    参数与 run_benchmark 一致，以下为多进程时的差异：
+    :param load: 到达速率拆分给各子进程；按时长运行时各子进程运行相同的时长，预热/收尾排除在本进程按合并后的记录计算
+    :param output: 样本文件、时间序列和指标均由本进程统一输出
+    :param start_at: 指定统一开始时间（多机协调时使用）；未指定时在所有子进程就绪后开始
+    :param pool_config: 连接池配置，每个子进程按此创建自己的客户端
+    :param client: 单进程运行时复用的客户端（如多轮测试共用），多进程时忽略
+    :param transport: 客户端传输方式（"openai" 或 "raw"），每个子进程按此创建客户端
+    :param trace: trace 回放配置，各子进程按行号交错回放同一个 trace，调度偏差在本进程汇总
+    :param session: 多轮会话配置，虚拟用户数（并发数）和总轮次数拆分给各子进程
+    """
+    load = load or load_config()
+    workload = workload or workload_config()
+    output = output or output_config()
+    duration = load["duration"]
+    # 按时长运行或回放 trace 时没有请求总数，进程数只受并发数限制
+    num_processes = max(1, min(num_processes, concurrency if duration or trace else min(concurrency, num_requests)))
+    if num_processes == 1:
+        return await run_benchmark(num_requests, concurrency, request_timeout, output_tokens, llm_url, api_key, model,
+                                   use_long_context, long_context_length, auth_config, vision_model,
+                                   load=load, workload=workload, output=output, observers=observers, start_at=start_at,
+                                   client=client, pool_config=pool_config, transport=transport,
+                                   request_mix=request_mix, trace=trace, session=session)
+
+    # 子进程回传的记录在本进程汇入统一的分位数草图，预热/收尾排除和稳态窗口也在本进程计算
+    aggregator = open_measurement_window(concurrency, without_fixed_concurrency(load["arrival_rate"], trace, session), load,
+                                         output["exact_percentiles"])
+    observers = [aggregator] + list(observers or [])
+    drift = open_replay_drift(trace)
+    if drift:
+        observers.append(drift)
+    # 样本文件由本进程统一写入，子进程只负责回传记录
+    sample_writer = open_sample_writer(output["samples_file"])
+    if sample_writer:
+        observers.append(sample_writer)
+    # 指标服务在本进程启动，子进程回传的请求事件汇入同一组指标
+    metrics_observer = await open_metrics_observer(output, concurrency)
+    if metrics_observer:
+        observers.append(metrics_observer)
+    timeseries_writer = open_timeseries_writer(output["timeseries_file"], output["timeseries_interval"])
+    if timeseries_writer:
+        observers.append(timeseries_writer)
+    ctx = multiprocessing.get_context("spawn")
+    sample_queue = ctx.Queue()
+    start_event = ctx.Event()
+    stop_event = ctx.Event()
+    start_value = ctx.Value("d", 0.0)
+
+    request_shards = split_evenly(num_requests, num_processes) if not duration and not trace else [None] * num_processes
+    concurrency_shards = split_evenly(concurrency, num_processes)
+    processes = []
+    for shard_index in range(num_processes):
+        benchmark_kwargs = {
+            "num_requests": request_shards[shard_index],
+            "concurrency": concurrency_shards[shard_index],
+            "request_timeout": request_timeout,
+            "output_tokens": output_tokens,
+            "llm_url": llm_url,
+            "api_key": api_key,
+            "model": model,
+            "use_long_context": use_long_context,
+            "long_context_length": long_context_length,
+            "auth_config": auth_config,
+            "vision_model": vision_model,
+            "load": load_shard(load, shard_index, num_processes),
+            "workload": workload,
+            "pool_config": pool_config,
+            "transport": transport,
+            "request_mix": request_mix,
+            "trace": trace_shard(trace, shard_index, num_processes) if trace else None,
+            "session": session,
+        }
+        process = ctx.Process(
+            target=_process_worker_main,
+            args=(shard_index, benchmark_kwargs, sample_queue, start_event, start_value, log_level, stop_event),
+            daemon=True,
+        )
+        process.start()
+        processes.append(process)
+
+    loop = asyncio.get_running_loop()
+    ready = set()
+    finished = set()
+    worker_errors = {}
+    requested_start_at = start_at
+    start_at = None
+
+    try:
+        while len(finished) < num_processes:
+            try:
+                kind, shard_index, payload = await loop.run_in_executor(None, sample_queue.get, True, 1.0)
+            except queue_module.Empty:
+                for shard_index, process in enumerate(processes):
+                    if shard_index not in finished and not process.is_alive():
+                        finished.add(shard_index)
+                        worker_errors[shard_index] = f"worker exited with code {process.exitcode}"
+                if start_at is None and len(ready) + len(finished) >= num_processes:
+                    break
+                continue
+
+            if kind == "ready":
+                ready.add(shard_index)
+                if start_at is None and len(ready) == num_processes:
+                    # 所有子进程完成导入和初始化后再统一开始，避免启动耗时混入计时窗口
+                    start_at = requested_start_at if requested_start_at is not None else time.time() + 0.2
+                    if start_at < time.time():
+                        logging.warning("子进程就绪时已超过指定的开始时间，测试将立即开始")
+                    start_value.value = start_at
+                    notify_start(observers, start_at)
+                    start_event.set()
+                    logging.info(f"{num_processes} 个子进程已就绪，开始测试")
+            elif kind == "started":
+                for _ in range(payload):
+                    _notify_request_start(observers)
+            elif kind == "records":
+                for record in payload:
+                    for observer in observers:
+                        observer.on_record(record)
+                if not stop_event.is_set() and _stop_requested(observers):
+                    stop_event.set()
+            elif kind == "done":
+                finished.add(shard_index)
+            elif kind == "error":
+                finished.add(shard_index)
+                worker_errors[shard_index] = payload
+    finally:
+        # 与单进程一致，结束时间取所有子进程完成时的墙钟时间，在关闭文件之前
+        end_time = time.time()
+        if sample_writer:
+            sample_writer.close()
+        if timeseries_writer:
+            timeseries_writer.close()
+
+    if start_at is None:
+        for process in processes:
+            process.terminate()
+        raise RuntimeError(f"多进程压测启动失败: {worker_errors}")
+
+    for process in processes:
+        process.join(timeout=5)
+    for shard_index, error in worker_errors.items():
+        logging.error(f"子进程 {shard_index} 运行失败: {error}")
+
+    aggregator.finish()
+    issued_requests, planned_requests = count_issued_requests(None if trace or duration else num_requests, aggregator, observers)
+    summary = aggregator.summary(issued_requests, end_time - start_at)
+    request_kwargs = build_request_kwargs(model, output_tokens, request_timeout, use_long_context, long_context_length,
+                                          vision_model, workload, request_mix)
+    return assemble_results(summary, aggregator.reported_requests(issued_requests), concurrency, request_kwargs,
+                            load["arrival_rate"], load["arrival_distribution"],
+                            processes=num_processes, samples_file=output["samples_file"], planned_requests=planned_requests,
+                            stopped_early=True if planned_requests else None, duration=duration,
+                            timeseries=timeseries_writer.summary() if timeseries_writer else None,
+                            trace_replay=drift.summary() if drift else None, session=session, transport=transport,
+                            failed_shards=[{"shard": shard_index, "error": error}
+                                           for shard_index, error in sorted(worker_errors.items())] or None)
+
+def _format_optional(value, digits=3):
+    return f"{value:.{digits}f}" if value is not None else "N/A"
+
 def print_results(results, output_format="both"):
     """
     打印测试结果
@@ -570,6 +1659,15 @@ def print_results(results, output_format="both"):
         print(f"总请求数: {results.get('total_requests', 0)} 个")
         print(f"成功请求数: {results.get('successful_requests', 0)} 个")
         print(f"并发数: {results.get('concurrency', 0)} 个")
+        if results.get('duration'):
+            print(f"运行时长: {results['duration']:g} 秒 (按时长运行)")
+        if results.get('arrival_mode') == 'open_loop':
+            print(f"到达模式: 开环 ({results.get('arrival_distribution')}), 目标速率 {results.get('arrival_rate')} 请求/秒")
+        session = results.get('session')
+        if isinstance(session, dict):
+            turns = session['min_turns'] if session['min_turns'] == session['max_turns'] else f"{session['min_turns']}-{session['max_turns']}"
+            print(f"多轮会话: 每个会话 {turns} 轮, 思考时间平均 {session['think_time']:g} 秒 ({session['think_distribution']}), "
+                  f"后续轮次 user 消息 {session['turn_tokens']} tokens")
         print(f"请求超时: {results.get('request_timeout', 0)} 秒")
         print(f"最大输出token数: {results.get('max_output_tokens', 0)}")
         print(f"是否使用长文本: {'是' if results.get('use_long_context', False) else '否'}")
@@ -586,6 +1684,33 @@ def print_results(results, output_format="both"):
         print(f"每秒请求数 (RPS): {rps:.2f}")
         print(f"总输出token数: {total_tokens}")
         print(f"模型名称: {model}")
+        if results.get('transport') == 'raw':
+            print("传输方式: raw (直接解析 SSE, 不经过 SDK)")
+        failed_shards = results.get('failed_shards')
+        if failed_shards:
+            # 按请求数运行时，失败子进程未回传的请求计为失败请求
+            print(f"失败的子进程: {len(failed_shards)}/{results.get('processes')} 个")
+            for shard in failed_shards:
+                print(f"  子进程 {shard['shard']}: {shard['error']}")
+        failed_agents = results.get('failed_agents')
+        if failed_agents:
+            # 未完成的 agent 已回传的记录计入结果，按请求数运行时未回传的请求计为失败请求
+            print(f"失败的 agent: {len(failed_agents)}/{results.get('agents')} 个")
+            for failed in failed_agents:
+                print(f"  agent {failed['agent']}: {failed['error']}")
+
+        token_accounting = results.get('token_accounting')
+        if isinstance(token_accounting, dict):
+            sources = token_accounting.get('sources') or {}
+            print("\nToken统计:")
+            print(f"计数来源: {', '.join(f'{name}={count}' for name, count in sources.items()) or 'N/A'}")
+            print(f"总输入token数: {results.get('total_prompt_tokens', 0)}")
+            avg_prompt_tokens = token_accounting.get('average_prompt_tokens')
+            print(f"平均输入token数: {avg_prompt_tokens:.1f}" if avg_prompt_tokens is not None else "平均输入token数: N/A")
+            tokens_per_chunk = token_accounting.get('tokens_per_chunk')
+            print(f"每个流式块平均token数: {tokens_per_chunk:.2f}" if tokens_per_chunk is not None else "每个流式块平均token数: N/A")
+            print(f"输出token吞吐: {results.get('output_token_throughput', 0):.2f} tokens/sec")
+            print(f"总token吞吐(输入+输出): {results.get('total_token_throughput', 0):.2f} tokens/sec")
         
         # 安全获取延迟数据
         latency_data = results.get('latency', {})
@@ -635,6 +1760,105 @@ def print_results(results, output_format="both"):
         print(f"TTFT P95: {p95_ttft:.3f}" if p95_ttft is not None else "TTFT P95: N/A")
         print(f"TTFT P99: {p99_ttft:.3f}" if p99_ttft is not None else "TTFT P99: N/A")
         
+        # 解码阶段指标
+        tpot_data = results.get('time_per_output_token')
+        if isinstance(tpot_data, dict):
+            print("\n每输出Token耗时 TPOT (秒):")
+            print(f"平均TPOT: {tpot_data.get('average', 0):.4f}")
+            for key in ('p50', 'p90', 'p99'):
+                value = tpot_data.get(key)
+                print(f"TPOT {key.upper()}: {value:.4f}" if value is not None else f"TPOT {key.upper()}: N/A")
+
+        itl_data = results.get('inter_token_latency')
+        if isinstance(itl_data, dict):
+            print("\nToken间延迟 ITL (秒):")
+            print(f"平均ITL: {itl_data.get('average', 0):.4f}")
+            for key in ('p50', 'p90', 'p99', 'max'):
+                value = itl_data.get(key)
+                label = key.upper() if key != 'max' else '最大间隔'
+                print(f"ITL {label}: {value:.4f}" if value is not None else f"ITL {label}: N/A")
+        
+        # 按请求标签分组的统计
+        breakdown = results.get('breakdown')
+        if isinstance(breakdown, dict):
+            for name, groups in breakdown.items():
+                print(f"\n分组统计 ({name}):")
+                for value, group in groups.items():
+                    ttft_data = group.get('time_to_first_token', {})
+                    latency_data = group.get('latency', {})
+                    success_rate = group.get('successful_requests', 0) / max(group.get('requests', 1), 1) * 100
+                    p99_ttft = ttft_data.get('p99')
+                    p99_latency = latency_data.get('p99')
+                    print(f"{value}: 请求 {group.get('requests', 0)}, 成功率 {success_rate:.1f}%, "
+                          f"RPS {group.get('requests_per_second', 0):.2f}, 输出 {group.get('output_token_throughput', 0):.1f} tokens/sec, "
+                          f"平均请求体 {group.get('average_prompt_bytes', 0) / 1024:.1f} KB, "
+                          f"TTFT 平均/P99 {_format_optional(ttft_data.get('average'))}/{_format_optional(p99_ttft)} 秒, "
+                          f"延迟 P99 {_format_optional(p99_latency)} 秒")
+        
+        # 预热/收尾排除和稳态窗口
+        excluded = results.get('excluded_requests')
+        if isinstance(excluded, dict):
+            full_run = results.get('full_run', {})
+            print("\n预热/收尾排除:")
+            print(f"排除请求数: 预热 {excluded.get('warmup', 0)}, 收尾 {excluded.get('cooldown', 0)}")
+            print(f"全部请求: {full_run.get('total_requests', 0)} 个, RPS {full_run.get('requests_per_second', 0):.2f}, "
+                  f"延迟 P99 {_format_optional(full_run.get('latency', {}).get('p99'))} 秒, "
+                  f"TTFT P99 {_format_optional(full_run.get('time_to_first_token', {}).get('p99'))} 秒")
+        steady = results.get('steady_state')
+        if isinstance(steady, dict):
+            print("\n稳态窗口 (在途请求数 = 并发数):")
+            if steady.get('window_start') is not None:
+                print(f"窗口: 第 {steady['window_start']:.2f} 秒 - 第 {steady['window_end']:.2f} 秒, 共 {steady.get('total_time', 0):.2f} 秒")
+            print(f"请求数: {steady.get('total_requests', 0)}, 成功 {steady.get('successful_requests', 0)}")
+            print(f"每秒请求数 (RPS): {steady.get('requests_per_second', 0):.2f}")
+            print(f"输出token吞吐: {steady.get('output_token_throughput', 0):.2f} tokens/sec")
+            for label, key in (("延迟", "latency"), ("TTFT", "time_to_first_token")):
+                data = steady.get(key, {})
+                print(f"{label} P50/P95/P99: {_format_optional(data.get('p50'))}/{_format_optional(data.get('p95'))}/"
+                      f"{_format_optional(data.get('p99'))} 秒")
+
+        # 分区间时间序列
+        timeseries = results.get('timeseries')
+        if isinstance(timeseries, dict):
+            trends = timeseries.get('trends_per_minute', {})
+            print(f"\n时间序列 ({timeseries.get('file')}, 每 {timeseries.get('interval', 0):g} 秒):")
+            print(f"区间数: {timeseries.get('intervals', 0)}, 停顿区间 (无请求完成且有在途请求): {timeseries.get('stall_intervals', 0)}")
+            print(f"每分钟变化: P50延迟 {_format_optional(trends.get('latency_p50'), 4)} 秒, "
+                  f"P50 TTFT {_format_optional(trends.get('ttft_p50'), 4)} 秒, "
+                  f"RPS {_format_optional(trends.get('requests_per_second'), 4)}")
+
+        # 连接池：等待可用连接和新建连接的耗时，已包含在延迟和 TTFT 中
+        pool_data = results.get('connection_pool')
+        if isinstance(pool_data, dict):
+            wait_data = pool_data.get('pool_wait', {})
+            connect_data = pool_data.get('connect_time', {})
+            print("\n连接池 (获取连接耗时, 秒):")
+            print(f"等待可用连接 平均/P50/P99/最大: {_format_optional(wait_data.get('average'), 4)}/"
+                  f"{_format_optional(wait_data.get('p50'), 4)}/{_format_optional(wait_data.get('p99'), 4)}/"
+                  f"{_format_optional(wait_data.get('max'), 4)}")
+            print(f"新建连接: {pool_data.get('new_connections', 0)} 个, 平均建连耗时 {_format_optional(connect_data.get('average'), 4)}, "
+                  f"P99 {_format_optional(connect_data.get('p99'), 4)}; 复用连接: {pool_data.get('reused_connections', 0)} 个")
+
+        # 开环模式下的调度滞后
+        lag_data = results.get('schedule_lag')
+        if isinstance(lag_data, dict):
+            print("\n调度滞后 (实际发送时间 - 计划时间, 秒):")
+            print(f"平均滞后: {lag_data.get('average', 0):.4f}")
+            print(f"滞后 P50: {lag_data.get('p50', 0):.4f}")
+            print(f"滞后 P95: {lag_data.get('p95', 0):.4f}")
+            print(f"滞后 P99: {lag_data.get('p99', 0):.4f}")
+            print(f"最大滞后: {lag_data.get('max', 0):.4f}")
+
+        # trace 回放的调度偏差
+        replay_data = results.get('trace_replay')
+        if isinstance(replay_data, dict) and replay_data.get('requests'):
+            late = ", ".join(f"{threshold} {share:.1%}" for threshold, share in replay_data.get('late_requests', {}).items())
+            print(f"\ntrace 回放 ({replay_data.get('trace')}, 时间缩放 {replay_data.get('time_scale'):g}, "
+                  f"prompt 来源 {replay_data.get('prompt_source')}):")
+            print(f"计划时间跨度: {replay_data.get('planned_span', 0):.3f} 秒, 实际发送跨度: {replay_data.get('achieved_span', 0):.3f} 秒, "
+                  f"偏差: {replay_data.get('span_drift', 0):+.3f} 秒")
+            print(f"末尾请求滞后: {_format_optional(replay_data.get('final_lag'), 4)} 秒; 滞后超过阈值的请求比例: {late}")
+        
         # 错误统计
         if 'error_statistics' in results and results['error_statistics'].get('count'):
             print("\n错误统计:")
@@ -651,7 +1875,7 @@ def print_results(results, output_format="both"):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Benchmark ai model with LLM")
-    parser.add_argument("--num_requests", type=int, required=True, help="Number of requests to make")
+    parser.add_argument("--num_requests", type=int, help="Number of requests to make (required unless --duration is set)")
     parser.add_argument("--concurrency", type=int, required=True, help="Number of concurrent requests")
     parser.add_argument("--request_timeout", type=int, default=60, help="Timeout for each request in seconds (default: 60)")
     parser.add_argument("--output_tokens", type=int, default=50, help="Number of output tokens (default: 50)")
@@ -668,9 +1892,88 @@ if __name__ == "__main__":
     parser.add_argument("--basic_auth_password", type=str, help="Password for HTTP Basic auth")
     parser.add_argument("--auth_header", type=str, help="Override Authorization header (e.g. 'Basic xxxx')")
     parser.add_argument("--vision_model", action="store_true", help="Flag to indicate the target model expects vision inputs")
+    parser.add_argument("--arrival_rate", type=float, default=None,
+                       help="Target requests/second. Enables open-loop mode; --concurrency becomes the in-flight cap")
+    parser.add_argument("--arrival_distribution", type=str, choices=list(ARRIVAL_DISTRIBUTIONS), default="poisson",
+                       help="Inter-arrival distribution for open-loop mode (default: poisson)")
+    parser.add_argument("--gamma_shape", type=float, default=0.5,
+                       help="Shape of gamma inter-arrivals; <1 is burstier than Poisson (default: 0.5)")
+    parser.add_argument("--arrival_seed", type=int, default=None, help="Random seed for the arrival schedule")
+    parser.add_argument("--processes", type=int, default=1,
+                       help="Number of load-generator processes to shard the run across (default: 1)")
+    parser.add_argument("--samples_file", type=str, default=None,
+                       help="Stream raw per-request samples to this file (.npy, or .parquet with pyarrow)")
+    parser.add_argument("--tokenizer", type=str, default=None,
+                       help="Local tokenizer used when the server returns no usage: tiktoken:<encoding> or a tokenizer.json path")
+    parser.add_argument("--no_stream_usage", action="store_true",
+                       help="Do not send stream_options.include_usage (for servers that reject it)")
+    parser.add_argument("--prompt_file", type=str, default=None,
+                       help="JSONL prompt corpus ({\"messages\": [...]} or {\"prompt\": \"...\"} per line) used instead of the built-in prompts")
+    parser.add_argument("--prebuilt_body", action="store_true",
+                       help="In vision mode, send a pre-serialized request body instead of letting the SDK serialize it per request")
+    parser.add_argument("--image_dir", type=str, default=None,
+                       help="Directory of images to send instead of the vision template")
+    parser.add_argument("--images_per_request", type=int, default=1, help="Images attached to each request (default: 1)")
+    parser.add_argument("--image_resolutions", type=str, default=None,
+                       help="Comma separated max image sides to sweep, 0 keeps the original size, e.g. 512,1024,0")
+    parser.add_argument("--jpeg_qualities", type=str, default=None,
+                       help="Comma separated JPEG qualities to sweep, 0 keeps the original encoding, e.g. 50,85")
+    parser.add_argument("--image_cache_mb", type=float, default=256, help="Memory budget for encoded images in MB (default: 256)")
+    parser.add_argument("--exact_percentiles", action="store_true",
+                       help="Keep every sample for exact percentiles instead of constant-memory DDSketch (1%% relative error)")
+    parser.add_argument("--metrics_port", type=int, default=None,
+                       help="Serve Prometheus metrics on this port at /metrics during the run")
+    parser.add_argument("--metrics_phase", type=str, default="run", help="Value of the phase label on exported metrics (default: run)")
+    parser.add_argument("--metrics_host", type=str, default="127.0.0.1",
+                       help="Address the metrics server listens on; use 0.0.0.0 to allow remote scrapes (default: 127.0.0.1)")
+    parser.add_argument("--warmup_requests", type=int, default=0,
+                       help="Exclude the first N requests (by start time) from the reported metrics")
+    parser.add_argument("--warmup_seconds", type=float, default=0.0,
+                       help="Exclude requests sent during the first S seconds from the reported metrics")
+    parser.add_argument("--cooldown_seconds", type=float, default=0.0,
+                       help="Exclude requests finishing during the last S seconds from the reported metrics")
+    parser.add_argument("--duration", type=float, default=None,
+                       help="Run for this many seconds instead of a fixed number of requests (soak test)")
+    parser.add_argument("--timeseries_file", type=str, default=None,
+                       help="Write per-interval aggregates to this .csv or .jsonl file")
+    parser.add_argument("--timeseries_interval", type=float, default=10.0,
+                       help="Length of each time-series interval in seconds (default: 10)")
+    parser.add_argument("--max_connections", type=int, default=None,
+                       help="Connection pool limit per load-generator process (default: unlimited)")
+    parser.add_argument("--max_keepalive_connections", type=int, default=None,
+                       help="Idle keep-alive connections kept in the pool (default: unlimited)")
+    parser.add_argument("--keepalive_expiry", type=float, default=DEFAULT_KEEPALIVE_EXPIRY,
+                       help=f"Seconds an idle connection is kept alive (default: {DEFAULT_KEEPALIVE_EXPIRY:g})")
+    parser.add_argument("--http2", action="store_true", help="Use HTTP/2 (requires `pip install 'httpx[http2]'`)")
+    parser.add_argument("--transport", type=str, choices=list(TRANSPORTS), default="openai",
+                       help="openai=official SDK; raw=lean httpx client parsing SSE directly, no retries (default: openai)")
+    parser.add_argument("--trace", type=str, default=None,
+                       help="Replay a request log (.jsonl/.csv, optionally .gz) at its original arrival times and lengths; "
+                            "--num_requests then limits the number of trace rows")
+    parser.add_argument("--trace_time_scale", type=float, default=1.0,
+                       help="Multiply trace inter-arrival times by this factor, e.g. 0.5 replays twice as fast (default: 1)")
+    parser.add_argument("--trace_prompt", type=str, choices=["synthetic", "corpus"], default="synthetic",
+                       help="How to rebuild trace prompts: synthetic text or slices of the built-in long-context corpus (default: synthetic)")
+    parser.add_argument("--session_turns", type=str, default=None,
+                       help="Run multi-turn conversations: turns per session, fixed (5) or a range (3-8); "
+                            "--concurrency becomes the number of virtual users")
+    parser.add_argument("--think_time", type=float, default=0.0,
+                       help="Mean think time in seconds between turns of a session (default: 0)")
+    parser.add_argument("--think_distribution", type=str, choices=list(THINK_DISTRIBUTIONS), default="exponential",
+                       help="Think time distribution (default: exponential)")
+    parser.add_argument("--session_turn_tokens", type=int, default=32,
+                       help="Tokens in each follow-up user message of a session (default: 32)")
     parser.add_argument("--output_format", type=str, choices=['json', 'line', 'both'], 
                        default='line', help="Output format (json/line/both)")
     args = parser.parse_args()
+    if args.trace and (args.arrival_rate or args.duration):
+        parser.error("--trace replays the trace's own arrival times; drop --arrival_rate / --duration")
+    if args.session_turns and (args.arrival_rate or args.trace or args.vision_model or args.image_dir):
+        parser.error("--session_turns runs closed-loop text conversations; drop --arrival_rate / --trace / vision options")
+    if args.num_requests is None and not args.duration and not args.trace:
+        parser.error("one of --num_requests, --duration or --trace is required")
+    # 延迟导入：trace_replay 依赖本模块
+    from trace_replay import trace_config
 
     auth_config = {
         "auth_type": args.auth_type,
@@ -679,7 +1982,9 @@ if __name__ == "__main__":
         "auth_header": args.auth_header,
     }
 
-    results = asyncio.run(run_benchmark(
+    # processes=1 时 run_benchmark_multiprocess 直接在当前进程运行
+    results = asyncio.run(run_benchmark_multiprocess(
+        args.processes,
         args.num_requests,
         args.concurrency,
         args.request_timeout,
@@ -690,10 +1995,22 @@ if __name__ == "__main__":
         args.use_long_context,
         args.long_context_length,
         auth_config,
-        args.vision_model
+        args.vision_model,
+        load=load_config(args.arrival_rate, args.arrival_distribution, args.gamma_shape, args.arrival_seed, args.duration,
+                         args.warmup_requests, args.warmup_seconds, args.cooldown_seconds),
+        workload=workload_config(args.tokenizer, not args.no_stream_usage, args.prompt_file, args.prebuilt_body,
+                                 vision_workload_config(args.image_dir, args.images_per_request, args.image_resolutions,
+                                                        args.jpeg_qualities, args.image_cache_mb)),
+        output=output_config(args.samples_file, args.timeseries_file, args.timeseries_interval, args.exact_percentiles,
+                             args.metrics_port, args.metrics_host, args.metrics_phase),
+        pool_config=connection_pool_config(args.max_connections, args.max_keepalive_connections,
+                                           args.keepalive_expiry, args.http2),
+        transport=args.transport,
+        trace=trace_config(args.trace, args.trace_time_scale, args.trace_prompt, args.num_requests),
+        session=session_config(args.session_turns, args.think_time, args.think_distribution, args.session_turn_tokens)
     ))
     print_results(results, args.output_format)
 
 else:
     # When imported as a module, provide the run_benchmark function
-    __all__ = ['run_benchmark']
+    __all__ = ['run_benchmark', 'run_benchmark_multiprocess', 'BenchmarkObserver', 'MetricsAggregator']
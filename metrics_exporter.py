@@ -0,0 +1,200 @@
+"""
+Prometheus / OpenMetrics 指标导出。
+
+在压测进程内启动一个基于 asyncio 的 HTTP 服务，GET /metrics 以 Prometheus 文本格式输出客户端视角的指标，
+便于和推理服务端的 Grafana 面板放在同一时间轴上对比。所有指标带 phase（测试阶段）和 concurrency 标签：
+    - llm_benchmark_requests_total{status}：按 make_request 的状态分类（success/timeout/rate_limit/...）计数的请求数
+    - llm_benchmark_in_flight_requests：在途请求数
+    - llm_benchmark_output_tokens_total / llm_benchmark_prompt_tokens_total：输出 / 输入 token 数
+    - llm_benchmark_ttft_seconds、llm_benchmark_request_latency_seconds、
+      llm_benchmark_inter_token_latency_seconds：TTFT、延迟、ITL 直方图
+
+同一进程、同一端口上的导出服务在多轮测试之间复用，计数器单调递增。
+观察者回调只更新计数和直方图桶，文本在抓取时才生成。
+"""
+import asyncio
+import logging
+
+import numpy as np
+
+from llm_benchmark import STATUS_CATEGORIES, BenchmarkObserver
+
+# 默认只监听本机；Prometheus 在其他机器上抓取时用 --metrics_host 0.0.0.0 显式开放
+DEFAULT_METRICS_HOST = "127.0.0.1"
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+ITL_BUCKETS = (0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0)
+_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 正在运行的导出服务，键为端口
+_EXPORTERS = {}
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    return ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels)
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Histogram:
+    """固定桶的累计直方图，observe_many 用 searchsorted 批量计数。"""
+
+    def __init__(self, buckets):
+        self.buckets = np.asarray(buckets, dtype=np.float64)
+        # 最后一个元素为 +Inf 桶
+        self.counts = np.zeros(len(buckets) + 1, dtype=np.int64)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[int(np.searchsorted(self.buckets, value, side="left"))] += 1
+        self.sum += value
+        self.count += 1
+
+    def observe_many(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if not values.size:
+            return
+        self.counts += np.bincount(np.searchsorted(self.buckets, values, side="left"), minlength=self.counts.size)
+        self.sum += float(values.sum())
+        self.count += int(values.size)
+
+
+class _PhaseMetrics(BenchmarkObserver):
+    """单个 (phase, concurrency) 标签组合下的全部指标，同时作为观察者接收请求事件。"""
+
+    def __init__(self, labels):
+        self.labels = labels
+        # 预先输出所有状态分类的 0 值序列，错误首次出现时 rate() 也能算出增量
+        self.status_counts = dict.fromkeys(STATUS_CATEGORIES, 0)
+        self.in_flight = 0
+        self.output_tokens = 0
+        self.prompt_tokens = 0
+        self.ttft = _Histogram(LATENCY_BUCKETS)
+        self.latency = _Histogram(LATENCY_BUCKETS)
+        self.itl = _Histogram(ITL_BUCKETS)
+
+    def on_request_start(self):
+        self.in_flight += 1
+
+    def on_record(self, record):
+        self.in_flight = max(0, self.in_flight - 1)
+        status = record["status"]
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        self.prompt_tokens += record.get("prompt_tokens") or 0
+        if status != "success":
+            return
+        self.output_tokens += record.get("output_tokens") or 0
+        if record.get("ttft") is not None:
+            self.ttft.observe(record["ttft"])
+        if record.get("latency") is not None:
+            self.latency.observe(record["latency"])
+        if record.get("itl") is not None:
+            self.itl.observe_many(record["itl"])
+
+
+class PrometheusExporter:
+    """持有各阶段的指标并通过 asyncio HTTP 服务输出 /metrics。"""
+
+    def __init__(self):
+        self.phases = {}
+        self.server = None
+        self.loop = None
+
+    def phase_observer(self, phase, concurrency):
+        """返回 (phase, concurrency) 对应的观察者；同一标签组合重复运行时继续累加。"""
+        labels = (("phase", phase), ("concurrency", concurrency))
+        metrics = self.phases.get(labels)
+        if metrics is None:
+            metrics = _PhaseMetrics(labels)
+            self.phases[labels] = metrics
+        return metrics
+
+    async def start(self, host, port):
+        self.server = await asyncio.start_server(self._handle, host, port)
+        self.loop = asyncio.get_running_loop()
+        logging.info(f"Prometheus 指标服务已启动: http://{host}:{port}/metrics")
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            # 读完请求头，忽略内容
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, content_type, body = "200 OK", _CONTENT_TYPE, self.render().encode("utf-8")
+            else:
+                status, content_type, body = "404 Not Found", "text/plain; charset=utf-8", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        except (ConnectionError, UnicodeDecodeError):
+            pass
+        finally:
+            writer.close()
+
+    def render(self):
+        """生成 Prometheus 文本格式（0.0.4）的全部指标。"""
+        lines = []
+
+        def family(name, metric_type, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        phases = list(self.phases.values())
+        family("llm_benchmark_requests_total", "counter", "Completed requests by status category.")
+        for metrics in phases:
+            for status, count in list(metrics.status_counts.items()):
+                lines.append(f"llm_benchmark_requests_total{{{_format_labels(metrics.labels + (('status', status),))}}} {count}")
+        family("llm_benchmark_in_flight_requests", "gauge", "Requests sent and not yet completed.")
+        for metrics in phases:
+            lines.append(f"llm_benchmark_in_flight_requests{{{_format_labels(metrics.labels)}}} {metrics.in_flight}")
+        family("llm_benchmark_output_tokens_total", "counter", "Output tokens of successful requests.")
+        for metrics in phases:
+            lines.append(f"llm_benchmark_output_tokens_total{{{_format_labels(metrics.labels)}}} {metrics.output_tokens}")
+        family("llm_benchmark_prompt_tokens_total", "counter", "Prompt tokens of completed requests.")
+        for metrics in phases:
+            lines.append(f"llm_benchmark_prompt_tokens_total{{{_format_labels(metrics.labels)}}} {metrics.prompt_tokens}")
+
+        for name, attribute, help_text in (
+            ("llm_benchmark_ttft_seconds", "ttft", "Time to first token of successful requests."),
+            ("llm_benchmark_request_latency_seconds", "latency", "End-to-end latency of successful requests."),
+            ("llm_benchmark_inter_token_latency_seconds", "itl", "Gaps between streamed chunks of successful requests."),
+        ):
+            family(name, "histogram", help_text)
+            for metrics in phases:
+                histogram = getattr(metrics, attribute)
+                cumulative = np.cumsum(histogram.counts)
+                for bound, count in zip(histogram.buckets, cumulative):
+                    lines.append(f"{name}_bucket{{{_format_labels(metrics.labels + (('le', _format_value(float(bound))),))}}} {count}")
+                lines.append(f"{name}_bucket{{{_format_labels(metrics.labels + (('le', '+Inf'),))}}} {cumulative[-1]}")
+                lines.append(f"{name}_sum{{{_format_labels(metrics.labels)}}} {_format_value(histogram.sum)}")
+                lines.append(f"{name}_count{{{_format_labels(metrics.labels)}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        if self.server:
+            self.server.close()
+
+
+async def get_metrics_exporter(port, host=DEFAULT_METRICS_HOST):
+    """返回本进程在 port 上的导出服务，首次调用（或事件循环已更换）时启动。"""
+    exporter = _EXPORTERS.get(port)
+    if exporter is None or exporter.loop is not asyncio.get_running_loop():
+        previous = exporter
+        exporter = PrometheusExporter()
+        if previous is not None:
+            # 上一个事件循环已结束：释放其监听端口，保留累计的指标
+            previous.close()
+            exporter.phases = previous.phases
+        await exporter.start(host, port)
+        _EXPORTERS[port] = exporter
+    return exporter
@@ -0,0 +1,342 @@
+"""
+本地 OpenAI 兼容的模拟流式服务，用于在没有真实 LLM 端点时自测压测工具。
+
+支持 /v1/chat/completions（流式 SSE 与非流式）和 /v1/models，可配置首 Token 延迟、
+Token 间隔分布、输出长度、错误注入（429/401/5xx/流中断开）以及模拟排队的并发上限。
+可选按输入 token 数模拟预填充耗时，并用 LRU 缓存 system 消息模拟前缀缓存（命中部分不计预填充耗时）。
+除共享的分布解析（distributions.py）外只依赖标准库 asyncio，可以命令行独立运行，也可以在代码中通过 MockLLMServer 启停。
+"""
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import random
+import time
+
+from distributions import parse_distribution
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    401: "Unauthorized",
+    404: "Not Found",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    502: "Bad Gateway",
+    503: "Service Unavailable",
+}
+
+_TOKEN_VOCAB = ["模拟", "输出", "的", "内容", "，", "用于", "压测", "。", "token", " "]
+
+
+def _estimate_prompt_tokens(messages):
+    """粗略估算输入 token 数：按文本字符数计，图片按固定值计。"""
+    total = 0
+    for message in messages or []:
+        content = message.get("content")
+        if isinstance(content, str):
+            total += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    total += len(part.get("text", ""))
+                else:
+                    total += 256
+    return max(1, total)
+
+
+class _InjectedDisconnect(Exception):
+    pass
+
+
+class MockLLMServer:
+    """
+    模拟服务端。所有延迟参数都是 parse_distribution 支持的分布描述。
+    max_concurrency 限制同时生成的请求数，超出的请求排队（排队时间计入首 Token 延迟）；
+    max_queue 限制排队长度，超出时返回 503。
+    """
+
+    def __init__(self, host="127.0.0.1", port=8000, ttft="0.2", itl="0.02", output_tokens=None,
+                 tokens_per_chunk=1, max_concurrency=None, max_queue=None, api_key=None,
+                 error_429_rate=0.0, error_401_rate=0.0, error_5xx_rate=0.0, disconnect_rate=0.0, seed=None,
+                 prefill_per_token=0.0, prefix_cache_size=0):
+        """
+        :param output_tokens: 输出 token 数分布；未指定时等于请求的 max_tokens
+        :param prefill_per_token: 每个未缓存的输入 token 额外增加的首 Token 延迟（秒）
+        :param prefix_cache_size: 缓存的 system 消息个数（LRU），命中时该消息的 token 不计预填充耗时；0 表示不缓存
+        :param tokens_per_chunk: 每个 SSE 块合并的 token 数，模拟服务端合并输出
+        :param api_key: 指定后要求 Authorization: Bearer <api_key>，否则返回 401
+        """
+        self.host = host
+        self.port = port
+        # 所有随机抽样使用实例自己的随机数生成器，不修改也不依赖进程的全局 random 状态
+        self.rng = random.Random(seed)
+        self.sample_ttft = parse_distribution(ttft, self.rng)
+        self.sample_itl = parse_distribution(itl, self.rng)
+        self.sample_output_tokens = parse_distribution(output_tokens, self.rng) if output_tokens is not None else None
+        self.tokens_per_chunk = max(1, int(tokens_per_chunk))
+        self.semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self.max_queue = max_queue
+        self.api_key = api_key
+        self.error_429_rate = error_429_rate
+        self.error_401_rate = error_401_rate
+        self.error_5xx_rate = error_5xx_rate
+        self.disconnect_rate = disconnect_rate
+        self.prefill_per_token = prefill_per_token
+        self.prefix_cache_size = prefix_cache_size
+        self.prefix_cache = collections.OrderedDict()
+        self.server = None
+        self.stats = {"requests": 0, "active": 0, "queued": 0, "completed": 0, "errors": 0, "disconnects": 0,
+                      "prefix_hits": 0}
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # port=0 时由系统分配端口
+        self.port = self.server.sockets[0].getsockname()[1]
+        logging.info(f"模拟服务已启动: http://{self.host}:{self.port}/v1")
+        return self
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def serve_forever(self):
+        if not self.server:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                except ValueError:
+                    # 请求行不完整（如缺少路径或协议版本），无法继续解析同一连接上的后续数据
+                    self._write_error(writer, 400, "invalid_request_error", "Malformed request line",
+                                      {"Connection": "close"})
+                    await writer.drain()
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = b""
+                if "content-length" in headers:
+                    body = await reader.readexactly(int(headers["content-length"]))
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self._dispatch(method, path, headers, body, writer)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (_InjectedDisconnect, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, path, headers, body, writer):
+        path = path.split("?", 1)[0].rstrip("/")
+        if method == "GET" and path.endswith("/models"):
+            self._write_json(writer, 200, {"object": "list", "data": [{"id": "mock-model", "object": "model", "owned_by": "mock"}]})
+        elif method == "GET" and path.endswith("/stats"):
+            self._write_json(writer, 200, self.stats)
+        elif method == "POST" and path.endswith("/chat/completions"):
+            await self._chat_completions(headers, body, writer)
+        else:
+            self._write_error(writer, 404, "not_found", f"Unknown endpoint {method} {path}")
+
+    def _write_response_head(self, writer, status, content_type, extra_headers=None):
+        lines = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", f"Content-Type: {content_type}"]
+        for name, value in (extra_headers or {}).items():
+            lines.append(f"{name}: {value}")
+        writer.write(("\r\n".join(lines) + "\r\n").encode("latin-1"))
+
+    def _write_json(self, writer, status, payload, extra_headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Length": len(data)}
+        headers.update(extra_headers or {})
+        self._write_response_head(writer, status, "application/json", headers)
+        writer.write(b"\r\n" + data)
+
+    def _write_error(self, writer, status, error_type, message, extra_headers=None):
+        self.stats["errors"] += 1
+        self._write_json(writer, status, {"error": {"message": message, "type": error_type, "code": error_type}}, extra_headers)
+
+    def _inject_error(self, headers, writer):
+        """按配置的概率注入错误，返回 True 表示已写出错误响应。"""
+        if self.api_key and headers.get("authorization") != f"Bearer {self.api_key}":
+            self._write_error(writer, 401, "invalid_api_key", "Incorrect API key provided")
+            return True
+        roll = self.rng.random()
+        if roll < self.error_401_rate:
+            self._write_error(writer, 401, "invalid_api_key", "Incorrect API key provided")
+            return True
+        roll -= self.error_401_rate
+        if roll < self.error_429_rate:
+            self._write_error(writer, 429, "rate_limit_exceeded", "Rate limit reached for requests",
+                              {"Retry-After": "0"})
+            return True
+        roll -= self.error_429_rate
+        if roll < self.error_5xx_rate:
+            self._write_error(writer, self.rng.choice([500, 502, 503]), "server_error",
+                              "The server had an error while processing your request")
+            return True
+        return False
+
+    async def _chat_completions(self, headers, body, writer):
+        self.stats["requests"] += 1
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            self._write_error(writer, 400, "invalid_request_error", "Invalid JSON body")
+            return
+        if self._inject_error(headers, writer):
+            return
+
+        if self.semaphore and self.semaphore.locked() and self.max_queue is not None and self.stats["queued"] >= self.max_queue:
+            self._write_error(writer, 503, "server_overloaded", "The server is overloaded, queue is full")
+            return
+
+        self.stats["queued"] += 1
+        if self.semaphore:
+            await self.semaphore.acquire()
+        self.stats["queued"] -= 1
+        self.stats["active"] += 1
+        try:
+            await self._generate(payload, writer)
+            self.stats["completed"] += 1
+        finally:
+            self.stats["active"] -= 1
+            if self.semaphore:
+                self.semaphore.release()
+
+    def _cached_tokens(self, messages):
+        """按首条 system 消息查询并更新前缀缓存，返回命中的 token 数。"""
+        if not self.prefix_cache_size or not messages or messages[0].get("role") != "system":
+            return 0
+        key = json.dumps(messages[0].get("content"), ensure_ascii=False)
+        if key in self.prefix_cache:
+            self.prefix_cache.move_to_end(key)
+            self.stats["prefix_hits"] += 1
+            return _estimate_prompt_tokens(messages[:1])
+        self.prefix_cache[key] = True
+        if len(self.prefix_cache) > self.prefix_cache_size:
+            self.prefix_cache.popitem(last=False)
+        return 0
+
+    async def _generate(self, payload, writer):
+        max_tokens = payload.get("max_tokens") or payload.get("max_completion_tokens") or 16
+        num_tokens = max_tokens
+        if self.sample_output_tokens:
+            num_tokens = max(1, min(max_tokens, int(round(self.sample_output_tokens()))))
+        prompt_tokens = _estimate_prompt_tokens(payload.get("messages"))
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": num_tokens, "total_tokens": prompt_tokens + num_tokens}
+        model = payload.get("model", "mock-model")
+        created = int(time.time())
+        disconnect_after = self.rng.randint(0, max(0, num_tokens - 1)) if self.rng.random() < self.disconnect_rate else None
+
+        prefill = self.prefill_per_token * max(0, prompt_tokens - self._cached_tokens(payload.get("messages")))
+        await asyncio.sleep(self.sample_ttft() + prefill)
+
+        if not payload.get("stream"):
+            # 非流式：等待全部 token 生成完再一次性返回
+            await asyncio.sleep(sum(self.sample_itl() for _ in range(max(0, num_tokens - 1))))
+            text = "".join(_TOKEN_VOCAB[i % len(_TOKEN_VOCAB)] for i in range(num_tokens))
+            self._write_json(writer, 200, {
+                "id": "chatcmpl-mock", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "length"}],
+                "usage": usage,
+            })
+            return
+
+        self._write_response_head(writer, 200, "text/event-stream",
+                                  {"Cache-Control": "no-cache", "Transfer-Encoding": "chunked"})
+        writer.write(b"\r\n")
+        chunk_prefix = json.dumps({"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created, "model": model})[:-1]
+
+        sent = 0
+        while sent < num_tokens:
+            if sent:
+                await asyncio.sleep(sum(self.sample_itl() for _ in range(self.tokens_per_chunk)))
+            count = min(self.tokens_per_chunk, num_tokens - sent)
+            text = "".join(_TOKEN_VOCAB[(sent + i) % len(_TOKEN_VOCAB)] for i in range(count))
+            sent += count
+            finish_reason = json.dumps("length") if sent >= num_tokens else "null"
+            self._write_sse(writer, f'{chunk_prefix}, "choices": [{{"index": 0, "delta": {{"content": {json.dumps(text, ensure_ascii=False)}}}, "finish_reason": {finish_reason}}}]}}')
+            await writer.drain()
+            if disconnect_after is not None and sent > disconnect_after:
+                # 模拟服务端在流中途断开连接
+                self.stats["disconnects"] += 1
+                writer.transport.abort()
+                raise _InjectedDisconnect()
+
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            self._write_sse(writer, f'{chunk_prefix}, "choices": [], "usage": {json.dumps(usage)}}}')
+        self._write_sse(writer, "[DONE]")
+        writer.write(b"0\r\n\r\n")
+
+    def _write_sse(self, writer, data):
+        event = f"data: {data}\n\n".encode("utf-8")
+        writer.write(f"{len(event):x}\r\n".encode("latin-1") + event + b"\r\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible streaming server for benchmarking the benchmark")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000)")
+    parser.add_argument("--ttft", type=str, default="0.2",
+                        help="Time-to-first-token distribution in seconds, e.g. 0.2, uniform:0.1,0.3, lognormal:0.2,0.5 (default: 0.2)")
+    parser.add_argument("--itl", type=str, default="0.02", help="Inter-token delay distribution in seconds (default: 0.02)")
+    parser.add_argument("--output_tokens", type=str, default=None,
+                        help="Output token count distribution, capped by max_tokens (default: max_tokens)")
+    parser.add_argument("--tokens_per_chunk", type=int, default=1, help="Tokens coalesced into one SSE chunk (default: 1)")
+    parser.add_argument("--max_concurrency", type=int, default=None, help="Requests generated at once; the rest queue (default: unlimited)")
+    parser.add_argument("--max_queue", type=int, default=None, help="Queue length above which requests get 503 (default: unlimited)")
+    parser.add_argument("--api_key", type=str, default=None, help="Require this Bearer token, otherwise respond 401")
+    parser.add_argument("--error_429_rate", type=float, default=0.0, help="Probability of a 429 rate-limit response")
+    parser.add_argument("--error_401_rate", type=float, default=0.0, help="Probability of a 401 auth error")
+    parser.add_argument("--error_5xx_rate", type=float, default=0.0, help="Probability of a 500/502/503 response")
+    parser.add_argument("--disconnect_rate", type=float, default=0.0, help="Probability of dropping the connection mid-stream")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed")
+    parser.add_argument("--prefill_per_token", type=float, default=0.0,
+                        help="Extra time to first token per uncached prompt token in seconds, e.g. 0.00005 (default: 0)")
+    parser.add_argument("--prefix_cache_size", type=int, default=0,
+                        help="Cache this many system messages (LRU) and skip their prefill time on a hit (default: 0, off)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = MockLLMServer(
+        host=args.host, port=args.port, ttft=args.ttft, itl=args.itl, output_tokens=args.output_tokens,
+        tokens_per_chunk=args.tokens_per_chunk, max_concurrency=args.max_concurrency, max_queue=args.max_queue,
+        api_key=args.api_key, error_429_rate=args.error_429_rate, error_401_rate=args.error_401_rate,
+        error_5xx_rate=args.error_5xx_rate, disconnect_rate=args.disconnect_rate, seed=args.seed,
+        prefill_per_token=args.prefill_per_token, prefix_cache_size=args.prefix_cache_size,
+    )
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+前缀缓存（KV 复用）效果测试。
+
+视觉模板追加时间戳、长文本重复 context_base，都是为了避开或控制服务端缓存；这里反过来直接测量前缀缓存的收益。
+负载为 scenario.py 中的 shared_prefix 请求类别：num_prefixes 个长度为 L 的共享 system 前缀（可理解为 N 份系统提示或文档），
+每个请求附带唯一的 user 后缀；按命中率 h 使用共享前缀（cache=hit），否则使用同样长度的唯一前缀（cache=miss）。
+
+对每个前缀长度 L：
+    1. 预热：单进程依次发送每个共享前缀一次（max_tokens=1），让前缀进入服务端缓存；
+    2. 对每个命中率 h 各跑一轮，按 cache 标签分别统计命中 / 未命中请求的 TTFT。
+报告每个 (L, h) 的命中 / 未命中 TTFT、加速比（未命中 TTFT P50 / 命中 TTFT P50），以及整体 TTFT 相对 h=0
+（全部未命中）的加速比，得到加速比随前缀长度和命中率变化的曲线。
+"命中" 指请求使用了已预热的共享前缀，服务端是否真正命中缓存取决于其缓存容量和淘汰策略，加速比接近 1 即说明没有生效。
+"""
+import asyncio
+
+from rich.console import Console
+from rich.table import Table
+
+from scenario import normalize_class
+
+DEFAULT_PREFIX_LENGTHS = "512,2048,8192"
+DEFAULT_HIT_RATES = "0,0.5,0.9,1"
+# 每轮测试的输出 token 数：只关心预填充，输出保持较短
+DEFAULT_OUTPUT_TOKENS = 32
+
+
+def parse_prefix_grid(prefix_lengths, hit_rates):
+    """解析逗号分隔的前缀长度（token）和命中率列表，返回 (长度列表, 命中率列表)。"""
+    lengths = sorted({int(value) for value in str(prefix_lengths).split(",") if value.strip()})
+    rates = sorted({float(value) for value in str(hit_rates).split(",") if value.strip()})
+    if not lengths or lengths[0] < 1:
+        raise ValueError("prefix lengths must be positive integers, e.g. 512,2048,8192")
+    if not rates or rates[0] < 0 or rates[-1] > 1:
+        raise ValueError("hit rates must be between 0 and 1, e.g. 0,0.5,0.9,1")
+    return lengths, rates
+
+
+def prefix_cache_config(prefix_lengths, hit_rates=DEFAULT_HIT_RATES, num_prefixes=8, suffix_tokens=64, num_requests=100,
+                        concurrency=4):
+    """由命令行参数构造前缀缓存测试配置，提前校验长度和命中率的写法；未指定前缀长度时返回 None。"""
+    if not prefix_lengths:
+        return None
+    parse_prefix_grid(prefix_lengths, hit_rates)
+    return {
+        "prefix_lengths": prefix_lengths,
+        "hit_rates": hit_rates,
+        "num_prefixes": num_prefixes,
+        "suffix_tokens": suffix_tokens,
+        "num_requests": num_requests,
+        "concurrency": concurrency,
+    }
+
+
+def prefix_cache_class(prefix_tokens, hit_rate, num_prefixes=8, suffix_tokens=64):
+    """构造单个 shared_prefix 请求类别，作为 request_mix 传给 run_benchmark。"""
+    return normalize_class(0, {
+        "name": f"prefix-{prefix_tokens}",
+        "prompt": "shared_prefix",
+        "prefix_tokens": prefix_tokens,
+        "num_prefixes": num_prefixes,
+        "hit_rate": hit_rate,
+        "suffix_tokens": suffix_tokens,
+    })
+
+
+def _cache_group(result, value):
+    return ((result.get("breakdown") or {}).get("cache") or {}).get(value) or {}
+
+
+def _ttft(group, key):
+    return (group.get("time_to_first_token") or {}).get(key)
+
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if numerator is not None and denominator else None
+
+
+async def run_prefix_cache_sweep(run_phase, prefix_lengths, hit_rates, num_prefixes=8, suffix_tokens=64,
+                                 num_requests=100, concurrency=4, cooldown=1.0, console=None):
+    """
+    按前缀长度 × 命中率执行前缀缓存测试。
+    :param run_phase: async (request_mix, num_requests, concurrency, output_tokens, warmup) -> run_benchmark 的结果字典；
+                      warmup 为 True 时应在单进程内执行，保证每个共享前缀都被发送一次
+    :return: (各轮测试结果, 报告)
+    """
+    console = console or Console()
+    all_results = []
+    points = []
+    for prefix_tokens in prefix_lengths:
+        console.print(f"[bold cyan]前缀缓存: 前缀 {prefix_tokens} tokens, 预热 {num_prefixes} 个共享前缀...[/bold cyan]")
+        await run_phase([prefix_cache_class(prefix_tokens, 1.0, num_prefixes, suffix_tokens)], num_prefixes,
+                        min(num_prefixes, concurrency), 1, True)
+        baseline = None
+        for hit_rate in hit_rates:
+            await asyncio.sleep(cooldown)
+            console.print(f"[bold cyan]前缀缓存: 前缀 {prefix_tokens} tokens, 命中率 {hit_rate:g}, 请求数 {num_requests}, "
+                          f"并发数 {concurrency}...[/bold cyan]")
+            result = await run_phase([prefix_cache_class(prefix_tokens, hit_rate, num_prefixes, suffix_tokens)],
+                                     num_requests, concurrency, DEFAULT_OUTPUT_TOKENS, False)
+            result["prefix_cache"] = {"prefix_tokens": prefix_tokens, "hit_rate": hit_rate}
+            all_results.append(result)
+
+            hit, miss = _cache_group(result, "hit"), _cache_group(result, "miss")
+            ttft_p50 = _ttft(result, "p50")
+            if hit_rate == 0:
+                baseline = ttft_p50
+            point = {
+                "prefix_tokens": prefix_tokens,
+                "hit_rate": hit_rate,
+                "achieved_hit_rate": hit.get("requests", 0) / max(result["total_requests"], 1),
+                "requests": result["total_requests"],
+                "successful_requests": result["successful_requests"],
+                "ttft_p50": ttft_p50,
+                "ttft_hit_p50": _ttft(hit, "p50"),
+                "ttft_hit_p95": _ttft(hit, "p95"),
+                "ttft_miss_p50": _ttft(miss, "p50"),
+                "ttft_miss_p95": _ttft(miss, "p95"),
+                # 同一轮内未命中 / 命中的 TTFT 之比，负载相同
+                "hit_speedup": _ratio(_ttft(miss, "p50"), _ttft(hit, "p50")),
+                # 整体 TTFT 相对同一前缀长度下全部未命中 (h=0) 的加速比
+                "overall_speedup": _ratio(baseline, ttft_p50),
+            }
+            points.append(point)
+            console.print(f"  TTFT P50 命中 {_seconds(point['ttft_hit_p50'])} / 未命中 {_seconds(point['ttft_miss_p50'])}, "
+                          f"加速比 {_times(point['hit_speedup'])}")
+        await asyncio.sleep(cooldown)
+
+    report = {
+        "num_prefixes": num_prefixes,
+        "suffix_tokens": suffix_tokens,
+        "requests_per_point": num_requests,
+        "concurrency": concurrency,
+        "points": points,
+    }
+    return all_results, report
+
+
+def _seconds(value):
+    return f"{value:.3f}" if value is not None else "N/A"
+
+
+def _times(value):
+    return f"{value:.2f}x" if value is not None else "N/A"
+
+
+def print_prefix_cache_report(report, console=None):
+    console = console or Console()
+    table = Table(title=f"前缀缓存加速比 ({report['num_prefixes']} 个共享前缀, 后缀 {report['suffix_tokens']} tokens, "
+                        f"并发数 {report['concurrency']})", header_style="bold cyan", border_style="blue")
+    for column in ("前缀 tokens", "命中率", "实际命中率", "请求数", "TTFT P50", "命中 P50", "命中 P95", "未命中 P50",
+                   "未命中 P95", "命中加速比", "整体加速比"):
+        table.add_column(column, justify="right")
+    for point in report["points"]:
+        table.add_row(str(point["prefix_tokens"]), f"{point['hit_rate']:g}", f"{point['achieved_hit_rate']:.1%}",
+                      str(point["requests"]), _seconds(point["ttft_p50"]), _seconds(point["ttft_hit_p50"]),
+                      _seconds(point["ttft_hit_p95"]), _seconds(point["ttft_miss_p50"]), _seconds(point["ttft_miss_p95"]),
+                      _times(point["hit_speedup"]), _times(point["overall_speedup"]))
+    Console(width=160).print(table)
+    console.print("命中加速比 = 同一轮未命中 TTFT P50 / 命中 TTFT P50；整体加速比 = 命中率 0 时的 TTFT P50 / 本轮 TTFT P50")
+
+
+def plot_prefix_cache_curve(report, filename="prefix_cache_speedup.png"):
+    import matplotlib.pyplot as plt
+
+    points = report["points"]
+    lengths = sorted({point["prefix_tokens"] for point in points})
+    rates = sorted({point["hit_rate"] for point in points})
+    fig, (left, right) = plt.subplots(1, 2, figsize=(13, 5))
+
+    # 左图：命中 / 未命中 TTFT 之比随前缀长度的变化（按命中率分线）
+    for rate in rates:
+        series = [(point["prefix_tokens"], point["hit_speedup"]) for point in points
+                  if point["hit_rate"] == rate and point["hit_speedup"] is not None]
+        if series:
+            left.plot(*zip(*series), "o-", label=f"hit rate {rate:g}")
+    left.axhline(1.0, color="gray", linestyle=":")
+    left.set_xscale("log", base=2)
+    left.set_title("Cache-hit TTFT speedup vs prefix length")
+    left.set_xlabel("Prefix length (tokens)")
+    left.set_ylabel("Miss TTFT P50 / Hit TTFT P50")
+    left.grid(True)
+    left.legend()
+
+    # 右图：整体 TTFT 相对全部未命中的加速比随命中率的变化（按前缀长度分线）
+    for length in lengths:
+        series = [(point["hit_rate"], point["overall_speedup"]) for point in points
+                  if point["prefix_tokens"] == length and point["overall_speedup"] is not None]
+        if series:
+            right.plot(*zip(*series), "o-", label=f"prefix {length}")
+    right.axhline(1.0, color="gray", linestyle=":")
+    right.set_title("Overall TTFT speedup vs hit rate")
+    right.set_xlabel("Hit rate")
+    right.set_ylabel("TTFT P50 at hit rate 0 / TTFT P50")
+    right.grid(True)
+    right.legend()
+
+    fig.tight_layout()
+    fig.savefig(filename)
+    plt.close(fig)
@@ -0,0 +1,239 @@
+"""
+预构建的 prompt 语料。
+
+每轮测试开始前把所有请求体（消息列表）一次性构建好并缓存，请求时只做一次随机抽取，
+不再在热路径上拼接长文本。支持两种来源：
+    - 内置短文本 / 长文本 prompt，长文本按 (prompt 对, 目标长度) 缓存，相同倍数的内容共享同一个字符串；
+    - 外部 JSONL 语料，打开时只建立行偏移索引，按需解析并缓存，用于回放真实的 prompt 分布。
+
+JSONL 每行一个对象，"messages"（OpenAI 消息列表）或 "prompt"（单条 user 消息）二选一，
+可选 "max_tokens" 覆盖该条请求的输出上限。
+
+另有按目标输入 token 数生成的合成 prompt（synthetic_entry）、按目标字符数截取的内置长文本（long_context_slice_entry）
+和前缀缓存测试用的共享前缀 prompt（shared_prefix_entry），用于混合负载、trace 回放和前缀缓存测试。
+"""
+import hashlib
+import itertools
+import json
+import random
+
+# 长文本内容缓存，键为 (prompt 对下标, 重复倍数)；不同目标长度算出相同倍数时共享内容
+_LONG_CONTENT_CACHE = {}
+# 内置语料缓存，键为 ("short",) 或 ("long", 目标长度)
+_BUILTIN_CORPORA = {}
+_JSONL_CORPORA = {}
+# 请求消息序列化后的字节数缓存，键为 prompt_key
+_PROMPT_BYTES_CACHE = {}
+
+# 合成 prompt 的词表：常见英文短词，带前导空格时在主流 BPE tokenizer 中各占 1 个 token
+_SYNTHETIC_WORDS = (
+    "the of and to in is that for it as was with be by on not he this are or his from at which but have an they "
+    "you were her she there one all we their been has when who will more no if out so said what up its about "
+    "into than them can only other new some time could these two may then do first any my now such like our "
+    "over man me even most made after also did many before must through back years where much your way well "
+    "down should because each just those people how too little state good very make world still own see men "
+    "work long get here between both life being under never day same another know while last might us great "
+    "old year off come since against go came right used take three"
+).split()
+# 合成 prompt 的随机词池（词数），请求从随机位置截取，不同请求之间不共享前缀
+_SYNTHETIC_POOL_WORDS = 1 << 16
+_SYNTHETIC_POOL = None
+# 单条 user 消息在 JSON 中除正文外的固定开销
+_USER_MESSAGE_OVERHEAD = len(json.dumps([{"role": "user", "content": ""}]))
+
+
+def _make_entry(prompt_id, messages, prompt_key, max_tokens=None):
+    return {
+        "prompt_id": prompt_id,
+        "messages": messages,
+        "prompt_key": prompt_key,
+        "prompt_bytes": len(json.dumps(messages, ensure_ascii=False).encode("utf-8")),
+        "max_tokens": max_tokens,
+    }
+
+
+class PromptCorpus:
+    """内存中的预构建语料，draw() 随机返回一条请求体。"""
+
+    def __init__(self, entries):
+        if not entries:
+            raise ValueError("Prompt corpus is empty")
+        self.entries = entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def draw(self):
+        return random.choice(self.entries)
+
+
+class JsonlCorpus:
+    """
+    从 JSONL 文件延迟加载的语料：打开时只扫描行偏移，条目在第一次被抽到时解析并缓存。
+    内容完全相同的行共享同一个条目（prompt_id 取首次出现的行号），抽取时仍按出现次数加权。
+    语料在进程内缓存、不会关闭，因此不保持文件打开，解析未缓存的条目时再按偏移读取该行。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offsets = []
+        # 每一行对应的首次出现行号，用于去重
+        self.canonical = []
+        self.entries = {}
+        first_seen = {}
+        offset = 0
+        with open(path, "rb") as f:
+            for line in f:
+                stripped = line.strip()
+                if stripped:
+                    digest = hashlib.blake2b(stripped, digest_size=16).digest()
+                    self.canonical.append(first_seen.setdefault(digest, len(self.offsets)))
+                    self.offsets.append(offset)
+                offset += len(line)
+        if not self.offsets:
+            raise ValueError(f"Prompt corpus {path} is empty")
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _load(self, index):
+        with open(self.path, "rb") as f:
+            f.seek(self.offsets[index])
+            item = json.loads(f.readline())
+        if "messages" in item:
+            messages = item["messages"]
+        elif "prompt" in item:
+            messages = [{"role": "user", "content": item["prompt"]}]
+        else:
+            raise ValueError(f"{self.path}: prompt #{index + 1} has neither a 'messages' nor a 'prompt' field")
+        entry = _make_entry(index, messages, ("file", self.path, index), item.get("max_tokens"))
+        self.entries[index] = entry
+        return entry
+
+    def draw(self):
+        index = self.canonical[random.randrange(len(self.canonical))]
+        entry = self.entries.get(index)
+        return entry if entry is not None else self._load(index)
+
+
+def cached_prompt_bytes(prompt_key, messages):
+    """返回请求消息序列化后的字节数，按 prompt_key 缓存，避免每个请求重复序列化长文本。"""
+    size = _PROMPT_BYTES_CACHE.get(prompt_key)
+    if size is None:
+        size = len(json.dumps(messages, ensure_ascii=False).encode("utf-8"))
+        _PROMPT_BYTES_CACHE[prompt_key] = size
+    return size
+
+
+def _long_content(pair_index, pair, multiplier):
+    key = (pair_index, multiplier)
+    content = _LONG_CONTENT_CACHE.get(key)
+    if content is None:
+        content = pair["context_base"] * multiplier + "\n\n" + pair["prompt"]
+        _LONG_CONTENT_CACHE[key] = content
+    return content
+
+
+def build_builtin_corpus(short_prompts, long_prompt_pairs, use_long_context, long_context_length):
+    """构建（或取缓存的）内置语料；长文本按 context_base 重复到不少于目标字符数的倍数。"""
+    cache_key = ("long", long_context_length) if use_long_context else ("short",)
+    corpus = _BUILTIN_CORPORA.get(cache_key)
+    if corpus is not None:
+        return corpus
+
+    entries = []
+    if use_long_context:
+        for pair_index, pair in enumerate(long_prompt_pairs):
+            # 计算需要重复的倍数，至少为1
+            multiplier = max(1, long_context_length // len(pair["context_base"]))
+            messages = [{"role": "user", "content": _long_content(pair_index, pair, multiplier)}]
+            entries.append(_make_entry(pair_index, messages, ("long", pair_index, multiplier)))
+    else:
+        for prompt_id, prompt in enumerate(short_prompts):
+            entries.append(_make_entry(prompt_id, [{"role": "user", "content": prompt}], ("short", prompt_id)))
+    corpus = PromptCorpus(entries)
+    _BUILTIN_CORPORA[cache_key] = corpus
+    return corpus
+
+
+def load_jsonl_corpus(path):
+    """打开（或取缓存的）JSONL 语料，同一进程内每个文件只建立一次索引。"""
+    corpus = _JSONL_CORPORA.get(path)
+    if corpus is None:
+        corpus = JsonlCorpus(path)
+        _JSONL_CORPORA[path] = corpus
+    return corpus
+
+
+def _synthetic_pool(num_words):
+    """返回 (词池文本, 各词起始偏移)，词池至少包含 num_words + 1 个词，按需加倍扩容。"""
+    global _SYNTHETIC_POOL
+    if _SYNTHETIC_POOL is None or len(_SYNTHETIC_POOL[1]) <= num_words:
+        size = max(_SYNTHETIC_POOL_WORDS, 2 * num_words + 1)
+        # 固定种子，各进程 / 各机生成相同的词池
+        rng = random.Random(0)
+        words = [" " + rng.choice(_SYNTHETIC_WORDS) for _ in range(size)]
+        offsets = list(itertools.accumulate((len(word) for word in words), initial=0))
+        _SYNTHETIC_POOL = ("".join(words), offsets)
+    return _SYNTHETIC_POOL
+
+
+def _synthetic_text(num_tokens, start=None):
+    """从词池的 start 位置（默认随机）截取 num_tokens 个词。"""
+    text, offsets = _synthetic_pool(num_tokens if start is None else start + num_tokens)
+    if start is None:
+        start = random.randrange(len(offsets) - num_tokens)
+    return text[offsets[start] + 1:offsets[start + num_tokens]]
+
+
+def synthetic_entry(num_tokens):
+    """
+    返回约 num_tokens 个输入 token 的合成 prompt 条目：从固定词池的随机位置截取 num_tokens 个词（每词约 1 个 token）。
+    文本为 ASCII，请求体字节数直接按长度计算；prompt_key 只区分长度，本地 tokenizer 计数按长度缓存（近似值）。
+    """
+    num_tokens = max(1, int(num_tokens))
+    content = _synthetic_text(num_tokens)
+    return {
+        "prompt_id": num_tokens,
+        "messages": [{"role": "user", "content": content}],
+        "prompt_key": ("synthetic", num_tokens),
+        "prompt_bytes": len(content) + _USER_MESSAGE_OVERHEAD,
+        "max_tokens": None,
+    }
+
+
+def long_context_slice_entry(long_prompt_pairs, num_chars):
+    """
+    返回约 num_chars 个字符的长文本 prompt 条目：随机选一组内置长文本，从重复正文的随机位置截取，末尾附上该组的问题。
+    重复正文按 2 的幂倍数缓存，各种目标长度共享少量字符串；起点随机，不同请求之间基本不共享前缀。
+    """
+    num_chars = max(1, int(num_chars))
+    pair_index = random.randrange(len(long_prompt_pairs))
+    pair = long_prompt_pairs[pair_index]
+    base = pair["context_base"]
+    body_chars = max(0, num_chars - len(pair["prompt"]) - 2)
+    multiplier = 1 << (body_chars // len(base) + 1).bit_length()
+    source = _long_content(pair_index, pair, multiplier)
+    start = random.randrange(len(base))
+    content = source[start:start + body_chars] + "\n\n" + pair["prompt"]
+    return _make_entry(num_chars, [{"role": "user", "content": content}], ("long_slice", num_chars))
+
+
+def shared_prefix_text(prefix_index, num_tokens):
+    """返回第 prefix_index 个共享前缀：固定词池中第 prefix_index 段 num_tokens 个词，各进程 / 各机内容一致。"""
+    return _synthetic_text(num_tokens, start=prefix_index * num_tokens)
+
+
+def _unique_text(num_tokens):
+    # 开头的随机标记让文本从第一个 token 起就与任何已缓存的前缀不同
+    return f"[{random.getrandbits(48):012x}] " + _synthetic_text(max(1, num_tokens))
+
+
+def shared_prefix_entry(prefix_index, prefix_tokens, suffix_tokens):
+    """
+    返回前缀缓存测试的请求条目：system 消息为约 prefix_tokens 个 token 的前缀，user 消息为唯一的后缀。
+    prefix_index 为共享前缀编号（可命中缓存）；为 None 时前缀也是唯一的（必然未命中）。
+    """
+    prefix = shared_prefix_text(prefix_index, prefix_tokens) if prefix_index is not None else _unique_text(prefix_tokens)
+    messages = [{"role": "system", "content": prefix}, {"role": "user", "content": _unique_text(suffix_tokens)}]
+    return _make_entry(prefix_tokens, messages, ("shared_prefix", prefix_tokens, suffix_tokens))
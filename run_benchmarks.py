@@ -3,7 +3,23 @@ import json
 import time
 import argparse
 import collections
-from llm_benchmark import run_benchmark
+import os
+import logging
+from llm_benchmark import (TRANSPORTS, create_llm_client, load_config, output_config, run_benchmark_multiprocess,
+                           workload_config)
+from distributed import DistributedCoordinator
+from http_client import DEFAULT_KEEPALIVE_EXPIRY, connection_pool_config
+from vision_workload import vision_workload_config
+from live_dashboard import LiveDashboard
+from run_checkpoint import DEFAULT_CHECKPOINT_DIR, RunCheckpoint, atomic_write_json, config_hash, phase_key
+from history import HistoryRecorder, HistoryStore
+from prefix_cache import (DEFAULT_HIT_RATES, parse_prefix_grid, plot_prefix_cache_curve, prefix_cache_config,
+                          print_prefix_cache_report, run_prefix_cache_sweep)
+from slo_search import parse_slo, plot_goodput_curve, print_slo_report, search_capacity
+from scenario import load_scenario
+from sessions import THINK_DISTRIBUTIONS, session_config
+from sweep import (DEFAULT_CONCURRENCY, DEFAULT_INPUT_TOKENS, DEFAULT_MAX_TOKENS, SAMPLING_METHODS, plot_sweep_heatmaps,
+                   print_sweep_table, run_sweep, sweep_class, sweep_config, write_sweep_table)
 import numpy as np
 from rich.console import Console
 from rich.table import Table
@@ -13,7 +29,127 @@ from rich.style import Style
 import matplotlib.pyplot as plt
 from rich.progress import Progress, TextColumn, BarColumn, TaskProgressColumn
 
-async def run_all_benchmarks(llm_url, api_key, model, use_long_context, long_context_length, request_timeout, adaptive_mode=False, auth_config=None, vision_model=False):
+async def run_all_benchmarks(llm_url, api_key, model, use_long_context, long_context_length, request_timeout, adaptive_mode=False, auth_config=None, vision_model=False, processes=1,
+                             agents=None, agent_token=None, load=None, workload=None, output=None, live_window=None,
+                             slo=None, slo_max_concurrency=512, pool_config=None, transport="openai", scenario=None,
+                             prefix_cache=None, session=None, sweep=None, checkpoint=None, history=None):
+    """
+    load / workload / output 为每轮测试共用的负载、请求内容和结果输出配置（见 llm_benchmark.load_config 等）；
+    output 中的样本文件和时间序列文件每轮追加 _c<并发数> 后缀，导出指标的 phase 标签按测试模式设置。
+    """
+    # 每轮测试共用的参数
+    phase_options = {
+        "llm_url": llm_url,
+        "api_key": api_key,
+        "model": model,
+        "use_long_context": use_long_context,
+        "long_context_length": long_context_length,
+        "request_timeout": request_timeout,
+        "auth_config": auth_config,
+        "vision_model": vision_model,
+        "processes": processes,
+        "coordinator": None,
+        "load": load or load_config(),
+        "workload": workload or workload_config(),
+        "output": output or output_config(),
+        "live_window": live_window,
+        "pool_config": pool_config,
+        "transport": transport,
+        "request_mix": None,
+        "session": session,
+        "client": None,
+        "checkpoint": checkpoint,
+        "history": history,
+    }
+    if agents:
+        phase_options["coordinator"] = DistributedCoordinator(agents, token=agent_token)
+        await phase_options["coordinator"].connect()
+    elif processes == 1:
+        # 本机单进程运行时各轮测试共用一个客户端，连接在轮次之间保持，不重复握手
+        phase_options["client"] = create_llm_client(llm_url, api_key, auth_config, pool_config, transport)
+    try:
+        if scenario:
+            return await _run_scenario(scenario, phase_options)
+        if prefix_cache:
+            return await _run_prefix_cache(prefix_cache, phase_options)
+        if sweep:
+            return await _run_sweep(sweep, phase_options)
+        if slo:
+            return await _run_slo_search(slo, slo_max_concurrency, phase_options)
+        return await _run_all_phases(adaptive_mode, phase_options)
+    finally:
+        if checkpoint:
+            # 中断时也写入最后一轮结果的标注（如 SLO 判定）
+            checkpoint.flush()
+        if phase_options["coordinator"]:
+            await phase_options["coordinator"].close()
+        if phase_options["client"]:
+            await phase_options["client"].close()
+
+async def _run_phase(num_requests, concurrency, output_tokens, phase_options, phase_name=None, observers=None):
+    """
+    执行单轮测试：配置了 agent 时分发到多台压测机，否则在本机（可多进程）执行。
+    设置了 live_window 时在测试过程中显示最近 live_window 秒的滑动窗口实时面板；
+    phase_name 作为导出指标的 phase 标签，observers 为额外的观察者。
+    设置了 duration 时每轮按时长运行，忽略 num_requests。
+    设置了 checkpoint 时每轮结束后持久化结果；续跑时已完成的轮次直接返回检查点中的结果（见 run_checkpoint.py）。
+    设置了 history 时收集本轮的请求样本，运行结束后写入历史数据库（见 history.py）。
+    """
+    options = dict(phase_options)
+    options["output"] = dict(options["output"], metrics_phase=phase_name)
+    options["observers"] = list(observers or [])
+    coordinator = options.pop("coordinator")
+    processes = options.pop("processes")
+    live_window = options.pop("live_window")
+    client = options.pop("client")
+    checkpoint = options.pop("checkpoint")
+    history = options.pop("history")
+    if checkpoint:
+        key = phase_key(phase_name, num_requests, concurrency, output_tokens, options)
+        slot, results = checkpoint.begin(key)
+        if results is not None:
+            Console().print(f"[dim]跳过已完成的轮次 {phase_name or ''} (并发数 {concurrency})，使用检查点中的结果[/dim]")
+            return results
+        snapshot = checkpoint.partial_snapshot(key)
+        if snapshot:
+            options["observers"].append(snapshot)
+    if history:
+        samples = history.sample_observer()
+        options["observers"].append(samples)
+    results = await _run_phase_now(num_requests, concurrency, output_tokens, options, coordinator, processes,
+                                   live_window, client)
+    if checkpoint:
+        checkpoint.record(slot, results)
+    if history:
+        history.add(results, samples)
+    return results
+
+async def _run_phase_now(num_requests, concurrency, output_tokens, options, coordinator, processes, live_window, client):
+    output = options["output"]
+    if output["samples_file"]:
+        # 每轮测试写入独立的样本文件，如 samples.npy -> samples_c10.npy
+        stem, ext = os.path.splitext(output["samples_file"])
+        output = dict(output, samples_file=f"{stem}_c{concurrency}{ext or '.npy'}")
+    if output["timeseries_file"]:
+        stem, ext = os.path.splitext(output["timeseries_file"])
+        output = dict(output, timeseries_file=f"{stem}_c{concurrency}{ext or '.csv'}")
+    options["output"] = output
+    if options["load"]["duration"]:
+        num_requests = None
+    if not live_window:
+        return await _dispatch_phase(num_requests, concurrency, output_tokens, coordinator, processes, client, options)
+    with LiveDashboard(f"并发数 {concurrency}", num_requests, window_seconds=live_window) as dashboard:
+        options["observers"].append(dashboard)
+        return await _dispatch_phase(num_requests, concurrency, output_tokens, coordinator, processes, client, options)
+
+async def _dispatch_phase(num_requests, concurrency, output_tokens, coordinator, processes, client, options):
+    if coordinator:
+        return await coordinator.run_phase(num_requests=num_requests, concurrency=concurrency, output_tokens=output_tokens,
+                                           processes_per_agent=processes, **options)
+    return await run_benchmark_multiprocess(processes, num_requests=num_requests, concurrency=concurrency,
+                                            output_tokens=output_tokens, client=client, **options)
+
+async def _run_all_phases(adaptive_mode, phase_options):
     # 更细粒度的并发配置
     configurations = [
         {"num_requests": 10, "concurrency": 1, "output_tokens": 100},
@@ -51,10 +187,8 @@ async def run_all_benchmarks(llm_url, api_key, model, use_long_context, long_con
                 test_requests = min(current_concurrency * 5, 500)
                 
                 try:
-                    results = await run_benchmark(
-                        test_requests, current_concurrency, request_timeout, 100,
-                        llm_url, api_key, model, use_long_context, long_context_length, auth_config, vision_model
-                    )
+                    results = await _run_phase(test_requests, current_concurrency, 100, phase_options,
+                                               phase_name="adaptive")
                     all_results.append(results)
                     
                     # 计算成功率
@@ -79,8 +213,9 @@ async def run_all_benchmarks(llm_url, api_key, model, use_long_context, long_con
                     console.print(f"[bold red]测试并发数 {current_concurrency} 时出错: {str(e)}[/bold red]")
                     break
                 
-                # 等待系统冷却
-                await asyncio.sleep(5)
+                # 等待系统冷却（检查点中的结果没有发请求，不需要冷却）
+                if not results.get('resumed'):
+                    await asyncio.sleep(5)
             
             progress.update(task, completed=100)
     else:
@@ -88,24 +223,162 @@ async def run_all_benchmarks(llm_url, api_key, model, use_long_context, long_con
         for i, config in enumerate(configurations):
             console.print(f"[bold cyan]运行基准测试 {i+1}/{len(configurations)}: 并发数 {config['concurrency']}...[/bold cyan]")
             try:
-                results = await run_benchmark(
-                    config['num_requests'], config['concurrency'], request_timeout,
-                    config['output_tokens'], llm_url, api_key, model, use_long_context, long_context_length, auth_config, vision_model
-                )
+                results = await _run_phase(config['num_requests'], config['concurrency'], config['output_tokens'], phase_options,
+                                           phase_name=f"fixed-{i+1}")
                 all_results.append(results)
                 
                 # 简化进度反馈，但增加更多有用信息
                 success_rate = (results['successful_requests'] / results['total_requests']) * 100
                 console.print(f"完成: RPS={results['requests_per_second']:.2f}, 成功率={success_rate:.1f}%, 平均延迟={results['latency']['average']:.3f}秒")
+                if results.get('steady_state'):
+                    steady = results['steady_state']
+                    console.print(f"稳态窗口: RPS={steady['requests_per_second']:.2f}, P99延迟={steady['latency']['p99'] or 0:.3f}秒, "
+                                  f"请求数={steady['total_requests']}")
                 
             except Exception as e:
                 console.print(f"[bold red]测试并发数 {config['concurrency']} 时出错: {str(e)}[/bold red]")
+                results = {}
             
-            # 等待系统冷却
-            await asyncio.sleep(5)
+            # 等待系统冷却（检查点中的结果没有发请求，不需要冷却）
+            if not results.get('resumed'):
+                await asyncio.sleep(5)
+
+    return all_results
+
+async def _run_slo_search(slo, max_concurrency, phase_options):
+    """按 SLO 搜索最大可承载并发数，打印并保存 goodput 曲线，返回按并发数排序的各轮结果。"""
+    console = Console()
+    criteria = parse_slo(slo)
+    console.print(f"[bold cyan]运行 SLO 容量搜索模式: {', '.join(str(criterion) for criterion in criteria)}[/bold cyan]")
+
+    # 每轮请求数由搜索过程决定，提前结束的判定依赖计划请求数，不按时长运行
+    phase_options = dict(phase_options, load=dict(phase_options["load"], duration=None))
 
+    async def run_phase(concurrency, num_requests, observers):
+        return await _run_phase(num_requests, concurrency, 100, phase_options, phase_name="slo", observers=observers)
+
+    all_results, report = await search_capacity(run_phase, criteria, max_concurrency=max_concurrency, console=console)
+    print_slo_report(report, console)
+    try:
+        with open('slo_search_results.json', 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        plot_goodput_curve(report, 'goodput_curve.png')
+        console.print("[bold green]SLO 搜索结果已保存至 slo_search_results.json，goodput 曲线已保存至 goodput_curve.png (已覆盖)[/bold green]")
+    except Exception as e:
+        console.print(f"[bold red]保存 SLO 搜索结果时出错: {str(e)}[/bold red]")
     return all_results
 
+async def _run_scenario(scenario, phase_options):
+    """按场景文件（见 scenario.py）依次执行各阶段，每个阶段按加权请求类别混合发送请求。"""
+    console = Console()
+    classes = ", ".join(f"{request_class['name']}({request_class['weight']:g})" for request_class in scenario["classes"])
+    console.print(f"[bold cyan]运行场景 {scenario['name']}: 请求类别 {classes}[/bold cyan]")
+    all_results = []
+    for i, phase in enumerate(scenario["phases"]):
+        if i:
+            await asyncio.sleep(scenario["cooldown"])
+        scope = f"时长 {phase['duration']:g} 秒" if phase["duration"] else f"请求数 {phase['num_requests']}"
+        rate = f", 到达速率 {phase['arrival_rate']:g} 请求/秒" if phase["arrival_rate"] else ""
+        console.print(f"[bold cyan]阶段 {i + 1}/{len(scenario['phases'])} {phase['name']}: 并发数 {phase['concurrency']}, "
+                      f"{scope}{rate}...[/bold cyan]")
+        load = dict(phase_options["load"], duration=phase["duration"], arrival_rate=phase["arrival_rate"],
+                    arrival_distribution=phase["arrival_distribution"])
+        options = dict(phase_options, load=load, request_mix=scenario["classes"])
+        try:
+            results = await _run_phase(phase["num_requests"], phase["concurrency"], phase["output_tokens"], options,
+                                       phase_name=phase["name"])
+        except Exception as e:
+            console.print(f"[bold red]阶段 {phase['name']} 出错: {str(e)}[/bold red]")
+            continue
+        results["phase"] = phase["name"]
+        all_results.append(results)
+        success_rate = results['successful_requests'] / max(results['total_requests'], 1) * 100
+        console.print(f"完成: RPS={results['requests_per_second']:.2f}, 成功率={success_rate:.1f}%, "
+                      f"平均延迟={results['latency']['average']:.3f}秒")
+    return all_results
+
+async def _run_prefix_cache(prefix_cache, phase_options):
+    """按前缀长度 × 命中率测量前缀缓存的 TTFT 加速比（见 prefix_cache.py），打印并保存加速比曲线。"""
+    console = Console()
+    lengths, rates = parse_prefix_grid(prefix_cache["prefix_lengths"], prefix_cache["hit_rates"])
+    console.print(f"[bold cyan]运行前缀缓存测试: 前缀长度 {lengths} tokens, 命中率 {rates}[/bold cyan]")
+    # 每轮请求数固定，不按时长运行
+    phase_options = dict(phase_options, load=dict(phase_options["load"], duration=None))
+
+    async def run_phase(request_mix, num_requests, concurrency, output_tokens, warmup):
+        options = dict(phase_options, request_mix=request_mix)
+        if warmup:
+            # 预热在本机单进程执行，保证每个共享前缀都被发送一次；预热请求不写样本和时间序列
+            # 预热不写检查点：续跑时仍需重新预热，服务端缓存可能已被淘汰
+            options.update(processes=1, coordinator=None, live_window=None, checkpoint=None,
+                           output=dict(options["output"], samples_file=None, timeseries_file=None))
+        return await _run_phase(num_requests, concurrency, output_tokens, options,
+                                phase_name="prefix-warmup" if warmup else "prefix-cache")
+
+    all_results, report = await run_prefix_cache_sweep(
+        run_phase, lengths, rates, num_prefixes=prefix_cache["num_prefixes"], suffix_tokens=prefix_cache["suffix_tokens"],
+        num_requests=prefix_cache["num_requests"], concurrency=prefix_cache["concurrency"], console=console)
+    print_prefix_cache_report(report, console)
+    try:
+        with open('prefix_cache_results.json', 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        plot_prefix_cache_curve(report, 'prefix_cache_speedup.png')
+        console.print("[bold green]前缀缓存测试结果已保存至 prefix_cache_results.json，加速比曲线已保存至 prefix_cache_speedup.png (已覆盖)[/bold green]")
+    except Exception as e:
+        console.print(f"[bold red]保存前缀缓存测试结果时出错: {str(e)}[/bold red]")
+    return all_results
+
+async def _run_sweep(sweep, phase_options):
+    """按输入长度 × 输出上限 × 并发数（或到达速率）扫描（见 sweep.py），打印并保存整洁表和热力图。"""
+    console = Console()
+    console.print(f"[bold cyan]运行参数扫描 ({sweep['sampling']}): 输入 {sweep['input_tokens']} tokens, "
+                  f"输出上限 {sweep['max_tokens']}, 并发数 {sweep['concurrency']}"
+                  + (f", 到达速率 {sweep['arrival_rate']}" if sweep['arrival_rate'] != [None] else "") + "[/bold cyan]")
+    # 检查点中的配置还包括模型和端点，换了被测服务不会续跑到旧结果上
+    fingerprint = dict(sweep, model=phase_options["model"], llm_url=phase_options["llm_url"])
+
+    async def run_cell(cell, num_requests):
+        # 扫描按格点写自己的检查点（见 sweep.py），不重复写入运行检查点
+        options = dict(phase_options, request_mix=[sweep_class(cell["input_tokens"])],
+                       load=dict(phase_options["load"], arrival_rate=cell["arrival_rate"]), checkpoint=None)
+        return await _run_phase(num_requests, cell["concurrency"], cell["max_tokens"], options, phase_name="sweep")
+
+    all_results, rows = await run_sweep(run_cell, sweep, fingerprint, console=console)
+    if not rows:
+        return all_results
+    print_sweep_table(rows, console)
+    try:
+        write_sweep_table(rows, 'sweep_results.csv')
+        plot_sweep_heatmaps(rows, 'sweep_heatmap.png')
+        console.print("[bold green]扫描结果已保存至 sweep_results.csv，热力图已保存至 sweep_heatmap.png (已覆盖)[/bold green]")
+    except Exception as e:
+        console.print(f"[bold red]保存扫描结果时出错: {str(e)}[/bold red]")
+    return all_results
+
+def print_label_breakdown(all_results, label="class", title="分类别性能指标", column_name="类别"):
+    """按阶段和请求标签打印分组统计，如混合负载的请求类别（class）、多轮会话的轮次（turn）。"""
+    table = Table(title=title, header_style="bold cyan", border_style="blue")
+    for column in ("阶段", column_name, "请求数", "成功率", "RPS", "输出tokens/s", "平均请求体KB", "TTFT P50", "TTFT P99",
+                   "延迟 P50", "延迟 P99", "TPOT P50", "ITL P99"):
+        table.add_column(column, justify="left" if column in ("阶段", column_name) else "right")
+
+    def seconds(value, digits=3):
+        return f"{value:.{digits}f}" if value is not None else "N/A"
+
+    for result in all_results:
+        groups = (result.get("breakdown") or {}).get(label) or {}
+        for name, group in groups.items():
+            success_rate = group["successful_requests"] / max(group["requests"], 1) * 100
+            table.add_row(
+                str(result.get("phase", result.get("concurrency"))), name, str(group["requests"]), f"{success_rate:.1f}%",
+                f"{group['requests_per_second']:.2f}", f"{group['output_token_throughput']:.1f}",
+                f"{group['average_prompt_bytes'] / 1024:.1f}",
+                seconds(group["time_to_first_token"]["p50"]), seconds(group["time_to_first_token"]["p99"]),
+                seconds(group["latency"]["p50"]), seconds(group["latency"]["p99"]),
+                seconds(group["time_per_output_token"]["p50"], 4), seconds(group["inter_token_latency"]["p99"], 4),
+            )
+    Console(width=160).print(table)
+
 def analyze_results(all_results):
     """分析所有测试结果并生成汇总报告"""
     summary = []
@@ -132,6 +405,11 @@ def analyze_results(all_results):
             p99_latency = latency_data.get('p99', 0) if isinstance(latency_data, dict) else 0
             avg_tps = tps_data.get('average', 0) if isinstance(tps_data, dict) else 0
             avg_ttft = ttft_data.get('average', 0) if isinstance(ttft_data, dict) else 0
+            # 解码阶段指标，旧版本结果中可能不存在
+            tpot_data = result.get('time_per_output_token') or {}
+            itl_data = result.get('inter_token_latency') or {}
+            avg_tpot = tpot_data.get('average') or 0
+            p99_itl = itl_data.get('p99') or 0
             
             total_requests = max(result.get('total_requests', 1), 1)  # 避免除以零
             success_rate = (result.get('successful_requests', 0) / total_requests) * 100
@@ -160,7 +438,9 @@ def analyze_results(all_results):
                 f"{p99_latency:.3f}",
                 f"{avg_tps:.2f}",
                 f"{avg_ttft:.3f}",
-                f"{success_rate:.1f}%"
+                f"{success_rate:.1f}%",
+                f"{avg_tpot:.4f}",
+                f"{p99_itl:.4f}"
             ])
             
             total_tokens += result.get('total_output_tokens', 0) or 0
@@ -187,7 +467,7 @@ def print_summary(all_results, model_name, use_long_context, long_context_length
         print("没有可用的测试结果数据进行展示")
         return
     
-    console = Console(width=100)  # 设置固定宽度
+    console = Console(width=120)  # 设置固定宽度
     
     # 创建标题面板
     title = Text("性能测试汇总报告", style="bold")
@@ -204,6 +484,9 @@ def print_summary(all_results, model_name, use_long_context, long_context_length
     if use_long_context and long_context_length:
         basic_info.add_row("目标上下文长度", f"{long_context_length:,} 字符")
     basic_info.add_row("总生成Token数", f"{total_tokens:,}")
+    total_prompt_tokens = sum(result.get('total_prompt_tokens') or 0 for result in all_results)
+    if total_prompt_tokens:
+        basic_info.add_row("总输入Token数", f"{total_prompt_tokens:,}")
     basic_info.add_row("总测试时间", f"{total_time:.2f} 秒")
     basic_info.add_row("平均Token生成速率", f"{total_tokens/total_time:.2f} tokens/sec")
     
@@ -216,7 +499,7 @@ def print_summary(all_results, model_name, use_long_context, long_context_length
         show_header=True,
         header_style="bold cyan",
         border_style="blue",
-        width=100,  # 设置表格总宽度
+        width=120,  # 设置表格总宽度
         pad_edge=False,  # 减少边缘填充
         min_width=80,    # 最小宽度
     )
@@ -228,6 +511,8 @@ def print_summary(all_results, model_name, use_long_context, long_context_length
     table.add_column("P99延迟(秒)", justify="right", width=12)
     table.add_column("平均TPS", justify="right", width=10)
     table.add_column("首Token延迟", justify="right", width=12)
+    table.add_column("平均TPOT(秒)", justify="right", width=12)
+    table.add_column("P99 ITL(秒)", justify="right", width=12)
     table.add_column("成功率", justify="right", style="green", width=8)
     
     # 添加数据行
@@ -244,6 +529,8 @@ def print_summary(all_results, model_name, use_long_context, long_context_length
                 f"{float(row[3]):.3f}",        # P99延迟
                 f"{float(row[4]):.2f}",        # 平均TPS
                 f"{float(row[5]):.3f}",        # 首Token延迟
+                row[7],                        # 平均TPOT
+                row[8],                        # P99 ITL
                 row[6],                        # 成功率
                 style=row_style
             )
@@ -425,6 +712,17 @@ def print_summary(all_results, model_name, use_long_context, long_context_length
     except Exception as e:
         console.print(f"警告: 生成性能分析时出错: {str(e)}", style="bold red")
 
+# 不计入运行配置的参数：密钥、显示方式、检查点和历史记录本身的参数
+_CHECKPOINT_EXCLUDED_ARGS = ("api_key", "basic_auth_password", "auth_header", "agent_token", "live", "live_window",
+                             "metrics_port", "metrics_host", "checkpoint_dir", "resume", "checkpoint_interval", "history_db",
+                             "run_label")
+
+def _run_mode(args):
+    for mode in ("scenario", "prefix_cache", "sweep", "slo"):
+        if getattr(args, mode):
+            return mode
+    return "adaptive" if args.adaptive else "fixed"
+
 def main():
     parser = argparse.ArgumentParser(description="Run LLM benchmarks with various configurations")
     parser.add_argument("--llm_url", type=str, required=True, help="URL of the LLM server")
@@ -442,7 +740,118 @@ def main():
     parser.add_argument("--basic_auth_password", type=str, help="Password for HTTP Basic auth")
     parser.add_argument("--auth_header", type=str, help="Override Authorization header (e.g. 'Basic xxxx')")
     parser.add_argument("--vision_model", action="store_true", help="是否使用视觉模型输入格式")
+    parser.add_argument("--processes", type=int, default=1, help="每轮测试使用的压测进程数 (默认: 1)")
+    parser.add_argument("--agents", type=str, help="分布式压测 agent 地址列表，逗号分隔，如 host1:9100,host2:9100")
+    parser.add_argument("--agent_token", type=str, help="分布式 agent 的共享口令")
+    parser.add_argument("--samples_file", type=str, help="逐请求原始样本输出文件(.npy/.parquet)，每轮测试追加 _c<并发数> 后缀")
+    parser.add_argument("--tokenizer", type=str, help="服务端不返回 usage 时使用的本地 tokenizer：tiktoken:<encoding> 或 tokenizer.json 路径")
+    parser.add_argument("--no_stream_usage", action="store_true", help="不发送 stream_options.include_usage（服务端不支持该参数时使用）")
+    parser.add_argument("--prompt_file", type=str, help="JSONL 格式的外部 prompt 语料，替代内置 prompt")
+    parser.add_argument("--prebuilt_body", action="store_true", help="视觉模式下发送预序列化的请求体，降低压测端 CPU 开销")
+    parser.add_argument("--image_dir", type=str, help="图片目录，替代视觉模板生成视觉请求")
+    parser.add_argument("--images_per_request", type=int, default=1, help="每个请求携带的图片数 (默认: 1)")
+    parser.add_argument("--image_resolutions", type=str, help="逗号分隔的图片最长边像素列表，0 表示原尺寸，如 512,1024,0")
+    parser.add_argument("--jpeg_qualities", type=str, help="逗号分隔的 JPEG 质量列表，0 表示不重新编码，如 50,85")
+    parser.add_argument("--exact_percentiles", action="store_true", help="保留全部取值计算精确分位数（默认使用固定内存的 DDSketch，相对误差 1%%）")
+    parser.add_argument("--image_cache_mb", type=float, default=256, help="已编码图片缓存上限(MB) (默认: 256)")
+    parser.add_argument("--live", action="store_true", help="测试过程中显示滑动窗口实时面板（RPS、Token/s、TTFT/延迟分位数、在途请求数、错误率）")
+    parser.add_argument("--live_window", type=float, default=10.0, help="实时面板的统计窗口(秒) (默认: 10)")
+    parser.add_argument("--metrics_port", type=int, help="在该端口提供 Prometheus /metrics 指标，按阶段和并发数打标签")
+    parser.add_argument("--metrics_host", type=str, default="127.0.0.1",
+                        help="指标服务监听的地址，Prometheus 在其他机器上抓取时设为 0.0.0.0 (默认: 127.0.0.1)")
+    parser.add_argument("--slo", type=str, help="按 SLO 搜索最大并发数，如 \"ttft_p99<2,itl_p95<0.1,success_rate>=99\"（替代常规/自适应模式）")
+    parser.add_argument("--slo_max_concurrency", type=int, default=512, help="SLO 搜索的并发数上限 (默认: 512)")
+    parser.add_argument("--warmup_requests", type=int, default=0, help="每轮测试统计时排除最早发出的 N 个请求（预热）")
+    parser.add_argument("--warmup_seconds", type=float, default=0.0, help="每轮测试统计时排除开始后 S 秒内发出的请求（预热）")
+    parser.add_argument("--cooldown_seconds", type=float, default=0.0, help="每轮测试统计时排除最后 S 秒内结束的请求（收尾）")
+    parser.add_argument("--phase_duration", type=float, help="每轮测试按时长运行的秒数，替代预设的请求数（长时间稳定性测试）")
+    parser.add_argument("--timeseries_file", type=str, help="分区间汇总的时间序列文件(.csv/.jsonl)，每轮测试追加 _c<并发数> 后缀")
+    parser.add_argument("--timeseries_interval", type=float, default=10.0, help="时间序列的区间长度(秒) (默认: 10)")
+    parser.add_argument("--max_connections", type=int, help="每个压测进程的连接池上限 (默认: 不限制)")
+    parser.add_argument("--max_keepalive_connections", type=int, help="连接池保持的空闲长连接数上限 (默认: 不限制)")
+    parser.add_argument("--keepalive_expiry", type=float, default=DEFAULT_KEEPALIVE_EXPIRY,
+                        help=f"空闲连接的保持时间(秒) (默认: {DEFAULT_KEEPALIVE_EXPIRY:g})")
+    parser.add_argument("--http2", action="store_true", help="使用 HTTP/2（需要 pip install 'httpx[http2]'）")
+    parser.add_argument("--scenario", type=str, help="混合负载场景文件(.yaml/.json)，按加权请求类别执行其中的各阶段（替代常规/自适应模式），见 scenario.py")
+    parser.add_argument("--transport", type=str, choices=list(TRANSPORTS), default="openai",
+                        help="客户端传输方式：openai=官方 SDK；raw=直接解析 SSE 的轻量客户端，不重试 (默认: openai)")
+    parser.add_argument("--prefix_cache", type=str,
+                        help="前缀缓存测试：逗号分隔的共享前缀长度(tokens)，如 512,2048,8192（替代常规/自适应模式），见 prefix_cache.py")
+    parser.add_argument("--prefix_hit_rates", type=str, default=DEFAULT_HIT_RATES,
+                        help=f"前缀缓存测试的命中率列表，包含 0 时报告整体加速比 (默认: {DEFAULT_HIT_RATES})")
+    parser.add_argument("--num_prefixes", type=int, default=8, help="前缀缓存测试的共享前缀个数 (默认: 8)")
+    parser.add_argument("--prefix_suffix_tokens", type=int, default=64, help="每个请求唯一后缀的 token 数 (默认: 64)")
+    parser.add_argument("--prefix_requests", type=int, default=100, help="前缀缓存测试每个 (长度, 命中率) 的请求数 (默认: 100)")
+    parser.add_argument("--prefix_concurrency", type=int, default=4, help="前缀缓存测试的并发数 (默认: 4)")
+    parser.add_argument("--session_turns", type=str,
+                        help="多轮会话：每个会话的轮数，固定值如 5 或范围如 3-8；每轮的并发数即虚拟用户数，见 sessions.py")
+    parser.add_argument("--think_time", type=float, default=0.0, help="多轮会话轮次之间的平均思考时间(秒) (默认: 0)")
+    parser.add_argument("--think_distribution", type=str, choices=list(THINK_DISTRIBUTIONS), default="exponential",
+                        help="思考时间分布 (默认: exponential)")
+    parser.add_argument("--session_turn_tokens", type=int, default=32, help="多轮会话第二轮起每条 user 消息的 token 数 (默认: 32)")
+    parser.add_argument("--sweep", action="store_true", help="参数扫描：输入长度 × 输出上限 × 并发数（或到达速率）（替代常规/自适应模式），见 sweep.py")
+    parser.add_argument("--sweep_input_tokens", type=str, default=DEFAULT_INPUT_TOKENS,
+                        help=f"扫描的输入 token 数，列表或 起点:终点:点数 的等比序列 (默认: {DEFAULT_INPUT_TOKENS})")
+    parser.add_argument("--sweep_max_tokens", type=str, default=DEFAULT_MAX_TOKENS,
+                        help=f"扫描的输出上限 max_tokens (默认: {DEFAULT_MAX_TOKENS})")
+    parser.add_argument("--sweep_concurrency", type=str, default=DEFAULT_CONCURRENCY,
+                        help=f"扫描的并发数；指定 --sweep_rates 时为在途请求上限 (默认: {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--sweep_rates", type=str, help="扫描的开环到达速率(请求/秒)，不指定时为闭环")
+    parser.add_argument("--sweep_sampling", type=str, choices=list(SAMPLING_METHODS), default="grid",
+                        help="grid=完整网格，lhs=拉丁超立方子集 (默认: grid)")
+    parser.add_argument("--sweep_samples", type=int, default=16, help="lhs 采样的格点数 (默认: 16)")
+    parser.add_argument("--sweep_seed", type=int, default=0, help="lhs 采样的随机种子 (默认: 0)")
+    parser.add_argument("--sweep_requests", type=int, default=50, help="每个格点的请求数，闭环时至少为并发数的 2 倍 (默认: 50)")
+    parser.add_argument("--sweep_checkpoint", type=str, default="sweep_checkpoint.jsonl",
+                        help="扫描检查点文件，中断后以相同参数再次运行即可续跑 (默认: sweep_checkpoint.jsonl)")
+    parser.add_argument("--checkpoint_dir", type=str,
+                        help="把 manifest.json 和每轮结果写入该检查点目录，见 run_checkpoint.py (默认: 不写检查点)")
+    parser.add_argument("--resume", action="store_true",
+                        help=f"从检查点续跑，跳过已完成的轮次（配置须与检查点一致）；未指定 --checkpoint_dir 时使用 {DEFAULT_CHECKPOINT_DIR}")
+    parser.add_argument("--checkpoint_interval", type=float, default=30.0,
+                        help="每隔 N 秒把进行中这一轮的部分汇总写入检查点目录的 partial.json，0 表示不写 (默认: 30)")
+    parser.add_argument("--history_db", type=str,
+                        help="把本次运行追加到该历史数据库（SQLite），用 history.py compare 对比 (默认: 不写历史)")
+    parser.add_argument("--run_label", type=str, help="本次运行在历史数据库中的标签，如版本号")
     args = parser.parse_args()
+    # 尽早校验长度和命中率写法
+    prefix_cache = prefix_cache_config(args.prefix_cache, args.prefix_hit_rates, args.num_prefixes,
+                                       args.prefix_suffix_tokens, args.prefix_requests, args.prefix_concurrency)
+    if args.slo:
+        # 尽早校验 SLO 写法，避免连接 agent 后才报错
+        parse_slo(args.slo)
+    scenario = load_scenario(args.scenario) if args.scenario else None
+    if args.session_turns and (scenario or args.prefix_cache or args.vision_model or args.image_dir):
+        parser.error("--session_turns 只能用于文本负载，不能与 --scenario / --prefix_cache / 视觉参数同时使用")
+    session = session_config(args.session_turns, args.think_time, args.think_distribution, args.session_turn_tokens)
+    sweep = None
+    if args.sweep:
+        if scenario or args.prefix_cache or session or args.slo or args.vision_model or args.image_dir:
+            parser.error("--sweep 使用合成 prompt，不能与 --scenario / --prefix_cache / --session_turns / --slo / 视觉参数同时使用")
+        sweep = sweep_config(args.sweep_input_tokens, args.sweep_max_tokens, args.sweep_concurrency, args.sweep_rates,
+                             args.sweep_sampling, args.sweep_samples, args.sweep_seed, args.sweep_requests,
+                             args.sweep_checkpoint)
+
+    if args.live:
+        # 逐请求的日志会打乱实时面板，只保留错误日志
+        logging.getLogger().setLevel(logging.ERROR)
+
+    # 运行配置写入检查点 manifest 并计算配置哈希；不含密钥，也不含不影响结果的显示和检查点参数
+    run_config = {name: value for name, value in vars(args).items() if name not in _CHECKPOINT_EXCLUDED_ARGS}
+    if scenario:
+        # 场景文件按内容计入配置，修改文件后不会续跑到旧结果上
+        run_config["scenario"] = scenario
+    # 检查点需要显式开启：指定 --checkpoint_dir，或 --resume 续跑默认目录
+    checkpoint = None
+    checkpoint_dir = args.checkpoint_dir or (DEFAULT_CHECKPOINT_DIR if args.resume else None)
+    if checkpoint_dir:
+        try:
+            checkpoint = RunCheckpoint(checkpoint_dir, run_config, resume=args.resume,
+                                       interval=args.checkpoint_interval)
+        except ValueError as e:
+            parser.error(str(e))
+    # 运行历史需要显式开启
+    history = HistoryRecorder() if args.history_db else None
 
     auth_config = {
         "auth_type": args.auth_type,
@@ -452,28 +861,67 @@ def main():
     }
 
     all_results = asyncio.run(run_all_benchmarks(
-        args.llm_url,
-        args.api_key,
-        args.model,
-        args.use_long_context,
-        args.long_context_length,
-        args.request_timeout,
-        args.adaptive,
-        auth_config,
-        args.vision_model
+        llm_url=args.llm_url,
+        api_key=args.api_key,
+        model=args.model,
+        use_long_context=args.use_long_context,
+        long_context_length=args.long_context_length,
+        request_timeout=args.request_timeout,
+        adaptive_mode=args.adaptive,
+        auth_config=auth_config,
+        vision_model=args.vision_model,
+        processes=args.processes,
+        agents=args.agents.split(",") if args.agents else None,
+        agent_token=args.agent_token,
+        load=load_config(duration=args.phase_duration, warmup_requests=args.warmup_requests,
+                         warmup_seconds=args.warmup_seconds, cooldown_seconds=args.cooldown_seconds),
+        workload=workload_config(args.tokenizer, not args.no_stream_usage, args.prompt_file, args.prebuilt_body,
+                                 vision_workload_config(args.image_dir, args.images_per_request, args.image_resolutions,
+                                                        args.jpeg_qualities, args.image_cache_mb)),
+        output=output_config(args.samples_file, args.timeseries_file, args.timeseries_interval, args.exact_percentiles,
+                             args.metrics_port, args.metrics_host),
+        live_window=args.live_window if args.live else None,
+        slo=args.slo,
+        slo_max_concurrency=args.slo_max_concurrency,
+        pool_config=connection_pool_config(args.max_connections, args.max_keepalive_connections,
+                                           args.keepalive_expiry, args.http2),
+        transport=args.transport,
+        scenario=scenario,
+        prefix_cache=prefix_cache,
+        session=session,
+        sweep=sweep,
+        checkpoint=checkpoint,
+        history=history,
     ))
+    if checkpoint:
+        checkpoint.finish()
+        if checkpoint.resumed_phases:
+            print(f"其中 {checkpoint.resumed_phases} 轮结果来自检查点 {checkpoint_dir}")
 
     # 保存详细结果到文件
     try:
         json_filename = 'benchmark_results.json'
-        with open(json_filename, 'w') as f:
-            json.dump(all_results, f, indent=2)
+        atomic_write_json(json_filename, all_results, indent=2)
         print(f"详细测试结果已保存至 {json_filename} (已覆盖)")
     except Exception as e:
         print(f"保存JSON结果时出错: {str(e)}")
+    if history and all_results:
+        try:
+            store = HistoryStore(args.history_db)
+            run_id = store.save_run(all_results, args.model, args.llm_url, run_config, config_hash(run_config),
+                                    _run_mode(args), args.run_label, history.samples_for)
+            store.close()
+            print(f"本次运行已写入历史数据库 {args.history_db} (运行 #{run_id})，"
+                  f"可用 python history.py --db {args.history_db} compare {run_id} 对比")
+        except Exception as e:
+            print(f"写入历史数据库时出错: {str(e)}")
     
     # 打印汇总报告
     print_summary(all_results, args.model, args.use_long_context, args.long_context_length, args.vision_model)
+    if scenario:
+        print_label_breakdown(all_results)
+    if session:
+        print_label_breakdown(all_results, "turn", "多轮会话分轮次性能指标", "轮次")
 
 if __name__ == "__main__":
     main()
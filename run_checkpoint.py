@@ -0,0 +1,204 @@
+"""
+多轮测试的检查点与续跑。
+
+run_benchmarks.py 的各模式由多轮测试组成，过去结果只在全部结束后写入 benchmark_results.json，
+第 5 轮时压测机崩溃或端点断开，前面各轮的结果都会丢失。RunCheckpoint 在运行过程中持久化：
+    - 检查点目录下的 manifest.json 记录运行配置、配置哈希（sha256）、状态（running / complete）和已完成的各轮；
+    - 每轮结束后结果写入 phases/NNN-<轮次名>.json，调用方在返回后追加的标注（如 SLO 判定、场景阶段名）
+      在下一轮开始前和运行结束时重新写入；
+    - 可选地每隔 interval 秒把进行中这一轮的部分汇总写入 partial.json（见 PartialSnapshot），该轮完成后删除；
+    - 所有文件都先写临时文件、fsync 后 os.replace，中途崩溃不会留下写了一半的文件。
+续跑（resume）时要求配置哈希一致。各轮按参数（轮次名、请求数、并发数、输出 token 数、时长、到达速率等）
+和该参数第几次出现查找已完成的结果，找到则直接返回，不再发请求。固定配置、自适应探测、SLO 搜索和场景各阶段
+在前几轮结果相同的情况下按相同的顺序执行，因此会在第一个未完成的轮次处接着跑。
+"""
+import datetime
+import hashlib
+import json
+import os
+import re
+import time
+
+from llm_benchmark import BenchmarkObserver, MetricsAggregator
+
+MANIFEST_VERSION = 1
+# 只指定 --resume 时使用的检查点目录
+DEFAULT_CHECKPOINT_DIR = "benchmark_checkpoint"
+# 参与轮次键的阶段参数（负载配置中的项和请求类别、会话配置），其余参数（客户端、认证等）在整次运行中不变，已包含在配置哈希里
+PHASE_KEY_LOAD_OPTIONS = ("duration", "arrival_rate", "arrival_distribution")
+PHASE_KEY_OPTIONS = ("request_mix", "session")
+
+
+def atomic_write_json(path, data, **dump_kwargs):
+    """先写同目录下的临时文件并 fsync，再原子替换目标文件。"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, **dump_kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def config_hash(config):
+    """运行配置的哈希：按键排序的 JSON 的 sha256。"""
+    canonical = json.dumps(config, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def phase_key(phase_name, num_requests, concurrency, output_tokens, options):
+    """单轮测试的参数键，续跑时据此匹配已完成的轮次。"""
+    key = {"phase": phase_name, "num_requests": num_requests, "concurrency": concurrency, "output_tokens": output_tokens}
+    load = options.get("load") or {}
+    key.update({name: load.get(name) for name in PHASE_KEY_LOAD_OPTIONS})
+    key.update({name: options.get(name) for name in PHASE_KEY_OPTIONS})
+    return json.dumps(key, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _now():
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+class RunCheckpoint:
+    """
+    检查点目录的读写，见模块说明。
+    :param directory: 检查点目录
+    :param config: 运行配置（不含密钥），写入 manifest 并计算配置哈希
+    :param resume: 为 True 时载入已有的 manifest 并复用其中已完成的轮次；配置哈希不一致时抛出 ValueError
+    :param interval: 部分汇总的写入间隔（秒），0 表示不写
+    """
+
+    def __init__(self, directory, config, resume=False, interval=0.0):
+        self.directory = directory
+        self.phases_dir = os.path.join(directory, "phases")
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.partial_path = os.path.join(directory, "partial.json")
+        self.interval = interval
+        self.config_hash = config_hash(config)
+        self.resumed_phases = 0
+        # 已完成的轮次：(轮次键, 第几次出现) -> manifest 中的条目
+        self._completed = {}
+        self._seen = {}
+        self._pending = None
+        os.makedirs(self.phases_dir, exist_ok=True)
+
+        manifest = self._load_manifest() if resume else None
+        if manifest is not None:
+            if manifest.get("config_hash") != self.config_hash:
+                raise ValueError(f"checkpoint in {directory} was written with a different configuration "
+                                 f"(config hash {manifest.get('config_hash', '')[:12]} != {self.config_hash[:12]}); "
+                                 "rerun without --resume to start over")
+            for entry in manifest["phases"]:
+                self._completed[(entry["key"], entry["occurrence"])] = entry
+            manifest["status"] = "running"
+        else:
+            # 新的运行：清除旧的轮次文件
+            for name in os.listdir(self.phases_dir):
+                os.remove(os.path.join(self.phases_dir, name))
+            manifest = {"version": MANIFEST_VERSION, "config_hash": self.config_hash, "config": config,
+                        "created_at": _now(), "status": "running", "phases": []}
+        self.manifest = manifest
+        self._write_manifest()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_manifest(self):
+        self.manifest["updated_at"] = _now()
+        atomic_write_json(self.manifest_path, self.manifest, indent=2, ensure_ascii=False)
+
+    def _flush_pending(self):
+        """重新写入上一轮的结果，带上调用方在返回后追加的标注。"""
+        if self._pending is not None:
+            path, result = self._pending
+            atomic_write_json(path, result, indent=2)
+
+    def begin(self, key):
+        """
+        开始一轮测试，返回 (槽位, 已完成的结果)。续跑且该轮已完成时结果为载入的字典（带 resumed 标记），否则为 None。
+        """
+        self._flush_pending()
+        self._pending = None
+        occurrence = self._seen.get(key, 0)
+        self._seen[key] = occurrence + 1
+        slot = (key, occurrence)
+        entry = self._completed.get(slot)
+        if entry is None:
+            return slot, None
+        try:
+            with open(os.path.join(self.directory, entry["file"]), "r", encoding="utf-8") as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            # 轮次文件缺失或损坏时重新执行该轮
+            del self._completed[slot]
+            self.manifest["phases"].remove(entry)
+            return slot, None
+        self.resumed_phases += 1
+        result["resumed"] = True
+        return slot, result
+
+    def record(self, slot, result):
+        """持久化刚完成的一轮结果并更新 manifest。"""
+        key, occurrence = slot
+        index = max((entry["index"] for entry in self.manifest["phases"]), default=0) + 1
+        name = re.sub(r"[^\w.-]+", "_", json.loads(key)["phase"] or "phase")
+        filename = os.path.join("phases", f"{index:03d}-{name}-c{result.get('concurrency', 0)}.json")
+        path = os.path.join(self.directory, filename)
+        atomic_write_json(path, result, indent=2)
+        entry = {"index": index, "key": key, "occurrence": occurrence, "file": filename, "completed_at": _now()}
+        self._completed[slot] = entry
+        self.manifest["phases"].append(entry)
+        self._write_manifest()
+        self._pending = (path, result)
+        if os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
+
+    def partial_snapshot(self, key):
+        """返回写入本轮部分汇总的观察者；未设置 interval 时返回 None。"""
+        if self.interval <= 0:
+            return None
+        return PartialSnapshot(self.partial_path, json.loads(key), self.interval)
+
+    def flush(self):
+        """写入上一轮结果的最新标注，中断退出前调用。"""
+        self._flush_pending()
+
+    def finish(self):
+        """整次运行正常结束：标记 manifest 为 complete。"""
+        self._flush_pending()
+        self._pending = None
+        self.manifest["status"] = "complete"
+        self._write_manifest()
+
+
+class PartialSnapshot(BenchmarkObserver):
+    """
+    在线汇总进行中这一轮的请求记录，每隔 interval 秒把部分汇总原子写入 partial.json，
+    崩溃时至少保留该轮已完成请求的统计。写入在请求完成回调中按时间间隔触发，没有请求完成时不写。
+    """
+
+    def __init__(self, path, phase, interval):
+        self.path = path
+        self.phase = phase
+        self.interval = interval
+        self.aggregator = MetricsAggregator()
+        self.start_time = None
+        self.last_write = None
+
+    def on_start(self, start_time):
+        self.start_time = start_time
+        self.last_write = time.time()
+
+    def on_record(self, record):
+        self.aggregator.on_record(record)
+        now = time.time()
+        if self.start_time is None or now - self.last_write < self.interval:
+            return
+        self.last_write = now
+        summary = self.aggregator.summary(self.aggregator.requests, now - self.start_time)
+        atomic_write_json(self.path, {"phase": self.phase, "updated_at": _now(), "elapsed": now - self.start_time,
+                                      "completed_requests": self.aggregator.requests, "summary": summary},
+                          indent=2, ensure_ascii=False)
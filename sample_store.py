@@ -0,0 +1,182 @@
+"""
+逐请求原始样本的落盘存储。
+
+每个请求完成后写入一条定长记录，批量追加到文件，内存占用与运行时长无关：
+    - 默认格式为 numpy .npy 结构化数组，文件头在每次落盘后原地更新，
+      任意时刻都可以用 np.load(path, mmap_mode="r") 以内存映射方式加载；
+    - 路径以 .parquet 结尾且安装了 pyarrow 时写 Parquet，每批一个 row group。
+"""
+import argparse
+import ast
+import os
+
+import numpy as np
+
+from llm_benchmark import STATUS_CATEGORIES, BenchmarkObserver
+
+SAMPLE_DTYPE = np.dtype([
+    ("start_time", "f8"),
+    ("ttft", "f4"),
+    ("end_time", "f8"),
+    ("output_tokens", "i4"),
+    ("status", "u1"),
+    ("prompt_id", "i4"),
+    ("prompt_bytes", "i4"),
+    ("tpot", "f4"),
+    ("itl_max", "f4"),
+    ("prompt_tokens", "i4"),
+])
+STATUS_CODES = {name: code for code, name in enumerate(STATUS_CATEGORIES)}
+UNKNOWN_STATUS_CODE = 255
+
+_NPY_MAGIC = b"\x93NUMPY\x01\x00"
+
+
+def _npy_header(count):
+    """构造定长的 .npy v1.0 文件头，预留足够位数，便于写入过程中原地更新记录数。"""
+    header = repr({"descr": np.lib.format.dtype_to_descr(SAMPLE_DTYPE), "fortran_order": False, "shape": (count,)})
+    reserved = len(repr({"descr": np.lib.format.dtype_to_descr(SAMPLE_DTYPE), "fortran_order": False, "shape": (10 ** 19,)}))
+    total = len(_NPY_MAGIC) + 2 + reserved + 1
+    total += -total % 64  # .npy 要求数据区按 64 字节对齐
+    header_len = total - len(_NPY_MAGIC) - 2
+    header = header.ljust(header_len - 1) + "\n"
+    return _NPY_MAGIC + header_len.to_bytes(2, "little") + header.encode("latin-1")
+
+
+def _read_npy_count(f):
+    f.seek(len(_NPY_MAGIC))
+    header_len = int.from_bytes(f.read(2), "little")
+    header = ast.literal_eval(f.read(header_len).decode("latin-1"))
+    return header["shape"][0]
+
+
+class SampleWriter(BenchmarkObserver):
+    """把每个请求的记录追加写入样本文件，按 batch_size 分批落盘。"""
+
+    def __init__(self, path, batch_size=4096, append=False):
+        """
+        :param path: 输出文件路径，.parquet 结尾时写 Parquet（需要 pyarrow），否则写 .npy
+        :param append: 文件已存在时在末尾追加，否则覆盖
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.buffer = np.zeros(batch_size, dtype=SAMPLE_DTYPE)
+        self.pending = 0
+        self.count = 0
+        self.parquet_writer = None
+        self.file = None
+
+        if path.endswith(".parquet"):
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ImportError("Writing Parquet samples requires pyarrow; use a .npy path or `pip install pyarrow`.")
+            self._pa = pa
+            self.parquet_writer = pq.ParquetWriter(path, pa.schema([
+                (name, pa.from_numpy_dtype(SAMPLE_DTYPE.fields[name][0])) for name in SAMPLE_DTYPE.names
+            ]))
+        elif append and os.path.exists(path):
+            self.file = open(path, "r+b")
+            self.count = _read_npy_count(self.file)
+            # 丢弃文件头记录数之后可能残留的不完整数据
+            self.file.truncate(len(_npy_header(0)) + self.count * SAMPLE_DTYPE.itemsize)
+        else:
+            self.file = open(path, "w+b")
+            self.file.write(_npy_header(0))
+
+    def on_record(self, record):
+        row = self.buffer[self.pending]
+        row["start_time"] = record["start_time"]
+        row["ttft"] = record["ttft"] if record["ttft"] is not None else np.nan
+        row["end_time"] = record["end_time"] if record["end_time"] is not None else np.nan
+        row["output_tokens"] = record["output_tokens"] if record["output_tokens"] is not None else -1
+        row["status"] = STATUS_CODES.get(record["status"], UNKNOWN_STATUS_CODE)
+        row["prompt_id"] = record.get("prompt_id", -1)
+        row["prompt_bytes"] = record.get("prompt_bytes", -1)
+        row["tpot"] = record["tpot"] if record.get("tpot") is not None else np.nan
+        row["itl_max"] = record["itl_max"] if record.get("itl_max") is not None else np.nan
+        row["prompt_tokens"] = record["prompt_tokens"] if record.get("prompt_tokens") is not None else -1
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        batch = self.buffer[:self.pending]
+        if self.parquet_writer:
+            self.parquet_writer.write_table(self._pa.table({name: batch[name] for name in SAMPLE_DTYPE.names}))
+        else:
+            self.file.seek(0, os.SEEK_END)
+            self.file.write(batch.tobytes())
+            # 数据写入后再更新文件头中的记录数，崩溃时文件仍可正常加载
+            self.file.seek(0)
+            self.file.write(_npy_header(self.count + self.pending))
+            self.file.flush()
+        self.count += self.pending
+        self.pending = 0
+
+    def close(self):
+        self.flush()
+        if self.parquet_writer:
+            self.parquet_writer.close()
+            self.parquet_writer = None
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def load_samples(path):
+    """
+    加载样本文件：.npy 返回内存映射的结构化数组，.parquet 返回 pyarrow.Table。
+    status 字段为 STATUS_CATEGORIES 中的下标。
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return pq.read_table(path, memory_map=True)
+    return np.load(path, mmap_mode="r")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a raw per-request sample file")
+    parser.add_argument("path", type=str, help="Sample file written with --samples_file")
+    parser.add_argument("--window", type=str, help="Only include requests started in [start,end] seconds from the first request, e.g. 60,120")
+    parser.add_argument("--prompt_id", type=int, help="Only include requests with this prompt id")
+    args = parser.parse_args()
+
+    samples = load_samples(args.path)
+    if not isinstance(samples, np.ndarray):
+        samples = np.array(list(zip(*(samples.column(name).to_numpy() for name in SAMPLE_DTYPE.names))), dtype=SAMPLE_DTYPE)
+    if len(samples) == 0:
+        print("样本文件为空")
+        return
+
+    mask = np.ones(len(samples), dtype=bool)
+    if args.window:
+        window_start, window_end = (float(v) for v in args.window.split(","))
+        offsets = samples["start_time"] - samples["start_time"].min()
+        mask &= (offsets >= window_start) & (offsets <= window_end)
+    if args.prompt_id is not None:
+        mask &= samples["prompt_id"] == args.prompt_id
+    selected = samples[mask]
+
+    success = selected[selected["status"] == STATUS_CODES["success"]]
+    print(f"样本数: {len(selected)} / {len(samples)}")
+    if len(selected):
+        span = selected["end_time"].max() - selected["start_time"].min()
+        print(f"时间跨度: {span:.2f} 秒, 成功 RPS: {len(success) / span if span > 0 else 0:.2f}")
+        codes, counts = np.unique(selected["status"], return_counts=True)
+        for code, count in zip(codes, counts):
+            name = STATUS_CATEGORIES[code] if code < len(STATUS_CATEGORIES) else "unknown"
+            print(f"  {name}: {count}")
+    if len(success):
+        latencies = success["end_time"] - success["start_time"]
+        print(f"延迟 P50/P95/P99: {', '.join(f'{v:.3f}' for v in np.percentile(latencies, [50, 95, 99]))} 秒")
+        print(f"TTFT P50/P95/P99: {', '.join(f'{v:.3f}' for v in np.nanpercentile(success['ttft'], [50, 95, 99]))} 秒")
+        if not np.isnan(success["tpot"]).all():
+            print(f"TPOT P50/P90/P99: {', '.join(f'{v:.4f}' for v in np.nanpercentile(success['tpot'], [50, 90, 99]))} 秒")
+
+
+if __name__ == "__main__":
+    main()
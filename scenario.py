@@ -0,0 +1,279 @@
+"""
+混合负载场景文件。
+
+生产流量是短对话、长上下文、视觉请求等的混合，单一类型的测试轮次无法反映真实负载。场景文件（YAML 或 JSON）
+声明若干加权的请求类别和一组测试阶段，由 run_benchmarks.py --scenario 执行：
+
+    name: mixed-chat
+    cooldown: 5                      # 阶段之间的冷却秒数，默认 5
+    classes:
+      - name: chat
+        weight: 7
+        prompt: short                # short / long / synthetic / file
+        max_tokens: lognormal:150,0.5
+      - name: rag
+        weight: 2
+        prompt: long
+        context_length: uniform:8000,30000   # 长文本目标字符数，同 --long_context_length
+        max_tokens: 300
+      - name: doc
+        weight: 1
+        prompt: synthetic
+        input_tokens: normal:2000,500        # 合成 prompt 的输入 token 数
+        stream: false
+      - name: vision
+        weight: 1
+        vision: true                 # 使用视觉模板；指定 image_dir 时改用图片目录
+    phases:
+      - {name: warm, concurrency: 4, num_requests: 40}
+      - {name: steady, concurrency: 32, duration: 300}
+      - {name: burst, arrival_rate: 20, concurrency: 200, duration: 60}
+
+类别字段：
+    - weight：抽中的相对权重，默认 1；
+    - prompt：short / long 为内置语料，synthetic 为按 input_tokens 生成的合成文本，file 为 prompt_file 指定的 JSONL 语料，
+      shared_prefix 为前缀缓存负载（见下）；
+    - context_length / input_tokens / max_tokens：固定值或分布描述（同 distributions.parse_distribution，如 uniform:100,500），
+      每个请求独立采样；context_length 按 1000 字符取整以复用缓存的长文本；
+      未指定 max_tokens 时使用语料条目自带的 max_tokens 或阶段的 output_tokens；
+    - vision：视觉请求，image_dir / images_per_request / image_resolutions / jpeg_qualities / image_cache_mb 同命令行参数；
+    - stream：是否流式请求，默认 true；非流式请求没有 TTFT 和 ITL，只统计端到端延迟；
+    - shared_prefix 类别：num_prefixes（默认 8）个长度为 prefix_tokens 的共享 system 前缀，每个请求附带唯一的
+      suffix_tokens（默认 64）个 token 的 user 后缀；按 hit_rate（默认 0.5）的概率轮流使用共享前缀（cache=hit），
+      否则使用同样长度的唯一前缀（cache=miss），结果另按 cache 标签统计，见 prefix_cache.py。
+阶段字段：concurrency（必填）、num_requests 或 duration 二选一、arrival_rate / arrival_distribution（开环）、output_tokens、name。
+每个请求带有 class 标签，各项指标按类别和整体分别统计。
+"""
+import itertools
+import json
+import os
+import random
+
+from llm_benchmark import ARRIVAL_DISTRIBUTIONS, get_prompt_corpus, get_vision_payload_builder
+from distributions import parse_distribution
+from prompt_corpus import cached_prompt_bytes, shared_prefix_entry, shared_prefix_text, synthetic_entry
+from vision_workload import get_vision_workload, vision_workload_config
+
+PROMPT_SOURCES = ("short", "long", "synthetic", "file", "shared_prefix")
+DEFAULT_PHASE_OUTPUT_TOKENS = 100
+DEFAULT_COOLDOWN = 5.0
+# 长文本目标字符数的取整粒度
+_CONTEXT_LENGTH_STEP = 1000
+
+_CLASS_FIELDS = {"name", "weight", "prompt", "prompt_file", "context_length", "input_tokens", "max_tokens", "stream",
+                 "vision", "image_dir", "images_per_request", "image_resolutions", "jpeg_qualities", "image_cache_mb",
+                 "prefix_tokens", "num_prefixes", "hit_rate", "suffix_tokens"}
+_PREFIX_FIELDS = ("prefix_tokens", "num_prefixes", "hit_rate", "suffix_tokens")
+_PHASE_FIELDS = {"name", "concurrency", "num_requests", "duration", "arrival_rate", "arrival_distribution", "output_tokens"}
+
+
+def _load_document(path):
+    with open(path, "r", encoding="utf-8") as f:
+        if path.lower().endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("YAML scenario files require PyYAML; `pip install pyyaml` or use a .json file.")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def _check_distribution(where, field, spec):
+    try:
+        parse_distribution(spec)
+    except (TypeError, ValueError):
+        raise ValueError(f"{where}: invalid {field} '{spec}', expected a number or e.g. uniform:100,500")
+
+
+def normalize_class(index, item):
+    """校验并补全单个请求类别（字段见模块说明），index 用于错误信息；结果的列表可作为 request_mix 传给 run_benchmark。"""
+    if not isinstance(item, dict):
+        raise ValueError(f"Scenario class #{index + 1} must be a mapping")
+    name = str(item.get("name") or f"class-{index + 1}")
+    where = f"Scenario class '{name}'"
+    unknown = set(item) - _CLASS_FIELDS
+    if unknown:
+        raise ValueError(f"{where}: unknown fields {', '.join(sorted(unknown))}")
+    weight = float(item.get("weight", 1))
+    if weight <= 0:
+        raise ValueError(f"{where}: weight must be positive")
+    vision = bool(item.get("vision", False))
+    prompt = item.get("prompt", "short")
+    if prompt not in PROMPT_SOURCES:
+        raise ValueError(f"{where}: prompt must be one of {', '.join(PROMPT_SOURCES)}")
+    if vision and "prompt" in item:
+        raise ValueError(f"{where}: vision classes use the vision template or image_dir instead of prompt")
+    if prompt == "file" and not item.get("prompt_file"):
+        raise ValueError(f"{where}: prompt: file requires prompt_file")
+    if prompt == "synthetic" and "input_tokens" not in item:
+        raise ValueError(f"{where}: prompt: synthetic requires input_tokens")
+    if "context_length" in item and prompt != "long":
+        raise ValueError(f"{where}: context_length only applies to prompt: long")
+    if "input_tokens" in item and prompt != "synthetic":
+        raise ValueError(f"{where}: input_tokens only applies to prompt: synthetic")
+    if prompt == "shared_prefix":
+        if int(item.get("prefix_tokens") or 0) < 1 or int(item.get("num_prefixes", 8)) < 1:
+            raise ValueError(f"{where}: prompt: shared_prefix requires positive prefix_tokens and num_prefixes")
+        if not 0 <= float(item.get("hit_rate", 0.5)) <= 1:
+            raise ValueError(f"{where}: hit_rate must be between 0 and 1")
+    elif any(field in item for field in _PREFIX_FIELDS):
+        raise ValueError(f"{where}: {', '.join(_PREFIX_FIELDS)} only apply to prompt: shared_prefix")
+    for field in ("context_length", "input_tokens", "max_tokens"):
+        if field in item:
+            _check_distribution(where, field, item[field])
+
+    normalized = {
+        "name": name,
+        "weight": weight,
+        "prompt": None if vision else prompt,
+        "prompt_file": item.get("prompt_file") if prompt == "file" else None,
+        "context_length": item.get("context_length", 20000) if prompt == "long" and not vision else None,
+        "input_tokens": item.get("input_tokens"),
+        "max_tokens": item.get("max_tokens"),
+        "stream": bool(item.get("stream", True)),
+        "vision": vision,
+        "vision_workload": None,
+    }
+    if prompt == "shared_prefix":
+        normalized.update({
+            "prefix_tokens": int(item["prefix_tokens"]),
+            "num_prefixes": int(item.get("num_prefixes", 8)),
+            "hit_rate": float(item.get("hit_rate", 0.5)),
+            "suffix_tokens": int(item.get("suffix_tokens", 64)),
+        })
+    if vision and item.get("image_dir"):
+        normalized["vision_workload"] = vision_workload_config(
+            item["image_dir"], item.get("images_per_request", 1), item.get("image_resolutions"),
+            item.get("jpeg_qualities"), item.get("image_cache_mb", 256))
+    return normalized
+
+
+def _normalize_phase(index, item):
+    if not isinstance(item, dict):
+        raise ValueError(f"Scenario phase #{index + 1} must be a mapping")
+    name = str(item.get("name") or f"phase-{index + 1}")
+    where = f"Scenario phase '{name}'"
+    unknown = set(item) - _PHASE_FIELDS
+    if unknown:
+        raise ValueError(f"{where}: unknown fields {', '.join(sorted(unknown))}")
+    if not item.get("concurrency") or int(item["concurrency"]) < 1:
+        raise ValueError(f"{where}: concurrency must be a positive integer")
+    if bool(item.get("num_requests")) == bool(item.get("duration")):
+        raise ValueError(f"{where}: exactly one of num_requests or duration is required")
+    distribution = item.get("arrival_distribution", "poisson")
+    if distribution not in ARRIVAL_DISTRIBUTIONS:
+        raise ValueError(f"{where}: arrival_distribution must be one of {', '.join(ARRIVAL_DISTRIBUTIONS)}")
+    return {
+        "name": name,
+        "concurrency": int(item["concurrency"]),
+        "num_requests": int(item["num_requests"]) if item.get("num_requests") else None,
+        "duration": float(item["duration"]) if item.get("duration") else None,
+        "arrival_rate": float(item["arrival_rate"]) if item.get("arrival_rate") else None,
+        "arrival_distribution": distribution,
+        "output_tokens": int(item.get("output_tokens", DEFAULT_PHASE_OUTPUT_TOKENS)),
+    }
+
+
+def load_scenario(path):
+    """读取并校验场景文件，返回 {"name", "cooldown", "classes", "phases"}；classes 可直接作为 request_mix 传给 run_benchmark。"""
+    document = _load_document(path)
+    if not isinstance(document, dict):
+        raise ValueError(f"Scenario {path} must be a mapping with 'classes' and 'phases'")
+    classes = [normalize_class(index, item) for index, item in enumerate(document.get("classes") or [])]
+    phases = [_normalize_phase(index, item) for index, item in enumerate(document.get("phases") or [])]
+    if not classes:
+        raise ValueError(f"Scenario {path} defines no request classes")
+    if not phases:
+        raise ValueError(f"Scenario {path} defines no phases")
+    names = [request_class["name"] for request_class in classes]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Scenario {path}: request class names must be unique")
+    return {
+        "name": document.get("name") or os.path.splitext(os.path.basename(path))[0],
+        "cooldown": float(document.get("cooldown", DEFAULT_COOLDOWN)),
+        "classes": classes,
+        "phases": phases,
+    }
+
+
+class RequestMix:
+    """按权重抽取请求类别并生成请求规格，next_request() 的返回值与 VisionWorkload.next_request 一致，另带 max_tokens 和 stream。"""
+
+    def __init__(self, classes):
+        self.classes = classes
+        self.cum_weights = list(itertools.accumulate(request_class["weight"] for request_class in classes))
+        self.samplers = [
+            {field: parse_distribution(request_class[field])
+             for field in ("context_length", "input_tokens", "max_tokens") if request_class.get(field) is not None}
+            for request_class in classes
+        ]
+        # 共享前缀按轮转使用，起点随机，各进程合起来仍均匀覆盖全部前缀
+        self.prefix_cycles = [
+            itertools.islice(itertools.cycle(range(request_class["num_prefixes"])),
+                             random.randrange(request_class["num_prefixes"]), None)
+            if request_class["prompt"] == "shared_prefix" else None
+            for request_class in classes
+        ]
+
+    def prepare(self):
+        """提前构建各类别的语料和视觉模板，避免首批请求承担初始化开销。"""
+        for index, request_class in enumerate(self.classes):
+            if request_class["vision_workload"]:
+                get_vision_workload(request_class["vision_workload"])
+            elif request_class["vision"]:
+                get_vision_payload_builder()
+            elif request_class["prompt"] in ("short", "file"):
+                get_prompt_corpus(request_class["prompt_file"], False, 0)
+            elif request_class["prompt"] == "shared_prefix":
+                # 按最后一个前缀的位置扩容词池
+                shared_prefix_text(request_class["num_prefixes"] - 1, request_class["prefix_tokens"])
+            elif request_class["prompt"] == "synthetic":
+                # 按一次采样的长度扩容词池，固定长度时之后的请求不再扩容
+                synthetic_entry(round(self.samplers[index]["input_tokens"]()))
+
+    async def next_request(self, timestamp_label=None):
+        index = random.choices(range(len(self.classes)), cum_weights=self.cum_weights)[0]
+        request_class = self.classes[index]
+        samplers = self.samplers[index]
+        labels = {"class": request_class["name"]}
+
+        if request_class["vision_workload"]:
+            spec = await get_vision_workload(request_class["vision_workload"]).next_request(timestamp_label)
+            spec["labels"] = dict(labels, **spec["labels"])
+        elif request_class["vision"]:
+            builder = get_vision_payload_builder()
+            # 字节数和 token 数按模板统计（不含时间戳）
+            spec = {
+                "messages": builder.messages(timestamp_label),
+                "accounting_messages": builder.base_messages,
+                "prompt_id": 0,
+                "prompt_key": ("vision",),
+                "prompt_bytes": cached_prompt_bytes(("vision",), builder.base_messages),
+                "labels": labels,
+            }
+        else:
+            if request_class["prompt"] == "shared_prefix":
+                hit = random.random() < request_class["hit_rate"]
+                entry = shared_prefix_entry(next(self.prefix_cycles[index]) if hit else None,
+                                            request_class["prefix_tokens"], request_class["suffix_tokens"])
+                labels["cache"] = "hit" if hit else "miss"
+            elif request_class["prompt"] == "synthetic":
+                entry = synthetic_entry(round(samplers["input_tokens"]()))
+            elif request_class["prompt"] == "long":
+                context_length = max(1, round(samplers["context_length"]() / _CONTEXT_LENGTH_STEP)) * _CONTEXT_LENGTH_STEP
+                entry = get_prompt_corpus(None, True, context_length).draw()
+            else:
+                entry = get_prompt_corpus(request_class["prompt_file"], False, 0).draw()
+            spec = {
+                "messages": entry["messages"],
+                "prompt_id": entry["prompt_id"],
+                "prompt_key": entry["prompt_key"],
+                "prompt_bytes": entry["prompt_bytes"],
+                "labels": labels,
+                "max_tokens": entry["max_tokens"],
+            }
+
+        if "max_tokens" in samplers:
+            spec["max_tokens"] = max(1, round(samplers["max_tokens"]()))
+        spec["stream"] = request_class["stream"]
+        return spec
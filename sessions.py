@@ -0,0 +1,115 @@
+"""
+多轮对话会话负载。
+
+默认每个请求都是一条无状态的 user 消息；生产中的对话是多轮的，每一轮都带上完整的历史，服务端 KV cache
+随轮次增长。会话模式下每个并发 worker 是一个虚拟用户，依次进行多轮对话：
+    - 第一轮的 user 消息从本轮测试的语料中抽取（内置短文本 / 长文本或 prompt_file），各会话之间共享语料前缀；
+    - 每轮结束后把流式返回的助手回复和一条新的合成 user 消息（turn_tokens 个 token，见 prompt_corpus.synthetic_entry）
+      追加到历史，作为下一轮的请求；推理模型的 reasoning_content 与正文一起计入回复；
+    - 轮次之间等待思考时间（不占用并发名额），会话轮数在 [min_turns, max_turns] 内均匀抽取，结束或请求失败后开始新会话。
+每个请求带有 turn 标签（从 1 开始），结果的 breakdown.turn 按轮次统计 TTFT、延迟和平均请求体大小。
+"""
+import json
+import random
+
+from prompt_corpus import synthetic_entry
+
+THINK_DISTRIBUTIONS = ("constant", "exponential")
+DEFAULT_TURN_TOKENS = 32
+
+
+def session_config(turns, think_time=0.0, think_distribution="exponential", turn_tokens=DEFAULT_TURN_TOKENS):
+    """
+    由命令行参数构造会话配置，作为 session 传给 run_benchmark 等入口；未指定轮数时返回 None。
+    :param turns: 每个会话的轮数，固定值如 "5" 或范围如 "3-8"
+    :param think_time: 轮次之间的平均思考时间（秒）
+    :param think_distribution: constant 为固定思考时间，exponential 为指数分布
+    :param turn_tokens: 第二轮起每条 user 消息的 token 数
+    """
+    if not turns:
+        return None
+    low, _, high = str(turns).partition("-")
+    min_turns = int(low)
+    max_turns = int(high) if high else min_turns
+    if min_turns < 1 or max_turns < min_turns:
+        raise ValueError("session turns must be a positive integer or a range like 3-8")
+    if think_time < 0:
+        raise ValueError("think_time must not be negative")
+    if think_distribution not in THINK_DISTRIBUTIONS:
+        raise ValueError(f"Unsupported think time distribution '{think_distribution}'. "
+                         f"Valid options: {', '.join(THINK_DISTRIBUTIONS)}")
+    if turn_tokens < 1:
+        raise ValueError("turn_tokens must be positive")
+    return {
+        "min_turns": min_turns,
+        "max_turns": max_turns,
+        "think_time": think_time,
+        "think_distribution": think_distribution,
+        "turn_tokens": turn_tokens,
+    }
+
+
+def _message_bytes(message):
+    return len(json.dumps(message, ensure_ascii=False).encode("utf-8"))
+
+
+class Conversation:
+    """
+    单个会话的历史消息。请求体字节数随追加的消息增量计算，不重复序列化整个历史。
+    请求规格的 prompt_key 为 None：每轮上下文都不同，本地 tokenizer 计数不缓存。
+    """
+
+    def __init__(self, entry, turns, turn_tokens):
+        self.messages = list(entry["messages"])
+        self.prompt_bytes = entry["prompt_bytes"]
+        self.first_max_tokens = entry.get("max_tokens")
+        self.turns = turns
+        self.turn_tokens = turn_tokens
+        self.turn = 1
+
+    def _append(self, message):
+        self.messages.append(message)
+        # json.dumps 对列表元素使用 ", " 分隔
+        self.prompt_bytes += _message_bytes(message) + 2
+
+    def next_request(self):
+        """返回本轮的请求规格，字段与 workload.next_request 一致，collect_reply 要求 make_request 回传回复文本。"""
+        return {
+            "messages": self.messages,
+            "prompt_id": self.turn,
+            "prompt_key": None,
+            "prompt_bytes": self.prompt_bytes,
+            "labels": {"turn": str(self.turn)},
+            "max_tokens": self.first_max_tokens if self.turn == 1 else None,
+            "collect_reply": True,
+        }
+
+    def advance(self, reply):
+        """追加助手回复和下一条 user 消息；会话已达到轮数时返回 False。"""
+        if self.turn >= self.turns:
+            return False
+        self._append({"role": "assistant", "content": reply})
+        self._append(synthetic_entry(self.turn_tokens)["messages"][0])
+        self.turn += 1
+        return True
+
+
+class SessionWorkload:
+    """
+    按会话配置（见 session_config）开始新会话和采样思考时间。
+    :param corpus: 第一轮 user 消息的来源，draw() 返回语料条目（见 prompt_corpus.py）
+    """
+
+    def __init__(self, config, corpus):
+        self.config = config
+        self.corpus = corpus
+
+    def start(self):
+        turns = random.randint(self.config["min_turns"], self.config["max_turns"])
+        return Conversation(self.corpus.draw(), turns, self.config["turn_tokens"])
+
+    def think_time(self):
+        mean = self.config["think_time"]
+        if mean <= 0 or self.config["think_distribution"] == "constant":
+            return mean
+        return random.expovariate(1.0 / mean)
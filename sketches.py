@@ -0,0 +1,146 @@
+"""
+流式分位数草图。
+
+长时间压测时不再保留每个请求的延迟列表，而是在线更新固定内存的草图，任意时刻都能查询分位数，
+并且可以跨进程 / 跨阶段合并：
+    - DDSketch：对数分桶，保证相对误差不超过 relative_accuracy（默认 1%），
+      桶数超过 max_buckets 时合并最低的桶，高分位数的精度不受影响；
+    - ExactQuantiles：保留全部取值、用 np.percentile 计算，适合小规模测试。
+两者接口一致：add / add_many / merge / quantile / count / mean / min / max。
+仅用于非负取值（耗时、速率等），不大于 min_value 的取值计为 0。
+"""
+import math
+
+import numpy as np
+
+
+class DDSketch:
+    """相对误差有界、可合并的分位数草图（Masson et al., DDSketch, VLDB 2019）。"""
+
+    def __init__(self, relative_accuracy=0.01, max_buckets=2048, min_value=1e-9):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be in (0, 1)")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+        self.min_value = min_value
+        # counts[i] 对应桶下标 offset + i，桶 k 覆盖 (gamma^(k-1), gamma^k]
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.offset = 0
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value):
+        self.add_many((value,))
+
+    def add_many(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if not values.size:
+            return
+        self.count += int(values.size)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        positive = values[values > self.min_value]
+        self.zero_count += int(values.size - positive.size)
+        if positive.size:
+            indices = np.ceil(np.log(positive) / self.log_gamma).astype(np.int64)
+            low = int(indices.min())
+            self._add_counts(low, np.bincount(indices - low))
+
+    def _add_counts(self, low, counts):
+        """把从桶 low 开始的一段计数累加到 store 中，必要时扩容或合并最低的桶。"""
+        if not self.counts.size:
+            self.counts = counts.astype(np.int64)
+            self.offset = low
+        else:
+            new_low = min(self.offset, low)
+            new_high = max(self.offset + self.counts.size, low + counts.size)
+            if new_low != self.offset or new_high != self.offset + self.counts.size:
+                expanded = np.zeros(new_high - new_low, dtype=np.int64)
+                expanded[self.offset - new_low:self.offset - new_low + self.counts.size] = self.counts
+                self.counts = expanded
+                self.offset = new_low
+            self.counts[low - self.offset:low - self.offset + counts.size] += counts
+        if self.counts.size > self.max_buckets:
+            excess = self.counts.size - self.max_buckets
+            self.counts[excess] += self.counts[:excess].sum()
+            self.counts = self.counts[excess:]
+            self.offset += excess
+
+    def merge(self, other):
+        if not math.isclose(other.gamma, self.gamma):
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.zero_count += other.zero_count
+        if other.counts.size:
+            self._add_counts(other.offset, other.counts)
+
+    def quantile(self, percentile):
+        """返回第 percentile 百分位（0-100）的估计值，没有数据时返回 None。"""
+        if not self.count:
+            return None
+        rank = percentile / 100 * (self.count - 1)
+        if rank < self.zero_count:
+            return max(self.min, 0.0)
+        position = int(np.searchsorted(np.cumsum(self.counts), rank - self.zero_count, side="right"))
+        position = min(position, self.counts.size - 1)
+        value = 2 * self.gamma ** (self.offset + position) / (self.gamma + 1)
+        return min(max(value, self.min), self.max)
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0
+
+
+class ExactQuantiles:
+    """保留全部取值的精确分位数，接口与 DDSketch 一致。"""
+
+    def __init__(self):
+        self.values = np.empty(64, dtype=np.float64)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value):
+        self.add_many((value,))
+
+    def add_many(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if not values.size:
+            return
+        if self.count + values.size > self.values.size:
+            self.values = np.resize(self.values, max(self.values.size * 2, self.count + values.size))
+        self.values[self.count:self.count + values.size] = values
+        self.count += int(values.size)
+        self.sum += float(values.sum())
+
+    def merge(self, other):
+        self.add_many(other.values[:other.count])
+
+    def quantile(self, percentile):
+        if not self.count:
+            return None
+        return float(np.percentile(self.values[:self.count], percentile))
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0
+
+    @property
+    def min(self):
+        return float(self.values[:self.count].min()) if self.count else math.inf
+
+    @property
+    def max(self):
+        return float(self.values[:self.count].max()) if self.count else -math.inf
+
+
+def make_quantile_sketch(exact=False, relative_accuracy=0.01):
+    return ExactQuantiles() if exact else DDSketch(relative_accuracy)
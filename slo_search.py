@@ -0,0 +1,287 @@
+"""
+基于 SLO 的容量搜索。
+
+给定一组 SLO（如 "ttft_p99<2,itl_p95<0.1,success_rate>=99"），寻找满足 SLO 的最大并发数：
+    1. 指数爬坡：并发数从起点开始逐轮翻倍，直到某一轮违反 SLO 或达到上限；
+    2. 二分查找：在最后一个满足和第一个违反的并发数之间二分，区间缩小到分辨率以内时停止；
+    3. 提前结束：每轮测试中 SloMonitor 在线统计，SLO 明显违反时请求停止发新请求，
+       不必跑完整轮（分布式模式下不支持提前结束，整轮照常执行）。
+每轮记录吞吐和 goodput（每秒完成且单个请求满足全部延迟 SLO 的请求数），输出 goodput 曲线，
+goodput 最高的并发数即为拐点（knee）。
+
+SLO 条件写法：<指标>_p<百分位><比较符><阈值>，指标为 ttft、latency、tpot、itl，阈值单位为秒；
+success_rate 为成功率百分比。比较符支持 <、<=、>、>=。
+"""
+import asyncio
+import operator
+import re
+
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+from llm_benchmark import BenchmarkObserver
+from sketches import DDSketch
+
+SLO_METRICS = ("ttft", "latency", "tpot", "itl")
+_OPERATORS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+_CRITERION_PATTERN = re.compile(
+    r"^(?:(?P<metric>ttft|latency|tpot|itl)_p(?P<percentile>\d+(?:\.\d+)?)|(?P<rate>success_rate))"
+    r"\s*(?P<op><=|>=|<|>)\s*(?P<threshold>\d+(?:\.\d+)?)$"
+)
+
+
+class SloCriterion:
+    """单个 SLO 条件：metric 为延迟指标（按 percentile 分位数比较）或 success_rate。"""
+
+    def __init__(self, metric, op, threshold, percentile=None):
+        self.metric = metric
+        self.op = op
+        self.threshold = threshold
+        self.percentile = percentile
+
+    @property
+    def name(self):
+        return f"{self.metric}_p{self.percentile:g}" if self.percentile is not None else self.metric
+
+    def passes(self, value):
+        return value is not None and _OPERATORS[self.op](value, self.threshold)
+
+    def __str__(self):
+        return f"{self.name}{self.op}{self.threshold:g}"
+
+
+def parse_slo(spec):
+    """解析逗号分隔的 SLO 条件，如 "ttft_p99<2,itl_p95<0.1,success_rate>=99"。"""
+    criteria = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        match = _CRITERION_PATTERN.match(part)
+        if not match:
+            raise ValueError(f"Invalid SLO criterion '{part}', expected e.g. ttft_p99<2 or success_rate>=99")
+        if match.group("rate"):
+            criteria.append(SloCriterion("success_rate", match.group("op"), float(match.group("threshold"))))
+        else:
+            percentile = float(match.group("percentile"))
+            if not 0 < percentile <= 100:
+                raise ValueError(f"Invalid percentile in SLO criterion '{part}'")
+            criteria.append(SloCriterion(match.group("metric"), match.group("op"), float(match.group("threshold")), percentile))
+    if not criteria:
+        raise ValueError("SLO spec is empty")
+    return criteria
+
+
+class SloMonitor(BenchmarkObserver):
+    """
+    在线统计一轮测试的 SLO 指标并判定是否达标。
+    至少完成 min_samples 个请求后，若某个延迟分位数超过阈值 (1 + margin) 倍，或失败数已超过
+    整轮允许的上限（剩余请求全部成功也无法达标），则认为 SLO 明显违反并请求提前结束。
+    """
+
+    def __init__(self, criteria, planned_requests, min_samples=30, margin=0.2, check_every=10):
+        self.criteria = criteria
+        self.planned_requests = planned_requests
+        self.min_samples = min_samples
+        self.margin = margin
+        self.check_every = check_every
+        self.latency_criteria = [criterion for criterion in criteria if criterion.metric in SLO_METRICS]
+        self.sketches = {criterion.metric: DDSketch() for criterion in self.latency_criteria}
+        self.requests = 0
+        self.successes = 0
+        # 成功且单个请求满足全部延迟 SLO 的请求数，用于计算 goodput
+        self.good_requests = 0
+        self.violation = None
+
+    def on_record(self, record):
+        self.requests += 1
+        if record["status"] == "success":
+            self.successes += 1
+            good = True
+            for criterion in self.latency_criteria:
+                if criterion.metric == "itl":
+                    itl = record.get("itl")
+                    if itl is None or not len(itl):
+                        continue
+                    self.sketches["itl"].add_many(itl)
+                    # 单个请求的 ITL 按同一分位数判定
+                    value = float(np.percentile(itl, criterion.percentile))
+                else:
+                    value = record.get(criterion.metric)
+                    if value is None:
+                        continue
+                    self.sketches[criterion.metric].add(value)
+                if not criterion.passes(value):
+                    good = False
+            if good:
+                self.good_requests += 1
+        if not self.stop_requested and self.requests % self.check_every == 0:
+            self.violation = self._clear_violation()
+            self.stop_requested = self.violation is not None
+
+    def _value(self, criterion):
+        if criterion.metric == "success_rate":
+            return self.successes / self.requests * 100 if self.requests else None
+        return self.sketches[criterion.metric].quantile(criterion.percentile)
+
+    def _clear_violation(self):
+        """返回明显违反的条件描述，没有时返回 None。"""
+        for criterion in self.criteria:
+            if criterion.metric == "success_rate":
+                if criterion.op in (">", ">="):
+                    # 先乘后除，避免 (1 - 0.9) * 100 这类浮点误差让恰好等于上限的失败数提前判定违反
+                    allowed_failures = (100 - criterion.threshold) * self.planned_requests / 100
+                    if self.requests - self.successes > allowed_failures:
+                        return f"{criterion}（失败数已超过整轮允许上限）"
+                continue
+            if self.requests < self.min_samples:
+                continue
+            value = self._value(criterion)
+            if value is None:
+                continue
+            if criterion.op in ("<", "<=") and value > criterion.threshold * (1 + self.margin):
+                return f"{criterion}（当前 {value:.3f}）"
+            if criterion.op in (">", ">=") and value < criterion.threshold * (1 - self.margin):
+                return f"{criterion}（当前 {value:.3f}）"
+        return None
+
+    def evaluate(self):
+        """返回 (是否达标, 各条件的取值和判定)。提前结束的轮次一律判为不达标。"""
+        details = []
+        for criterion in self.criteria:
+            value = self._value(criterion)
+            details.append({"criterion": str(criterion), "name": criterion.name, "value": value,
+                            "passed": criterion.passes(value)})
+        passed = self.violation is None and all(detail["passed"] for detail in details)
+        return passed, details
+
+
+def _phase_requests(concurrency, requests_per_user, min_requests, max_requests):
+    return max(min_requests, min(concurrency * requests_per_user, max_requests))
+
+
+async def search_capacity(run_phase, criteria, start_concurrency=1, max_concurrency=512, requests_per_user=5,
+                          min_requests=20, max_requests=500, resolution=0.1, cooldown=1.0, console=None):
+    """
+    搜索满足 SLO 的最大并发数。
+    :param run_phase: async (concurrency, num_requests, observers) -> run_benchmark 的结果字典
+    :param resolution: 二分查找的相对分辨率，区间宽度不超过 max(1, 下界 * resolution) 时停止
+    :param cooldown: 相邻两轮之间的等待秒数
+    :return: (按并发数排序的各轮结果, 搜索报告)
+    """
+    console = console or Console()
+    points = {}
+
+    async def evaluate(concurrency):
+        if points:
+            await asyncio.sleep(cooldown)
+        num_requests = _phase_requests(concurrency, requests_per_user, min_requests, max_requests)
+        console.print(f"[bold cyan]SLO 搜索: 并发数 {concurrency}, 请求数 {num_requests}...[/bold cyan]")
+        monitor = SloMonitor(criteria, num_requests)
+        result = await run_phase(concurrency, num_requests, [monitor])
+        # 续跑时 run_phase 直接返回检查点中的结果，monitor 没有收到记录，沿用其中保存的判定
+        if "slo" not in result:
+            passed, details = monitor.evaluate()
+            goodput = monitor.good_requests / result["total_time"] if result["total_time"] > 0 else 0.0
+            result["slo"] = {"passed": passed, "goodput": goodput, "criteria": details, "violation": monitor.violation}
+        slo = result["slo"]
+        passed, goodput, details = slo["passed"], slo["goodput"], slo["criteria"]
+        points[concurrency] = result
+        summary = ", ".join(f"{detail['name']}={detail['value']:.3f}" if detail["value"] is not None else f"{detail['name']}=N/A"
+                            for detail in details)
+        status = "[green]达标[/green]" if passed else "[red]未达标[/red]"
+        if slo["violation"]:
+            status += f" [yellow]提前结束: {slo['violation']}[/yellow]"
+        console.print(f"  {status} goodput={goodput:.2f} req/s, RPS={result['requests_per_second']:.2f}, {summary}")
+        return passed
+
+    # 指数爬坡
+    low, high = 0, None
+    concurrency = max(1, start_concurrency)
+    while True:
+        if await evaluate(concurrency):
+            low = concurrency
+            if concurrency >= max_concurrency:
+                break
+            concurrency = min(concurrency * 2, max_concurrency)
+        else:
+            high = concurrency
+            break
+
+    # 二分查找
+    while high is not None and high - low > max(1, int(low * resolution)):
+        middle = (low + high) // 2
+        if middle in points:
+            break
+        if await evaluate(middle):
+            low = middle
+        else:
+            high = middle
+
+    results = [points[key] for key in sorted(points)]
+    curve = [{
+        "concurrency": result["concurrency"],
+        "num_requests": result["total_requests"],
+        "passed": result["slo"]["passed"],
+        "goodput": result["slo"]["goodput"],
+        "requests_per_second": result["requests_per_second"],
+        "stopped_early": bool(result.get("stopped_early")),
+    } for result in results]
+    knee = max(curve, key=lambda point: point["goodput"])
+    report = {
+        "slo": [str(criterion) for criterion in criteria],
+        "max_concurrency_meeting_slo": low or None,
+        "first_failing_concurrency": high,
+        "knee": {"concurrency": knee["concurrency"], "goodput": knee["goodput"]},
+        "phases": len(curve),
+        "goodput_curve": curve,
+    }
+    return results, report
+
+
+def print_slo_report(report, console=None):
+    console = console or Console()
+    table = Table(title=f"Goodput 曲线 (SLO: {', '.join(report['slo'])})", header_style="bold cyan", border_style="blue")
+    table.add_column("并发数", justify="right", style="cyan")
+    table.add_column("请求数", justify="right")
+    table.add_column("RPS", justify="right")
+    table.add_column("Goodput", justify="right")
+    table.add_column("SLO", justify="center")
+    for point in report["goodput_curve"]:
+        verdict = "[green]达标[/green]" if point["passed"] else "[red]未达标[/red]"
+        if point["stopped_early"]:
+            verdict += " (提前结束)"
+        marker = " *" if point["concurrency"] == report["knee"]["concurrency"] else ""
+        table.add_row(f"{point['concurrency']}{marker}", str(point["num_requests"]), f"{point['requests_per_second']:.2f}",
+                      f"{point['goodput']:.2f}", verdict)
+    console.print(table)
+    if report["max_concurrency_meeting_slo"]:
+        console.print(f"[bold green]满足 SLO 的最大并发数: {report['max_concurrency_meeting_slo']}[/bold green]")
+    else:
+        console.print("[bold red]没有满足 SLO 的并发数[/bold red]")
+    console.print(f"[bold]拐点 (goodput 最高, 表中 * 标记): 并发数 {report['knee']['concurrency']}, "
+                  f"goodput {report['knee']['goodput']:.2f} req/s[/bold]，共执行 {report['phases']} 轮测试")
+
+
+def plot_goodput_curve(report, filename="goodput_curve.png"):
+    import matplotlib.pyplot as plt
+
+    curve = report["goodput_curve"]
+    concurrencies = [point["concurrency"] for point in curve]
+    plt.figure(figsize=(8, 5))
+    plt.plot(concurrencies, [point["requests_per_second"] for point in curve], "o--", color="gray", label="Throughput (RPS)")
+    plt.plot(concurrencies, [point["goodput"] for point in curve], "o-", color="blue", label="Goodput")
+    failing = [point for point in curve if not point["passed"]]
+    if failing:
+        plt.scatter([point["concurrency"] for point in failing], [point["goodput"] for point in failing],
+                    color="red", zorder=3, label="SLO violated")
+    plt.axvline(report["knee"]["concurrency"], color="green", linestyle=":", label="Knee")
+    plt.title("Goodput vs Concurrency")
+    plt.xlabel("Concurrency")
+    plt.ylabel("Requests Per Second")
+    plt.grid(True)
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(filename)
+    plt.close()
@@ -0,0 +1,181 @@
+"""
+绕过 openai SDK 的轻量流式传输。
+
+SDK 为每个 SSE 块构造 pydantic 模型（ChatCompletionChunk、Choice、ChoiceDelta……），高并发、
+小块输出时这部分开销会让压测客户端先于服务端占满 CPU。SSEChatClient 直接用 httpx 向
+/chat/completions 发送请求，process_sse_stream 按行增量解析 SSE 字节流：
+    - 只处理 data: 行，每个事件做一次 JSON 解码（装了 orjson 时用 orjson），不构造中间对象；
+    - 只提取 delta 的 content / reasoning_content、finish_reason 和 usage；
+    - 块的到达时间按网络读取记录，同一次读取中的多个事件共用一个时间戳。
+返回值与 llm_benchmark.process_stream 一致，make_request 按客户端类型选择解析函数。
+与 SDK 不同，这里不做失败重试（SDK 默认对 429 / 5xx / 连接错误重试 2 次），每个错误都直接计入结果。
+"""
+import collections
+import json
+import logging
+import time
+
+import numpy as np
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+
+    def _dumps(obj):
+        return orjson.dumps(obj)
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+# 与 SDK 的 usage 对象保持相同的属性名，make_request 不区分来源
+StreamUsage = collections.namedtuple("StreamUsage", ["prompt_tokens", "completion_tokens"])
+
+# 错误信息中的关键词与 make_request 按错误信息分类的规则对应
+_STATUS_HINTS = {400: "invalid request", 401: "unauthorized", 403: "unauthorized", 404: "not found",
+                 422: "invalid request", 429: "rate_limit"}
+
+
+class SSEStatusError(Exception):
+    """服务端返回非 2xx 状态码。"""
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        hint = _STATUS_HINTS.get(status_code, "server error" if status_code >= 500 else "unexpected status")
+        super().__init__(f"Error code: {status_code} - {hint}: {text[:200]}")
+
+
+class SSEStreamError(Exception):
+    """服务端在流中发送了 error 事件。"""
+
+
+class SSEChatClient:
+    """
+    只支持 chat completions 的最小客户端（流式为主，非流式由 read_completion 读取），由 make_request 单独分支调用。
+    :param base_url: 以 /v1 结尾的 API 地址
+    :param api_key: Bearer token，为空时不发送 Authorization（由 default_headers 提供 Basic 等认证）
+    :param default_headers: 附加到每个请求的请求头
+    :param http_client: httpx.AsyncClient（见 http_client.create_http_client），由本客户端负责关闭
+    """
+
+    def __init__(self, base_url, api_key, default_headers, http_client):
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.headers = {"Content-Type": "application/json", "Accept": "text/event-stream"}
+        if api_key:
+            self.headers["Authorization"] = f"Bearer {api_key}"
+        self.headers.update(default_headers or {})
+        self.http = http_client
+
+    @staticmethod
+    def encode_body(model, messages, max_tokens, stream_usage=True, stream=True):
+        body = {"model": model, "messages": messages, "max_tokens": max_tokens}
+        if stream:
+            body["stream"] = True
+            if stream_usage:
+                body["stream_options"] = {"include_usage": True}
+        return _dumps(body)
+
+    async def send(self, body):
+        """发送序列化好的请求体，返回尚未读取正文的流式响应；非 2xx 时读取错误正文后抛出 SSEStatusError。"""
+        request = self.http.build_request("POST", self.url, content=body, headers=self.headers)
+        response = await self.http.send(request, stream=True)
+        if response.status_code >= 300:
+            try:
+                text = (await response.aread()).decode("utf-8", "replace")
+            finally:
+                await response.aclose()
+            raise SSEStatusError(response.status_code, text)
+        return response
+
+    async def close(self):
+        await self.http.aclose()
+
+
+async def read_completion(response):
+    """读取非流式响应，返回 (usage, 输出文本)，结束后关闭响应。"""
+    try:
+        payload = _loads(await response.aread())
+    finally:
+        await response.aclose()
+    usage = payload.get("usage")
+    choices = payload.get("choices") or [{}]
+    message = choices[0].get("message") or {}
+    text = (message.get("reasoning_content") or "") + (message.get("content") or "")
+    return (StreamUsage(usage.get("prompt_tokens"), usage.get("completion_tokens")) if usage else None), text
+
+
+async def process_sse_stream(response, expected_chunks=0, collect_text=False):
+    """
+    消费 SSE 响应，返回值与 process_stream 相同：(first_token_time, total_chunks, chunk_times, usage, text)。
+    流中途出错时，已收到内容则返回已有数据，否则抛出异常；结束后关闭响应。
+    """
+    first_token_time = None
+    total_tokens = 0
+    chunk_times = np.empty(max(expected_chunks, 16) + 1)
+    usage = None
+    text_parts = [] if collect_text else None
+    buffer = b""
+    # 当前事件的 data 行（一个事件可以有多行 data，按 SSE 规范用换行连接）
+    data_lines = []
+    try:
+        async for raw in response.aiter_bytes():
+            now = time.time()
+            buffer += raw
+            start = 0
+            while True:
+                end = buffer.find(b"\n", start)
+                if end < 0:
+                    break
+                line = buffer[start:end]
+                start = end + 1
+                if line.endswith(b"\r"):
+                    line = line[:-1]
+                if line.startswith(b"data:"):
+                    data_lines.append(line[6:] if line[5:6] == b" " else line[5:])
+                    continue
+                if line or not data_lines:
+                    # event: / id: / 注释行不影响解析
+                    continue
+                data = data_lines[0] if len(data_lines) == 1 else b"\n".join(data_lines)
+                data_lines = []
+                if data == b"[DONE]":
+                    continue
+                payload = _loads(data)
+                if payload.get("error"):
+                    raise SSEStreamError(f"stream error: {payload['error']}")
+                # include_usage 时最后一个块的 choices 为空，只携带 usage
+                chunk_usage = payload.get("usage")
+                if chunk_usage:
+                    usage = StreamUsage(chunk_usage.get("prompt_tokens"), chunk_usage.get("completion_tokens"))
+                choices = payload.get("choices")
+                if not choices:
+                    continue
+                if first_token_time is None:
+                    first_token_time = now
+                choice = choices[0]
+                delta = choice.get("delta") or {}
+                content = delta.get("content")
+                reasoning_content = delta.get("reasoning_content")
+                if content or reasoning_content:
+                    if total_tokens == len(chunk_times):
+                        chunk_times = np.resize(chunk_times, total_tokens * 2)
+                    chunk_times[total_tokens] = now
+                    total_tokens += 1
+                    if text_parts is not None:
+                        text_parts.append(reasoning_content or "")
+                        text_parts.append(content or "")
+                if choice.get("finish_reason") is not None:
+                    logging.debug(f"流式响应完成，原因: {choice['finish_reason']}")
+            buffer = buffer[start:]
+
+        logging.debug(f"流式响应处理完毕，共收到 {total_tokens} 个内容块")
+        return first_token_time, total_tokens, chunk_times[:total_tokens], usage, "".join(text_parts or ())
+    except Exception as e:
+        logging.error(f"处理流式响应时出错: {type(e).__name__}: {e}")
+        if first_token_time and total_tokens > 0:
+            return first_token_time, total_tokens, chunk_times[:total_tokens], usage, "".join(text_parts or ())
+        raise
+    finally:
+        await response.aclose()
@@ -0,0 +1,196 @@
+"""
+预热 / 收尾排除和稳态窗口统计。
+
+冷 KV cache 上的爬坡请求和最后的拖尾请求都会拉低 RPS、抬高分位数。MeasurementWindow 作为观察者
+把请求记录分流到三份汇总：
+    - measured：主结果，排除预热请求（最早开始的 N 个请求，或开始于前 S 秒的请求）
+      和收尾请求（结束于最后 S 秒的请求）；
+    - full：全部请求，仅在配置了排除时单独统计，作为对照；
+    - steady：闭环模式下在途请求数等于目标并发数的稳态窗口，即第 concurrency 个请求发出
+      到最后一个请求发出之间，只统计完整落在窗口内的请求。
+记录按完成顺序到达，暂时无法判定归属的记录（可能属于最早的 N 个、可能落入收尾或稳态窗口外）先缓存，
+缓存量与并发数、预热请求数和收尾时长成正比，与总请求数无关；finish() 时统一判定。
+多进程时稳态窗口按所有分片合并后的开始时间近似计算。
+"""
+import heapq
+
+from llm_benchmark import BenchmarkObserver, MetricsAggregator
+
+# 稳态 / 全量对照结果中保留的字段
+COMPACT_FIELDS = ("successful_requests", "failed_requests", "total_time", "requests_per_second",
+                  "output_token_throughput", "latency", "time_to_first_token", "time_per_output_token",
+                  "inter_token_latency")
+
+
+def compact_summary(summary, **extra_fields):
+    compact = {key: summary[key] for key in COMPACT_FIELDS if key in summary}
+    compact.update(extra_fields)
+    return compact
+
+
+class MeasurementWindow(BenchmarkObserver):
+    """
+    :param measured: 主结果的 MetricsAggregator，只接收排除预热和收尾后的请求
+    :param closed_loop: 是否为闭环模式；开环模式没有固定的在途请求数，不计算稳态窗口
+    :param warmup_requests: 按开始顺序排除最早的 N 个请求
+    :param warmup_seconds: 排除开始于测试开始后 S 秒内的请求
+    :param cooldown_seconds: 排除结束于最后 S 秒内的请求
+    """
+
+    def __init__(self, measured, concurrency, closed_loop=True, warmup_requests=0, warmup_seconds=0.0,
+                 cooldown_seconds=0.0, exact=False):
+        self.measured = measured
+        self.concurrency = concurrency
+        self.warmup_requests = warmup_requests or 0
+        self.warmup_seconds = warmup_seconds or 0.0
+        self.cooldown_seconds = cooldown_seconds or 0.0
+        self.excluding = bool(self.warmup_requests or self.warmup_seconds or self.cooldown_seconds)
+        self.full = MetricsAggregator(exact, measured.relative_accuracy, with_breakdown=False) if self.excluding else None
+        self.steady = MetricsAggregator(exact, measured.relative_accuracy, with_breakdown=False) if closed_loop else None
+        # 测试开始时间，统一开始时由 on_start 设置
+        self.start_time = None
+        self.requests = 0
+        self.last_end_time = None
+        self.excluded_warmup = 0
+        self.excluded_cooldown = 0
+        self.measured_first_start = None
+        self.measured_last_end = None
+        self._sequence = 0
+        # 最早开始的 warmup_requests 个请求（大顶堆，键为 -start_time）
+        self._warmup_heap = []
+        # 可能落入收尾区间的请求（小顶堆，键为 end_time）
+        self._cooldown_heap = []
+        # 稳态窗口：最早的 concurrency 个开始时间（大顶堆）、已知的最晚开始时间
+        self._steady_starts = []
+        self._last_start = None
+        # 稳态窗口待定记录：开始时间待定的早期记录，以及结束时间晚于当前最晚开始时间的记录（小顶堆）
+        self._steady_early = []
+        self._steady_pending = []
+
+    def on_start(self, start_time):
+        self.start_time = start_time
+
+    def on_request_start(self):
+        self.measured.on_request_start()
+
+    def on_record(self, record):
+        self.requests += 1
+        self._sequence += 1
+        end_time = record.get("end_time")
+        if end_time is not None:
+            self.last_end_time = max(self.last_end_time or end_time, end_time)
+        if self.full is not None:
+            self.full.on_record(record)
+        if self.steady is not None:
+            self._route_steady(record)
+        self._route_warmup(record)
+
+    # 预热 / 收尾
+
+    def _route_warmup(self, record):
+        start = record.get("start_time")
+        if self.warmup_seconds and self.start_time is not None and start is not None \
+                and start < self.start_time + self.warmup_seconds:
+            self.excluded_warmup += 1
+            return
+        if self.warmup_requests:
+            heapq.heappush(self._warmup_heap, (-(start or 0.0), self._sequence, record))
+            if len(self._warmup_heap) <= self.warmup_requests:
+                return
+            # 堆中最晚开始的记录已不可能属于最早的 N 个
+            record = heapq.heappop(self._warmup_heap)[2]
+        self._route_cooldown(record)
+
+    def _route_cooldown(self, record):
+        if not self.cooldown_seconds:
+            self._measure(record)
+            return
+        heapq.heappush(self._cooldown_heap, (record.get("end_time") or 0.0, self._sequence, record))
+        cutoff = (self.last_end_time or 0.0) - self.cooldown_seconds
+        while self._cooldown_heap and self._cooldown_heap[0][0] <= cutoff:
+            self._measure(heapq.heappop(self._cooldown_heap)[2])
+
+    def _measure(self, record):
+        self.measured.on_record(record)
+        if record.get("start_time") is not None:
+            self.measured_first_start = min(self.measured_first_start or record["start_time"], record["start_time"])
+        if record.get("end_time") is not None:
+            self.measured_last_end = max(self.measured_last_end or record["end_time"], record["end_time"])
+
+    # 稳态窗口
+
+    def _route_steady(self, record):
+        start, end = record.get("start_time"), record.get("end_time")
+        if start is None or end is None:
+            return
+        self._last_start = max(self._last_start or start, start)
+        if len(self._steady_starts) < self.concurrency:
+            heapq.heappush(self._steady_starts, -start)
+        elif start < -self._steady_starts[0]:
+            heapq.heapreplace(self._steady_starts, -start)
+        # 窗口起点只会随新记录提前，开始时间不早于当前估计值的记录一定在窗口起点之后
+        if len(self._steady_starts) < self.concurrency or start < -self._steady_starts[0]:
+            self._steady_early.append(record)
+            return
+        heapq.heappush(self._steady_pending, (end, self._sequence, record))
+        # 窗口终点（最晚开始时间）只会推后，结束时间不晚于它的记录一定在窗口内
+        while self._steady_pending and self._steady_pending[0][0] <= self._last_start:
+            self.steady.on_record(heapq.heappop(self._steady_pending)[2])
+
+    def steady_window(self):
+        """返回稳态窗口 (起点, 终点)，请求数不足并发数或窗口为空时返回 None。"""
+        if self.steady is None or len(self._steady_starts) < self.concurrency:
+            return None
+        window_start, window_end = -self._steady_starts[0], self._last_start
+        return (window_start, window_end) if window_end > window_start else None
+
+    def finish(self):
+        """测试结束后判定所有缓存的记录。"""
+        self.excluded_warmup += len(self._warmup_heap)
+        self._warmup_heap = []
+        cutoff = (self.last_end_time or 0.0) - self.cooldown_seconds
+        for end_time, _, record in self._cooldown_heap:
+            if end_time <= cutoff:
+                self._measure(record)
+            else:
+                self.excluded_cooldown += 1
+        self._cooldown_heap = []
+
+        window = self.steady_window()
+        if window:
+            window_start, window_end = window
+            for record in self._steady_early + [item[2] for item in self._steady_pending]:
+                if record["start_time"] >= window_start and record["end_time"] <= window_end:
+                    self.steady.on_record(record)
+        self._steady_early = []
+        self._steady_pending = []
+
+    def reported_requests(self, num_requests):
+        """主结果中的总请求数：配置了排除时为排除后参与统计的请求数。"""
+        return self.measured.requests if self.excluding else num_requests
+
+    def summary(self, num_requests, total_elapsed_time):
+        """
+        返回主结果的汇总（字段与 MetricsAggregator.summary 一致），并附加稳态窗口统计；
+        配置了排除时主结果只统计排除后的请求，计时窗口为这些请求的最早开始到最晚结束，另附全量对照。
+        """
+        if self.excluding:
+            measured_time = (self.measured_last_end - self.measured_first_start) if self.measured.requests else 0.0
+            summary = self.measured.summary(self.measured.requests, measured_time)
+            summary["excluded_requests"] = {"warmup": self.excluded_warmup, "cooldown": self.excluded_cooldown}
+            summary["full_run"] = compact_summary(self.full.summary(num_requests, total_elapsed_time),
+                                                  total_requests=num_requests)
+        else:
+            summary = self.measured.summary(num_requests, total_elapsed_time)
+
+        window = self.steady_window()
+        if window:
+            window_start, window_end = window
+            steady = self.steady.summary(self.steady.requests, window_end - window_start)
+            summary["steady_state"] = compact_summary(
+                steady,
+                total_requests=self.steady.requests,
+                window_start=window_start - self.start_time if self.start_time is not None else None,
+                window_end=window_end - self.start_time if self.start_time is not None else None,
+            )
+        return summary
@@ -0,0 +1,317 @@
+"""
+输入长度 × 输出长度 × 负载的参数扫描。
+
+常规模式的六轮测试固定 output_tokens=100，--long_context_length 每次运行也只有一个取值，无法拟合延迟模型。
+扫描模式按三（或四）个维度生成格点，每个格点跑一轮测试，结果整理为每个格点一行的整洁表（tidy table）：
+    - input_tokens：输入 token 数，使用合成 prompt（见 prompt_corpus.synthetic_entry，每词约 1 个 token）；
+    - max_tokens：输出上限，服务端提前遇到结束符时实际输出会更短，表中另有 avg_output_tokens；
+    - concurrency：并发数（闭环）；同时指定 arrival_rate 时为开环到达速率，concurrency 只作为在途请求上限。
+维度写法：逗号分隔的列表（如 128,512,2048），或 起点:终点:点数 的等比序列（如 128:8192:4 -> 128,512,2048,8192）。
+采样方式：grid 为完整网格；lhs 为拉丁超立方子集，每个维度的取值在 samples 个分层中各被抽中一次，
+用较少的格点覆盖各维度的取值范围。
+
+每完成一个格点即向检查点文件（JSONL）追加一行并落盘；再次运行相同的扫描时跳过已完成的格点，
+中断的扫描可以直接续跑。检查点第一行记录扫描配置，配置不同时拒绝续跑，避免混入其他扫描的结果。
+单进程运行时各格点共用同一个客户端，合成 prompt 的词池在进程内只构建一次、按需扩容。
+"""
+import asyncio
+import csv
+import json
+import os
+import random
+
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+from scenario import normalize_class
+
+SAMPLING_METHODS = ("grid", "lhs")
+DEFAULT_INPUT_TOKENS = "128,512,2048,8192"
+DEFAULT_MAX_TOKENS = "32,128,512"
+DEFAULT_CONCURRENCY = "1,4,16,64"
+# 格点之间的冷却秒数
+DEFAULT_COOLDOWN = 2.0
+# 整洁表的列，顺序即 CSV 的列顺序
+ROW_FIELDS = (
+    "input_tokens", "max_tokens", "concurrency", "arrival_rate",
+    "requests", "successful_requests", "success_rate", "total_time", "requests_per_second",
+    "output_token_throughput", "avg_prompt_tokens", "avg_output_tokens",
+    "ttft_avg", "ttft_p50", "ttft_p95", "ttft_p99",
+    "latency_avg", "latency_p50", "latency_p95", "latency_p99",
+    "tpot_p50", "tpot_p90", "tpot_p99", "itl_p50", "itl_p99", "tokens_per_second_p50",
+)
+_CELL_FIELDS = ROW_FIELDS[:4]
+
+
+def parse_axis(spec, cast=int):
+    """解析维度取值：逗号分隔的列表，或 起点:终点:点数 的等比序列（两端包含，取整后去重）。返回升序列表。"""
+    spec = str(spec).strip()
+    if ":" in spec:
+        start, stop, count = spec.split(":")
+        start, stop, count = float(start), float(stop), int(count)
+        if start <= 0 or stop < start or count < 1:
+            raise ValueError(f"invalid range '{spec}', expected start:stop:count with 0 < start <= stop")
+        values = np.geomspace(start, stop, count) if count > 1 else [start]
+    else:
+        values = [float(value) for value in spec.split(",") if value.strip()]
+    values = sorted({cast(round(value)) if cast is int else cast(value) for value in values})
+    if not values or values[0] <= 0:
+        raise ValueError(f"invalid sweep values '{spec}', expected positive numbers such as 128,512,2048 or 128:8192:4")
+    return values
+
+
+def sweep_config(input_tokens=DEFAULT_INPUT_TOKENS, max_tokens=DEFAULT_MAX_TOKENS, concurrency=DEFAULT_CONCURRENCY,
+                 arrival_rates=None, sampling="grid", samples=16, seed=0, num_requests=50,
+                 checkpoint="sweep_checkpoint.jsonl"):
+    """由命令行参数构造扫描配置，提前校验各维度的写法。"""
+    if sampling not in SAMPLING_METHODS:
+        raise ValueError(f"Unsupported sampling '{sampling}'. Valid options: {', '.join(SAMPLING_METHODS)}")
+    if sampling == "lhs" and samples < 1:
+        raise ValueError("lhs sampling requires a positive number of samples")
+    if num_requests < 1:
+        raise ValueError("requests per sweep cell must be positive")
+    return {
+        "input_tokens": parse_axis(input_tokens),
+        "max_tokens": parse_axis(max_tokens),
+        "concurrency": parse_axis(concurrency),
+        "arrival_rate": parse_axis(arrival_rates, float) if arrival_rates else [None],
+        "sampling": sampling,
+        "samples": samples if sampling == "lhs" else None,
+        "seed": seed,
+        "num_requests": num_requests,
+        "checkpoint": checkpoint,
+    }
+
+
+def _latin_hypercube(axes, samples, seed):
+    """在离散维度上做拉丁超立方采样：每个维度把 [0, 1) 等分为 samples 层，每层抽一次后映射到取值下标。"""
+    rng = random.Random(seed)
+    columns = []
+    for values in axes:
+        strata = list(range(samples))
+        rng.shuffle(strata)
+        columns.append([values[int((stratum + rng.random()) / samples * len(values))] for stratum in strata])
+    # 取值较少的维度会重复抽到相同组合，去重后保留首次出现的顺序
+    return list(dict.fromkeys(zip(*columns)))
+
+
+def sweep_cells(config):
+    """
+    返回扫描的格点列表，每个格点为 {input_tokens, max_tokens, concurrency, arrival_rate}。
+    按输入长度、输出长度、负载从小到大排列，相邻格点复用同一长度的 prompt，负载逐步升高。
+    """
+    axes = [config[field] for field in _CELL_FIELDS]
+    if config["sampling"] == "lhs":
+        combinations = _latin_hypercube(axes, config["samples"], config["seed"])
+    else:
+        combinations = [(i, o, c, r) for i in axes[0] for o in axes[1] for c in axes[2] for r in axes[3]]
+    combinations.sort(key=lambda cell: tuple(-1 if value is None else value for value in cell))
+    return [dict(zip(_CELL_FIELDS, combination)) for combination in combinations]
+
+
+def sweep_class(input_tokens):
+    """构造单个合成 prompt 请求类别，作为 request_mix 传给 run_benchmark。"""
+    return normalize_class(0, {"name": f"input-{input_tokens}", "prompt": "synthetic", "input_tokens": input_tokens})
+
+
+def cell_requests(config, cell):
+    """每个格点的请求数：闭环时至少为并发数的 2 倍，保证出现在途请求数等于并发数的稳态。"""
+    if cell["arrival_rate"]:
+        return config["num_requests"]
+    return max(config["num_requests"], 2 * cell["concurrency"])
+
+
+def _cell_key(cell):
+    return tuple(cell[field] for field in _CELL_FIELDS)
+
+
+def sweep_row(cell, result):
+    """把一个格点的结果整理为整洁表的一行。"""
+    ttft = result.get("time_to_first_token") or {}
+    latency = result.get("latency") or {}
+    tpot = result.get("time_per_output_token") or {}
+    itl = result.get("inter_token_latency") or {}
+    accounting = result.get("token_accounting") or {}
+    successful = result["successful_requests"]
+    row = dict(cell)
+    row.update({
+        "requests": result["total_requests"],
+        "successful_requests": successful,
+        "success_rate": successful / max(result["total_requests"], 1),
+        "total_time": result["total_time"],
+        "requests_per_second": result["requests_per_second"],
+        "output_token_throughput": result["output_token_throughput"],
+        "avg_prompt_tokens": accounting.get("average_prompt_tokens"),
+        "avg_output_tokens": result["total_output_tokens"] / successful if successful else None,
+        "ttft_avg": ttft.get("average"),
+        "ttft_p50": ttft.get("p50"),
+        "ttft_p95": ttft.get("p95"),
+        "ttft_p99": ttft.get("p99"),
+        "latency_avg": latency.get("average"),
+        "latency_p50": latency.get("p50"),
+        "latency_p95": latency.get("p95"),
+        "latency_p99": latency.get("p99"),
+        "tpot_p50": tpot.get("p50"),
+        "tpot_p90": tpot.get("p90"),
+        "tpot_p99": tpot.get("p99"),
+        "itl_p50": itl.get("p50"),
+        "itl_p99": itl.get("p99"),
+        "tokens_per_second_p50": (result.get("tokens_per_second") or {}).get("p50"),
+    })
+    # 分位数可能是 numpy 标量，转换为 Python 数值以便写入 JSON
+    return {field: value.item() if isinstance(value, np.generic) else value for field, value in row.items()}
+
+
+class SweepCheckpoint:
+    """
+    扫描检查点（JSONL）：第一行为 {"sweep": 配置}，之后每个完成的格点一行 {"row": 整洁表行}。
+    每行写入后立即 flush 并 fsync；末尾被中断写坏的行在续跑时忽略。
+    """
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.rows = {}
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            self._load(fingerprint)
+        self.file = open(path, "a", encoding="utf-8")
+        if not exists:
+            self._write({"sweep": fingerprint})
+
+    def _load(self, fingerprint):
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        header = json.loads(lines[0])
+        if header.get("sweep") != fingerprint:
+            raise ValueError(f"Checkpoint {self.path} was written by a different sweep configuration; "
+                             f"delete it or choose another checkpoint file")
+        for line in lines[1:]:
+            try:
+                row = json.loads(line)["row"]
+            except (ValueError, KeyError, TypeError):
+                continue
+            self.rows[_cell_key(row)] = row
+
+    def _write(self, message):
+        self.file.write(json.dumps(message, ensure_ascii=False) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def done(self, cell):
+        return _cell_key(cell) in self.rows
+
+    def add(self, row):
+        self.rows[_cell_key(row)] = row
+        self._write({"row": row})
+
+    def close(self):
+        self.file.close()
+
+
+async def run_sweep(run_cell, config, fingerprint, cooldown=DEFAULT_COOLDOWN, console=None):
+    """
+    执行参数扫描，已记录在检查点中的格点跳过。
+    :param run_cell: async (cell, num_requests) -> run_benchmark 的结果字典
+    :param fingerprint: 写入检查点的扫描配置（含模型和端点），续跑时必须与检查点一致
+    :return: (本次运行的各格点结果, 按格点顺序排列的整洁表，含续跑前已完成的格点)
+    """
+    console = console or Console()
+    cells = sweep_cells(config)
+    checkpoint = SweepCheckpoint(config["checkpoint"], fingerprint)
+    all_results = []
+    try:
+        pending = [cell for cell in cells if not checkpoint.done(cell)]
+        if len(pending) < len(cells):
+            console.print(f"[bold cyan]从检查点 {config['checkpoint']} 续跑: 已完成 {len(cells) - len(pending)}/{len(cells)} 个格点[/bold cyan]")
+        for index, cell in enumerate(pending):
+            if index:
+                await asyncio.sleep(cooldown)
+            num_requests = cell_requests(config, cell)
+            rate = f", 到达速率 {cell['arrival_rate']:g} 请求/秒" if cell["arrival_rate"] else ""
+            console.print(f"[bold cyan]格点 {len(cells) - len(pending) + index + 1}/{len(cells)}: 输入 {cell['input_tokens']} tokens, "
+                          f"输出上限 {cell['max_tokens']}, 并发数 {cell['concurrency']}{rate}, 请求数 {num_requests}...[/bold cyan]")
+            try:
+                result = await run_cell(cell, num_requests)
+            except Exception as e:
+                # 出错的格点不写入检查点，续跑时重试
+                console.print(f"[bold red]格点出错: {str(e)}[/bold red]")
+                continue
+            result["sweep_cell"] = cell
+            all_results.append(result)
+            row = sweep_row(cell, result)
+            checkpoint.add(row)
+            console.print(f"  TTFT P50 {_seconds(row['ttft_p50'])} 秒, 延迟 P50 {_seconds(row['latency_p50'])} 秒, "
+                          f"输出 {row['output_token_throughput']:.1f} tokens/s")
+    finally:
+        checkpoint.close()
+    rows = [checkpoint.rows[_cell_key(cell)] for cell in cells if checkpoint.done(cell)]
+    return all_results, rows
+
+
+def _seconds(value):
+    return f"{value:.3f}" if value is not None else "N/A"
+
+
+def write_sweep_table(rows, filename="sweep_results.csv"):
+    """把整洁表写成 CSV，每个格点一行，列见 ROW_FIELDS；空值写为空字符串。"""
+    with open(filename, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=ROW_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({field: "" if row.get(field) is None else row[field] for field in ROW_FIELDS})
+
+
+def print_sweep_table(rows, console=None):
+    console = console or Console()
+    table = Table(title=f"参数扫描结果 ({len(rows)} 个格点)", header_style="bold cyan", border_style="blue")
+    for column in ("输入 tokens", "输出上限", "并发数", "到达速率", "成功率", "RPS", "输出tokens/s", "平均输出",
+                   "TTFT P50", "TTFT P99", "延迟 P50", "延迟 P99", "TPOT P50"):
+        table.add_column(column, justify="right")
+    for row in rows:
+        table.add_row(
+            str(row["input_tokens"]), str(row["max_tokens"]), str(row["concurrency"]),
+            f"{row['arrival_rate']:g}" if row["arrival_rate"] else "-", f"{row['success_rate']:.1%}",
+            f"{row['requests_per_second']:.2f}", f"{row['output_token_throughput']:.1f}",
+            f"{row['avg_output_tokens']:.0f}" if row["avg_output_tokens"] is not None else "N/A",
+            _seconds(row["ttft_p50"]), _seconds(row["ttft_p99"]), _seconds(row["latency_p50"]),
+            _seconds(row["latency_p99"]), f"{row['tpot_p50']:.4f}" if row["tpot_p50"] is not None else "N/A",
+        )
+    Console(width=160).print(table)
+
+
+def plot_sweep_heatmaps(rows, filename="sweep_heatmap.png", metrics=("ttft_p50", "tpot_p50")):
+    """
+    按输出上限分列、按指标分行绘制 输入长度 × 负载 的热力图；负载轴为到达速率（扫描了速率时）或并发数。
+    同一单元格有多个格点（如同时扫描并发数和速率）时取平均，未采样的单元格留空。
+    """
+    import matplotlib.pyplot as plt
+
+    load_field = "arrival_rate" if len({row["arrival_rate"] for row in rows}) > 1 else "concurrency"
+    inputs = sorted({row["input_tokens"] for row in rows})
+    loads = sorted({row[load_field] for row in rows})
+    outputs = sorted({row["max_tokens"] for row in rows})
+    fig, axes = plt.subplots(len(metrics), len(outputs), figsize=(4.5 * len(outputs), 3.8 * len(metrics)), squeeze=False)
+    for i, metric in enumerate(metrics):
+        for j, max_tokens in enumerate(outputs):
+            sums = np.zeros((len(inputs), len(loads)))
+            counts = np.zeros((len(inputs), len(loads)))
+            for row in rows:
+                if row["max_tokens"] == max_tokens and row.get(metric) is not None:
+                    y, x = inputs.index(row["input_tokens"]), loads.index(row[load_field])
+                    sums[y, x] += row[metric]
+                    counts[y, x] += 1
+            grid = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+            ax = axes[i][j]
+            image = ax.imshow(grid, origin="lower", aspect="auto", cmap="viridis")
+            fig.colorbar(image, ax=ax)
+            ax.set_xticks(range(len(loads)))
+            ax.set_xticklabels([f"{load:g}" for load in loads])
+            ax.set_yticks(range(len(inputs)))
+            ax.set_yticklabels([str(value) for value in inputs])
+            ax.set_xlabel("Arrival rate (req/s)" if load_field == "arrival_rate" else "Concurrency")
+            ax.set_ylabel("Input tokens")
+            ax.set_title(f"{metric} (s), max_tokens={max_tokens}")
+    fig.tight_layout()
+    fig.savefig(filename)
+    plt.close(fig)
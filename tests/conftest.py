@@ -0,0 +1,20 @@
+import os
+import sys
+
+# 各模块平铺在仓库根目录，测试直接按模块名导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_record(start_time=0.0, end_time=1.0, status="success", ttft=0.1, output_tokens=10, **fields):
+    """构造 make_request 返回格式的请求记录，供观察者和汇总的测试使用。"""
+    record = {
+        "status": status,
+        "error": None if status == "success" else f"{status} error",
+        "start_time": start_time,
+        "end_time": end_time,
+        "latency": end_time - start_time,
+        "ttft": ttft,
+        "output_tokens": output_tokens,
+    }
+    record.update(fields)
+    return record
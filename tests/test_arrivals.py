@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from llm_benchmark import _arrival_offsets, _arrival_offsets_until
+
+
+def test_constant_schedule_is_evenly_spaced():
+    offsets = _arrival_offsets(5, 2.0, "constant")
+    assert offsets == pytest.approx([0.0, 0.5, 1.0, 1.5, 2.0])
+
+
+@pytest.mark.parametrize("distribution", ["poisson", "gamma"])
+def test_random_schedules_keep_the_mean_rate(distribution):
+    offsets = _arrival_offsets(20_000, 10.0, distribution, gamma_shape=0.5, seed=7)
+    assert offsets[0] == 0.0
+    assert np.all(np.diff(offsets) >= 0)
+    assert np.mean(np.diff(offsets)) == pytest.approx(0.1, rel=0.05)
+
+
+def test_gamma_shape_controls_burstiness():
+    bursty = np.diff(_arrival_offsets(20_000, 10.0, "gamma", gamma_shape=0.25, seed=1))
+    smooth = np.diff(_arrival_offsets(20_000, 10.0, "gamma", gamma_shape=4.0, seed=1))
+    poisson = np.diff(_arrival_offsets(20_000, 10.0, "poisson", seed=1))
+    assert np.std(bursty) > np.std(poisson) > np.std(smooth)
+
+
+def test_seed_makes_schedule_reproducible():
+    assert _arrival_offsets(100, 5.0, seed=3) == _arrival_offsets(100, 5.0, seed=3)
+    assert _arrival_offsets(100, 5.0, seed=3) != _arrival_offsets(100, 5.0, seed=4)
+
+
+def test_empty_and_invalid_schedules():
+    assert _arrival_offsets(0, 5.0) == []
+    with pytest.raises(ValueError):
+        _arrival_offsets(10, 0)
+    with pytest.raises(ValueError):
+        _arrival_offsets(10, 5.0, "uniform")
+    with pytest.raises(ValueError):
+        _arrival_offsets(10, 5.0, "gamma", gamma_shape=0)
+
+
+def test_duration_schedule_stays_inside_the_window():
+    offsets = list(_arrival_offsets_until(60.0, 20.0, seed=11, batch_size=64))
+    assert offsets[0] == 0.0
+    assert max(offsets) < 60.0
+    assert len(offsets) == pytest.approx(1200, rel=0.1)
+    assert list(_arrival_offsets_until(0, 20.0)) == []
+    assert list(_arrival_offsets_until(3.0, 1.0, "constant")) == pytest.approx([0.0, 1.0, 2.0])
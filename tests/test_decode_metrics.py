@@ -0,0 +1,45 @@
+"""ITL / TPOT：对 mock_server 压测，服务端每个块 1 个 token、块间隔固定。"""
+import asyncio
+
+import numpy as np
+
+from llm_benchmark import output_config, run_benchmark
+from mock_server import MockLLMServer
+from sample_store import load_samples
+
+ITL = 0.02
+
+
+def _run(output_tokens, samples_file=None):
+    async def main():
+        async with MockLLMServer(port=0, ttft="0.1", itl=str(ITL)) as server:
+            return await run_benchmark(4, 2, 10, output_tokens, server.base_url, "test-key", "mock-model", False,
+                                       output=output_config(samples_file=samples_file))
+    return asyncio.run(main())
+
+
+def test_itl_and_tpot_exclude_prefill(tmp_path):
+    path = str(tmp_path / "samples.npy")
+    result = _run(6, samples_file=path)
+
+    # 首 Token 延迟 0.1 秒，远大于 Token 间隔；ITL/TPOT 不应包含预填充
+    itl = result["inter_token_latency"]
+    assert ITL * 0.9 <= itl["p50"] < ITL * 2.5
+    assert itl["max"] >= itl["p50"]
+    tpot = result["time_per_output_token"]
+    assert ITL * 0.9 <= tpot["average"] < ITL * 2.5
+    assert result["time_to_first_token"]["p50"] >= 0.1
+
+    samples = load_samples(path)
+    assert len(samples) == 4
+    # 6 个 token 有 5 个间隔，TPOT 为总解码时间 / 5，不会超过最大间隔
+    assert (samples["tpot"] >= ITL * 0.9).all()
+    assert (samples["itl_max"] >= samples["tpot"] - 1e-6).all()
+
+
+def test_single_token_has_no_decode_metrics(tmp_path):
+    path = str(tmp_path / "samples.npy")
+    result = _run(1, samples_file=path)
+    assert result["successful_requests"] == 4
+    assert np.isnan(load_samples(path)["tpot"]).all()
+    assert result["inter_token_latency"]["p50"] is None
@@ -0,0 +1,136 @@
+"""本机多 agent 测试：mock_server 和协调端在测试进程内，两个 agent 以 `distributed.py agent` 子进程运行。"""
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from distributed import DistributedCoordinator
+from llm_benchmark import load_config
+from mock_server import MockLLMServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = "test-token"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port, process, timeout=20.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"agent exited with code {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"agent on port {port} did not start within {timeout} seconds")
+
+
+@pytest.fixture(scope="module")
+def agents():
+    ports = [_free_port(), _free_port()]
+    processes = [subprocess.Popen([sys.executable, "distributed.py", "agent", "--port", str(port), "--token", TOKEN],
+                                  cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                 for port in ports]
+    try:
+        for port, process in zip(ports, processes):
+            _wait_for_port(port, process)
+        yield [f"127.0.0.1:{port}" for port in ports]
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+
+
+async def _stalled_agent(reader, writer, heartbeat):
+    """回应握手但从不完成阶段的 agent；heartbeat 为 True 时持续发送心跳。"""
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        if json.loads(line)["type"] == "ping":
+            writer.write((json.dumps({"type": "pong", "time": time.time()}) + "\n").encode())
+        else:
+            while heartbeat:
+                writer.write(b'{"type": "heartbeat"}\n')
+                await asyncio.sleep(0.1)
+        await writer.drain()
+
+
+def _run_phase(agents, token=TOKEN, stalled_agent=None, agent_timeout=30.0, request_timeout=10, **phase):
+    async def main():
+        async with MockLLMServer(port=0, ttft="0.01", itl="0.001") as server:
+            addresses = list(agents)
+            if stalled_agent is not None:
+                stalled = await asyncio.start_server(
+                    lambda reader, writer: _stalled_agent(reader, writer, stalled_agent), "127.0.0.1", 0)
+                addresses.append(f"127.0.0.1:{stalled.sockets[0].getsockname()[1]}")
+            async with DistributedCoordinator(addresses, token=token, start_delay=1.0,
+                                              agent_timeout=agent_timeout) as coordinator:
+                result = await coordinator.run_phase(request_timeout=request_timeout, output_tokens=8, llm_url=server.base_url,
+                                                     api_key="test-key", model="mock-model", use_long_context=False,
+                                                     **phase)
+            return result, dict(server.stats)
+    return asyncio.run(main())
+
+
+def test_merged_record_count_matches_requests(agents):
+    result, stats = _run_phase(agents, num_requests=30, concurrency=4)
+    assert result["agents"] == 2
+    assert result["total_requests"] == 30
+    assert result["successful_requests"] == 30
+    assert result["failed_requests"] == 0
+    assert result["total_output_tokens"] == 30 * 8
+    assert stats["completed"] == 30
+
+
+def test_uneven_split_and_multiple_processes(agents):
+    result, stats = _run_phase(agents, num_requests=11, concurrency=3, processes_per_agent=2)
+    # 并发 3 拆成 [2, 1]，并发为 1 的 agent 只用 1 个进程
+    assert result["processes"] == 3
+    assert result["successful_requests"] == 11
+    assert stats["completed"] == 11
+
+
+def test_wrong_token_is_rejected(agents):
+    with pytest.raises(RuntimeError):
+        _run_phase(agents, token="wrong", num_requests=2, concurrency=2)
+
+
+def test_duration_counts_records_from_all_agents(agents):
+    result, stats = _run_phase(agents, num_requests=5, concurrency=2, load=load_config(duration=0.5))
+    assert result["total_requests"] == stats["completed"] > 5
+    assert result["failed_requests"] == 0
+
+
+def test_silent_agent_times_out(agents):
+    started = time.time()
+    result, stats = _run_phase(agents, stalled_agent=False, agent_timeout=1.0, num_requests=12, concurrency=3)
+    assert time.time() - started < 10
+    assert result["agents"] == 3
+    failed, = result["failed_agents"]
+    assert failed["agent"] not in agents
+    # 未完成的 agent 分到的请求计为失败
+    assert result["successful_requests"] == stats["completed"] == 8
+    assert result["failed_requests"] == 4
+
+
+def test_duration_phase_stops_waiting_at_deadline(agents):
+    # 一直发送心跳但不完成的 agent 在 时长 + 请求超时 + 余量 之后放弃
+    started = time.time()
+    result, stats = _run_phase(agents, stalled_agent=True, num_requests=5, concurrency=3, request_timeout=1,
+                               transport="raw", load=load_config(duration=0.5))
+    assert time.time() - started < 10
+    assert len(result["failed_agents"]) == 1
+    assert "截止时间" in result["failed_agents"][0]["error"]
+    assert result["total_requests"] == stats["completed"] > 0
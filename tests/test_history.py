@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from conftest import make_record
+from history import HISTORY_SAMPLE_DTYPE, HistoryStore, SampleReservoir, compare_runs, phase_label
+
+
+def _samples(seed, scale=1.0, size=500):
+    rng = np.random.default_rng(seed)
+    samples = np.empty(size, dtype=HISTORY_SAMPLE_DTYPE)
+    samples["ttft"] = rng.lognormal(-2.0, 0.3, size) * scale
+    samples["latency"] = rng.lognormal(0.0, 0.3, size) * scale
+    samples["itl"] = rng.lognormal(-4.0, 0.3, size) * scale
+    return samples
+
+
+def _phase(samples, concurrency=4, rps=10.0, total_time=50.0, **fields):
+    result = {
+        "concurrency": concurrency,
+        "successful_requests": int(rps * total_time),
+        "total_time": total_time,
+        "requests_per_second": rps,
+        "time_to_first_token": {"p50": float(np.percentile(samples["ttft"], 50))},
+        "inter_token_latency": {"p50": float(np.percentile(samples["itl"], 50))},
+        "latency": {"p99": float(np.percentile(samples["latency"], 99))},
+    }
+    result.update(fields)
+    return result, samples
+
+
+def _regressions(rows):
+    return {row["metric"] for row in rows if row["regression"]}
+
+
+def test_identical_distributions_have_no_regression():
+    baseline = [_phase(_samples(0))]
+    candidate = [_phase(_samples(1))]
+    rows = compare_runs(baseline, candidate, iterations=300)
+    assert len(rows) == 4
+    assert _regressions(rows) == set()
+
+
+def test_slower_candidate_is_flagged():
+    baseline = [_phase(_samples(0))]
+    candidate = [_phase(_samples(1, scale=1.5), rps=7.0)]
+    rows = compare_runs(baseline, candidate, iterations=300)
+    assert _regressions(rows) == {"RPS", "TTFT P50", "ITL P50", "延迟 P99"}
+    ttft = next(row for row in rows if row["metric"] == "TTFT P50")
+    assert ttft["delta_pct"] == pytest.approx(50, abs=10)
+    assert ttft["ci"][0] > 0 and ttft["p_value"] < 0.05
+
+
+def test_faster_candidate_is_not_a_regression():
+    rows = compare_runs([_phase(_samples(0))], [_phase(_samples(1, scale=0.5), rps=20.0)], iterations=300)
+    assert _regressions(rows) == set()
+
+
+def test_without_samples_only_the_threshold_applies():
+    base, _ = _phase(_samples(0))
+    cand, _ = _phase(_samples(1, scale=1.2))
+    rows = compare_runs([(base, None)], [(cand, None)])
+    ttft = next(row for row in rows if row["metric"] == "TTFT P50")
+    assert ttft["p_value"] is None and ttft["regression"]
+
+
+def test_phases_align_by_label():
+    baseline = [_phase(_samples(0), concurrency=1), _phase(_samples(1), concurrency=8)]
+    candidate = [_phase(_samples(2), concurrency=8), _phase(_samples(3), concurrency=16)]
+    rows = compare_runs(baseline, candidate, iterations=100)
+    assert {row["phase"] for row in rows} == {phase_label({"concurrency": 8})}
+
+
+def test_reservoir_keeps_a_bounded_sample():
+    reservoir = SampleReservoir(capacity=50)
+    for i in range(500):
+        reservoir.on_record(make_record(0.0, 1.0 + i, itl=np.array([0.01, 0.03])))
+    reservoir.on_record(make_record(status="timeout"))
+    samples = reservoir.to_array()
+    assert reservoir.seen == 500
+    assert len(samples) == 50
+    assert np.all(samples["itl"] == np.float32(0.02))
+
+
+def test_store_round_trip_and_references(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.db"))
+    try:
+        phases = [_phase(_samples(0)), _phase(_samples(1), concurrency=8)]
+        samples = {id(result): data for result, data in phases}
+        first = store.save_run([result for result, _ in phases], "m", "http://x", {"a": 1}, "h1", "fixed",
+                               samples_for=lambda result: samples.get(id(result)))
+        second = store.save_run([phases[0][0]], "m", "http://x", {"a": 1}, "h1", "fixed")
+        other = store.save_run([phases[0][0]], "m", "http://x", {"a": 2}, "h2", "fixed")
+
+        loaded = store.phases(first)
+        assert [result for result, _ in loaded] == [result for result, _ in phases]
+        np.testing.assert_array_equal(loaded[1][1], phases[1][1])
+        assert store.phases(second)[0][1] is None
+
+        assert store.resolve("latest") == other
+        assert store.resolve(str(first)) == first
+        assert store.previous_run(second) == first
+        assert store.previous_run(other) is None
+        store.set_baseline("default", first)
+        store.set_baseline("default", second)
+        assert store.resolve("default") == second
+        assert [run["id"] for run in store.list_runs(model="m")] == [other, second, first]
+        with pytest.raises(ValueError):
+            store.resolve("missing")
+        with pytest.raises(ValueError):
+            store.set_baseline("default", 99)
+    finally:
+        store.close()
@@ -0,0 +1,50 @@
+import asyncio
+
+from http_client import ConnectionTiming, connection_pool_config
+from llm_benchmark import run_benchmark
+from mock_server import MockLLMServer
+
+
+def test_connection_timing_splits_connect_and_wait():
+    async def main():
+        timing = ConnectionTiming()
+        timing.begin()
+        timing.request_time -= 0.5
+        await timing.trace("connection.connect_tcp.started", {})
+        timing._phase_start -= 0.2
+        await timing.trace("connection.connect_tcp.complete", {})
+        await timing.trace("http11.send_request_headers.started", {})
+        return timing
+    timing = asyncio.run(main())
+    assert abs(timing.connect_time - 0.2) < 0.01
+    # 等待可用连接的时间不含新建连接耗时
+    assert abs(timing.pool_wait - 0.3) < 0.01
+
+
+def test_pool_wait_is_none_without_trace():
+    assert ConnectionTiming().pool_wait is None
+
+
+def _run(pool_config, num_requests=8, concurrency=4):
+    async def main():
+        async with MockLLMServer(port=0, ttft="0.02", itl="0.001") as server:
+            return await run_benchmark(num_requests, concurrency, 10, 4, server.base_url, "test-key", "mock-model",
+                                       False, pool_config=pool_config)
+    return asyncio.run(main())
+
+
+def test_single_connection_pool_reports_wait():
+    result = _run(connection_pool_config(max_connections=1))
+    assert result["successful_requests"] == 8
+    pool = result["connection_pool"]
+    # 只有一个连接：首个请求新建连接，其余请求排队等待并复用
+    assert pool["new_connections"] == 1
+    assert pool["reused_connections"] == 7
+    assert pool["pool_wait"]["max"] > 0.01
+    assert pool["connect_time"]["average"] > 0
+
+
+def test_unlimited_pool_reuses_connections_across_requests():
+    pool = _run(connection_pool_config(), num_requests=12, concurrency=3)["connection_pool"]
+    assert pool["new_connections"] == 3
+    assert pool["reused_connections"] == 9
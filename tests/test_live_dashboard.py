@@ -0,0 +1,47 @@
+from rich.console import Console
+
+from conftest import make_record
+from live_dashboard import LiveDashboard
+
+
+def test_snapshot_only_counts_the_rolling_window():
+    dashboard = LiveDashboard(window_seconds=10.0)
+    dashboard.first_start = 0.0
+    for _ in range(5):
+        dashboard.on_request_start()
+    dashboard.on_record(make_record(end_time=1.0, ttft=0.5, output_tokens=100))
+    dashboard.on_record(make_record(end_time=15.0, ttft=0.1, output_tokens=20))
+    dashboard.on_record(make_record(end_time=16.0, status="timeout", ttft=None, output_tokens=None))
+
+    stats = dashboard.snapshot(now=20.0)
+    # end_time=1.0 的请求已滑出最近 10 秒的窗口
+    assert stats["window_requests"] == 2
+    assert stats["requests_per_second"] == 0.2
+    assert stats["tokens_per_second"] == 2.0
+    assert stats["error_rate"] == 50.0
+    assert stats["ttft"][50] == 0.1
+    # 累计计数不受窗口影响
+    assert stats["completed"] == 3
+    assert stats["failed"] == 1
+    assert stats["in_flight"] == 2
+
+
+def test_rates_use_elapsed_time_before_window_fills():
+    dashboard = LiveDashboard(window_seconds=10.0)
+    dashboard.first_start = 100.0
+    dashboard.on_request_start()
+    dashboard.on_record(make_record(start_time=100.0, end_time=101.0, output_tokens=8))
+    stats = dashboard.snapshot(now=102.0)
+    assert stats["span"] == 2.0
+    assert stats["requests_per_second"] == 0.5
+    assert stats["latency"][99] == 1.0
+
+
+def test_empty_window_renders():
+    dashboard = LiveDashboard("并发数 4", total_requests=10, console=Console(file=None, width=100))
+    stats = dashboard.snapshot(now=1.0)
+    assert stats["window_requests"] == 0
+    assert stats["ttft"][50] is None
+    console = Console(record=True, width=100)
+    console.print(dashboard)
+    assert "0/10" in console.export_text()
@@ -0,0 +1,92 @@
+import asyncio
+import socket
+
+import numpy as np
+
+from conftest import make_record
+from llm_benchmark import output_config, run_benchmark
+from metrics_exporter import PrometheusExporter, _Histogram, get_metrics_exporter
+from mock_server import MockLLMServer
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_histogram_buckets_are_cumulative_in_output():
+    histogram = _Histogram((0.1, 1.0))
+    histogram.observe(0.1)
+    histogram.observe_many(np.array([0.05, 0.5, 5.0]))
+    assert list(histogram.counts) == [2, 1, 1]
+    assert histogram.count == 4
+    assert abs(histogram.sum - 5.65) < 1e-9
+
+
+def test_render_phase_metrics():
+    exporter = PrometheusExporter()
+    metrics = exporter.phase_observer("fixed-1", 4)
+    assert exporter.phase_observer("fixed-1", 4) is metrics
+    metrics.on_request_start()
+    metrics.on_request_start()
+    metrics.on_record(make_record(ttft=0.2, output_tokens=12, prompt_tokens=30, itl=np.array([0.01, 0.03])))
+    metrics.on_record(make_record(status="timeout", ttft=None, output_tokens=None))
+
+    text = exporter.render()
+    labels = 'phase="fixed-1",concurrency="4"'
+    assert f'llm_benchmark_requests_total{{{labels},status="success"}} 1' in text
+    assert f'llm_benchmark_requests_total{{{labels},status="timeout"}} 1' in text
+    # 未出现过的错误分类也输出 0 值序列
+    assert f'llm_benchmark_requests_total{{{labels},status="rate_limit"}} 0' in text
+    assert f"llm_benchmark_in_flight_requests{{{labels}}} 0" in text
+    assert f"llm_benchmark_output_tokens_total{{{labels}}} 12" in text
+    assert f"llm_benchmark_prompt_tokens_total{{{labels}}} 30" in text
+    assert f'llm_benchmark_ttft_seconds_bucket{{{labels},le="0.1"}} 0' in text
+    assert f'llm_benchmark_ttft_seconds_bucket{{{labels},le="0.25"}} 1' in text
+    assert f'llm_benchmark_inter_token_latency_seconds_bucket{{{labels},le="0.02"}} 1' in text
+    assert f"llm_benchmark_inter_token_latency_seconds_count{{{labels}}} 2" in text
+
+
+def test_scrape_over_http():
+    port = _free_port()
+
+    async def fetch(path):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        return response
+
+    async def main():
+        exporter = await get_metrics_exporter(port, host="127.0.0.1")
+        try:
+            assert await get_metrics_exporter(port, host="127.0.0.1") is exporter
+            exporter.phase_observer("run", 1).on_record(make_record())
+            return await fetch("/metrics"), await fetch("/other")
+        finally:
+            exporter.close()
+
+    metrics, other = asyncio.run(main())
+    assert metrics.startswith(b"HTTP/1.1 200 OK")
+    assert b'llm_benchmark_requests_total{phase="run",concurrency="1",status="success"} 1' in metrics
+    assert other.startswith(b"HTTP/1.1 404")
+
+
+def test_run_benchmark_serves_metrics_on_loopback_by_default():
+    port = _free_port()
+
+    async def main():
+        async with MockLLMServer(port=0, ttft="0.01", itl="0.001") as server:
+            await run_benchmark(4, 2, 10, 4, server.base_url, "test-key", "mock-model", False,
+                                output=output_config(metrics_port=port), transport="raw")
+        exporter = await get_metrics_exporter(port)
+        try:
+            return [sock.getsockname()[0] for sock in exporter.server.sockets], exporter.render()
+        finally:
+            exporter.close()
+
+    addresses, text = asyncio.run(main())
+    assert addresses == ["127.0.0.1"]
+    assert 'llm_benchmark_requests_total{phase="run",concurrency="2",status="success"} 4' in text
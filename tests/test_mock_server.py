@@ -0,0 +1,85 @@
+"""端到端测试：在本机起 mock_server（随机端口），用 run_benchmark 对其压测。"""
+import asyncio
+import random
+
+import pytest
+
+from distributions import parse_distribution
+from llm_benchmark import load_config, run_benchmark
+from mock_server import MockLLMServer
+
+FAST = {"ttft": "0.01", "itl": "0.001"}
+
+
+def _run(server_kwargs, *args, **kwargs):
+    async def main():
+        async with MockLLMServer(port=0, seed=0, **{**FAST, **server_kwargs}) as server:
+            result = await run_benchmark(*args[:4], server.base_url, "test-key", "mock-model", False, **kwargs)
+            return result, dict(server.stats)
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("transport", ["raw", "openai"])
+def test_all_requests_succeed(transport):
+    result, stats = _run({}, 20, 4, 10, 16, transport=transport)
+    assert result["total_requests"] == 20
+    assert result["successful_requests"] == 20
+    assert result["failed_requests"] == 0
+    assert result["total_output_tokens"] == 20 * 16
+    assert result["time_to_first_token"]["p50"] >= 0.01
+    assert stats["completed"] == 20
+
+
+def test_duration_ignores_num_requests():
+    # 指定时长时实际发出的请求数以记录为准，不能按 num_requests 把多出的请求算成失败
+    result, _ = _run({}, 5, 2, 10, 8, load=load_config(duration=0.5), transport="raw")
+    assert result["total_requests"] > 5
+    assert result["successful_requests"] == result["total_requests"]
+    assert result["failed_requests"] == 0
+
+
+def test_rate_limited_requests_are_classified():
+    result, stats = _run({"error_429_rate": 1.0}, 6, 2, 10, 8, transport="raw")
+    assert result["successful_requests"] == 0
+    assert result["error_statistics"]["count"] == {"rate_limit": 6}
+    assert stats["errors"] == 6
+
+
+def test_open_loop_arrivals():
+    result, _ = _run({}, 10, 10, 10, 4, load=load_config(50.0, "constant"), transport="raw")
+    assert result["arrival_mode"] == "open_loop"
+    assert result["successful_requests"] == 10
+    assert result["total_time"] >= 9 / 50.0
+
+
+def test_malformed_request_line_gets_400():
+    async def main():
+        async with MockLLMServer(port=0, **FAST) as server:
+            reader, writer = await asyncio.open_connection(server.host, server.port)
+            writer.write(b"GARBAGE\r\n\r\n")
+            await writer.drain()
+            status_line = await reader.readline()
+            writer.close()
+            await writer.wait_closed()
+            return status_line
+    assert asyncio.run(main()).startswith(b"HTTP/1.1 400")
+
+
+def test_parse_distribution_uses_the_given_rng():
+    first = parse_distribution("lognormal:0.2,0.5", random.Random(7))
+    second = parse_distribution("lognormal:0.2,0.5", random.Random(7))
+    assert [first() for _ in range(5)] == [second() for _ in range(5)]
+    assert parse_distribution("const:0.3")() == 0.3
+    with pytest.raises(ValueError):
+        parse_distribution("zipf:2")
+
+
+def test_seed_does_not_touch_global_random_state():
+    random.seed(5)
+    expected = random.random()
+    random.seed(5)
+    servers = [MockLLMServer(port=0, seed=1, ttft="uniform:0,1", error_5xx_rate=0.5) for _ in range(2)]
+    assert random.random() == expected
+    # 相同种子的实例抽样序列相同
+    assert [servers[0].sample_ttft() for _ in range(5)] == [servers[1].sample_ttft() for _ in range(5)]
+    assert servers[0].rng.random() == servers[1].rng.random()
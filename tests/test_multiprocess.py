@@ -0,0 +1,78 @@
+import asyncio
+import multiprocessing
+
+from llm_benchmark import (BenchmarkObserver, load_config, load_shard, print_results, run_benchmark_multiprocess,
+                           split_evenly)
+from mock_server import MockLLMServer
+
+FAST = {"ttft": "0.01", "itl": "0.001"}
+
+
+def test_split_evenly():
+    assert split_evenly(10, 3) == [4, 3, 3]
+    assert split_evenly(2, 4) == [1, 1, 0, 0]
+    assert sum(split_evenly(1001, 7)) == 1001
+
+
+def test_load_shard_splits_arrival_rate():
+    assert load_shard(load_config(), 1, 4) == load_config()
+    poisson = load_shard(load_config(8.0, arrival_seed=5), 2, 4)
+    assert (poisson["arrival_rate"], poisson["arrival_seed"], poisson["arrival_offset"]) == (2.0, 7, 0.0)
+    # constant 到达逐级拆分（2 个 agent × 2 个进程）后相位依次错开 1/8 秒，合并后仍是等间隔
+    agents = [load_shard(load_config(8.0, "constant"), i, 2) for i in range(2)]
+    offsets = sorted(load_shard(agent, j, 2)["arrival_offset"] for agent in agents for j in range(2))
+    assert offsets == [0.0, 0.125, 0.25, 0.375]
+
+
+def _run_multiprocess(num_processes, *args, **kwargs):
+    async def main():
+        async with MockLLMServer(port=0, **FAST) as server:
+            result = await run_benchmark_multiprocess(num_processes, *args[:4], server.base_url, "test-key",
+                                                      "mock-model", False, **kwargs)
+            return result, dict(server.stats)
+    return asyncio.run(main())
+
+
+def test_multiprocess_merges_worker_records():
+    result, stats = _run_multiprocess(2, 12, 4, 10, 8)
+    assert result["processes"] == 2
+    assert result["total_requests"] == 12
+    assert result["successful_requests"] == 12
+    assert result["total_output_tokens"] == 12 * 8
+    assert stats["completed"] == 12
+    # 分位数在本进程合并后的记录上计算
+    assert result["time_to_first_token"]["p50"] >= 0.01
+
+
+def test_multiprocess_open_loop_keeps_target_rate():
+    # constant 分布下各分片错开相位，合并后仍按目标速率等间隔到达
+    result, _ = _run_multiprocess(2, 10, 10, 10, 4, load=load_config(40.0, "constant"))
+    assert result["arrival_mode"] == "open_loop"
+    assert result["successful_requests"] == 10
+    assert result["total_time"] >= 9 / 40.0
+
+
+class _KillOneShard(BenchmarkObserver):
+    """收到第一条记录时杀掉一个子进程，模拟开始后崩溃的分片。"""
+
+    def __init__(self):
+        self.killed = False
+
+    def on_record(self, record):
+        children = multiprocessing.active_children()
+        if children and not self.killed:
+            self.killed = True
+            children[0].kill()
+
+
+def test_shard_failure_after_start_is_reported(capsys):
+    # 每个分片 100 个请求，第一批记录回传时两个子进程都还在运行
+    result, _ = _run_multiprocess(2, 200, 2, 10, 8, observers=[_KillOneShard()], transport="raw")
+    assert result["processes"] == 2
+    failed, = result["failed_shards"]
+    assert "exited with code" in failed["error"]
+    assert result["successful_requests"] < 200
+    assert result["failed_requests"] == 200 - result["successful_requests"]
+
+    print_results(result, "line")
+    assert "失败的子进程: 1/2 个" in capsys.readouterr().out
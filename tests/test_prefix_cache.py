@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+from rich.console import Console
+
+from llm_benchmark import run_benchmark
+from mock_server import MockLLMServer
+from prefix_cache import parse_prefix_grid, prefix_cache_class, run_prefix_cache_sweep
+from prompt_corpus import shared_prefix_entry
+
+
+def test_parse_prefix_grid():
+    assert parse_prefix_grid("2048, 512,512", "1,0,0.5") == ([512, 2048], [0.0, 0.5, 1.0])
+    with pytest.raises(ValueError):
+        parse_prefix_grid("0,512", "0.5")
+    with pytest.raises(ValueError):
+        parse_prefix_grid("512", "0,1.5")
+
+
+def test_shared_prefix_entries():
+    first, second = shared_prefix_entry(3, 50, 8), shared_prefix_entry(3, 50, 8)
+    # 同一编号的前缀内容一致，后缀各不相同
+    assert first["messages"][0] == second["messages"][0]
+    assert first["messages"][1] != second["messages"][1]
+    assert len(first["messages"][0]["content"].split()) == 50
+    assert shared_prefix_entry(4, 50, 8)["messages"][0] != first["messages"][0]
+    assert shared_prefix_entry(None, 50, 8)["messages"][0] != first["messages"][0]
+
+
+def test_prefix_cache_class_validation():
+    request_class = prefix_cache_class(128, 0.5, num_prefixes=4)
+    assert (request_class["prompt"], request_class["prefix_tokens"], request_class["num_prefixes"]) == ("shared_prefix", 128, 4)
+    with pytest.raises(ValueError):
+        prefix_cache_class(128, 1.5)
+
+
+def test_sweep_measures_hit_speedup_against_mock_server():
+    # 模拟服务按未缓存的输入 token 数增加首 Token 延迟，命中缓存的 system 前缀不计预填充
+    async def main():
+        async with MockLLMServer(port=0, ttft="0.005", itl="0.001", prefill_per_token=0.0002,
+                                 prefix_cache_size=64) as server:
+            async def run_phase(request_mix, num_requests, concurrency, output_tokens, warmup):
+                return await run_benchmark(num_requests, concurrency, 10, output_tokens, server.base_url, "test-key",
+                                           "mock-model", False, request_mix=request_mix, transport="raw")
+            results = await run_prefix_cache_sweep(run_phase, [100], [0.0, 0.5, 1.0], num_prefixes=4, suffix_tokens=4,
+                                                   num_requests=16, concurrency=4, cooldown=0.0,
+                                                   console=Console(quiet=True))
+            return results, dict(server.stats)
+    (results, report), stats = asyncio.run(main())
+
+    assert len(results) == 3
+    miss_only, mixed, hit_only = report["points"]
+    assert miss_only["achieved_hit_rate"] == 0.0 and hit_only["achieved_hit_rate"] == 1.0
+    assert miss_only["ttft_hit_p50"] is None
+    assert mixed["hit_speedup"] > 3
+    assert hit_only["overall_speedup"] > 3
+    # 缓存容量足够，唯一前缀不会挤掉共享前缀：预热之后每个命中请求都命中服务端缓存
+    assert stats["prefix_hits"] == 16 + round(mixed["achieved_hit_rate"] * 16)
@@ -0,0 +1,83 @@
+import json
+import os
+
+import pytest
+
+from prompt_corpus import JsonlCorpus, build_builtin_corpus, cached_prompt_bytes, load_jsonl_corpus
+
+
+def _write_jsonl(path, items):
+    path.write_text("".join((json.dumps(item, ensure_ascii=False) if isinstance(item, dict) else item) + "\n"
+                            for item in items), encoding="utf-8")
+    return str(path)
+
+
+def test_jsonl_rows_are_deduplicated_but_weighted(tmp_path):
+    path = _write_jsonl(tmp_path / "corpus.jsonl", [
+        {"prompt": "你好"},
+        {"messages": [{"role": "system", "content": "s"}, {"role": "user", "content": "u"}], "max_tokens": 7},
+        "",
+        {"prompt": "你好"},
+    ])
+    corpus = JsonlCorpus(path)
+    assert len(corpus) == 3
+    counts = {0: 0, 1: 0}
+    for _ in range(3000):
+        entry = corpus.draw()
+        counts[entry["prompt_id"]] += 1
+    # 重复的行共享同一条目（首次出现的行号），按出现次数加权抽取
+    assert counts[0] > counts[1] > 0
+    assert set(corpus.entries) == {0, 1}
+
+
+def test_jsonl_entry_fields(tmp_path):
+    messages = [{"role": "user", "content": "测试"}]
+    path = _write_jsonl(tmp_path / "corpus.jsonl", [{"messages": messages, "max_tokens": 5}])
+    entry = JsonlCorpus(path).draw()
+    assert entry["messages"] == messages
+    assert entry["max_tokens"] == 5
+    assert entry["prompt_key"] == ("file", path, 0)
+    assert entry["prompt_bytes"] == len(json.dumps(messages, ensure_ascii=False).encode("utf-8"))
+
+
+def test_jsonl_errors(tmp_path):
+    with pytest.raises(ValueError):
+        JsonlCorpus(_write_jsonl(tmp_path / "empty.jsonl", ["", "  "]))
+    corpus = JsonlCorpus(_write_jsonl(tmp_path / "bad.jsonl", [{"text": "x"}]))
+    with pytest.raises(ValueError, match="neither"):
+        corpus.draw()
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc/self/fd")
+def test_jsonl_corpus_keeps_no_file_open(tmp_path):
+    path = _write_jsonl(tmp_path / "corpus.jsonl", [{"prompt": str(i)} for i in range(5)])
+    corpus = JsonlCorpus(path)
+    for _ in range(50):
+        corpus.draw()
+    open_files = {os.path.realpath(os.path.join("/proc/self/fd", fd)) for fd in os.listdir("/proc/self/fd")}
+    assert os.path.realpath(path) not in open_files
+
+
+def test_jsonl_corpus_is_cached_per_path(tmp_path):
+    path = _write_jsonl(tmp_path / "corpus.jsonl", [{"prompt": "a"}])
+    assert load_jsonl_corpus(path) is load_jsonl_corpus(path)
+
+
+def test_builtin_long_corpus_shares_content():
+    pairs = [{"context_base": "abcd", "prompt": "q1"}, {"context_base": "xyz", "prompt": "q2"}]
+    corpus = build_builtin_corpus(["s"], pairs, True, 10)
+    assert build_builtin_corpus(["s"], pairs, True, 10) is corpus
+    contents = sorted(entry["messages"][0]["content"] for entry in corpus.entries)
+    assert contents == ["abcd" * 2 + "\n\nq1", "xyz" * 3 + "\n\nq2"]
+    # 目标长度不同但重复倍数相同时共享同一个字符串
+    other = build_builtin_corpus(["s"], pairs, True, 11)
+    assert other is not corpus
+    assert other.entries[0]["messages"][0]["content"] is corpus.entries[0]["messages"][0]["content"]
+
+
+def test_prompt_bytes_are_cached_per_key():
+    messages = [{"role": "user", "content": "你好"}]
+    size = cached_prompt_bytes(("test", 1), messages)
+    assert size == len(json.dumps(messages, ensure_ascii=False).encode("utf-8"))
+    # 同一 prompt_key 不再重新序列化
+    assert cached_prompt_bytes(("test", 1), messages * 2) == size
@@ -0,0 +1,117 @@
+import json
+import os
+
+import pytest
+
+from conftest import make_record
+from llm_benchmark import load_config
+from run_checkpoint import RunCheckpoint, atomic_write_json, config_hash, phase_key
+
+CONFIG = {"model": "m", "concurrency": [1, 2]}
+
+
+def _key(concurrency, **options):
+    return phase_key("fixed", 10, concurrency, 50, options)
+
+
+def _run_phases(checkpoint, concurrencies):
+    """按顺序执行各轮，返回 (各轮结果, 实际执行的并发数)。"""
+    results, executed = [], []
+    for concurrency in concurrencies:
+        slot, result = checkpoint.begin(_key(concurrency))
+        if result is None:
+            executed.append(concurrency)
+            result = {"concurrency": concurrency, "successful_requests": 10}
+            checkpoint.record(slot, result)
+        results.append(result)
+    return results, executed
+
+
+def test_resume_skips_completed_phases(tmp_path):
+    directory = str(tmp_path / "ckpt")
+    first = RunCheckpoint(directory, CONFIG)
+    _, executed = _run_phases(first, [1, 2])
+    assert executed == [1, 2]
+    # 中断：第三轮没有完成，manifest 仍为 running
+    with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+        assert json.load(f)["status"] == "running"
+
+    resumed = RunCheckpoint(directory, CONFIG, resume=True)
+    results, executed = _run_phases(resumed, [1, 2, 4])
+    resumed.finish()
+    assert executed == [4]
+    assert resumed.resumed_phases == 2
+    assert results[0]["resumed"] and "resumed" not in results[2]
+    with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert manifest["status"] == "complete"
+    assert [entry["index"] for entry in manifest["phases"]] == [1, 2, 3]
+
+
+def test_repeated_phases_match_by_occurrence(tmp_path):
+    directory = str(tmp_path / "ckpt")
+    _run_phases(RunCheckpoint(directory, CONFIG), [2])
+    _, executed = _run_phases(RunCheckpoint(directory, CONFIG, resume=True), [2, 2])
+    assert executed == [2]
+
+
+def test_annotations_added_after_record_are_persisted(tmp_path):
+    directory = str(tmp_path / "ckpt")
+    checkpoint = RunCheckpoint(directory, CONFIG)
+    (result,), _ = _run_phases(checkpoint, [1])
+    result["slo"] = {"passed": True}
+    checkpoint.finish()
+    (resumed,), _ = _run_phases(RunCheckpoint(directory, CONFIG, resume=True), [1])
+    assert resumed["slo"] == {"passed": True}
+
+
+def test_missing_phase_file_is_rerun(tmp_path):
+    directory = str(tmp_path / "ckpt")
+    _run_phases(RunCheckpoint(directory, CONFIG), [1])
+    for name in os.listdir(os.path.join(directory, "phases")):
+        os.remove(os.path.join(directory, "phases", name))
+    _, executed = _run_phases(RunCheckpoint(directory, CONFIG, resume=True), [1])
+    assert executed == [1]
+
+
+def test_config_mismatch_and_fresh_start(tmp_path):
+    directory = str(tmp_path / "ckpt")
+    _run_phases(RunCheckpoint(directory, CONFIG), [1])
+    with pytest.raises(ValueError):
+        RunCheckpoint(directory, {**CONFIG, "model": "other"}, resume=True)
+    # 不续跑时清除旧的轮次
+    _, executed = _run_phases(RunCheckpoint(directory, CONFIG), [1])
+    assert executed == [1]
+    assert len(os.listdir(os.path.join(directory, "phases"))) == 1
+
+
+def test_phase_key_and_config_hash():
+    assert _key(1) == _key(1, unrelated="ignored")
+    assert _key(1) != _key(1, load=load_config(duration=30))
+    assert config_hash({"a": 1, "b": 2}) == config_hash({"b": 2, "a": 1})
+
+
+def test_partial_snapshot_writes_running_summary(tmp_path):
+    directory = str(tmp_path / "ckpt")
+    checkpoint = RunCheckpoint(directory, CONFIG, interval=1e-9)
+    assert RunCheckpoint(str(tmp_path / "other"), CONFIG).partial_snapshot(_key(1)) is None
+    slot, _ = checkpoint.begin(_key(1))
+    snapshot = checkpoint.partial_snapshot(_key(1))
+    snapshot.on_start(0.0)
+    for i in range(3):
+        snapshot.on_record(make_record(float(i), i + 1.0))
+    with open(checkpoint.partial_path, encoding="utf-8") as f:
+        partial = json.load(f)
+    assert partial["completed_requests"] == 3
+    assert partial["phase"]["concurrency"] == 1
+    checkpoint.record(slot, {"concurrency": 1})
+    assert not os.path.exists(checkpoint.partial_path)
+
+
+def test_atomic_write_leaves_no_temp_file(tmp_path):
+    path = str(tmp_path / "data.json")
+    atomic_write_json(path, {"x": 1})
+    atomic_write_json(path, {"x": 2})
+    assert os.listdir(tmp_path) == ["data.json"]
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f) == {"x": 2}
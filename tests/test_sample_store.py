@@ -0,0 +1,83 @@
+import asyncio
+
+import numpy as np
+
+from conftest import make_record
+from llm_benchmark import output_config, run_benchmark
+from mock_server import MockLLMServer
+from sample_store import STATUS_CODES, SampleWriter, _read_npy_count, load_samples
+
+
+def test_header_is_rewritten_after_each_flush(tmp_path):
+    path = str(tmp_path / "samples.npy")
+    writer = SampleWriter(path, batch_size=2)
+    for i in range(3):
+        writer.on_record(make_record(start_time=float(i), end_time=i + 0.5, prompt_id=i, prompt_bytes=100 + i))
+    # 攒满一批后已落盘，文件头中的记录数随之更新，未满的一批还在内存中
+    assert len(np.load(path, mmap_mode="r")) == 2
+    writer.close()
+
+    samples = load_samples(path)
+    assert len(samples) == 3
+    assert list(samples["start_time"]) == [0.0, 1.0, 2.0]
+    assert list(samples["prompt_id"]) == [0, 1, 2]
+    assert list(samples["prompt_bytes"]) == [100, 101, 102]
+    assert (samples["status"] == STATUS_CODES["success"]).all()
+
+
+def test_missing_fields_use_sentinels(tmp_path):
+    path = str(tmp_path / "samples.npy")
+    writer = SampleWriter(path)
+    writer.on_record(make_record(status="timeout", ttft=None, output_tokens=None))
+    writer.on_record(make_record(status="no-such-status"))
+    writer.close()
+
+    samples = load_samples(path)
+    assert samples["status"][0] == STATUS_CODES["timeout"]
+    assert np.isnan(samples["ttft"][0])
+    assert samples["output_tokens"][0] == -1
+    assert samples["prompt_id"][0] == -1
+    assert samples["status"][1] == 255
+
+
+def test_append_continues_after_existing_records(tmp_path):
+    path = str(tmp_path / "samples.npy")
+    writer = SampleWriter(path)
+    writer.on_record(make_record(start_time=1.0))
+    writer.close()
+    # 模拟上次写入时崩溃：文件头之后残留了半条记录
+    with open(path, "ab") as f:
+        f.write(b"\x00" * 7)
+
+    writer = SampleWriter(path, append=True)
+    assert writer.count == 1
+    writer.on_record(make_record(start_time=2.0))
+    writer.close()
+
+    with open(path, "rb") as f:
+        assert _read_npy_count(f) == 2
+    assert list(load_samples(path)["start_time"]) == [1.0, 2.0]
+
+
+def test_overwrite_without_append(tmp_path):
+    path = str(tmp_path / "samples.npy")
+    for start_time in (1.0, 2.0):
+        writer = SampleWriter(path)
+        writer.on_record(make_record(start_time=start_time))
+        writer.close()
+    assert list(load_samples(path)["start_time"]) == [2.0]
+
+
+def test_run_benchmark_writes_one_sample_per_request(tmp_path):
+    path = str(tmp_path / "samples.npy")
+
+    async def main():
+        async with MockLLMServer(port=0, ttft="0.01", itl="0.001") as server:
+            return await run_benchmark(8, 2, 10, 4, server.base_url, "test-key", "mock-model", False,
+                                       output=output_config(samples_file=path))
+    result = asyncio.run(main())
+    assert result["samples_file"] == path
+    samples = load_samples(path)
+    assert len(samples) == 8
+    assert (samples["status"] == STATUS_CODES["success"]).all()
+    assert (samples["ttft"] >= 0.01).all()
@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+import pytest
+
+from llm_benchmark import run_benchmark
+from mock_server import MockLLMServer
+from scenario import RequestMix, load_scenario
+
+PHASES = [{"name": "warm", "concurrency": 2, "num_requests": 10}]
+
+
+def _write(tmp_path, document, name="scenario.json"):
+    path = tmp_path / name
+    path.write_text(json.dumps(document), encoding="utf-8")
+    return str(path)
+
+
+def test_load_yaml_scenario(tmp_path):
+    path = tmp_path / "mixed.yaml"
+    path.write_text(
+        "classes:\n"
+        "  - {name: chat, weight: 3, max_tokens: 'uniform:10,20'}\n"
+        "  - {name: doc, prompt: synthetic, input_tokens: 100, stream: false}\n"
+        "  - {name: rag, prompt: long}\n"
+        "phases:\n"
+        "  - {concurrency: 4, duration: 30, arrival_rate: 5}\n",
+        encoding="utf-8")
+    scenario = load_scenario(str(path))
+
+    assert scenario["name"] == "mixed"
+    assert scenario["cooldown"] == 5.0
+    chat, doc, rag = scenario["classes"]
+    assert (chat["weight"], chat["prompt"], chat["stream"]) == (3.0, "short", True)
+    assert (doc["input_tokens"], doc["stream"]) == (100, False)
+    assert rag["context_length"] == 20000
+    phase, = scenario["phases"]
+    assert phase == {"name": "phase-1", "concurrency": 4, "num_requests": None, "duration": 30.0, "arrival_rate": 5.0,
+                     "arrival_distribution": "poisson", "output_tokens": 100}
+
+
+@pytest.mark.parametrize("classes, phases, message", [
+    ([], PHASES, "no request classes"),
+    ([{"name": "a"}], [], "no phases"),
+    ([{"name": "a"}, {"name": "a"}], PHASES, "unique"),
+    ([{"name": "a", "colour": "red"}], PHASES, "unknown fields colour"),
+    ([{"name": "a", "weight": 0}], PHASES, "weight must be positive"),
+    ([{"name": "a", "prompt": "poem"}], PHASES, "prompt must be one of"),
+    ([{"name": "a", "prompt": "file"}], PHASES, "requires prompt_file"),
+    ([{"name": "a", "prompt": "synthetic"}], PHASES, "requires input_tokens"),
+    ([{"name": "a", "context_length": 1000}], PHASES, "context_length only applies"),
+    ([{"name": "a", "vision": True, "prompt": "short"}], PHASES, "vision classes"),
+    ([{"name": "a", "max_tokens": "zipf:2"}], PHASES, "invalid max_tokens"),
+    ([{"name": "a"}], [{"concurrency": 0, "num_requests": 5}], "concurrency must be a positive integer"),
+    ([{"name": "a"}], [{"concurrency": 1}], "exactly one of num_requests or duration"),
+    ([{"name": "a"}], [{"concurrency": 1, "num_requests": 5, "duration": 5}], "exactly one of num_requests or duration"),
+    ([{"name": "a"}], [{"concurrency": 1, "duration": 5, "arrival_distribution": "zipf"}], "arrival_distribution"),
+])
+def test_validation_errors(tmp_path, classes, phases, message):
+    with pytest.raises(ValueError, match=message):
+        load_scenario(_write(tmp_path, {"classes": classes, "phases": phases}))
+
+
+def test_request_mix_specs():
+    scenario_classes = [
+        {"name": "doc", "weight": 1.0, "prompt": "synthetic", "prompt_file": None, "context_length": None,
+         "input_tokens": 50, "max_tokens": "const:7", "stream": False, "vision": False, "vision_workload": None},
+    ]
+    mix = RequestMix(scenario_classes)
+    mix.prepare()
+    spec = asyncio.run(mix.next_request("t"))
+    assert spec["labels"] == {"class": "doc"}
+    assert spec["max_tokens"] == 7
+    assert spec["stream"] is False
+    # 合成 prompt 每个词约 1 个 token
+    assert len(spec["messages"][0]["content"].split()) == 50
+    assert spec["prompt_bytes"] == len(json.dumps(spec["messages"]))
+
+
+def test_scenario_classes_against_mock_server(tmp_path):
+    scenario = load_scenario(_write(tmp_path, {
+        "classes": [{"name": "chat", "weight": 1, "max_tokens": 6},
+                    {"name": "batch", "weight": 1, "prompt": "synthetic", "input_tokens": 20, "max_tokens": 3,
+                     "stream": False}],
+        "phases": PHASES,
+    }))
+
+    async def main():
+        async with MockLLMServer(port=0, ttft="0.01", itl="0.001") as server:
+            return await run_benchmark(40, 4, 10, 100, server.base_url, "test-key", "mock-model", False,
+                                       request_mix=scenario["classes"], transport="raw")
+    result = asyncio.run(main())
+    assert result["successful_requests"] == 40
+    classes = result["breakdown"]["class"]
+    assert set(classes) == {"chat", "batch"}
+    assert classes["chat"]["requests"] + classes["batch"]["requests"] == 40
+    assert classes["chat"]["total_output_tokens"] == 6 * classes["chat"]["requests"]
+    assert classes["batch"]["total_output_tokens"] == 3 * classes["batch"]["requests"]
+    # 非流式请求没有首 Token 时间
+    assert classes["batch"]["time_to_first_token"]["p50"] is None
+    assert classes["chat"]["time_to_first_token"]["p50"] is not None
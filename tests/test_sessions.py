@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+import pytest
+
+from llm_benchmark import load_config, run_benchmark
+from mock_server import MockLLMServer
+from prompt_corpus import PromptCorpus, _make_entry
+from sessions import Conversation, SessionWorkload, session_config
+
+
+def _serialized_bytes(messages):
+    return len(json.dumps(messages, ensure_ascii=False).encode("utf-8"))
+
+
+def test_session_config():
+    assert session_config(None) is None
+    config = session_config("3-8", think_time=0.5, think_distribution="constant", turn_tokens=16)
+    assert (config["min_turns"], config["max_turns"], config["turn_tokens"]) == (3, 8, 16)
+    for turns, kwargs in (("0", {}), ("5-3", {}), ("2", {"think_time": -1}), ("2", {"think_distribution": "zipf"}),
+                          ("2", {"turn_tokens": 0})):
+        with pytest.raises(ValueError):
+            session_config(turns, **kwargs)
+
+
+def test_conversation_tracks_request_bytes_incrementally():
+    entry = _make_entry(0, [{"role": "user", "content": "你好，介绍一下你自己"}], ("short", 0), max_tokens=9)
+    conversation = Conversation(entry, turns=3, turn_tokens=8)
+    spec = conversation.next_request()
+    assert spec["labels"] == {"turn": "1"}
+    assert spec["max_tokens"] == 9
+    assert spec["collect_reply"] is True
+
+    assert conversation.advance("我是一个\"模拟\"回复")
+    assert conversation.advance("第二条回复")
+    assert not conversation.advance("第三条回复")
+    spec = conversation.next_request()
+    assert spec["labels"] == {"turn": "3"}
+    assert spec["max_tokens"] is None
+    assert [message["role"] for message in spec["messages"]] == ["user", "assistant", "user", "assistant", "user"]
+    # 增量累加的字节数与整体序列化的结果一致
+    assert spec["prompt_bytes"] == _serialized_bytes(spec["messages"])
+    # 会话历史不修改语料中的条目
+    assert len(entry["messages"]) == 1
+
+
+def test_workload_think_time():
+    corpus = PromptCorpus([_make_entry(0, [{"role": "user", "content": "hi"}], ("short", 0))])
+    constant = SessionWorkload(session_config("2", 0.25, "constant"), corpus)
+    assert constant.think_time() == 0.25
+    assert 2 <= SessionWorkload(session_config("2-4"), corpus).start().turns <= 4
+    assert SessionWorkload(session_config("2", 0.0), corpus).think_time() == 0.0
+
+
+def test_sessions_against_mock_server():
+    async def main():
+        async with MockLLMServer(port=0, ttft="0.01", itl="0.001") as server:
+            return await run_benchmark(12, 2, 10, 8, server.base_url, "test-key", "mock-model", False,
+                                       session=session_config("3"), transport="raw")
+    result = asyncio.run(main())
+    assert result["total_requests"] == 12
+    assert result["successful_requests"] == 12
+    turns = result["breakdown"]["turn"]
+    assert set(turns) == {"1", "2", "3"}
+    assert all(group["requests"] == 4 for group in turns.values())
+    # 每轮带上完整历史，请求体随轮次增长
+    assert turns["1"]["average_prompt_bytes"] < turns["2"]["average_prompt_bytes"] < turns["3"]["average_prompt_bytes"]
+
+
+def test_sessions_reject_open_loop():
+    with pytest.raises(ValueError):
+        asyncio.run(run_benchmark(4, 2, 10, 8, "http://127.0.0.1:1/v1", "k", "m", False, session=session_config("2"),
+                                  load=load_config(5.0)))
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from sketches import DDSketch, ExactQuantiles, make_quantile_sketch
+
+PERCENTILES = (1, 10, 50, 90, 95, 99, 99.9)
+
+
+def _lognormal(seed, size=50_000):
+    return np.random.default_rng(seed).lognormal(mean=-2.0, sigma=1.0, size=size)
+
+
+def test_quantiles_within_relative_accuracy():
+    values = _lognormal(0)
+    sketch = DDSketch(relative_accuracy=0.01)
+    sketch.add_many(values)
+    for percentile in PERCENTILES:
+        # 近邻秩与 np.percentile 的插值略有差别，额外放宽一点
+        expected = np.percentile(values, percentile)
+        assert sketch.quantile(percentile) == pytest.approx(expected, rel=0.015)
+
+
+def test_merge_matches_single_sketch():
+    left, right = _lognormal(1), _lognormal(2)
+    merged = DDSketch()
+    merged.add_many(left)
+    other = DDSketch()
+    other.add_many(right)
+    merged.merge(other)
+
+    combined = DDSketch()
+    combined.add_many(np.concatenate([left, right]))
+    assert merged.count == combined.count
+    assert merged.mean == pytest.approx(combined.mean)
+    assert (merged.min, merged.max) == (combined.min, combined.max)
+    for percentile in PERCENTILES:
+        assert merged.quantile(percentile) == combined.quantile(percentile)
+
+
+def test_merge_rejects_different_accuracy():
+    with pytest.raises(ValueError):
+        DDSketch(0.01).merge(DDSketch(0.02))
+
+
+def test_empty_zero_and_single_values():
+    sketch = DDSketch()
+    assert sketch.quantile(50) is None
+    assert sketch.mean == 0
+    sketch.add_many([0.0, 0.0, 0.0])
+    assert sketch.quantile(50) == 0.0
+    sketch.add(2.0)
+    assert sketch.quantile(100) == pytest.approx(2.0, rel=0.01)
+    assert sketch.quantile(100) <= sketch.max
+
+
+def test_bucket_limit_keeps_high_quantiles():
+    values = np.concatenate([np.geomspace(1e-6, 1e-3, 10_000), np.linspace(1.0, 2.0, 10_000)])
+    sketch = DDSketch(max_buckets=64)
+    sketch.add_many(values)
+    assert sketch.counts.size <= 64
+    assert sketch.count == values.size
+    assert sketch.quantile(99) == pytest.approx(np.percentile(values, 99), rel=0.015)
+
+
+def test_exact_quantiles_match_numpy():
+    values = _lognormal(3, size=1000)
+    exact = make_quantile_sketch(exact=True)
+    assert isinstance(exact, ExactQuantiles)
+    exact.add_many(values[:400])
+    other = ExactQuantiles()
+    other.add_many(values[400:])
+    exact.merge(other)
+    assert exact.count == values.size
+    assert exact.min == values.min() and exact.max == values.max()
+    for percentile in PERCENTILES:
+        assert exact.quantile(percentile) == pytest.approx(np.percentile(values, percentile))
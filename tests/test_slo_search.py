@@ -0,0 +1,76 @@
+import asyncio
+
+import numpy as np
+import pytest
+from rich.console import Console
+
+from conftest import make_record
+from llm_benchmark import run_benchmark
+from mock_server import MockLLMServer
+from slo_search import SloMonitor, parse_slo, search_capacity
+
+QUIET = Console(quiet=True)
+
+
+def test_parse_slo():
+    criteria = parse_slo("ttft_p99<2, itl_p95<=0.1,success_rate>=99")
+    assert [str(criterion) for criterion in criteria] == ["ttft_p99<2", "itl_p95<=0.1", "success_rate>=99"]
+    assert criteria[1].percentile == 95
+    assert criteria[2].passes(99.0) and not criteria[2].passes(98.9)
+    for spec in ("", "ttft<2", "ttft_p0<2", "ttft_p99=2", "queue_p99<1"):
+        with pytest.raises(ValueError):
+            parse_slo(spec)
+
+
+def test_monitor_goodput_counts_requests_meeting_every_slo():
+    monitor = SloMonitor(parse_slo("ttft_p50<0.5,itl_p50<0.1"), planned_requests=3)
+    monitor.on_record(make_record(ttft=0.1, itl=np.array([0.01, 0.02])))
+    monitor.on_record(make_record(ttft=0.9, itl=np.array([0.01])))
+    monitor.on_record(make_record(ttft=0.1, itl=np.array([0.5, 0.5])))
+    assert monitor.good_requests == 1
+    # 整体分位数达标，但只有第一个请求单独满足全部条件
+    passed, details = monitor.evaluate()
+    assert passed is True
+    assert [detail["name"] for detail in details] == ["ttft_p50", "itl_p50"]
+
+
+def test_monitor_stops_once_failures_exceed_budget():
+    # 整轮 20 个请求最多允许 10 个失败，第 11 个失败后即可判定违反
+    monitor = SloMonitor(parse_slo("success_rate>=50"), planned_requests=20, check_every=1)
+    for _ in range(10):
+        monitor.on_record(make_record(status="timeout", ttft=None))
+    assert not monitor.stop_requested
+    monitor.on_record(make_record(status="timeout", ttft=None))
+    assert monitor.stop_requested
+    assert "success_rate>=50" in monitor.violation
+    assert monitor.evaluate()[0] is False
+
+
+def test_monitor_failure_budget_is_exact():
+    # 90% 成功率、整轮 100 个请求恰好允许 10 个失败
+    monitor = SloMonitor(parse_slo("success_rate>=90"), planned_requests=100, check_every=1)
+    for _ in range(10):
+        monitor.on_record(make_record(status="timeout", ttft=None))
+    assert not monitor.stop_requested
+    monitor.on_record(make_record(status="timeout", ttft=None))
+    assert monitor.stop_requested
+
+
+def test_search_finds_mock_server_capacity():
+    # 服务端同时只处理 4 个请求，超出的排队，排队时间计入 TTFT：并发数超过 4 后 TTFT P99 约翻倍
+    async def main():
+        async with MockLLMServer(port=0, ttft="0.05", itl="0.005", max_concurrency=4) as server:
+            async def run_phase(concurrency, num_requests, observers):
+                return await run_benchmark(num_requests, concurrency, 10, 4, server.base_url, "test-key", "mock-model",
+                                           False, observers=observers, transport="raw")
+            return await search_capacity(run_phase, parse_slo("ttft_p99<0.09"), max_concurrency=16,
+                                         min_requests=20, cooldown=0.0, console=QUIET)
+    results, report = asyncio.run(main())
+
+    assert report["max_concurrency_meeting_slo"] == 4
+    assert report["first_failing_concurrency"] == 5
+    tested = [point["concurrency"] for point in report["goodput_curve"]]
+    # 指数爬坡 1, 2, 4, 8，再在 (4, 8) 之间二分
+    assert tested == [1, 2, 4, 5, 6, 8]
+    assert [result["concurrency"] for result in results] == tested
+    assert all(point["passed"] == (point["concurrency"] <= 4) for point in report["goodput_curve"])
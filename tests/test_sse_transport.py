@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+import pytest
+
+from sse_transport import SSEStreamError, StreamUsage, process_sse_stream
+
+
+class FakeResponse:
+    """按给定的分片依次返回字节的响应，模拟网络上任意切分的 SSE 流。"""
+
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.closed = False
+
+    async def aiter_bytes(self):
+        for piece in self.pieces:
+            yield piece
+
+    async def aclose(self):
+        self.closed = True
+
+
+def _event(payload):
+    return f"data: {json.dumps(payload)}\n\n".encode()
+
+
+def _delta(content, finish_reason=None):
+    return _event({"choices": [{"delta": {"content": content}, "finish_reason": finish_reason}]})
+
+
+def _split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("piece_size", [1, 7, 4096])
+def test_chunks_split_across_reads(piece_size):
+    stream = (b": keep-alive\n\n" + _delta("Hel") + _delta("lo") + _delta("", "stop")
+              + _event({"choices": [], "usage": {"prompt_tokens": 5, "completion_tokens": 2}})
+              + b"data: [DONE]\n\n")
+    response = FakeResponse(_split(stream, piece_size))
+    first, chunks, chunk_times, usage, text = asyncio.run(process_sse_stream(response, collect_text=True))
+    assert first is not None
+    assert chunks == 2 and len(chunk_times) == 2
+    assert usage == StreamUsage(5, 2)
+    assert text == "Hello"
+    assert response.closed
+
+
+def test_crlf_and_multiline_data():
+    payload = json.dumps({"choices": [{"delta": {"content": "x"}}]})
+    half = len(payload) // 2
+    # 一个事件拆成两行 data，按规范用换行连接后仍是合法 JSON
+    stream = f"event: message\r\ndata: {payload[:half]}\r\ndata:{payload[half:]}\r\n\r\n".encode()
+    _, chunks, _, usage, text = asyncio.run(process_sse_stream(FakeResponse([stream]), collect_text=True))
+    assert (chunks, usage, text) == (1, None, "x")
+
+
+def test_chunk_buffer_grows_past_expected_chunks():
+    stream = b"".join(_delta(str(i % 10)) for i in range(100))
+    _, chunks, chunk_times, _, _ = asyncio.run(process_sse_stream(FakeResponse([stream]), expected_chunks=4))
+    assert chunks == 100 and len(chunk_times) == 100
+
+
+def test_error_payload_before_content_raises():
+    response = FakeResponse([_event({"error": {"message": "overloaded"}})])
+    with pytest.raises(SSEStreamError):
+        asyncio.run(process_sse_stream(response))
+    assert response.closed
+
+
+def test_error_payload_after_content_keeps_partial_result():
+    stream = _delta("a") + _delta("b") + _event({"error": {"message": "disconnected"}})
+    _, chunks, _, _, text = asyncio.run(process_sse_stream(FakeResponse([stream]), collect_text=True))
+    assert (chunks, text) == (2, "ab")
@@ -0,0 +1,62 @@
+from conftest import make_record
+
+from llm_benchmark import MetricsAggregator
+from steady_state import MeasurementWindow
+
+
+def _window(records, concurrency=2, **kwargs):
+    window = MeasurementWindow(MetricsAggregator(), concurrency, **kwargs)
+    window.on_start(0.0)
+    for record in records:
+        window.on_record(record)
+    window.finish()
+    return window
+
+
+def _closed_loop_records():
+    # 并发 2 的闭环：每秒两个请求同时开始、一秒后结束；按完成顺序到达
+    return [make_record(start, start + 1.0) for start in (0.0, 0.0, 1.0, 1.0, 2.0, 2.0, 3.0, 3.0)]
+
+
+def test_no_exclusion_measures_everything():
+    window = _window(_closed_loop_records())
+    assert window.measured.requests == 8
+    assert not window.excluding
+    assert window.reported_requests(8) == 8
+
+
+def test_warmup_requests_drop_the_earliest_starts():
+    records = list(reversed(_closed_loop_records()))
+    window = _window(records, warmup_requests=3)
+    assert window.excluded_warmup == 3
+    assert window.measured.requests == 5
+    assert window.measured_first_start == 1.0
+    assert window.reported_requests(8) == 5
+
+
+def test_warmup_seconds_and_cooldown_seconds():
+    window = _window(_closed_loop_records(), warmup_seconds=1.0, cooldown_seconds=0.5)
+    # 开始于第 1 秒之前的 2 个请求为预热，结束于最后 0.5 秒内的 2 个请求为收尾
+    assert window.excluded_warmup == 2
+    assert window.excluded_cooldown == 2
+    assert window.measured.requests == 4
+    summary = window.summary(8, 4.0)
+    assert summary["excluded_requests"] == {"warmup": 2, "cooldown": 2}
+    assert summary["full_run"]["total_requests"] == 8
+    assert summary["total_time"] == 2.0
+
+
+def test_steady_window_counts_requests_fully_inside():
+    window = _window(_closed_loop_records())
+    # 第 2 个请求开始（0 秒）到最后一个请求开始（3 秒）之间
+    assert window.steady_window() == (0.0, 3.0)
+    summary = window.summary(8, 4.0)
+    assert summary["steady_state"]["total_requests"] == 6
+    assert summary["steady_state"]["window_start"] == 0.0
+    assert summary["steady_state"]["window_end"] == 3.0
+
+
+def test_open_loop_has_no_steady_window():
+    window = _window(_closed_loop_records(), closed_loop=False)
+    assert window.steady_window() is None
+    assert "steady_state" not in window.summary(8, 4.0)
@@ -0,0 +1,97 @@
+import asyncio
+import csv
+
+import pytest
+from rich.console import Console
+
+from llm_benchmark import run_benchmark
+from mock_server import MockLLMServer
+from sweep import (ROW_FIELDS, SweepCheckpoint, _latin_hypercube, cell_requests, parse_axis, run_sweep, sweep_cells,
+                   sweep_class, sweep_config, write_sweep_table)
+
+
+def test_parse_axis():
+    assert parse_axis("512,128, 128") == [128, 512]
+    assert parse_axis("128:8192:4") == [128, 512, 2048, 8192]
+    assert parse_axis("0.5,2", float) == [0.5, 2.0]
+    for spec in ("0,1", "", "8:2:3", "1:8"):
+        with pytest.raises(ValueError):
+            parse_axis(spec)
+
+
+def test_latin_hypercube_hits_every_stratum_once():
+    axes = [list(range(8)), list(range(100, 108)), list(range(16))]
+    cells = _latin_hypercube(axes, 8, seed=1)
+    assert len(cells) == 8
+    # 取值个数等于样本数时每个取值恰好出现一次
+    assert sorted(cell[0] for cell in cells) == axes[0]
+    assert sorted(cell[1] for cell in cells) == axes[1]
+    # 取值个数为样本数的 2 倍时，每个分层（相邻两个取值）恰好出现一次
+    assert sorted(cell[2] // 2 for cell in cells) == list(range(8))
+    assert _latin_hypercube(axes, 8, seed=1) == cells
+
+
+def test_sweep_cells_order_and_requests():
+    config = sweep_config("512,128", "32", "4,1", sampling="grid", num_requests=5)
+    cells = sweep_cells(config)
+    assert [(cell["input_tokens"], cell["concurrency"]) for cell in cells] == [(128, 1), (128, 4), (512, 1), (512, 4)]
+    assert cell_requests(config, cells[1]) == 8
+    assert cell_requests(config, dict(cells[1], arrival_rate=2.0)) == 5
+    lhs = sweep_config("128:8192:8", "32:512:4", "1:64:8", sampling="lhs", samples=6, seed=3)
+    assert len(sweep_cells(lhs)) == 6
+    with pytest.raises(ValueError):
+        sweep_config(sampling="sobol")
+
+
+def test_interrupted_sweep_resumes_from_checkpoint(tmp_path):
+    checkpoint = str(tmp_path / "sweep.jsonl")
+    config = sweep_config("8,16", "2", "1,2", num_requests=4, checkpoint=checkpoint)
+    fingerprint = dict(config, model="mock-model")
+    attempted = []
+
+    async def main(fail_cell=None):
+        async with MockLLMServer(port=0, ttft="0.005", itl="0.001") as server:
+            async def run_cell(cell, num_requests):
+                attempted.append((cell["input_tokens"], cell["concurrency"]))
+                if (cell["input_tokens"], cell["concurrency"]) == fail_cell:
+                    raise RuntimeError("interrupted")
+                return await run_benchmark(num_requests, cell["concurrency"], 10, cell["max_tokens"], server.base_url,
+                                           "test-key", "mock-model", False, request_mix=[sweep_class(cell["input_tokens"])],
+                                           transport="raw")
+            return await run_sweep(run_cell, config, fingerprint, cooldown=0.0, console=Console(quiet=True))
+
+    results, rows = asyncio.run(main(fail_cell=(16, 1)))
+    assert len(results) == 3
+    assert [(row["input_tokens"], row["concurrency"]) for row in rows] == [(8, 1), (8, 2), (16, 2)]
+
+    attempted.clear()
+    results, rows = asyncio.run(main())
+    # 续跑只执行上次失败的格点，整洁表包含全部格点
+    assert attempted == [(16, 1)]
+    assert [(row["input_tokens"], row["concurrency"]) for row in rows] == [(8, 1), (8, 2), (16, 1), (16, 2)]
+    assert all(row["successful_requests"] == row["requests"] == 4 for row in rows)
+    assert all(row["avg_output_tokens"] == 2 for row in rows)
+
+    table = str(tmp_path / "sweep.csv")
+    write_sweep_table(rows, table)
+    with open(table, newline="") as f:
+        reader = csv.DictReader(f)
+        assert tuple(reader.fieldnames) == ROW_FIELDS
+        assert len(list(reader)) == 4
+
+
+def test_checkpoint_rejects_other_sweeps_and_skips_torn_lines(tmp_path):
+    path = str(tmp_path / "sweep.jsonl")
+    row = dict.fromkeys(ROW_FIELDS, 1)
+    checkpoint = SweepCheckpoint(path, {"sweep": 1})
+    checkpoint.add(row)
+    checkpoint.close()
+    with open(path, "a") as f:
+        f.write('{"row": {"input_tok')
+
+    checkpoint = SweepCheckpoint(path, {"sweep": 1})
+    assert checkpoint.done(row)
+    assert len(checkpoint.rows) == 1
+    checkpoint.close()
+    with pytest.raises(ValueError):
+        SweepCheckpoint(path, {"sweep": 2})
@@ -0,0 +1,101 @@
+import asyncio
+import csv
+import itertools
+import json
+import time
+
+import pytest
+
+import timeseries
+from conftest import make_record
+from llm_benchmark import BenchmarkObserver, _timed_worker, load_config, output_config, run_benchmark
+from mock_server import MockLLMServer
+from timeseries import FIELDNAMES, TimeSeriesWriter
+
+
+def _read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_intervals_flush_after_grace_and_count_stalls(tmp_path, monkeypatch):
+    path = str(tmp_path / "series.jsonl")
+    writer = TimeSeriesWriter(path, interval=1.0, grace=0.5)
+    writer.on_start(100.0)
+    monkeypatch.setattr(timeseries.time, "time", lambda: 100.0)
+    for _ in range(3):
+        writer.on_request_start()
+    writer.on_record(make_record(100.0, 100.4))
+    writer.on_record(make_record(100.0, 100.8))
+    assert writer.rows_written == 0
+    # 第三个请求在 3.2 秒才完成：区间 0、1 已过 grace 写出，区间 1 有在途请求但没有完成，是停顿区间
+    writer.on_record(make_record(100.0, 103.2))
+    assert writer.rows_written == 2
+    writer.close()
+
+    rows = _read_jsonl(path)
+    assert [(row["interval_start"], row["interval_end"]) for row in rows] == [(0, 1), (1, 2), (2, 3), (3, 3.2)]
+    assert [row["completed"] for row in rows] == [2, 0, 0, 1]
+    assert [row["in_flight"] for row in rows] == [1, 1, 1, 0]
+    assert rows[0]["started"] == 3
+    assert rows[0]["latency_p50"] == pytest.approx(0.4, rel=0.02)
+    assert writer.summary()["stall_intervals"] == 2
+
+
+def test_trend_tracks_latency_growth(tmp_path):
+    path = str(tmp_path / "series.csv")
+    writer = TimeSeriesWriter(path, interval=1.0, grace=0.0)
+    writer.on_start(0.0)
+    # 第 i 个区间的延迟为 0.1 * (i + 1) 秒，即每分钟增加 6 秒
+    for i in range(5):
+        latency = 0.1 * (i + 1)
+        writer.on_record(make_record(i + 0.9 - latency, i + 0.9, ttft=0.05))
+    writer.close()
+
+    summary = writer.summary()
+    assert summary["intervals"] == 5
+    assert summary["trends_per_minute"]["latency_p50"] == pytest.approx(6.0, rel=0.05)
+    assert summary["trends_per_minute"]["ttft_p50"] == pytest.approx(0.0, abs=1e-9)
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        assert reader.fieldnames == FIELDNAMES
+        assert [row["itl_max"] for row in reader] == [""] * 5
+
+
+def test_soak_run_writes_time_series(tmp_path):
+    path = str(tmp_path / "series.jsonl")
+
+    async def main():
+        async with MockLLMServer(port=0, ttft="0.01", itl="0.001") as server:
+            result = await run_benchmark(5, 2, 10, 4, server.base_url, "test-key", "mock-model", False,
+                                         load=load_config(duration=0.6),
+                                         output=output_config(timeseries_file=path, timeseries_interval=0.2))
+            return result, dict(server.stats)
+    result, stats = asyncio.run(main())
+    assert result["duration"] == 0.6
+    assert result["timeseries"]["intervals"] >= 3
+    rows = _read_jsonl(path)
+    assert sum(row["completed"] for row in rows) == stats["completed"]
+    assert sum(row["started"] for row in rows) == stats["completed"]
+
+
+class _StartCounter(BenchmarkObserver):
+    def __init__(self):
+        self.started = 0
+
+    def on_request_start(self):
+        self.started += 1
+
+
+def test_timed_worker_rechecks_deadline_after_waiting_for_a_slot():
+    async def main():
+        semaphore = asyncio.Semaphore(1)
+        counter = _StartCounter()
+        await semaphore.acquire()
+        # worker 在截止时间之前开始等待名额，拿到名额时已超过截止时间，不应再发出请求
+        worker = asyncio.create_task(_timed_worker(None, semaphore, time.time() + 0.05, itertools.count(), {}, [counter]))
+        await asyncio.sleep(0.1)
+        semaphore.release()
+        await asyncio.wait_for(worker, 1)
+        return counter.started
+    assert asyncio.run(main()) == 0
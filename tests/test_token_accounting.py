@@ -0,0 +1,71 @@
+"""token 计数来源：服务端 usage 优先，其次本地 tokenizer，最后按内容块计数。"""
+import asyncio
+
+import pytest
+
+from llm_benchmark import run_benchmark, workload_config
+from mock_server import MockLLMServer
+from token_counter import TokenCounter, load_token_counter
+
+# mock_server 依次输出 "模拟" "输出" "的" "内容"：4 个 token，7 个字符
+OUTPUT_TOKENS = 4
+OUTPUT_CHARS = 7
+
+
+@pytest.fixture(scope="module")
+def char_tokenizer(tmp_path_factory):
+    """每个字符一个 token 的 tokenizer.json，不需要下载模型。"""
+    from tokenizers import Regex, Tokenizer, models, pre_tokenizers
+    tokenizer = Tokenizer(models.WordLevel({"[UNK]": 0}, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Split(Regex(r"[\s\S]"), behavior="isolated")
+    path = str(tmp_path_factory.mktemp("tokenizer") / "tokenizer.json")
+    tokenizer.save(path)
+    return path
+
+
+def _run(**kwargs):
+    async def main():
+        async with MockLLMServer(port=0, ttft="0.01", itl="0.001", tokens_per_chunk=2) as server:
+            return await run_benchmark(3, 3, 10, OUTPUT_TOKENS, server.base_url, "test-key", "mock-model", False,
+                                       workload=workload_config(**kwargs))
+    return asyncio.run(main())
+
+
+def test_token_counter_counts_text_parts(char_tokenizer):
+    counter = TokenCounter(char_tokenizer)
+    assert counter.count("ab c") == 4
+    assert counter.count("") == 0
+    messages = [{"role": "system", "content": "abc"},
+                {"role": "user", "content": [{"type": "text", "text": "de"}, {"type": "image_url", "image_url": {}}]}]
+    assert counter.count_messages(messages) == 5
+    assert load_token_counter(char_tokenizer) is load_token_counter(char_tokenizer)
+
+
+def test_missing_tokenizer_file(tmp_path):
+    with pytest.raises(ValueError):
+        TokenCounter(str(tmp_path / "missing.json"))
+
+
+def test_server_usage_takes_precedence(char_tokenizer):
+    result = _run(tokenizer=char_tokenizer)
+    accounting = result["token_accounting"]
+    assert accounting["sources"] == {"usage": 3}
+    assert result["total_output_tokens"] == 3 * OUTPUT_TOKENS
+    # 服务端每块合并 2 个 token
+    assert accounting["tokens_per_chunk"] == 2.0
+    assert accounting["average_prompt_tokens"] > 0
+
+
+def test_tokenizer_fallback_without_usage(char_tokenizer):
+    result = _run(tokenizer=char_tokenizer, stream_usage=False)
+    assert result["token_accounting"]["sources"] == {"tokenizer": 3}
+    assert result["total_output_tokens"] == 3 * OUTPUT_CHARS
+    assert result["total_prompt_tokens"] > 0
+
+
+def test_chunk_count_is_last_resort():
+    result = _run(stream_usage=False)
+    assert result["token_accounting"]["sources"] == {"chunks": 3}
+    # 合并输出的服务端按块计数会偏低
+    assert result["total_output_tokens"] == 3 * OUTPUT_TOKENS // 2
+    assert result["total_prompt_tokens"] == 0
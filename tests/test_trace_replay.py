@@ -0,0 +1,91 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+
+from llm_benchmark import run_benchmark
+from mock_server import MockLLMServer
+from trace_replay import TraceReplay, _parse_row, trace_config
+
+
+def _write_trace(path, rows):
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "wt", encoding="utf-8") as f:
+        for row in rows:
+            f.write((row if isinstance(row, str) else json.dumps(row)) + "\n")
+    return str(path)
+
+
+ROWS = [{"timestamp": 100.0 + i * 0.5, "input_tokens": 10 + i, "output_tokens": 4} for i in range(6)]
+
+
+def test_parse_row_aliases():
+    assert _parse_row('{"ts": "2024-01-01T00:00:01Z", "prompt_tokens": "12", "completion_tokens": 3}') == (
+        1704067201.0, 12, 3)
+    assert _parse_row({"time": "5", "input_length": "7.0"}) == (5.0, 7, None)
+    with pytest.raises(ValueError):
+        _parse_row('{"timestamp": 1}')
+    with pytest.raises(ValueError):
+        _parse_row("[1, 2]")
+
+
+def test_schedule_offsets_and_specs(tmp_path):
+    path = _write_trace(tmp_path / "trace.jsonl.gz", ROWS)
+    schedule = list(TraceReplay(path, time_scale=2.0).schedule())
+    assert [offset for offset, _ in schedule] == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0]
+    spec = schedule[3][1]
+    assert spec["max_tokens"] == 4
+    assert len(spec["messages"][0]["content"].split()) == 13
+
+
+def test_shards_interleave_rows_with_a_common_origin(tmp_path):
+    # 第一行无效：起点取第一条有效行，各分片一致
+    path = _write_trace(tmp_path / "trace.jsonl", ['{"bad": 1}'] + ROWS)
+    full = [offset for offset, _ in TraceReplay(path).schedule()]
+    shards = [[offset for offset, _ in TraceReplay(path, shard_index=i, shard_count=3).schedule()] for i in range(3)]
+    assert full == [0.0, 0.5, 1.0, 1.5, 2.0, 2.5]
+    # 第 i 行（含无效行）由 i % 3 的分片发出
+    assert shards == [[1.0, 2.5], [0.0, 1.5], [0.5, 2.0]]
+    assert sorted(sum(shards, [])) == full
+
+
+def test_skipped_and_out_of_order_rows(tmp_path):
+    rows = [ROWS[0], "not json", ROWS[2], ROWS[1]]
+    replay = TraceReplay(_write_trace(tmp_path / "trace.jsonl", rows), limit=3)
+    assert [offset for offset, _ in replay.schedule()] == [0.0, 1.0]
+    assert replay.skipped_rows == 1
+
+    replay = TraceReplay(_write_trace(tmp_path / "trace.jsonl", rows))
+    assert [offset for offset, _ in replay.schedule()] == [0.0, 1.0, 0.5]
+    assert replay.out_of_order_rows == 1
+
+
+def test_trace_config_validation(tmp_path):
+    assert trace_config(None) is None
+    with pytest.raises(ValueError):
+        trace_config("trace.jsonl", time_scale=0)
+    with pytest.raises(ValueError):
+        trace_config("trace.jsonl", prompt_source="random")
+
+
+def test_replay_against_mock_server(tmp_path):
+    path = tmp_path / "trace.csv"
+    path.write_text("timestamp,input_tokens,output_tokens\n" +
+                    "".join(f"{i * 0.05},{20},{3}\n" for i in range(10)), encoding="utf-8")
+    trace = trace_config(str(path))
+
+    async def main():
+        async with MockLLMServer(port=0, ttft="0.01", itl="0.001") as server:
+            # num_requests 被忽略，请求数以 trace 为准
+            return await run_benchmark(1, 4, 10, 100, server.base_url, "test-key", "mock-model", False,
+                                       trace=trace, transport="raw")
+    result = asyncio.run(main())
+    assert result["total_requests"] == 10
+    assert result["successful_requests"] == 10
+    assert result["total_output_tokens"] == 30
+    assert result["arrival_mode"] == "open_loop"
+    drift = result["trace_replay"]
+    assert drift["requests"] == 10
+    assert abs(drift["planned_span"] - 0.45) < 1e-6
+    assert drift["achieved_span"] >= 0.44
@@ -0,0 +1,46 @@
+import asyncio
+import copy
+import json
+
+from llm_benchmark import run_benchmark, workload_config
+from mock_server import MockLLMServer
+from vision_payload import VisionPayloadBuilder
+
+IMAGE = {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64,AAAA"}}
+TEMPLATE = [
+    {"role": "system", "content": "描述图片"},
+    {"role": "user", "content": [IMAGE, {"type": "text", "text": "这是什么？"}]},
+    {"role": "assistant", "content": "好的"},
+]
+
+
+def test_messages_share_unmodified_parts():
+    template = copy.deepcopy(TEMPLATE)
+    builder = VisionPayloadBuilder(template)
+    messages = builder.messages("t1")
+
+    assert messages[0]["content"] == "描述图片\n\n[timestamp:t1]"
+    assert messages[1]["content"][-1] == {"type": "text", "text": "timestamp:t1"}
+    # 图片内容块和未修改的消息按引用共享，模板本身不变
+    assert messages[1]["content"][0] is template[1]["content"][0]
+    assert messages[2] is template[2]
+    assert template == TEMPLATE
+
+
+def test_body_bytes_matches_serialized_request():
+    builder = VisionPayloadBuilder(TEMPLATE)
+    label = 'a "quoted" 标签'
+    body = json.loads(builder.body_bytes(label, "mock-model", 32))
+    assert body == {"model": "mock-model", "messages": builder.messages(label), "max_tokens": 32, "stream": True,
+                    "stream_options": {"include_usage": True}}
+    assert "stream_options" not in json.loads(builder.body_bytes(label, "mock-model", 32, stream_usage=False))
+
+
+def test_prebuilt_body_against_mock_server():
+    async def main():
+        async with MockLLMServer(port=0, ttft="0.01", itl="0.001") as server:
+            return await run_benchmark(4, 2, 10, 8, server.base_url, "test-key", "mock-model", False,
+                                       vision_model=True, workload=workload_config(prebuilt_body=True))
+    result = asyncio.run(main())
+    assert result["successful_requests"] == 4
+    assert result["total_output_tokens"] == 4 * 8
@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+import pytest
+
+from llm_benchmark import run_benchmark, workload_config
+from mock_server import MockLLMServer
+from vision_workload import (EncodedImageCache, VisionWorkload, get_vision_workload, parse_int_list, size_bucket,
+                             variant_label, vision_workload_config)
+
+
+@pytest.fixture(scope="module")
+def image_dir(tmp_path_factory):
+    from PIL import Image
+    directory = tmp_path_factory.mktemp("images")
+    for i, color in enumerate(("red", "green", "blue")):
+        Image.new("RGB", (640, 480), color).save(directory / f"image{i}.png")
+    (directory / "notes.txt").write_text("不是图片")
+    return str(directory)
+
+
+def _next_request(workload, label=None):
+    async def main():
+        try:
+            return await workload.next_request(label)
+        finally:
+            workload.close()
+    return asyncio.run(main())
+
+
+def test_request_spec_and_labels(image_dir):
+    workload = VisionWorkload(image_dir, images_per_request=2, resolutions=[128], jpeg_qualities=[50])
+    assert len(workload.image_paths) == 3
+    spec = _next_request(workload, "t1")
+
+    content = spec["messages"][0]["content"]
+    assert [part["type"] for part in content] == ["image_url", "image_url", "text"]
+    assert content[0]["image_url"]["url"].startswith("data:image/jpeg;base64,")
+    assert content[-1]["text"].endswith("[timestamp:t1]")
+    assert spec["labels"] == {"image_bucket": "<64KB", "image_variant": "128px/q50"}
+    # 请求体字节数按 data URL 长度估算，与实际序列化的消息长度相差不超过消息外层的 JSON 结构
+    actual = len(json.dumps(spec["messages"], ensure_ascii=False).encode("utf-8"))
+    assert abs(spec["prompt_bytes"] - actual) < 0.05 * actual
+
+
+def test_encoded_images_are_cached_and_shared(image_dir):
+    workload = VisionWorkload(image_dir, images_per_request=3)
+
+    async def main():
+        try:
+            first = await workload.next_request()
+            second = await workload.next_request()
+            return first, second
+        finally:
+            workload.close()
+    first, second = asyncio.run(main())
+    parts = {id(part) for part in first["messages"][0]["content"][:3]}
+    assert {id(part) for part in second["messages"][0]["content"][:3]} == parts
+    assert workload.cache.misses == 3
+    assert first["labels"]["image_variant"] == "original"
+
+
+def test_cache_evicts_least_recently_used():
+    cache = EncodedImageCache(max_bytes=10)
+    cache.put("a", "A", 4)
+    cache.put("b", "B", 4)
+    assert cache.get("a") == ("A", 4)
+    cache.put("c", "C", 4)
+    assert cache.get("b") is None
+    assert set(cache.items) == {"a", "c"}
+    # 单项超过容量时仍保留
+    cache.put("d", "D", 100)
+    assert list(cache.items) == ["d"]
+
+
+def test_helpers(tmp_path):
+    assert size_bucket(10) == "<64KB"
+    assert size_bucket(300 * 1024) == "256KB-1MB"
+    assert size_bucket(10 * 1024 * 1024) == ">4MB"
+    assert variant_label(None, None) == "original"
+    assert variant_label(1024, None) == "1024px"
+    assert parse_int_list("512, 1024,0") == [512, 1024, 0]
+    assert parse_int_list("") is None
+    assert vision_workload_config(None) is None
+    assert vision_workload_config("imgs", 2, "512,0", None, cache_mb=1)["resolutions"] == [512, 0]
+    with pytest.raises(ValueError):
+        VisionWorkload(str(tmp_path))
+
+
+def test_workload_is_shared_per_config(image_dir):
+    config = vision_workload_config(image_dir, 2)
+    workload = get_vision_workload(config)
+    assert get_vision_workload(dict(config)) is workload
+    assert get_vision_workload(vision_workload_config(image_dir, 3)) is not workload
+
+
+def test_breakdown_by_image_variant(image_dir):
+    config = vision_workload_config(image_dir, 1, "64,256", None)
+
+    async def main():
+        async with MockLLMServer(port=0, ttft="0.01", itl="0.001") as server:
+            return await run_benchmark(20, 4, 10, 4, server.base_url, "test-key", "mock-model", False,
+                                       workload=workload_config(vision_workload=config))
+    result = asyncio.run(main())
+    assert result["successful_requests"] == 20
+    variants = result["breakdown"]["image_variant"]
+    assert set(variants) <= {"64px", "256px"}
+    assert sum(group["requests"] for group in variants.values()) == 20
+    assert sum(group["requests"] for group in result["breakdown"]["image_bucket"].values()) == 20
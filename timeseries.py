@@ -0,0 +1,210 @@
+"""
+按时间区间输出的时间序列汇总。
+
+长时间稳定性测试（soak test）关心的是指标随时间的变化：内存泄漏式的缓慢劣化、周期性的停顿等，
+整轮汇总会把它们平均掉。TimeSeriesWriter 作为观察者把请求按结束时间划入固定长度的区间，
+每个区间只保留计数和分位数草图，区间结束后立即写成一行并释放，内存占用与运行时长无关：
+    - 文件格式由扩展名决定：.csv 输出表格，其他（如 .jsonl）每行一个 JSON 对象；
+    - 每行包含区间起止（相对测试开始的秒数）、发出/完成/成功请求数、各类错误数、区间末的在途请求数、
+      RPS、输出 token/s，以及 TTFT、延迟、ITL 的 P50/P90/P99 和最大 ITL；
+    - 没有请求完成但仍有在途请求的区间计为停顿区间；
+    - 结束时汇总区间数、停顿区间数，以及 P50 延迟、P50 TTFT、RPS 随时间变化的线性趋势（每分钟的变化量），
+      趋势用累加和在线拟合，不保留各区间的取值。
+记录按完成顺序到达，多进程 / 分布式回传有延迟，区间在最新结束时间超过区间终点 grace 秒后才写出；
+晚于此到达的记录计入当前尚未写出的最早区间。请求记录按结束时间归入区间，发出数按收到通知的时间归入区间，
+多进程 / 分布式时会滞后约一个回传周期（0.5 秒），区间长度应远大于该值和单个请求的延迟。
+"""
+import csv
+import json
+import time
+
+from llm_benchmark import STATUS_CATEGORIES, BenchmarkObserver
+from sketches import DDSketch
+
+TIMESERIES_PERCENTILES = (50, 90, 99)
+ERROR_CATEGORIES = tuple(status for status in STATUS_CATEGORIES if status != "success")
+# 在线拟合趋势的指标：(结果中的名称, 区间行中的字段)
+TREND_FIELDS = (("latency_p50", "latency_p50"), ("ttft_p50", "ttft_p50"), ("requests_per_second", "requests_per_second"))
+
+FIELDNAMES = (
+    ["interval_start", "interval_end", "timestamp", "started", "completed", "successful", "error_rate"]
+    + [f"errors_{status}" for status in ERROR_CATEGORIES]
+    + ["in_flight", "requests_per_second", "output_tokens_per_second"]
+    + [f"{metric}_p{p}" for metric in ("ttft", "latency", "itl") for p in TIMESERIES_PERCENTILES]
+    + ["itl_max"]
+)
+
+
+class _Interval:
+    """单个时间区间内的计数和分位数草图。"""
+
+    def __init__(self):
+        self.started = 0
+        self.completed = 0
+        self.status_counts = dict.fromkeys(STATUS_CATEGORIES, 0)
+        self.output_tokens = 0
+        self.ttft = DDSketch()
+        self.latency = DDSketch()
+        self.itl = DDSketch()
+
+    def add(self, record):
+        self.completed += 1
+        status = record["status"]
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        if status != "success":
+            return
+        self.output_tokens += record.get("output_tokens") or 0
+        if record.get("ttft") is not None:
+            self.ttft.add(record["ttft"])
+        if record.get("latency") is not None:
+            self.latency.add(record["latency"])
+        if record.get("itl") is not None:
+            self.itl.add_many(record["itl"])
+
+
+class _Trend:
+    """在线最小二乘拟合 y = a + b * x，只保留累加和。"""
+
+    def __init__(self):
+        self.n = 0
+        self.sum_x = self.sum_y = self.sum_xx = self.sum_xy = 0.0
+
+    def add(self, x, y):
+        self.n += 1
+        self.sum_x += x
+        self.sum_y += y
+        self.sum_xx += x * x
+        self.sum_xy += x * y
+
+    def slope(self):
+        denominator = self.n * self.sum_xx - self.sum_x ** 2
+        if self.n < 2 or denominator <= 0:
+            return None
+        return (self.n * self.sum_xy - self.sum_x * self.sum_y) / denominator
+
+
+class TimeSeriesWriter(BenchmarkObserver):
+    """
+    :param path: 输出文件路径，.csv 为表格，其他扩展名按 JSONL 写出
+    :param interval: 区间长度（秒）
+    :param grace: 区间结束后等待迟到记录的秒数
+    """
+
+    def __init__(self, path, interval=10.0, grace=1.0):
+        if interval <= 0:
+            raise ValueError("timeseries interval must be positive")
+        self.path = path
+        self.interval = interval
+        self.grace = grace
+        self.start_time = None
+        self.intervals = {}
+        # 下一个待写出的区间序号
+        self.next_index = 0
+        self.latest_time = None
+        self.started_total = 0
+        self.completed_total = 0
+        self.rows_written = 0
+        self.stall_intervals = 0
+        self.trends = {name: _Trend() for name, _ in TREND_FIELDS}
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.csv_writer = None
+        if path.lower().endswith(".csv"):
+            self.csv_writer = csv.DictWriter(self.file, fieldnames=FIELDNAMES)
+            self.csv_writer.writeheader()
+
+    def on_start(self, start_time):
+        self.start_time = start_time
+
+    def on_request_start(self):
+        now = time.time()
+        if self.start_time is None:
+            self.start_time = now
+        self._interval_at(now).started += 1
+        self._advance(now)
+
+    def on_record(self, record):
+        end_time = record.get("end_time") or time.time()
+        if self.start_time is None:
+            self.start_time = record.get("start_time") or end_time
+        self._interval_at(end_time).add(record)
+        self._advance(end_time)
+
+    def _interval_at(self, timestamp):
+        index = max(self.next_index, int((timestamp - self.start_time) // self.interval))
+        interval = self.intervals.get(index)
+        if interval is None:
+            interval = self.intervals[index] = _Interval()
+        return interval
+
+    def _advance(self, timestamp):
+        self.latest_time = max(self.latest_time or timestamp, timestamp)
+        # 最新时间超过区间终点 grace 秒后，该区间不再等待迟到的记录
+        while self.start_time + (self.next_index + 1) * self.interval + self.grace <= self.latest_time:
+            self._write(self.next_index, self.interval)
+
+    def _write(self, index, span):
+        interval = self.intervals.pop(index, None) or _Interval()
+        self.next_index = index + 1
+        self.started_total += interval.started
+        self.completed_total += interval.completed
+        in_flight = max(0, self.started_total - self.completed_total)
+        successful = interval.status_counts.get("success", 0)
+        interval_start = index * self.interval
+        row = {
+            "interval_start": round(interval_start, 3),
+            "interval_end": round(interval_start + span, 3),
+            "timestamp": round(self.start_time + interval_start, 3),
+            "started": interval.started,
+            "completed": interval.completed,
+            "successful": successful,
+            "error_rate": (interval.completed - successful) / interval.completed * 100 if interval.completed else 0.0,
+        }
+        row.update({f"errors_{status}": interval.status_counts.get(status, 0) for status in ERROR_CATEGORIES})
+        row.update({
+            "in_flight": in_flight,
+            "requests_per_second": successful / span if span > 0 else 0.0,
+            "output_tokens_per_second": interval.output_tokens / span if span > 0 else 0.0,
+        })
+        for metric in ("ttft", "latency", "itl"):
+            sketch = getattr(interval, metric)
+            for p in TIMESERIES_PERCENTILES:
+                row[f"{metric}_p{p}"] = sketch.quantile(p)
+        row["itl_max"] = interval.itl.max if interval.itl.count else None
+
+        if not interval.completed and in_flight:
+            self.stall_intervals += 1
+        # 不完整的最后一个区间不参与趋势拟合
+        if span == self.interval:
+            minute = (interval_start + span / 2) / 60
+            for name, field in TREND_FIELDS:
+                if row[field] is not None:
+                    self.trends[name].add(minute, row[field])
+
+        if self.csv_writer:
+            self.csv_writer.writerow({key: "" if value is None else value for key, value in row.items()})
+        else:
+            self.file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        # 逐行刷盘，测试中断时已写出的区间仍然可用
+        self.file.flush()
+        self.rows_written += 1
+
+    def close(self):
+        """写出剩余的区间，最后一个区间截止到最后一次事件的时间。"""
+        if self.file.closed:
+            return
+        if self.start_time is not None and self.latest_time is not None:
+            last_index = max([self.next_index] + list(self.intervals))
+            for index in range(self.next_index, last_index + 1):
+                end = min((index + 1) * self.interval, self.latest_time - self.start_time)
+                self._write(index, max(end - index * self.interval, 0.0) if index == last_index else self.interval)
+        self.file.close()
+
+    def summary(self):
+        """时间序列的概要：区间数、停顿区间数和各指标每分钟的线性变化量。"""
+        return {
+            "file": self.path,
+            "interval": self.interval,
+            "intervals": self.rows_written,
+            "stall_intervals": self.stall_intervals,
+            "trends_per_minute": {name: trend.slope() for name, trend in self.trends.items()},
+        }
@@ -0,0 +1,59 @@
+"""
+本地 token 计数，用于服务端不返回 usage 信息时的兜底统计。
+
+tokenizer 参数支持两种写法：
+    - tiktoken:<encoding>，如 tiktoken:cl100k_base、tiktoken:o200k_base（需要 tiktoken）
+    - 本地 HuggingFace tokenizer.json 文件路径，或包含 tokenizer.json 的模型目录（需要 tokenizers）
+"""
+import os
+
+_TOKEN_COUNTERS = {}
+
+
+class TokenCounter:
+    """对文本或 chat 消息列表计数，底层为 tiktoken 或 HuggingFace tokenizers。"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        if spec.startswith("tiktoken:"):
+            try:
+                import tiktoken
+            except ImportError:
+                raise ImportError("tiktoken tokenizer requires the tiktoken package; `pip install tiktoken`.")
+            encoding = tiktoken.get_encoding(spec.split(":", 1)[1])
+            self._encode = lambda text: encoding.encode(text, disallowed_special=())
+        else:
+            path = os.path.join(spec, "tokenizer.json") if os.path.isdir(spec) else spec
+            if not os.path.exists(path):
+                raise ValueError(f"Tokenizer file not found: {path}")
+            try:
+                from tokenizers import Tokenizer
+            except ImportError:
+                raise ImportError("HuggingFace tokenizer files require the tokenizers package; `pip install tokenizers`.")
+            tokenizer = Tokenizer.from_file(path)
+            self._encode = lambda text: tokenizer.encode(text, add_special_tokens=False).ids
+
+    def count(self, text):
+        return len(self._encode(text)) if text else 0
+
+    def count_messages(self, messages):
+        """统计消息中所有文本内容的 token 数，不含 chat 模板开销，图片等非文本部分忽略。"""
+        total = 0
+        for message in messages:
+            content = message.get("content")
+            if isinstance(content, str):
+                total += self.count(content)
+            elif isinstance(content, list):
+                total += sum(self.count(part.get("text", "")) for part in content if part.get("type") == "text")
+        return total
+
+
+def load_token_counter(spec):
+    """按 spec 加载并缓存 TokenCounter，同一进程内只初始化一次。"""
+    if not spec:
+        return None
+    counter = _TOKEN_COUNTERS.get(spec)
+    if counter is None:
+        counter = TokenCounter(spec)
+        _TOKEN_COUNTERS[spec] = counter
+    return counter
@@ -0,0 +1,230 @@
+"""
+按生产请求日志（trace）回放负载。
+
+trace 为 JSONL 或 CSV（可以是 .gz 压缩文件），每行一个请求，逐行流式读取，任意大小的 trace 都不会整体载入内存：
+    - timestamp：请求到达时间，秒数（Unix 时间戳或相对秒数均可）或 ISO 8601 字符串；
+      也可以写作 time / ts / arrival_time；毫秒时间戳配合 time_scale=0.001 使用；
+    - input_tokens：输入 token 数，也可以写作 prompt_tokens / input_length；
+    - output_tokens：输出 token 数，作为该请求的 max_tokens，也可以写作 completion_tokens / output_length / max_tokens。
+第一行的时间戳为回放起点，每个请求在 (时间戳 - 起点) × time_scale 秒时发出，不等待前序请求完成（开环）。
+缺少字段或无法解析的行跳过并计数；trace 应按时间戳排序，乱序的行在读到时立即发出，计入调度偏差。
+
+请求按 trace 中的长度重新构造：
+    - synthetic：合成英文文本，每个词约 1 个 token（见 prompt_corpus.synthetic_entry）；
+    - corpus：从内置长文本语料截取，按字符数 = token 数 × 每 token 字符数 构造；指定本地 tokenizer 时用它标定
+      每 token 字符数，否则按中文文本的经验值估算。
+多进程 / 多机回放时各分片按行号交错读取同一个 trace（第 i 行由 i % shard_count == shard_index 的分片发出），
+起点都取 trace 第一行，合并后的到达时间与单进程一致。
+"""
+import csv
+import datetime
+import gzip
+import json
+import logging
+
+from llm_benchmark import LONG_PROMPT_PAIRS, BenchmarkObserver
+from prompt_corpus import long_context_slice_entry, synthetic_entry
+from token_counter import load_token_counter
+
+PROMPT_SOURCES = ("synthetic", "corpus")
+
+_TIMESTAMP_FIELDS = ("timestamp", "time", "ts", "arrival_time")
+_INPUT_FIELDS = ("input_tokens", "prompt_tokens", "input_length")
+_OUTPUT_FIELDS = ("output_tokens", "completion_tokens", "output_length", "max_tokens")
+# 未指定 tokenizer 时内置中文长文本的每 token 字符数（DeepSeek / Qwen 等中文词表的经验值）
+DEFAULT_CHARS_PER_TOKEN = 1.4
+# 调度偏差报告中统计的滞后阈值（秒）
+LATE_THRESHOLDS = (0.01, 0.1, 1.0)
+
+
+def trace_config(path, time_scale=1.0, prompt_source="synthetic", limit=None):
+    """由命令行参数构造 trace 回放配置，作为 trace 传给 run_benchmark 等入口；未指定 trace 文件时返回 None。"""
+    if not path:
+        return None
+    if time_scale <= 0:
+        raise ValueError("trace time_scale must be positive")
+    if prompt_source not in PROMPT_SOURCES:
+        raise ValueError(f"Unsupported trace prompt source '{prompt_source}'. Valid options: {', '.join(PROMPT_SOURCES)}")
+    return {
+        "path": path,
+        "time_scale": time_scale,
+        "prompt_source": prompt_source,
+        "limit": limit,
+        "shard_index": 0,
+        "shard_count": 1,
+    }
+
+
+def _open_text(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+def _iter_rows(path):
+    """逐行产出原始行：JSONL 为未解析的字符串（跳过空行），CSV 为字段字典。"""
+    with _open_text(path) as f:
+        if path.endswith((".csv", ".csv.gz")):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield line
+
+
+def _field(row, names):
+    for name in names:
+        value = row.get(name)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def _parse_timestamp(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def _parse_row(row):
+    """返回 (时间戳, 输入 token 数, 输出 token 数或 None)，缺少必需字段或无法解析时抛出 ValueError。"""
+    if isinstance(row, str):
+        row = json.loads(row)
+        if not isinstance(row, dict):
+            raise ValueError("row is not an object")
+    timestamp = _field(row, _TIMESTAMP_FIELDS)
+    input_tokens = _field(row, _INPUT_FIELDS)
+    if timestamp is None or input_tokens is None:
+        raise ValueError("missing timestamp or input_tokens")
+    output_tokens = _field(row, _OUTPUT_FIELDS)
+    return (_parse_timestamp(timestamp), int(float(input_tokens)),
+            int(float(output_tokens)) if output_tokens is not None else None)
+
+
+class TraceReplay:
+    """
+    按配置（见 trace_config）流式读取 trace，schedule() 产出本分片的 (相对开始时间的秒数, 请求规格)。
+    :param tokenizer: 本轮测试的本地 tokenizer，corpus 来源时用于标定每 token 字符数
+    """
+
+    def __init__(self, path, time_scale=1.0, prompt_source="synthetic", limit=None, tokenizer=None,
+                 shard_index=0, shard_count=1):
+        self.path = path
+        self.time_scale = time_scale
+        self.prompt_source = prompt_source
+        self.limit = limit
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.chars_per_token = DEFAULT_CHARS_PER_TOKEN
+        counter = load_token_counter(tokenizer)
+        if counter is not None and prompt_source == "corpus":
+            sample = "".join(pair["context_base"] + pair["prompt"] for pair in LONG_PROMPT_PAIRS)
+            self.chars_per_token = len(sample) / max(1, counter.count(sample))
+        self.skipped_rows = 0
+        self.out_of_order_rows = 0
+
+    def _request_spec(self, input_tokens, output_tokens):
+        if self.prompt_source == "corpus":
+            entry = long_context_slice_entry(LONG_PROMPT_PAIRS, round(input_tokens * self.chars_per_token))
+        else:
+            entry = synthetic_entry(input_tokens)
+        return {
+            "messages": entry["messages"],
+            "prompt_id": entry["prompt_id"],
+            "prompt_key": entry["prompt_key"],
+            "prompt_bytes": entry["prompt_bytes"],
+            "labels": None,
+            "max_tokens": max(1, output_tokens) if output_tokens else None,
+        }
+
+    def schedule(self):
+        """
+        惰性产出本分片的请求。只解析第一条有效行（确定起点）和本分片的行，其余行只计行号。
+        请求规格在产出时才构造，内存占用与 trace 长度无关。
+        """
+        origin = None
+        last_offset = 0.0
+        for index, row in enumerate(_iter_rows(self.path)):
+            if self.limit is not None and index >= self.limit:
+                break
+            owned = index % self.shard_count == self.shard_index
+            if origin is not None and not owned:
+                continue
+            try:
+                timestamp, input_tokens, output_tokens = _parse_row(row)
+            except (TypeError, ValueError) as exc:
+                self.skipped_rows += 1
+                if self.skipped_rows <= 3:
+                    logging.warning(f"{self.path}: 跳过第 {index + 1} 行: {exc}")
+                continue
+            if origin is None:
+                origin = timestamp
+                if not owned:
+                    continue
+            offset = (timestamp - origin) * self.time_scale
+            if offset < last_offset:
+                self.out_of_order_rows += 1
+            last_offset = max(last_offset, offset)
+            yield offset, self._request_spec(input_tokens, output_tokens)
+        if self.skipped_rows or self.out_of_order_rows:
+            logging.warning(f"{self.path}: 跳过 {self.skipped_rows} 行无效记录, {self.out_of_order_rows} 行时间戳乱序")
+
+
+class ReplayDrift(BenchmarkObserver):
+    """
+    统计回放的调度偏差：trace 计划的时间跨度与实际发送的时间跨度之差、末尾请求的滞后（累积漂移）
+    以及滞后超过各阈值的请求比例。逐请求的滞后分位数见结果中的 schedule_lag。
+    """
+
+    def __init__(self, trace):
+        self.trace = trace
+        self.requests = 0
+        self.first_scheduled = None
+        self.last_scheduled = None
+        self.first_sent = None
+        self.last_sent = None
+        self.final_lag = None
+        self.late = [0] * len(LATE_THRESHOLDS)
+
+    def on_record(self, record):
+        lag = record.get("schedule_lag")
+        if lag is None:
+            return
+        scheduled, sent = record["start_time"], record["send_time"]
+        self.requests += 1
+        if self.first_scheduled is None or scheduled < self.first_scheduled:
+            self.first_scheduled = scheduled
+        if self.last_scheduled is None or scheduled >= self.last_scheduled:
+            self.last_scheduled = scheduled
+            self.final_lag = lag
+        if self.first_sent is None or sent < self.first_sent:
+            self.first_sent = sent
+        if self.last_sent is None or sent > self.last_sent:
+            self.last_sent = sent
+        for i, threshold in enumerate(LATE_THRESHOLDS):
+            if lag > threshold:
+                self.late[i] += 1
+
+    def summary(self):
+        summary = {
+            "trace": self.trace["path"],
+            "time_scale": self.trace["time_scale"],
+            "prompt_source": self.trace["prompt_source"],
+            "requests": self.requests,
+        }
+        if self.requests:
+            planned_span = self.last_scheduled - self.first_scheduled
+            achieved_span = self.last_sent - self.first_sent
+            summary.update({
+                "planned_span": planned_span,
+                "achieved_span": achieved_span,
+                "span_drift": achieved_span - planned_span,
+                "final_lag": self.final_lag,
+                "late_requests": {f">{threshold:g}s": count / self.requests
+                                  for threshold, count in zip(LATE_THRESHOLDS, self.late)},
+            })
+        return summary
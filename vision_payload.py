@@ -0,0 +1,54 @@
+"""
+视觉请求体构造。
+
+视觉模板里的图片以 base64 内嵌，体积达数百 KB。每个请求只需要给 system 文本和 user 内容
+追加时间戳，其余部分（尤其是图片）在请求之间共享，不再逐请求深拷贝：
+    - messages()：返回新的外层列表和被修改的消息，图片等未修改的部分直接引用模板对象；
+    - body_bytes()：把整个请求体预先序列化为字节片段，请求时只拼接时间戳，跳过 SDK 的参数转换和 JSON 序列化。
+模板对象在请求之间共享，调用方不能原地修改返回的消息。
+"""
+import json
+
+# 预序列化时时间戳的占位符，JSON 转义后保持不变，便于在字节串中定位
+_TIMESTAMP_MARKER = "@@vision-timestamp@@"
+
+
+def _with_timestamp(message, timestamp_label):
+    """返回追加了时间戳的新消息；不需要修改的消息原样返回（共享引用）。"""
+    role = message.get("role")
+    content = message.get("content")
+    if role == "system" and isinstance(content, str):
+        return {**message, "content": f"{content}\n\n[timestamp:{timestamp_label}]"}
+    if role == "user":
+        if isinstance(content, list):
+            # 新建内容列表，图片等原有内容块按引用共享
+            return {**message, "content": content + [{"type": "text", "text": f"timestamp:{timestamp_label}"}]}
+        if isinstance(content, str):
+            return {**message, "content": f"{content}\n\n[timestamp:{timestamp_label}]"}
+    return message
+
+
+class VisionPayloadBuilder:
+    """基于只读的模板消息构造每个请求的消息或预序列化的请求体。"""
+
+    def __init__(self, base_messages):
+        self.base_messages = base_messages
+        # 预序列化片段缓存，键为 (model, max_tokens, stream_usage)
+        self._body_segments = {}
+
+    def messages(self, timestamp_label):
+        return [_with_timestamp(message, timestamp_label) for message in self.base_messages]
+
+    def body_bytes(self, timestamp_label, model, max_tokens, stream_usage=True):
+        """返回完整的 chat completions 流式请求体（UTF-8 JSON 字节）。"""
+        key = (model, max_tokens, stream_usage)
+        segments = self._body_segments.get(key)
+        if segments is None:
+            body = {"model": model, "messages": self.messages(_TIMESTAMP_MARKER), "max_tokens": max_tokens, "stream": True}
+            if stream_usage:
+                body["stream_options"] = {"include_usage": True}
+            serialized = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            segments = serialized.split(_TIMESTAMP_MARKER.encode("utf-8"))
+            self._body_segments[key] = segments
+        escaped_label = json.dumps(timestamp_label, ensure_ascii=False)[1:-1].encode("utf-8")
+        return escaped_label.join(segments)
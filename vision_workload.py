@@ -0,0 +1,212 @@
+"""
+基于图片目录的视觉压测负载。
+
+从目录中按需读取图片并编码为 base64 data URL，每个请求携带可配置数量的图片，
+并可在多个缩放尺寸 / JPEG 质量之间轮换（sweep），用于测量图片数量和分辨率对 TTFT 的影响：
+    - 编码在线程池中执行，不阻塞事件循环；同一图片的并发编码只执行一次；
+    - 编码结果放入按字节数限制容量的 LRU 缓存，图片内容块在请求之间共享；
+    - 每个请求带有 image_bucket（本请求图片总字节数区间）和 image_variant（尺寸/质量）标签，
+      结果中按标签分组统计。
+缩放和调整 JPEG 质量需要 Pillow；两者都不指定时直接发送原始文件。
+"""
+import asyncio
+import base64
+import collections
+import io
+import json
+import mimetypes
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp")
+# 图片总字节数分桶边界及标签
+SIZE_BUCKETS = ((64 * 1024, "<64KB"), (256 * 1024, "64-256KB"), (1024 * 1024, "256KB-1MB"), (4 * 1024 * 1024, "1-4MB"))
+OVERSIZE_BUCKET = ">4MB"
+# 单个图片内容块 JSON 序列化后除 data URL 外的固定开销
+_IMAGE_PART_OVERHEAD = len('{"type": "image_url", "image_url": {"url": ""}}')
+# 本进程内已创建的负载，键为序列化后的配置
+_VISION_WORKLOADS = {}
+
+
+def size_bucket(num_bytes):
+    for limit, label in SIZE_BUCKETS:
+        if num_bytes < limit:
+            return label
+    return OVERSIZE_BUCKET
+
+
+def variant_label(max_side, quality):
+    """尺寸/质量组合的可读标签，如 1024px/q85、original。"""
+    parts = []
+    if max_side:
+        parts.append(f"{max_side}px")
+    if quality:
+        parts.append(f"q{quality}")
+    return "/".join(parts) or "original"
+
+
+class EncodedImageCache:
+    """按编码后字节数限制容量的 LRU 缓存，值为共享的图片内容块。线程安全。"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.items = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return item
+
+    def put(self, key, part, size):
+        with self.lock:
+            if key in self.items:
+                return
+            self.items[key] = (part, size)
+            self.current_bytes += size
+            # 至少保留刚放入的一项，即使它本身超过容量
+            while self.current_bytes > self.max_bytes and len(self.items) > 1:
+                _, (_, evicted_size) = self.items.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+
+class VisionWorkload:
+    """从图片目录生成视觉请求，next_request() 返回请求规格（消息、prompt 编号、字节数、分组标签）。"""
+
+    def __init__(self, image_dir, images_per_request=1, resolutions=None, jpeg_qualities=None,
+                 prompt="请详细描述图片中的内容。", system_prompt=None, cache_bytes=256 * 1024 * 1024, encode_workers=4):
+        """
+        :param resolutions: 缩放后最长边像素列表，0/None 表示保持原尺寸；与 jpeg_qualities 组合成 sweep
+        :param jpeg_qualities: JPEG 重新编码的质量列表，0/None 表示不重新编码
+        :param cache_bytes: 编码结果缓存的容量上限（字节）
+        """
+        self.image_paths = sorted(
+            os.path.join(image_dir, name) for name in os.listdir(image_dir) if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if not self.image_paths:
+            raise ValueError(f"No images found in {image_dir}")
+        self.images_per_request = max(1, images_per_request)
+        self.variants = [(max_side or None, quality or None)
+                         for max_side in (resolutions or [None]) for quality in (jpeg_qualities or [None])]
+        if any(max_side or quality for max_side, quality in self.variants):
+            try:
+                import PIL.Image  # noqa: F401
+            except ImportError:
+                raise ImportError("Resizing or re-encoding images requires Pillow; `pip install Pillow`.")
+        self.prompt = prompt
+        self.system_prompt = system_prompt
+        self.cache = EncodedImageCache(cache_bytes)
+        self.executor = ThreadPoolExecutor(max_workers=encode_workers, thread_name_prefix="image-encode")
+        self.pending = {}
+
+    def _encode(self, path, max_side, quality):
+        """在线程池中执行：读取并按需缩放/重新编码图片，返回 (图片内容块, data URL 字节数)。"""
+        if max_side or quality:
+            from PIL import Image
+            with Image.open(path) as image:
+                if max_side:
+                    image.thumbnail((max_side, max_side))
+                buffer = io.BytesIO()
+                if quality:
+                    image.convert("RGB").save(buffer, format="JPEG", quality=quality)
+                    mime_type = "image/jpeg"
+                else:
+                    image_format = image.format or "PNG"
+                    image.save(buffer, format=image_format)
+                    mime_type = Image.MIME.get(image_format, "image/png")
+                data = buffer.getvalue()
+        else:
+            with open(path, "rb") as f:
+                data = f.read()
+            mime_type = mimetypes.guess_type(path)[0] or "image/jpeg"
+        url = f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+        return {"type": "image_url", "image_url": {"url": url}}, len(url)
+
+    async def _image_part(self, path, max_side, quality):
+        key = (path, max_side, quality)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        # 同一图片同时被多个请求用到时只编码一次
+        future = self.pending.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(self.executor, self._encode, path, max_side, quality)
+            self.pending[key] = future
+            try:
+                part, size = await future
+            finally:
+                self.pending.pop(key, None)
+            self.cache.put(key, part, size)
+            return part, size
+        return await future
+
+    async def next_request(self, timestamp_label=None):
+        variant_index = random.randrange(len(self.variants))
+        max_side, quality = self.variants[variant_index]
+        if len(self.image_paths) >= self.images_per_request:
+            paths = random.sample(self.image_paths, self.images_per_request)
+        else:
+            paths = random.choices(self.image_paths, k=self.images_per_request)
+        parts = await asyncio.gather(*(self._image_part(path, max_side, quality) for path in paths))
+
+        text = self.prompt if timestamp_label is None else f"{self.prompt}\n\n[timestamp:{timestamp_label}]"
+        content = [part for part, _ in parts] + [{"type": "text", "text": text}]
+        messages = [{"role": "user", "content": content}]
+        if self.system_prompt:
+            messages.insert(0, {"role": "system", "content": self.system_prompt})
+        image_bytes = sum(size for _, size in parts)
+        return {
+            "messages": messages,
+            # prompt_id 为 sweep 中的尺寸/质量组合编号
+            "prompt_id": variant_index,
+            "prompt_key": ("images", self.prompt, self.system_prompt),
+            # 图片内容为 base64，无需 JSON 转义，按 data URL 长度加固定开销估算
+            "prompt_bytes": image_bytes + _IMAGE_PART_OVERHEAD * len(parts) + len(text.encode("utf-8"))
+                            + len((self.system_prompt or "").encode("utf-8")),
+            "labels": {
+                "image_bucket": size_bucket(image_bytes),
+                "image_variant": variant_label(max_side, quality),
+            },
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def get_vision_workload(config):
+    """按配置创建（或取缓存的）图片目录负载，同一进程内各轮测试共享编码缓存。"""
+    key = json.dumps(config, sort_keys=True)
+    workload = _VISION_WORKLOADS.get(key)
+    if workload is None:
+        workload = _VISION_WORKLOADS[key] = VisionWorkload(**config)
+    return workload
+
+
+def parse_int_list(spec):
+    """解析逗号分隔的整数列表，如 "512,1024,0"；空值返回 None。"""
+    if not spec:
+        return None
+    return [int(value) for value in spec.split(",") if value.strip()]
+
+
+def vision_workload_config(image_dir, images_per_request=1, resolutions=None, jpeg_qualities=None, cache_mb=256):
+    """根据命令行参数构造可序列化的负载配置（传给子进程/agent 后在各自进程内创建 VisionWorkload）。"""
+    if not image_dir:
+        return None
+    return {
+        "image_dir": image_dir,
+        "images_per_request": images_per_request,
+        "resolutions": parse_int_list(resolutions) if isinstance(resolutions, str) else resolutions,
+        "jpeg_qualities": parse_int_list(jpeg_qualities) if isinstance(jpeg_qualities, str) else jpeg_qualities,
+        "cache_bytes": int(cache_mb * 1024 * 1024),
+    }